@@ -0,0 +1,3 @@
+"""
+Benchmarks for the Foreplay API client, run against a local mock server.
+"""
@@ -0,0 +1,90 @@
+"""
+Foreplay API - Local Ad Index Benchmark
+Description: Fetches a discovery corpus from the mock server (every ad lands in
+the local index), then compares the same filters answered by the API (one
+paginated call sequence per filter) and by the index, cold and repeated, with
+facet counts.
+
+Usage:
+    python -m benchmarks.bench_adindex --ads 20000 --latency-ms 40
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.mock_server import MockForeplayServer, MockSettings
+from foreplay_adindex import AdIndex
+from foreplay_client import ForeplayAPIClient
+
+
+FILTERS = [
+    {"display_format": "video"},
+    {"publisher_platform": "Instagram", "live": True},
+    {"display_format": "image", "live": False, "start_date": "2000-01-01"},
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the local ad index against API filters")
+    parser.add_argument("--ads", type=int, default=20000)
+    parser.add_argument("--latency-ms", type=float, default=40.0)
+    parser.add_argument("--page", type=int, default=100)
+    args = parser.parse_args()
+
+    report = {"benchmark": "adindex", "ads": args.ads, "latency_ms": args.latency_ms, "filters": []}
+    with tempfile.TemporaryDirectory() as directory, \
+            MockForeplayServer(MockSettings(latency_ms=args.latency_ms, corpus_size=args.ads)) as server:
+        index = AdIndex(os.path.join(directory, "ads.sqlite"))
+        client = ForeplayAPIClient("bench", base_url=server.url, index_ads=False)
+        client.ad_index = index
+
+        start = time.perf_counter()
+        for offset in range(0, args.ads, args.page):
+            client.discover_ads(offset=offset, limit=args.page)
+        index.flush()
+        report["ingest_seconds"] = round(time.perf_counter() - start, 2)
+
+        for filters in FILTERS:
+            requests_before = sum(server.stats.values())
+            start = time.perf_counter()
+            remote, offset = 0, 0
+            while True:
+                page = client.discover_ads(offset=offset, limit=args.page, **filters).get("data", [])
+                remote += len(page)
+                if len(page) < args.page:
+                    break
+                offset += len(page)
+            api_seconds = time.perf_counter() - start
+            requests = sum(server.stats.values()) - requests_before
+
+            local = index.query(facets=["all"], limit=args.page, **filters)
+            repeat = index.query(facets=["all"], limit=args.page, **filters)
+            report["filters"].append({
+                "filters": filters,
+                "api_ads": remote,
+                "api_requests": requests,
+                "api_seconds": round(api_seconds, 3),
+                "local_total": local["metadata"]["total"],
+                "local_ms": local["metadata"]["took_ms"],
+                "repeat_ms": repeat["metadata"]["took_ms"],
+            })
+        report["index"] = index.snapshot()
+        client.close()
+        index.close()
+
+    for row in report["filters"]:
+        print(
+            f"{row['filters']}: API {row['api_seconds']}s ({row['api_requests']} requests, {row['api_ads']} ads), "
+            f"local {row['local_ms']} ms with all facets ({row['local_total']} ads), repeated {row['repeat_ms']} ms",
+            file=sys.stderr
+        )
+    json.dump(report, sys.stdout, default=str)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Foreplay API - Export Artifact Benchmark
+Description: Stores a synthetic board in the ResultStore, then compares
+rebuilding each export on every click (the old GUI behaviour) with the
+artifact cache: one background prebuild, then repeated downloads served from
+disk. The prebuild runs twice, in threads of this process and in the export
+worker processes, while a ticker thread measures how long this process
+stalls (what other GUI sessions would feel).
+
+Usage:
+    python -m benchmarks.bench_artifacts --board-size 1000 --clicks 5
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.mock_server import MockDataset, MockSettings
+from foreplay_artifacts import ExportArtifactCache, FORMATS
+from foreplay_exportpool import ExportWorkerPool
+from foreplay_store import ResultStore
+
+
+def prebuild(root: str, handle, processes: bool) -> dict:
+    """Build every format once while measuring the stalls of this process"""
+    artifacts = ExportArtifactCache(
+        cache_dir=os.path.join(root, f"exports_{'processes' if processes else 'threads'}"),
+        pool=ExportWorkerPool(processes=processes)
+    )
+    stalls, stop = [], threading.Event()
+
+    def ticker():
+        while not stop.is_set():
+            start = time.perf_counter()
+            time.sleep(0.005)
+            stalls.append(time.perf_counter() - start - 0.005)
+
+    thread = threading.Thread(target=ticker)
+    thread.start()
+    start = time.perf_counter()
+    for future in artifacts.prebuild(handle):
+        future.result()
+    seconds = time.perf_counter() - start
+    stop.set()
+    thread.join()
+    stalls.sort()
+    return {
+        "artifacts": artifacts,
+        "seconds": round(seconds, 2),
+        "stall_p99_ms": round(stalls[int(len(stalls) * 0.99)] * 1000, 1),
+        "stall_max_ms": round(stalls[-1] * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark memoized export artifacts")
+    parser.add_argument("--board-size", type=int, default=1000)
+    parser.add_argument("--transcript-words", type=int, default=400)
+    parser.add_argument("--clicks", type=int, default=5, help="downloads of each format")
+    args = parser.parse_args()
+
+    dataset = MockDataset(MockSettings(transcript_words=args.transcript_words))
+    report = {"benchmark": "artifacts", "board_size": args.board_size, "clicks": args.clicks, "formats": {}}
+
+    with tempfile.TemporaryDirectory() as root:
+        store = ResultStore(root=os.path.join(root, "results"), session_quota_mb=1024)
+        handle = store.write("bench", [dataset.ad_detail(f"ad{i:05d}") for i in range(args.board_size)], board_id="bench")
+
+        # Old behaviour: every click rebuilds the file
+        for fmt, spec in FORMATS.items():
+            path = os.path.join(root, f"rebuild.{spec['extension']}")
+            start = time.process_time()
+            spec["build"](handle, path)
+            report["formats"][fmt] = {"rebuild_cpu_seconds_per_click": round(time.process_time() - start, 4)}
+
+        for processes in (False, True):
+            result = prebuild(root, handle, processes)
+            artifacts = result.pop("artifacts")
+            report["prebuild_processes" if processes else "prebuild_threads"] = result
+            if not processes:
+                artifacts.close()
+
+        for fmt in FORMATS:
+            start_cpu, start = time.process_time(), time.perf_counter()
+            for _ in range(args.clicks):
+                artifact = artifacts.build(handle, fmt)
+                artifact.read()
+            report["formats"][fmt].update({
+                "cached_cpu_ms_per_click": round((time.process_time() - start_cpu) / args.clicks * 1000, 2),
+                "cached_ms_per_click": round((time.perf_counter() - start) / args.clicks * 1000, 2),
+                "bytes": artifact.size_bytes,
+            })
+        report["cache"] = artifacts.snapshot()
+        artifacts.close()
+
+    for mode in ("threads", "processes"):
+        row = report[f"prebuild_{mode}"]
+        print(
+            f"prebuild in {mode}: {row['seconds']}s, GUI process stalls p99 {row['stall_p99_ms']} ms, "
+            f"max {row['stall_max_ms']} ms",
+            file=sys.stderr
+        )
+    for fmt, row in report["formats"].items():
+        print(
+            f"{fmt}: rebuild {row['rebuild_cpu_seconds_per_click']}s CPU per click, "
+            f"cached {row['cached_ms_per_click']} ms ({row['cached_cpu_ms_per_click']} ms CPU), {row['bytes']} bytes",
+            file=sys.stderr
+        )
+    json.dump(report, sys.stdout)
+    print()
+
+
+if __name__ == "__main__":
+    main()
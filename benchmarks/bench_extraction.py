@@ -0,0 +1,240 @@
+"""
+Foreplay API - Extraction Throughput Benchmark
+Description: Runs the board extraction and every export against the local mock
+server at several board sizes and writes machine-readable results.
+
+Each board size runs in a fresh process so that peak RSS is measured per size.
+
+Usage:
+    python -m benchmarks.bench_extraction --sizes 50,200,1000 --latency-ms 20
+    python -m benchmarks.bench_extraction --compare benchmarks/results/<old>.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict
+from datetime import datetime
+from typing import Optional, Dict, Any, List
+
+from benchmarks.mock_server import MockForeplayServer, MockSettings
+
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of values (0 if empty)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of the current process, in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(RESULTS_DIR),
+            stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _timed(func, *args) -> float:
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def run_scenario(base_url: str, board_size: int, delay: float) -> Dict[str, Any]:
+    """
+    Run one extraction + export cycle against the mock server.
+
+    Executed in a child process; returns plain data for the parent.
+    """
+    from foreplay_client import ForeplayAPIClient
+    from foreplay_extraction import extract_board_video_ads
+    from foreplay_export import (
+        create_quick_dataframe,
+        create_csv_dataframe,
+        create_timestamped_dataframe,
+        create_json_export,
+        write_excel
+    )
+
+    client = ForeplayAPIClient("benchmark", base_url=base_url)
+    latencies: List[float] = []
+    make_request = client._make_request
+
+    def timed_request(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return make_request(*args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - start)
+
+    client._make_request = timed_request
+    errors: List[str] = []
+
+    start = time.perf_counter()
+    video_ads = extract_board_video_ads(
+        client,
+        f"board-{board_size}",
+        limit=board_size,
+        delay=delay,
+        on_error=lambda ad_id, e: errors.append(ad_id)
+    )
+    extraction_seconds = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as tmp:
+        export_seconds = {
+            "csv_quick": _timed(lambda: create_quick_dataframe(video_ads).to_csv(os.path.join(tmp, "q.csv"), index=False)),
+            "csv_full": _timed(lambda: create_csv_dataframe(video_ads).to_csv(os.path.join(tmp, "f.csv"), index=False)),
+            "csv_timestamped": _timed(lambda: create_timestamped_dataframe(video_ads).to_csv(os.path.join(tmp, "t.csv"), index=False)),
+            "json": _timed(lambda: create_json_export(video_ads)),
+            "excel": _timed(write_excel, video_ads, os.path.join(tmp, "x.xlsx")),
+        }
+
+    return {
+        "board_size": board_size,
+        "video_ads": len(video_ads),
+        "requests": len(latencies),
+        "errors": len(errors),
+        "extraction_seconds": round(extraction_seconds, 4),
+        "ads_per_second": round(len(video_ads) / extraction_seconds, 2) if extraction_seconds else None,
+        "latency_p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "latency_p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "latency_mean_ms": round(statistics.fmean(latencies) * 1000, 2) if latencies else 0.0,
+        "export_seconds": {name: round(value, 4) for name, value in export_seconds.items()},
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "connection_reuse_rate": client.connection_stats().get("reuse_rate"),
+    }
+
+
+def _scenario_worker(queue, base_url: str, board_size: int, delay: float) -> None:
+    try:
+        queue.put(run_scenario(base_url, board_size, delay))
+    except Exception as e:
+        queue.put({"board_size": board_size, "error": repr(e)})
+
+
+def run_benchmarks(sizes: List[int], settings: MockSettings, delay: float = 0.0) -> Dict[str, Any]:
+    """Start the mock server and run every board size in its own process"""
+    context = multiprocessing.get_context("spawn")
+    results = []
+
+    with MockForeplayServer(settings) as server:
+        for size in sizes:
+            queue = context.Queue()
+            process = context.Process(target=_scenario_worker, args=(queue, server.url, size, delay))
+            process.start()
+            result = queue.get()
+            process.join()
+            results.append(result)
+            print(_format_row(result), file=sys.stderr)
+
+    return {
+        "benchmark": "extraction",
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "extraction_delay": delay,
+        "mock_settings": asdict(settings),
+        "results": results,
+    }
+
+
+def _format_row(result: Dict[str, Any]) -> str:
+    if "error" in result:
+        return f"board_size={result['board_size']:>6}  ERROR {result['error']}"
+    exports = result["export_seconds"]
+    return (
+        f"board_size={result['board_size']:>6}  ads/s={result['ads_per_second']:>8}  "
+        f"p50={result['latency_p50_ms']:>7}ms  p99={result['latency_p99_ms']:>7}ms  "
+        f"rss={result['peak_rss_mb']:>6}MB  export={sum(exports.values()):.3f}s"
+    )
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    """Return one line per board size with the relative change of key metrics"""
+    lines = []
+    previous = {r["board_size"]: r for r in baseline.get("results", []) if "error" not in r}
+    metrics = ("ads_per_second", "latency_p50_ms", "latency_p99_ms", "peak_rss_mb")
+
+    for result in current["results"]:
+        old = previous.get(result["board_size"])
+        if old is None or "error" in result:
+            continue
+        parts = []
+        for metric in metrics:
+            if old.get(metric):
+                change = (result[metric] - old[metric]) / old[metric] * 100
+                parts.append(f"{metric} {change:+.1f}%")
+        old_export, new_export = sum(old["export_seconds"].values()), sum(result["export_seconds"].values())
+        if old_export:
+            parts.append(f"export {(new_export - old_export) / old_export * 100:+.1f}%")
+        lines.append(f"board_size={result['board_size']}: " + ", ".join(parts))
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark board extraction against the mock API")
+    parser.add_argument("--sizes", default="50,200,1000", help="Comma-separated board sizes")
+    parser.add_argument("--delay", type=float, default=0.0, help="Pause between detail calls (GUI uses 0.1)")
+    parser.add_argument("--latency-ms", type=float, default=MockSettings.latency_ms)
+    parser.add_argument("--latency-jitter-ms", type=float, default=MockSettings.latency_jitter_ms)
+    parser.add_argument("--error-rate", type=float, default=MockSettings.error_rate)
+    parser.add_argument("--max-page-size", type=int, default=10000)
+    parser.add_argument("--transcript-words", type=int, default=MockSettings.transcript_words)
+    parser.add_argument("--segments", type=int, default=MockSettings.segments)
+    parser.add_argument("--output", help="Results file (default benchmarks/results/extraction_<commit>.json)")
+    parser.add_argument("--compare", help="Previous results file to compare against")
+    args = parser.parse_args()
+
+    settings = MockSettings(
+        latency_ms=args.latency_ms,
+        latency_jitter_ms=args.latency_jitter_ms,
+        error_rate=args.error_rate,
+        max_page_size=args.max_page_size,
+        transcript_words=args.transcript_words,
+        segments=args.segments,
+    )
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    report = run_benchmarks(sizes, settings, delay=args.delay)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"extraction_{report['commit'] or 'local'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            for line in compare(report, json.load(f)):
+                print(line, file=sys.stderr)
+
+    json.dump(report, sys.stdout)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Foreplay API - Replay Transport Benchmark
+Description: Records a board extraction from the mock server into a cassette,
+then replays it and reports how much faster replay is than the live path.
+
+Usage:
+    python -m benchmarks.bench_replay --board-size 1000 --latency-ms 20
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.mock_server import MockForeplayServer, MockSettings
+from foreplay_client import ForeplayAPIClient
+from foreplay_extraction import extract_board_video_ads
+from foreplay_transport import HTTPTransport, RecordingTransport, ReplayTransport
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark cassette record/replay")
+    parser.add_argument("--board-size", type=int, default=1000)
+    parser.add_argument("--latency-ms", type=float, default=MockSettings.latency_ms)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    board_id = f"board-{args.board_size}"
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.cassette")
+
+        with MockForeplayServer(MockSettings(latency_ms=args.latency_ms, max_page_size=args.board_size)) as server:
+            client = ForeplayAPIClient("benchmark", base_url=server.url)
+            client.transport = RecordingTransport(HTTPTransport(client.session), path)
+            start = time.perf_counter()
+            live_ads = extract_board_video_ads(client, board_id, limit=args.board_size, delay=0)
+            live_seconds = time.perf_counter() - start
+            client.close()
+
+        requests_recorded = len(client.transport.cassette)
+        replay_times = []
+        for _ in range(args.repeat):
+            client = ForeplayAPIClient("benchmark", transport=ReplayTransport(path))
+            start = time.perf_counter()
+            replay_ads = extract_board_video_ads(client, board_id, limit=args.board_size, delay=0)
+            replay_times.append(time.perf_counter() - start)
+            assert replay_ads == live_ads, "replayed extraction differs from the recorded one"
+
+        report = {
+            "benchmark": "replay",
+            "board_size": args.board_size,
+            "requests": requests_recorded,
+            "cassette_bytes": os.path.getsize(path),
+            "live_seconds": round(live_seconds, 4),
+            "replay_seconds_best": round(min(replay_times), 4),
+            "replay_requests_per_second": round(requests_recorded / min(replay_times), 1),
+        }
+
+    print(
+        f"{report['requests']} requests, cassette {report['cassette_bytes'] / 1024:.1f} KB, "
+        f"live {report['live_seconds']}s, replay {report['replay_seconds_best']}s "
+        f"({report['replay_requests_per_second']} req/s)",
+        file=sys.stderr
+    )
+    json.dump(report, sys.stdout)
+    print()
+
+
+if __name__ == "__main__":
+    main()
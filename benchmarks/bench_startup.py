@@ -0,0 +1,85 @@
+"""
+Foreplay API - GUI Startup Benchmark
+Description: Measures the cold start of the Streamlit app in fresh processes:
+import time of its modules, time to the first complete script run (first
+paint), time of a warm rerun, and which heavy modules were loaded by then.
+
+Usage:
+    python -m benchmarks.bench_startup --runs 5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Executed in a fresh interpreter for every run
+PROBE = r"""
+import json, sys, time
+start = time.perf_counter()
+import streamlit
+from streamlit.testing.v1 import AppTest
+import foreplay_client, foreplay_extraction, foreplay_export, foreplay_profiler
+imported = time.perf_counter()
+app = AppTest.from_file(sys.argv[1], default_timeout=120)
+app.run()
+painted = time.perf_counter()
+app.run()
+rerun = time.perf_counter()
+print(json.dumps({
+    "import_seconds": imported - start,
+    "first_paint_seconds": painted - imported,
+    "rerun_seconds": rerun - painted,
+    "exceptions": len(app.exception),
+    "heavy_modules_loaded": sorted(m for m in ("pandas", "numpy", "openpyxl") if m in sys.modules),
+}))
+"""
+
+
+def run_once() -> dict:
+    env = dict(os.environ, FOREPLAY_API_KEY=os.environ.get("FOREPLAY_API_KEY", "benchmark"))
+    start = time.perf_counter()
+    output = subprocess.check_output(
+        [sys.executable, "-c", PROBE, os.path.join(ROOT, "foreplay_gui.py")],
+        cwd=ROOT,
+        env=env,
+        stderr=subprocess.DEVNULL
+    )
+    result = json.loads(output.decode().strip().splitlines()[-1])
+    result["process_seconds"] = time.perf_counter() - start
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Streamlit app cold start")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    runs = [run_once() for _ in range(args.runs)]
+    metrics = ("import_seconds", "first_paint_seconds", "rerun_seconds", "process_seconds")
+    report = {
+        "benchmark": "startup",
+        "runs": args.runs,
+        **{f"{metric}_median": round(statistics.median(r[metric] for r in runs), 4) for metric in metrics},
+        "heavy_modules_loaded": runs[-1]["heavy_modules_loaded"],
+        "exceptions": sum(r["exceptions"] for r in runs),
+    }
+
+    print(
+        f"import {report['import_seconds_median']}s, first paint {report['first_paint_seconds_median']}s, "
+        f"rerun {report['rerun_seconds_median']}s, process {report['process_seconds_median']}s, "
+        f"heavy modules: {', '.join(report['heavy_modules_loaded']) or 'none'}",
+        file=sys.stderr
+    )
+    json.dump(report, sys.stdout)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Foreplay API - Result Store Benchmark
+Description: Compares process memory when many sessions keep their extracted
+boards in memory (the old session_state behaviour) versus holding ResultStore
+handles, and measures write and full-scan read speed.
+
+Usage:
+    python -m benchmarks.bench_store --sessions 20 --board-size 300
+"""
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+
+from benchmarks.mock_server import MockDataset, MockSettings
+from foreplay_store import ResultStore
+
+
+def current_rss_mb() -> float:
+    """Current resident set size in MB (Linux), 0 if unavailable"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        import resource
+        return pages * resource.getpagesize() / 1024 / 1024
+    except (OSError, ValueError):
+        return 0.0
+
+
+def make_board(dataset: MockDataset, session: int, size: int):
+    return [dataset.ad_detail(f"s{session}-ad{i:05d}") for i in range(size)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the spill-to-disk result store")
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--board-size", type=int, default=300)
+    parser.add_argument("--transcript-words", type=int, default=400)
+    args = parser.parse_args()
+
+    dataset = MockDataset(MockSettings(transcript_words=args.transcript_words))
+    report = {"benchmark": "store", "sessions": args.sessions, "board_size": args.board_size}
+
+    with tempfile.TemporaryDirectory() as root:
+        store = ResultStore(root=root, session_quota_mb=1024)
+        base = current_rss_mb()
+        handles = []
+        write_seconds = 0.0
+        for session in range(args.sessions):
+            board = make_board(dataset, session, args.board_size)
+            start = time.perf_counter()
+            handles.append(store.write(f"session{session}", board))
+            write_seconds += time.perf_counter() - start
+            del board
+        report["store_rss_growth_mb"] = round(current_rss_mb() - base, 1)
+        report["store_disk_mb"] = round(store.disk_usage() / 1024 / 1024, 2)
+        report["write_seconds_per_board"] = round(write_seconds / args.sessions, 4)
+
+        start = time.perf_counter()
+        scanned = sum(1 for handle in handles for _ in handle)
+        report["read_ads_per_second"] = round(scanned / (time.perf_counter() - start), 1)
+
+    base = current_rss_mb()
+    boards = [make_board(dataset, session, args.board_size) for session in range(args.sessions)]
+    report["in_memory_rss_growth_mb"] = round(current_rss_mb() - base, 1)
+    del boards
+
+    print(
+        f"{args.sessions} sessions x {args.board_size} ads: in memory +{report['in_memory_rss_growth_mb']} MB, "
+        f"store +{report['store_rss_growth_mb']} MB RSS ({report['store_disk_mb']} MB on disk), "
+        f"read {report['read_ads_per_second']} ads/s",
+        file=sys.stderr
+    )
+    json.dump(report, sys.stdout)
+    print()
+
+
+if __name__ == "__main__":
+    main()
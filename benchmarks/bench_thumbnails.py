@@ -0,0 +1,72 @@
+"""
+Foreplay API - Thumbnail Cache Benchmark
+Description: Serves full-size mock thumbnails from a local CDN and compares a
+results page that downloads every original (what the browser did before)
+with the thumbnail cache: first render, rerun, and bytes stored per image.
+
+Usage:
+    python -m benchmarks.bench_thumbnails --ads 200 --latency-ms 40
+"""
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.cdn_server import LocalCDNServer, write_thumbnails
+from foreplay_thumbnails import ThumbnailCache
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the local thumbnail cache")
+    parser.add_argument("--ads", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=40.0)
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    ad_ids = [f"ad-{i:05d}" for i in range(args.ads)]
+    urls = [f"https://cdn.example.com/thumbs/{ad_id}.jpg" for ad_id in ad_ids]
+    report = {"benchmark": "thumbnails", "ads": args.ads, "latency_ms": args.latency_ms}
+
+    with tempfile.TemporaryDirectory() as cdn_dir, tempfile.TemporaryDirectory() as cache_dir:
+        write_thumbnails(cdn_dir, ad_ids)
+        with LocalCDNServer(cdn_dir, latency_ms=args.latency_ms) as cdn:
+            session = requests.Session()
+            start = time.perf_counter()
+            with ThreadPoolExecutor(args.workers) as pool:
+                sizes = list(pool.map(lambda ad_id: len(session.get(f"{cdn.url}thumbs/{ad_id}.jpg").content), ad_ids))
+            report["direct_seconds"] = round(time.perf_counter() - start, 3)
+            report["direct_kb_per_image"] = round(sum(sizes) / len(sizes) / 1024, 1)
+
+            direct_requests = sum(cdn.stats.values())
+            cache = ThumbnailCache(cache_dir=cache_dir, max_workers=args.workers, origin=cdn.url)
+            start = time.perf_counter()
+            # Two sessions rendering the same page at once must share the downloads
+            with ThreadPoolExecutor(2) as sessions:
+                list(sessions.map(cache.fetch_many, [urls, urls]))
+            report["cold_seconds"] = round(time.perf_counter() - start, 3)
+            start = time.perf_counter()
+            cache.fetch_many(urls)
+            report["warm_seconds"] = round(time.perf_counter() - start, 4)
+            stats = cache.snapshot()
+            cache.close()
+            report["cached_kb_per_image"] = round(stats["stored_bytes"] / max(1, stats["downloads"]) / 1024, 1)
+            report["cdn_requests"] = sum(cdn.stats.values()) - direct_requests
+            report["cache"] = stats
+
+    print(
+        f"{args.ads} thumbnails: direct {report['direct_seconds']}s ({report['direct_kb_per_image']} KB each), "
+        f"cache cold {report['cold_seconds']}s, warm {report['warm_seconds']}s "
+        f"({report['cached_kb_per_image']} KB each), {report['cdn_requests']} CDN requests",
+        file=sys.stderr
+    )
+    json.dump(report, sys.stdout)
+    print()
+
+
+if __name__ == "__main__":
+    main()
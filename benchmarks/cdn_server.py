@@ -0,0 +1,235 @@
+"""
+Foreplay API - Local CDN Server
+Description: Static file server standing in for the thumbnail/video CDN, with
+added latency and per-path request counts. Point the thumbnail cache at it
+with FOREPLAY_THUMBNAIL_ORIGIN (or ThumbnailCache(origin=server.url)): the
+mock API's URLs (https://cdn.example.com/thumbs/<ad_id>.jpg) are then served
+from directory/thumbs/<ad_id>.jpg, and videos from directory/videos/ (see
+FOREPLAY_MEDIA_ORIGIN).
+
+Like a real CDN it answers Range requests (206 + Content-Range, If-Range on
+the ETag, which is the MD5 of the file). drop_rate cuts that fraction of
+responses halfway through the body, to exercise resumable downloads.
+
+Usage:
+    python -m benchmarks.cdn_server --dir /tmp/cdn --thumbnails 500 --port 8766
+
+    with LocalCDNServer("/tmp/cdn", latency_ms=40) as cdn:
+        write_thumbnails("/tmp/cdn", [f"ad-{i}" for i in range(100)])
+        ThumbnailCache(origin=cdn.url).get("https://cdn.example.com/thumbs/ad-1.jpg")
+"""
+
+import argparse
+import hashlib
+import io
+import mimetypes
+import os
+import random
+import re
+import threading
+import time
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Dict, Iterable, Tuple
+
+
+def write_thumbnails(directory: str, ad_ids: Iterable[str], width: int = 1280, height: int = 720, seed: int = 42) -> int:
+    """
+    Write full-size JPEG thumbnails (directory/thumbs/<ad_id>.jpg), like the CDN serves.
+
+    Returns:
+        Number of files written (requires Pillow)
+    """
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(seed)
+    os.makedirs(os.path.join(directory, "thumbs"), exist_ok=True)
+    count = 0
+    for ad_id in ad_ids:
+        image = Image.new("RGB", (width, height), tuple(rng.randrange(256) for _ in range(3)))
+        draw = ImageDraw.Draw(image)
+        for _ in range(40):
+            x, y = rng.randrange(width), rng.randrange(height)
+            draw.ellipse((x, y, x + rng.randrange(20, 300), y + rng.randrange(20, 300)),
+                         fill=tuple(rng.randrange(256) for _ in range(3)))
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=95)
+        with open(os.path.join(directory, "thumbs", f"{ad_id}.jpg"), "wb") as f:
+            f.write(buffer.getvalue())
+        count += 1
+    return count
+
+
+def write_videos(directory: str, ad_ids: Iterable[str], size_kb: int = 512, duplicate_every: int = 0, seed: int = 42) -> int:
+    """
+    Write mock MP4 files (directory/videos/<ad_id>.mp4) of size_kb each.
+
+    With duplicate_every=N every Nth ad reuses the previous ad's bytes, like
+    the same creative uploaded under two URLs.
+
+    Returns:
+        Number of files written
+    """
+    rng = random.Random(seed)
+    os.makedirs(os.path.join(directory, "videos"), exist_ok=True)
+    count, data = 0, b""
+    for index, ad_id in enumerate(ad_ids):
+        if not (duplicate_every and index % duplicate_every == duplicate_every - 1 and data):
+            data = b"\x00\x00\x00\x18ftypmp42" + rng.randbytes(size_kb * 1024 - 12)
+        with open(os.path.join(directory, "videos", f"{ad_id}.mp4"), "wb") as f:
+            f.write(data)
+        count += 1
+    return count
+
+
+class LocalCDNServer:
+    """Threaded static file server with latency, Range support and request counts, for tests and benchmarks"""
+
+    def __init__(
+        self,
+        directory: str,
+        latency_ms: float = 0.0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        ranges: bool = True,
+        drop_rate: float = 0.0
+    ):
+        self.directory = directory
+        self.latency_ms = latency_ms
+        self.ranges = ranges
+        self.drop_rate = drop_rate
+        self.stats: Dict[str, int] = {}
+        self.bytes_sent = 0
+        self._stats_lock = threading.Lock()
+        self._etags: Dict[Tuple[str, float], str] = {}
+        self._httpd = ThreadingHTTPServer((host, port), partial(self._handler_class(), directory=directory))
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self) -> "LocalCDNServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "LocalCDNServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def _etag(self, path: str, data: bytes) -> str:
+        key = (path, os.path.getmtime(path))
+        with self._stats_lock:
+            if key not in self._etags:
+                self._etags[key] = f'"{hashlib.md5(data).hexdigest()}"'
+            return self._etags[key]
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(SimpleHTTPRequestHandler):
+            def log_message(self, format, *args):  # keep benchmark output clean
+                pass
+
+            def do_GET(self):
+                self._serve(body=True)
+
+            def do_HEAD(self):
+                self._serve(body=False)
+
+            def _serve(self, body: bool) -> None:
+                with server._stats_lock:
+                    server.stats[self.path] = server.stats.get(self.path, 0) + 1
+                if server.latency_ms:
+                    time.sleep(server.latency_ms / 1000)
+
+                path = self.translate_path(self.path)
+                if not os.path.isfile(path):
+                    self.send_error(404, "File not found")
+                    return
+                with open(path, "rb") as f:
+                    data = f.read()
+                etag = server._etag(path, data)
+                start, end, status = 0, len(data) - 1, 200
+
+                match = re.match(r"bytes=(\d*)-(\d*)$", self.headers.get("Range", ""))
+                if_range = self.headers.get("If-Range")
+                if server.ranges and match and (not if_range or if_range == etag):
+                    first, last = match.groups()
+                    if first:
+                        start, end = int(first), min(int(last), end) if last else end
+                    elif last:
+                        start = max(0, len(data) - int(last))
+                    if start >= len(data):
+                        self.send_response(416)
+                        self.send_header("Content-Range", f"bytes */{len(data)}")
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        return
+                    status = 206
+
+                chunk = data[start:end + 1]
+                self.send_response(status)
+                self.send_header("Content-Type", mimetypes.guess_type(path)[0] or "application/octet-stream")
+                self.send_header("Content-Length", str(len(chunk)))
+                self.send_header("ETag", etag)
+                if server.ranges:
+                    self.send_header("Accept-Ranges", "bytes")
+                if status == 206:
+                    self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+                self.end_headers()
+                if not body:
+                    return
+
+                if server.drop_rate and random.random() < server.drop_rate:
+                    # Connection lost mid-transfer: half the body, then close
+                    chunk = chunk[:len(chunk) // 2]
+                    self.close_connection = True
+                self.wfile.write(chunk)
+                with server._stats_lock:
+                    server.bytes_sent += len(chunk)
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a directory as a local stand-in for the CDN")
+    parser.add_argument("--dir", required=True, help="Directory to serve")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="Fraction of responses cut halfway")
+    parser.add_argument("--no-ranges", dest="ranges", action="store_false", help="Ignore Range headers")
+    parser.add_argument("--thumbnails", type=int, default=0,
+                        help="Write this many mock thumbnails (ad-00000.jpg ...) first")
+    parser.add_argument("--videos", type=int, default=0,
+                        help="Write this many mock videos (ad-00000.mp4 ...) first")
+    parser.add_argument("--video-kb", type=int, default=512)
+    args = parser.parse_args()
+
+    if args.thumbnails:
+        write_thumbnails(args.dir, (f"ad-{i:05d}" for i in range(args.thumbnails)))
+    if args.videos:
+        write_videos(args.dir, (f"ad-{i:05d}" for i in range(args.videos)), size_kb=args.video_kb)
+    server = LocalCDNServer(
+        args.dir, latency_ms=args.latency_ms, host=args.host, port=args.port,
+        ranges=args.ranges, drop_rate=args.drop_rate
+    )
+    print(f"Local CDN serving {args.dir} on {server.url}")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+"""
+Foreplay API - Local Mock Server
+Description: Stand-in HTTP server implementing the paths ForeplayAPIClient calls,
+with configurable latency, error rate, page sizes and transcript sizes. Used by
+the benchmarks so performance can be measured without spending credits.
+
+Usage:
+    python -m benchmarks.mock_server --port 8765 --latency-ms 50
+
+    client = ForeplayAPIClient("any-key", base_url="http://127.0.0.1:8765/")
+    client.get_board_ads(board_id="board-500")  # board with 500 ads
+"""
+
+import argparse
+import gzip
+import json
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass, asdict
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Dict, Any, List
+from urllib.parse import urlparse, parse_qs
+
+
+WORDS = (
+    "you need to see this before you buy another supplement the results "
+    "speak for themselves our customers love how fast it works try it today "
+    "and get free shipping on your first order limited time only stop scrolling "
+    "this changed my morning routine forever energy focus sleep better feel great"
+).split()
+
+PLATFORMS = ["Facebook", "Instagram", "Messenger", "Audience Network"]
+FORMATS = ["video", "video", "video", "image", "carousel"]
+NICHES = ["Health & Fitness", "Beauty", "Food & Beverage", "Technology", "Fashion"]
+
+
+@dataclass
+class MockSettings:
+    """Behaviour of the mock server"""
+
+    latency_ms: float = 20.0          # mean added latency per request
+    latency_jitter_ms: float = 5.0    # uniform jitter around the mean
+    error_rate: float = 0.0           # fraction of requests answered with 500
+    rate_limit_rate: float = 0.0      # fraction of requests answered with 429
+    max_page_size: int = 250          # limit is clipped to this value
+    transcript_words: int = 150       # words per full_transcription
+    segments: int = 20                # timestamped segments per video ad
+    default_board_size: int = 100     # ads in boards not named "board-<N>"
+    corpus_size: int = 5000           # ads served by discovery/brand endpoints
+    brands: int = 300                 # distinct brands in the corpus
+    corpus_days: int = 365            # corpus spread over this many days
+    credits: int = 100000
+    credit_header: bool = False       # send X-Credits-Remaining (client prints it)
+    gzip_responses: bool = True       # gzip bodies when the client accepts it
+    seed: int = 42
+
+
+class MockDataset:
+    """Deterministic generator of boards, ads, brands and transcripts"""
+
+    def __init__(self, settings: MockSettings):
+        self.settings = settings
+        self.today = date.today()
+        self._corpus: Optional[List[Dict[str, Any]]] = None
+        self._lock = threading.Lock()
+
+    def _rng(self, key: str) -> random.Random:
+        return random.Random(f"{self.settings.seed}:{key}")
+
+    def board_size(self, board_id: str) -> int:
+        match = re.match(r'^board-(\d+)$', board_id or '')
+        return int(match.group(1)) if match else self.settings.default_board_size
+
+    def ad_summary(self, ad_id: str, rng: Optional[random.Random] = None) -> Dict[str, Any]:
+        rng = rng or self._rng(ad_id)
+        started = self.today - timedelta(days=rng.randrange(self.settings.corpus_days))
+        return {
+            "id": ad_id,
+            "ad_id": ad_id,
+            "name": f"Ad {ad_id} - {' '.join(rng.choices(WORDS, k=4))}",
+            "brand_id": f"brand{rng.randrange(self.settings.brands):05d}",
+            "brand_name": f"Brand {rng.randrange(self.settings.brands)}",
+            "display_format": rng.choice(FORMATS),
+            "publisher_platform": rng.sample(PLATFORMS, k=rng.randint(1, 3)),
+            "niches": [rng.choice(NICHES)],
+            "live": rng.random() < 0.6,
+            "started_running": started.isoformat(),
+            "thumbnail": f"https://cdn.example.com/thumbs/{ad_id}.jpg",
+        }
+
+    def ad_detail(self, ad_id: str) -> Dict[str, Any]:
+        rng = self._rng(ad_id)
+        ad = self.ad_summary(ad_id, rng)
+        words = rng.choices(WORDS, k=self.settings.transcript_words)
+        per_segment = max(1, len(words) // max(1, self.settings.segments))
+        duration = round(len(words) / 2.5, 2)
+
+        segments = []
+        for i in range(0, len(words), per_segment):
+            start = round(i / 2.5, 2)
+            segments.append({
+                "startTime": start,
+                "endTime": round(min(duration, (i + per_segment) / 2.5), 2),
+                "sentence": " " + " ".join(words[i:i + per_segment])
+            })
+
+        ad.update({
+            "description": "Limited offer!<br />Shop now.",
+            "headline": " ".join(rng.choices(WORDS, k=6)).title(),
+            "full_transcription": " ".join(words),
+            "timestamped_transcription": segments if ad["display_format"] == "video" else None,
+            "video_duration": duration,
+            "video": f"https://cdn.example.com/videos/{ad_id}.mp4",
+            "link_url": f"https://shop.example.com/{ad['brand_id']}",
+        })
+        return ad
+
+    def board_ads(self, board_id: str) -> List[Dict[str, Any]]:
+        return [self.ad_summary(f"{board_id}-ad{i:06d}") for i in range(self.board_size(board_id))]
+
+    def corpus(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            if self._corpus is None:
+                self._corpus = sorted(
+                    (self.ad_summary(f"disc{i:07d}") for i in range(self.settings.corpus_size)),
+                    key=lambda ad: ad["started_running"],
+                    reverse=True
+                )
+            return self._corpus
+
+    def analytics(self, start: date, end: date, brand_id: str) -> Dict[str, Any]:
+        base = self._rng(f"analytics:{brand_id}").randint(5, 80)
+        running, velocity = [], []
+        for i in range((end - start).days + 1):
+            day = start + timedelta(days=i)
+            rng = self._rng(f"analytics:{brand_id}:{day.isoformat()}")
+            running.append({"date": day.isoformat(), "count": base + rng.randrange(10)})
+            velocity.append({"date": day.isoformat(), "new_ads": rng.randrange(7)})
+        return {"running_ads_distribution": running, "creative_velocity": velocity}
+
+
+def _filter_ads(ads: List[Dict[str, Any]], query: Dict[str, str]) -> List[Dict[str, Any]]:
+    start, end = query.get("start_date"), query.get("end_date")
+    if start:
+        ads = [ad for ad in ads if ad["started_running"] >= start[:10]]
+    if end:
+        ads = [ad for ad in ads if ad["started_running"] <= end[:10]]
+    if query.get("display_format"):
+        ads = [ad for ad in ads if ad["display_format"] == query["display_format"]]
+    if query.get("live") in ("true", "True", "false", "False"):
+        live = query["live"].lower() == "true"
+        ads = [ad for ad in ads if ad["live"] == live]
+    if query.get("publisher_platform"):
+        ads = [ad for ad in ads if query["publisher_platform"] in ad["publisher_platform"]]
+    if query.get("order") == "oldest":
+        ads = list(reversed(ads))
+    return ads
+
+
+class MockForeplayServer:
+    """
+    Threaded HTTP server serving mock Foreplay API responses.
+
+    Example:
+        with MockForeplayServer(MockSettings(latency_ms=30)) as server:
+            client = ForeplayAPIClient("key", base_url=server.url)
+    """
+
+    def __init__(self, settings: Optional[MockSettings] = None, host: str = "127.0.0.1", port: int = 0):
+        self.settings = settings or MockSettings()
+        self.dataset = MockDataset(self.settings)
+        self.stats: Dict[str, int] = {}
+        self._stats_lock = threading.Lock()
+        self._credits = self.settings.credits
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self) -> "MockForeplayServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "MockForeplayServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def _count(self, key: str) -> None:
+        with self._stats_lock:
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+    # -------------------------------------------------------------------------
+    # Routing
+    # -------------------------------------------------------------------------
+
+    def route(self, path: str, query: Dict[str, str]) -> tuple:
+        """Return (status, payload) for a request path and flat query dict"""
+        settings = self.settings
+        offset = int(query.get("offset", 0))
+        limit = min(int(query.get("limit", 10)), settings.max_page_size)
+
+        def page(items: List[Any]) -> tuple:
+            data = items[offset:offset + limit]
+            return 200, {"metadata": {"success": True, "status_code": 200, "count": len(data)}, "data": data}
+
+        if path == "api/usage":
+            return 200, {"credits_remaining": self._credits, "credits_used": settings.credits - self._credits}
+        if path == "api/boards":
+            return 200, {"data": [{"id": f"board-{n}", "name": f"Board {n}"} for n in (10, 100, 1000)]}
+        if path == "api/board/ads":
+            return page(_filter_ads(self.dataset.board_ads(query.get("board_id", "")), query))
+        if path == "api/board/brands":
+            brands = sorted({ad["brand_id"] for ad in self.dataset.board_ads(query.get("board_id", ""))})
+            return page([{"id": b, "name": b} for b in brands])
+        if path == "api/ad":
+            return 200, self.dataset.ad_detail(query.get("ad_id", ""))
+        if path.startswith("api/ad/"):
+            return 200, self.dataset.ad_detail(path[len("api/ad/"):])
+        if path in ("api/discovery/ads", "api/swipefile/ads"):
+            return page(_filter_ads(self.dataset.corpus(), query))
+        if path in ("api/brand/getAdsByBrandId", "api/spyder/brand/ads"):
+            brand_ids = set(query.get("brand_id", "").split(","))
+            return page(_filter_ads([ad for ad in self.dataset.corpus() if ad["brand_id"] in brand_ids], query))
+        if path == "api/brand/getAdsByPageId":
+            return page(_filter_ads(self.dataset.corpus()[:200], query))
+        if path in ("api/spyder/brands", "api/discovery/brands"):
+            return page([{"id": f"brand{i:05d}", "name": f"Brand {i}"} for i in range(settings.brands)])
+        if path == "api/spyder/brand":
+            return 200, {"data": {"id": query.get("brand_id"), "name": query.get("brand_id")}}
+        if path == "api/brand/getBrandsByDomain":
+            rng = self.dataset._rng(query.get("domain", ""))
+            return page([{"id": f"brand{rng.randrange(settings.brands):05d}", "domain": query.get("domain")}])
+        if path == "api/brand/analytics":
+            today = self.dataset.today
+            start = date.fromisoformat(query.get("start_date", (today - timedelta(days=29)).isoformat())[:10])
+            end = date.fromisoformat(query.get("end_date", today.isoformat())[:10])
+            if (end - start).days > 30:
+                return 400, {"error": "Date range cannot exceed 30 days"}
+            return 200, {"data": self.dataset.analytics(start, end, query.get("id", ""))}
+        return 404, {"error": f"Unknown endpoint: {path}"}
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out in separate writes; without this, Nagle's
+            # algorithm plus delayed ACKs add ~40ms to every keep-alive request
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                path = parsed.path.lstrip("/")
+                query = {k: v[-1] for k, v in parse_qs(parsed.query).items()}
+                settings = server.settings
+                server._count(path.split("/")[1] if path.startswith("api/ad/") else path)
+
+                delay = settings.latency_ms + random.uniform(-1, 1) * settings.latency_jitter_ms
+                if delay > 0:
+                    time.sleep(delay / 1000.0)
+
+                roll = random.random()
+                if roll < settings.rate_limit_rate:
+                    status, payload = 429, {"error": "Too Many Requests"}
+                elif roll < settings.rate_limit_rate + settings.error_rate:
+                    status, payload = 500, {"error": "Internal Server Error"}
+                else:
+                    status, payload = server.route(path, query)
+                    if status == 200:
+                        with server._stats_lock:
+                            server._credits -= 1
+
+                body = json.dumps(payload).encode("utf-8")
+                compressed = (
+                    settings.gzip_responses
+                    and len(body) > 1024
+                    and "gzip" in self.headers.get("Accept-Encoding", "")
+                )
+                if compressed:
+                    body = gzip.compress(body, compresslevel=5)
+
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                if compressed:
+                    self.send_header("Content-Encoding", "gzip")
+                self.send_header("Content-Length", str(len(body)))
+                if status == 429:
+                    self.send_header("Retry-After", "1")
+                if settings.credit_header:
+                    self.send_header("X-Credits-Remaining", str(server._credits))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local mock Foreplay API server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    for field, value in asdict(MockSettings()).items():
+        flag = f"--{field.replace('_', '-')}"
+        if isinstance(value, bool):
+            parser.add_argument(flag, action="store_true", default=value)
+        else:
+            parser.add_argument(flag, type=type(value), default=value)
+    args = parser.parse_args()
+
+    settings = MockSettings(**{field: getattr(args, field) for field in asdict(MockSettings())})
+    server = MockForeplayServer(settings, host=args.host, port=args.port)
+    print(f"Mock Foreplay API listening on {server.url}")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
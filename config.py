@@ -3,6 +3,7 @@ Configuration module for Foreplay API Client
 """
 
 import os
+import tempfile
 from typing import Optional
 
 
@@ -22,6 +23,137 @@ class ForeplayConfig:
     REQUEST_TIMEOUT: int = 30  # seconds
     MAX_RETRIES: int = 3
     
+    # Connection Pool Settings (one long-lived client per process)
+    MAX_CONCURRENCY: int = int(os.getenv("FOREPLAY_MAX_CONCURRENCY", "8"))
+    HTTP_POOL_CONNECTIONS: int = 4  # distinct hosts kept in the pool manager
+    RATE_LIMIT: float = float(os.getenv("FOREPLAY_RATE_LIMIT", "0"))  # requests/second, 0 = unlimited
+    
+    # Adaptive Concurrency Settings (AIMD limit on requests in flight)
+    ADAPTIVE_CONCURRENCY: bool = os.getenv("FOREPLAY_ADAPTIVE_CONCURRENCY", "1").lower() in ("1", "true", "yes")
+    ADAPTIVE_INITIAL_CONCURRENCY: int = 4
+    ADAPTIVE_MIN_CONCURRENCY: int = 1
+    ADAPTIVE_MAX_CONCURRENCY: int = int(os.getenv("FOREPLAY_ADAPTIVE_MAX_CONCURRENCY", "32"))
+    ADAPTIVE_DECREASE_FACTOR: float = 0.5  # limit multiplier on 429, 5xx, timeouts
+    ADAPTIVE_LATENCY_SPIKE: float = 2.0  # recent latency / baseline counted as overload
+    
+    # Request Scheduler Settings (interactive, background and prefetch traffic)
+    DEFAULT_PRIORITY: str = os.getenv("FOREPLAY_PRIORITY", "interactive")
+    SCHEDULER_WEIGHTS = {"interactive": 16, "background": 2, "prefetch": 1}
+    SCHEDULER_PREEMPT_SLOTS: int = 2  # interactive requests allowed over the limit
+    SCHEDULER_BACKGROUND_SHARE: float = 0.5  # of the limit, while interactive traffic is active
+    SCHEDULER_INTERACTIVE_GRACE_SECONDS: float = 2.0
+    
+    # Hedged Request Settings (second ad detail request past a latency percentile)
+    HEDGE_REQUESTS: bool = os.getenv("FOREPLAY_HEDGE", "").lower() in ("1", "true", "yes")
+    HEDGE_PERCENTILE: float = 95  # of recent detail latencies, used as hedge deadline
+    HEDGE_BUDGET: float = float(os.getenv("FOREPLAY_HEDGE_BUDGET", "0.1"))  # extra requests per lookup
+    HEDGE_BUDGET_BURST: float = 5  # hedges that can be spent at once
+    HEDGE_TARGET: str = os.getenv("FOREPLAY_HEDGE_TARGET", "alternate")  # "alternate" endpoint or "same"
+    HEDGE_MIN_SAMPLES: int = 20  # latencies needed before the percentile is used
+    HEDGE_INITIAL_DELAY_SECONDS: float = 1.0
+    HEDGE_MIN_DELAY_SECONDS: float = 0.05
+    
+    # Spyder Watch Settings (change feed of tracked brands)
+    WATCH_INTERVAL_SECONDS: float = float(os.getenv("FOREPLAY_WATCH_INTERVAL_SECONDS", "3600"))  # per brand
+    WATCH_HEAD_LIMIT: int = 10  # ads in the first page of each check
+    WATCH_PAGE_LIMIT: int = 100  # later pages double up to this size
+    WATCH_FULL_SCAN_EVERY: int = 24  # checks between full reconciliations of a brand
+    WATCH_MAX_WORKERS: int = 4
+    WATCH_BRANDS_REFRESH_SECONDS: float = 3600  # tracked brand list reloaded after this
+    
+    # Board Extraction Settings
+    BOARD_PAGE_LIMIT: int = 200  # board ads requested per page
+    DETAIL_RETRIES: int = int(os.getenv("FOREPLAY_DETAIL_RETRIES", "2"))  # retry rounds for failed ad details
+    RETRY_BACKOFF_SECONDS: float = 2.0  # doubled on every retry round
+    
+    # Checkpoint Settings (resumable extraction journals)
+    CHECKPOINT_DIR: str = os.getenv("FOREPLAY_CHECKPOINT_DIR", ".foreplay_checkpoints")
+    CHECKPOINT_SYNC_SECONDS: float = 1.0  # fsync interval of the journals
+    CHECKPOINT_MAX_AGE_HOURS: float = 24  # GUI resumes interrupted extractions younger than this
+    
+    # Transport Settings (live, record or replay)
+    TRANSPORT_MODE: str = os.getenv("FOREPLAY_TRANSPORT", "live")
+    CASSETTE_PATH: str = os.getenv("FOREPLAY_CASSETTE", "foreplay.cassette")
+    REPLAY_LATENCY: Optional[str] = os.getenv("FOREPLAY_REPLAY_LATENCY")  # seconds or "recorded"
+    
+    # Profiling (timed spans per stage, exported as Chrome trace)
+    PROFILING: bool = os.getenv("FOREPLAY_PROFILE", "").lower() in ("1", "true", "yes")
+    PROFILE_MAX_SPANS: int = int(os.getenv("FOREPLAY_PROFILE_MAX_SPANS", "100000"))  # newest kept by the process-wide profiler
+    
+    # Sharded Scan Settings (date-range windows scanned in parallel)
+    SCAN_MAX_WORKERS: int = int(os.getenv("FOREPLAY_SCAN_MAX_WORKERS", "4"))
+    SCAN_WINDOW_DAYS: int = 7
+    SCAN_MIN_WINDOW_DAYS: int = 1
+    SCAN_PAGE_LIMIT: int = 100
+    SCAN_MAX_PAGES_PER_WINDOW: int = 50
+    
+    # Local Cache Settings
+    CACHE_DIR: str = os.getenv("FOREPLAY_CACHE_DIR", ".foreplay_cache")
+    
+    # Local Ad Index Settings (opt-in: every fetched ad, queryable offline with facet counts)
+    AD_INDEX: bool = os.getenv("FOREPLAY_AD_INDEX", "0").lower() in ("1", "true", "yes")
+    AD_INDEX_PATH: Optional[str] = os.getenv("FOREPLAY_AD_INDEX_PATH")  # default CACHE_DIR/ads.sqlite
+    AD_INDEX_BATCH_SIZE: int = 2000  # most ads written per transaction
+    
+    # Thumbnail Cache Settings (resized copies of ad thumbnails served by the GUI)
+    THUMBNAIL_CACHE_MB: float = float(os.getenv("FOREPLAY_THUMBNAIL_CACHE_MB", "200"))
+    THUMBNAIL_WIDTH: int = 400  # pixels, twice the width shown in the GUI
+    THUMBNAIL_QUALITY: int = 80  # JPEG quality
+    THUMBNAIL_MAX_WORKERS: int = 8
+    THUMBNAIL_ORIGIN: Optional[str] = os.getenv("FOREPLAY_THUMBNAIL_ORIGIN")  # e.g. a local file server
+    THUMBNAIL_TIMEOUT: int = 10  # seconds
+    THUMBNAIL_MAX_DOWNLOAD_MB: float = 10
+    THUMBNAIL_RETRY_SECONDS: float = 300  # failed URLs are not fetched again before this
+    
+    # Media Download Settings (video archive of extracted ads)
+    MEDIA_DIR: str = os.getenv("FOREPLAY_MEDIA_DIR", "media")
+    MEDIA_MAX_WORKERS: int = int(os.getenv("FOREPLAY_MEDIA_MAX_WORKERS", "4"))
+    MEDIA_BANDWIDTH_MB_S: float = float(os.getenv("FOREPLAY_MEDIA_BANDWIDTH_MB_S", "0"))  # total, 0 = unlimited
+    MEDIA_CHUNK_MB: float = 8  # size of each range request
+    MEDIA_RETRIES: int = 3  # per chunk after network errors, per file after failed verification
+    MEDIA_RETRY_BACKOFF_SECONDS: float = 0.5  # doubled on every retry
+    MEDIA_TIMEOUT: int = 30  # seconds
+    MEDIA_ORIGIN: Optional[str] = os.getenv("FOREPLAY_MEDIA_ORIGIN")  # e.g. a local file server
+    MEDIA_ZIP_MAX_MB: float = 200  # largest video ZIP offered for download in the GUI
+    
+    # Result Store Settings (extracted ads spilled to disk per session)
+    RESULT_STORE_DIR: str = os.getenv(
+        "FOREPLAY_RESULT_STORE_DIR",
+        os.path.join(tempfile.gettempdir(), "foreplay_results")
+    )
+    RESULT_SESSION_QUOTA_MB: float = float(os.getenv("FOREPLAY_RESULT_SESSION_QUOTA_MB", "200"))
+    RESULT_MAX_AGE_HOURS: float = 6
+    
+    # Export Artifact Settings (CSV/JSON/Excel files built once per board snapshot)
+    EXPORT_CACHE_MB: float = float(os.getenv("FOREPLAY_EXPORT_CACHE_MB", "500"))
+    EXPORT_MAX_AGE_HOURS: float = float(os.getenv("FOREPLAY_EXPORT_MAX_AGE_HOURS", "24"))  # since last download
+    EXPORT_PREBUILD: bool = os.getenv("FOREPLAY_EXPORT_PREBUILD", "1").lower() in ("1", "true", "yes")
+    EXPORT_MAX_WORKERS: int = int(os.getenv("FOREPLAY_EXPORT_MAX_WORKERS", "1"))  # export processes (fly.toml: 1 shared CPU)
+    EXPORT_PROCESSES: bool = os.getenv("FOREPLAY_EXPORT_PROCESSES", "1").lower() in ("1", "true", "yes")  # 0 = threads
+    EXPORT_WORKER_NICE: int = 10  # export processes yield the CPU to the GUI
+    EXPORT_WORKER_MAX_TASKS: int = 20  # exports per worker process before it is replaced (frees memory)
+    
+    # Segment Corpus Settings (columnar timestamped transcripts, one per board)
+    CORPUS_DIR: str = os.getenv("FOREPLAY_CORPUS_DIR", ".foreplay_corpus")
+    
+    # Near-Duplicate Detection Settings (MinHash/LSH over transcripts)
+    NEARDUP_THRESHOLD: float = float(os.getenv("FOREPLAY_NEARDUP_THRESHOLD", "0.7"))
+    
+    # Domain Resolution Settings (landing-page URLs to brands)
+    DOMAIN_CACHE_TTL_HOURS: float = float(os.getenv("FOREPLAY_DOMAIN_CACHE_TTL_HOURS", "168"))
+    DOMAIN_MISSING_TTL_HOURS: float = 24  # domains without brands are asked again after this
+    DOMAIN_BRAND_LIMIT: int = 10  # brands requested per domain
+    DOMAIN_MAX_WORKERS: int = 8
+    
+    # Brand Analytics Settings (API allows max 30 days per request)
+    ANALYTICS_WINDOW_DAYS: int = 29
+    ANALYTICS_SETTLE_DAYS: int = 1  # days after which a closed window is cached
+    ANALYTICS_MAX_WORKERS: int = 4
+    
+    # Brand Batching Settings (comma-separated brand_id packing)
+    BRAND_IDS_PER_REQUEST: int = int(os.getenv("FOREPLAY_BRAND_IDS_PER_REQUEST", "10"))
+    BRAND_BATCH_MAX_WORKERS: int = 4
+    
     # Display Formats
     DISPLAY_FORMATS = [
         "video",
@@ -0,0 +1,526 @@
+"""
+Foreplay API - Local Ad Index
+Description: When enabled (FOREPLAY_AD_INDEX=1, or index_ads=True on the
+client), every ad the client receives (listings, board pages, details) is
+also written to a local SQLite database, so repeat filters and dashboard
+breakdowns are answered on this machine in milliseconds, without API calls
+or credits. The database is never pruned, so indexing is opt-in: delete the
+file to start over.
+
+Ads are stored once per ad ID, merged with what was already known (a board
+summary and its later detail become one record), as compressed JSON. Each
+filterable field is a row of a (facet, value, ad_id) table whose primary key
+is the index, so a filter is an index range scan and a facet count is a
+GROUP BY over it. Multi-valued fields (platforms, niches, languages) get one
+row per value. Counts are disjunctive: the counts of a facet ignore the
+filter on that same facet, so a dashboard can show every alternative value.
+
+Writes are queued and applied in batches by a background thread, off the
+request path; queries flush the queue first, so they see every ad received
+before them. The database lives in config.AD_INDEX_PATH (WAL mode, shared by
+every process on the host).
+"""
+
+import atexit
+import copy
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any, List, Iterable, Tuple, Union
+
+from config import config
+
+
+# Query filter -> ad fields holding its values
+FACET_FIELDS = {
+    "brand_id": ("brand_id",),
+    "live": ("live",),
+    "display_format": ("display_format",),
+    "publisher_platform": ("publisher_platform",),
+    "niche": ("niches", "niche"),
+    "market_target": ("market_target",),
+    "language": ("languages", "language"),
+}
+
+# Publication date of an ad, first field present wins
+DATE_FIELDS = ("started_running", "publication_date", "created_at")
+
+# Fields matched by the search filter
+SEARCH_FIELDS = ("name", "brand_name", "headline", "description", "full_transcription")
+
+# Endpoints whose responses carry ads
+AD_ENDPOINTS = frozenset((
+    "api/swipefile/ads", "api/board/ads", "api/spyder/brand/ads", "api/ad",
+    "api/brand/getAdsByBrandId", "api/brand/getAdsByPageId", "api/discovery/ads"
+))
+
+ORDERS = {"newest": "a.started DESC, a.id DESC", "oldest": "a.started ASC, a.id ASC", "recently_seen": "a.seen_at DESC, a.id DESC"}
+
+# Narrow tables for filtering; the records and the search text live apart,
+# so filters and counts only read small integer-keyed index pages
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ads (
+    id INTEGER PRIMARY KEY,
+    ad_id TEXT NOT NULL UNIQUE,
+    started TEXT NOT NULL DEFAULT '',
+    seen_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ads_started ON ads (started, id);
+CREATE INDEX IF NOT EXISTS ads_seen ON ads (seen_at, id);
+CREATE TABLE IF NOT EXISTS ad_data (id INTEGER PRIMARY KEY, data BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS ad_text (id INTEGER PRIMARY KEY, text TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS facets (
+    facet TEXT NOT NULL,
+    value TEXT NOT NULL COLLATE NOCASE,
+    id INTEGER NOT NULL,
+    PRIMARY KEY (facet, value, id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS facets_id ON facets (id, facet, value);
+"""
+
+# Per-connection scratch sets of matching ad ids, filled once per query
+TEMP_SCHEMA = """
+CREATE TEMP TABLE IF NOT EXISTS search_hits (id INTEGER PRIMARY KEY);
+CREATE TEMP TABLE IF NOT EXISTS hits (id INTEGER PRIMARY KEY);
+CREATE TEMP TABLE IF NOT EXISTS facet_hits (id INTEGER PRIMARY KEY);
+"""
+
+# Results of recent queries, reused until the database changes
+QUERY_CACHE_SIZE = 128
+
+FilterValue = Union[str, bool, Iterable[str], None]
+
+
+def is_ad_endpoint(endpoint: str) -> bool:
+    """True for API endpoints whose responses contain ads"""
+    return endpoint in AD_ENDPOINTS or endpoint.startswith("api/ad/")
+
+
+def response_ads(payload: Any) -> List[Dict[str, Any]]:
+    """Ads contained in an API response (a page of ads or a single ad)"""
+    data = payload.get("data", payload) if isinstance(payload, dict) else payload
+    if isinstance(data, dict):
+        data = [data]
+    if not isinstance(data, list):
+        return []
+    return [ad for ad in data if isinstance(ad, dict) and (ad.get("ad_id") or ad.get("id"))]
+
+
+def ad_date(ad: Dict[str, Any]) -> Optional[str]:
+    """Publication day of an ad (YYYY-MM-DD) from ISO strings or epoch seconds/milliseconds"""
+    for field in DATE_FIELDS:
+        value = ad.get(field)
+        if value in (None, ""):
+            continue
+        if isinstance(value, (int, float)):
+            seconds = value / 1000 if value > 1e11 else value
+            try:
+                return datetime.fromtimestamp(seconds, timezone.utc).date().isoformat()
+            except (OverflowError, OSError, ValueError):
+                # Out of range for a date: treat the ad as undated
+                return None
+        return str(value)[:10]
+    return None
+
+
+def _values(value: Any) -> List[str]:
+    if value is None or value == "":
+        return []
+    if isinstance(value, bool):
+        return ["true" if value else "false"]
+    if isinstance(value, (list, tuple, set)):
+        return [v for item in value for v in _values(item)]
+    return [str(value)]
+
+
+def facet_values(ad: Dict[str, Any]) -> Dict[str, List[str]]:
+    """Facet -> values of one ad"""
+    facets = {}
+    for facet, fields in FACET_FIELDS.items():
+        values = [v for field in fields for v in _values(ad.get(field))]
+        if values:
+            facets[facet] = list(dict.fromkeys(values))
+    return facets
+
+
+class AdIndex:
+    """
+    Local, faceted index of every ad fetched through the client.
+
+    Example:
+        index = get_ad_index()
+        index.add(page["data"])
+        result = index.query(niche="beauty", live=True, facets=["publisher_platform"])
+        result["metadata"]["total"], result["facets"]["publisher_platform"]
+    """
+
+    def __init__(self, path: Optional[str] = None, batch_size: Optional[int] = None):
+        """
+        Open (or create) the index.
+
+        Args:
+            path: SQLite database file (default config.AD_INDEX_PATH,
+                or CACHE_DIR/ads.sqlite)
+            batch_size: Most ads written per transaction
+        """
+        self.path = path or config.AD_INDEX_PATH or os.path.join(config.CACHE_DIR, "ads.sqlite")
+        self.batch_size = batch_size or config.AD_INDEX_BATCH_SIZE
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+
+        self._writer = self._connect()
+        self._writer.executescript(SCHEMA)
+        self._reader = self._connect()
+        self._reader.executescript(TEMP_SCHEMA)
+        self._read_lock = threading.Lock()
+        self._results: "OrderedDict[str, Tuple[int, Dict[str, Any]]]" = OrderedDict()
+
+        # Bounded, so a stalled disk slows the fetchers down instead of growing memory
+        self._queue: "queue.Queue[Optional[List[Dict[str, Any]]]]" = queue.Queue(maxsize=256)
+        self._stats_lock = threading.Lock()
+        self.stats: Dict[str, Any] = {"received": 0, "written": 0, "batches": 0, "write_seconds": 0.0, "queries": 0, "cached_queries": 0, "failed_batches": 0}
+        self._closed = False
+        self._thread = threading.Thread(target=self._write_loop, name="ad-index", daemon=True)
+        self._thread.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    # =============================================================================
+    # WRITES
+    # =============================================================================
+
+    def add(self, ads: Iterable[Dict[str, Any]]) -> None:
+        """Queue ads for indexing (returns immediately)"""
+        ads = [ad for ad in ads if isinstance(ad, dict) and (ad.get("ad_id") or ad.get("id"))]
+        if not ads or self._closed:
+            return
+        with self._stats_lock:
+            self.stats["received"] += len(ads)
+        self._queue.put(ads)
+
+    def add_response(self, payload: Any) -> None:
+        """Queue the ads of an API response"""
+        self.add(response_ads(payload))
+
+    def flush(self) -> None:
+        """Wait until every queued ad is written"""
+        if not self._closed:
+            self._queue.join()
+
+    def _write_loop(self) -> None:
+        stop = False
+        while not stop:
+            item = self._queue.get()
+            batch, taken = [], 1
+            stop = item is None
+            # Coalesce whatever else is waiting into the same transaction
+            while item is not None:
+                batch.extend(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                taken += 1
+                stop = item is None
+            try:
+                if batch:
+                    self._write(batch)
+            except Exception:
+                # Indexing is best effort: the ads were already returned to the caller,
+                # and the thread must survive a bad batch or flush() would wait forever
+                with self._stats_lock:
+                    self.stats["failed_batches"] += 1
+            finally:
+                for _ in range(taken):
+                    self._queue.task_done()
+
+    def _write(self, ads: List[Dict[str, Any]]) -> None:
+        start = time.perf_counter()
+        merged: Dict[str, Dict[str, Any]] = {}
+        for ad in ads:
+            ad_id = str(ad.get("ad_id") or ad.get("id"))
+            merged[ad_id] = {**merged.get(ad_id, {}), **ad}
+
+        conn = self._writer
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            ad_ids = list(merged)
+            for offset in range(0, len(ad_ids), 500):
+                chunk = ad_ids[offset:offset + 500]
+                marks = ",".join("?" * len(chunk))
+                rows = conn.execute(
+                    f"SELECT a.ad_id, d.data FROM ads a JOIN ad_data d ON d.id = a.id WHERE a.ad_id IN ({marks})", chunk
+                )
+                for ad_id, data in rows:
+                    # Keep fields the new copy lacks (details over a listing summary)
+                    merged[ad_id] = {**json.loads(zlib.decompress(data)), **merged[ad_id]}
+
+            now = time.time()
+            conn.executemany(
+                "INSERT INTO ads (ad_id, started, seen_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (ad_id) DO UPDATE SET started = excluded.started, seen_at = excluded.seen_at",
+                [(ad_id, ad_date(ad) or "", now) for ad_id, ad in merged.items()]
+            )
+            ids: Dict[str, int] = {}
+            for offset in range(0, len(ad_ids), 500):
+                chunk = ad_ids[offset:offset + 500]
+                marks = ",".join("?" * len(chunk))
+                ids.update(conn.execute(f"SELECT ad_id, id FROM ads WHERE ad_id IN ({marks})", chunk))
+                conn.execute(f"DELETE FROM facets WHERE id IN ({marks})", [ids[a] for a in chunk])
+
+            data_rows, text_rows, facet_rows = [], [], []
+            for ad_id, ad in merged.items():
+                row_id = ids[ad_id]
+                data_rows.append((row_id, zlib.compress(json.dumps(ad, ensure_ascii=False, default=str).encode("utf-8"), 1)))
+                text_rows.append((row_id, " ".join(str(ad[field]) for field in SEARCH_FIELDS if ad.get(field)).lower()))
+                for facet, values in facet_values(ad).items():
+                    facet_rows.extend((facet, value, row_id) for value in values)
+            conn.executemany("INSERT OR REPLACE INTO ad_data (id, data) VALUES (?, ?)", data_rows)
+            conn.executemany("INSERT OR REPLACE INTO ad_text (id, text) VALUES (?, ?)", text_rows)
+            conn.executemany("INSERT OR IGNORE INTO facets (facet, value, id) VALUES (?, ?, ?)", facet_rows)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+        with self._stats_lock:
+            self.stats["written"] += len(merged)
+            self.stats["batches"] += 1
+            self.stats["write_seconds"] += time.perf_counter() - start
+
+    # =============================================================================
+    # QUERIES
+    # =============================================================================
+
+    @staticmethod
+    def _matching(filters: Dict[str, List[str]], start_date: Optional[str], end_date: Optional[str],
+                  search: bool, skip: Optional[str] = None) -> Optional[Tuple[str, List[Any]]]:
+        """SELECT of the ad ids passing every filter but skip (None without filters)"""
+        selects, params = [], []
+        for facet, values in filters.items():
+            if facet == skip:
+                continue
+            selects.append(f"SELECT id FROM facets WHERE facet = ? AND value IN ({','.join('?' * len(values))})")
+            params.extend([facet, *values])
+        if start_date or end_date:
+            selects.append("SELECT id FROM ads WHERE started BETWEEN ? AND ?")
+            params.extend([str(start_date or "0000")[:10], str(end_date or "9999")[:10]])
+        if search:
+            selects.append("SELECT id FROM search_hits")
+        if not selects:
+            return None
+        return " INTERSECT ".join(selects), params
+
+    def _fill(self, table: str, matching: Tuple[str, List[Any]]) -> int:
+        self._reader.execute(f"DELETE FROM {table}")
+        return self._reader.execute(f"INSERT OR IGNORE INTO {table} {matching[0]}", matching[1]).rowcount
+
+    def query(
+        self,
+        brand_id: FilterValue = None,
+        live: Optional[bool] = None,
+        display_format: FilterValue = None,
+        publisher_platform: FilterValue = None,
+        niche: FilterValue = None,
+        market_target: FilterValue = None,
+        language: FilterValue = None,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        search: Optional[str] = None,
+        order: str = "newest",
+        offset: int = 0,
+        limit: int = 10,
+        facets: Optional[Iterable[str]] = None,
+        facet_limit: int = 50
+    ) -> Dict[str, Any]:
+        """
+        Filter the indexed ads, with optional facet counts.
+
+        Filters take the API's names; facet filters also accept a list of
+        values (any of them matches), values match case-insensitively.
+
+        Args:
+            brand_id: Brand ID(s)
+            live: Only live (True) or inactive (False) ads
+            display_format: Ad format(s) (video, image, carousel, ...)
+            publisher_platform: Platform(s) (facebook, instagram, ...)
+            niche: Niche(s)
+            market_target: Target(s) (b2b, b2c)
+            language: Language(s)
+            start_date: First publication day (YYYY-MM-DD)
+            end_date: Last publication day (YYYY-MM-DD)
+            search: Text contained in name, brand, headline, description or transcript
+            order: newest, oldest or recently_seen (last fetched first)
+            offset: Number of results to skip
+            limit: Results returned (0 = only counts)
+            facets: Facets to count (names of FACET_FIELDS, or ["all"])
+            facet_limit: Most values returned per facet, most frequent first
+
+        Returns:
+            {"data": [ads], "metadata": {"count", "total", "offset", "source",
+            "took_ms"}, "facets": {facet: {value: count}}}
+        """
+        if order not in ORDERS:
+            raise ValueError(f"Unknown order '{order}' (use {', '.join(ORDERS)})")
+        facets = list(facets or [])
+        if "all" in facets:
+            facets = list(FACET_FIELDS)
+        unknown = [f for f in facets if f not in FACET_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown facet(s) {', '.join(unknown)} (use {', '.join(FACET_FIELDS)})")
+
+        requested = {
+            "brand_id": brand_id, "live": live, "display_format": display_format,
+            "publisher_platform": publisher_platform, "niche": niche,
+            "market_target": market_target, "language": language,
+        }
+        filters = {facet: _values(value) for facet, value in requested.items() if _values(value)}
+
+        self.flush()
+        start = time.perf_counter()
+        key = json.dumps([filters, start_date, end_date, search, order, offset, limit, facets, facet_limit], default=str)
+        with self._read_lock:
+            conn = self._reader
+            # Changes whenever another connection (our writer included) commits
+            version = conn.execute("PRAGMA data_version").fetchone()[0]
+            cached = self._results.get(key)
+            if cached and cached[0] == version:
+                self._results.move_to_end(key)
+                with self._stats_lock:
+                    self.stats["cached_queries"] += 1
+                result = copy.deepcopy(cached[1])
+                result["metadata"]["took_ms"] = round((time.perf_counter() - start) * 1000, 2)
+                return result
+
+            conn.execute("BEGIN")
+            try:
+                ads = conn.execute("SELECT COUNT(*) FROM ads").fetchone()[0]
+                if search:
+                    # Text is scanned once per query, every count reuses the hits
+                    conn.execute("DELETE FROM search_hits")
+                    conn.execute("INSERT INTO search_hits SELECT id FROM ad_text WHERE instr(text, ?) > 0", (search.lower(),))
+                matching = self._matching(filters, start_date, end_date, bool(search))
+                total = self._fill("hits", matching) if matching else ads
+                source = "ads a JOIN hits h ON h.id = a.id" if matching else "ads a"
+
+                page = [row[0] for row in conn.execute(
+                    f"SELECT a.id FROM {source} ORDER BY {ORDERS[order]} LIMIT ? OFFSET ?",
+                    (max(0, limit), max(0, offset))
+                )] if limit else []
+                blobs = dict(conn.execute(
+                    f"SELECT id, data FROM ad_data WHERE id IN ({','.join('?' * len(page))})", page
+                )) if page else {}
+
+                counts: Dict[str, Dict[str, int]] = {}
+                for facet in facets:
+                    # Disjunctive counts: a facet's own filter does not narrow its counts
+                    hits, size = ("hits", total) if matching else (None, ads)
+                    if facet in filters:
+                        facet_matching = self._matching(filters, start_date, end_date, bool(search), skip=facet)
+                        hits, size = ("facet_hits", self._fill("facet_hits", facet_matching)) if facet_matching else (None, ads)
+                    if hits is None:
+                        source = "facets f"
+                    elif size * 4 < ads:
+                        # Few matches: look each one up instead of scanning the facet
+                        source = f"{hits} h CROSS JOIN facets f ON f.id = h.id"
+                    else:
+                        source = f"facets f JOIN {hits} h ON h.id = f.id"
+                    counts[facet] = dict(conn.execute(
+                        f"SELECT f.value, COUNT(*) FROM {source} WHERE f.facet = ? "
+                        "GROUP BY f.value ORDER BY COUNT(*) DESC, f.value LIMIT ?",
+                        (facet, facet_limit)
+                    ))
+            finally:
+                conn.execute("COMMIT")
+
+        data = [json.loads(zlib.decompress(blobs[row_id])) for row_id in page if row_id in blobs]
+        result = {
+            "data": data,
+            "metadata": {
+                "count": len(data), "total": total, "offset": offset, "source": "local",
+                "took_ms": round((time.perf_counter() - start) * 1000, 2),
+            },
+            "facets": counts,
+        }
+        with self._read_lock:
+            self._results[key] = (version, copy.deepcopy(result))
+            while len(self._results) > QUERY_CACHE_SIZE:
+                self._results.popitem(last=False)
+        with self._stats_lock:
+            self.stats["queries"] += 1
+        return result
+
+    def facet_counts(self, facets: Iterable[str] = ("all",), **filters: Any) -> Dict[str, Dict[str, int]]:
+        """Facet counts only (same filters as query)"""
+        return self.query(facets=facets, limit=0, **filters)["facets"]
+
+    def get(self, ad_id: str) -> Optional[Dict[str, Any]]:
+        """Indexed copy of one ad, or None"""
+        self.flush()
+        with self._read_lock:
+            row = self._reader.execute(
+                "SELECT d.data FROM ads a JOIN ad_data d ON d.id = a.id WHERE a.ad_id = ?", (str(ad_id),)
+            ).fetchone()
+        return json.loads(zlib.decompress(row[0])) if row else None
+
+    def __len__(self) -> int:
+        self.flush()
+        with self._read_lock:
+            return self._reader.execute("SELECT COUNT(*) FROM ads").fetchone()[0]
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Ads indexed, counters and database size (MB)"""
+        try:
+            size = sum(os.path.getsize(self.path + suffix) for suffix in ("", "-wal") if os.path.exists(self.path + suffix))
+        except OSError:
+            size = 0
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats["write_seconds"] = round(stats["write_seconds"], 3)
+        stats["pending"] = self._queue.qsize()
+        with self._read_lock:
+            stats["ads"] = self._reader.execute("SELECT COUNT(*) FROM ads").fetchone()[0]
+        stats["disk_mb"] = round(size / 1024 / 1024, 2)
+        return stats
+
+    def close(self) -> None:
+        """Write the queued ads and close the database"""
+        if self._closed:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._closed = True
+        self._writer.close()
+        with self._read_lock:
+            self._reader.close()
+
+
+_indexes: Dict[str, AdIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_ad_index(path: Optional[str] = None) -> AdIndex:
+    """
+    Get the index of this process for a database file (default
+    config.AD_INDEX_PATH), created on first use and closed at exit.
+    """
+    path = os.path.abspath(path or config.AD_INDEX_PATH or os.path.join(config.CACHE_DIR, "ads.sqlite"))
+    with _indexes_lock:
+        index = _indexes.get(path)
+        if index is None:
+            index = AdIndex(path)
+            _indexes[path] = index
+            atexit.register(index.close)
+        return index
@@ -0,0 +1,253 @@
+"""
+Foreplay API - Long-Range Brand Analytics
+Description: Fetches get_brand_analytics over ranges longer than the 30-day API
+limit by splitting them into windows, fetching the windows concurrently and
+stitching the series back into one continuous time series per brand.
+"""
+
+import contextvars
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional, Dict, Any, List, Iterable
+
+from config import config
+from foreplay_cache import JsonDiskCache
+from foreplay_sharding import DateLike, DateWindow, parse_date
+
+
+# Field names that may carry the date of a point in an analytics series
+POINT_DATE_FIELDS = ("date", "day", "week", "period", "start_date", "timestamp")
+
+# Epoch used to align windows, so the same calendar window is requested (and
+# cached) whatever start_date the caller picks
+WINDOW_EPOCH = date(2020, 1, 1)
+
+
+def _point_date(point: Any) -> Optional[str]:
+    """Return the ISO date of a series point, or None if it has no date"""
+    if not isinstance(point, dict):
+        return None
+    for field in POINT_DATE_FIELDS:
+        value = point.get(field)
+        if value is None:
+            continue
+        if isinstance(value, (int, float)):
+            # Epoch timestamps, in seconds or milliseconds
+            seconds = value / 1000 if value > 1e11 else value
+            return datetime.fromtimestamp(seconds, timezone.utc).date().isoformat()
+        try:
+            return parse_date(str(value)).isoformat()
+        except ValueError:
+            continue
+    return None
+
+
+def aligned_windows(start: date, end: date, window_days: int) -> List[DateWindow]:
+    """
+    Return the epoch-aligned windows covering [start, end].
+
+    Windows may extend before start or after end; points outside the requested
+    range are trimmed after stitching.
+    """
+    offset = (start - WINDOW_EPOCH).days // window_days
+    cursor = WINDOW_EPOCH + timedelta(days=offset * window_days)
+    windows = []
+    while cursor <= end:
+        windows.append(DateWindow(cursor, cursor + timedelta(days=window_days - 1)))
+        cursor += timedelta(days=window_days)
+    return windows
+
+
+class BrandAnalyticsFetcher:
+    """
+    Fetch and stitch brand analytics over arbitrary date ranges.
+
+    Windows that closed more than ANALYTICS_SETTLE_DAYS ago are cached on disk
+    and never requested again, so repeat dashboard loads only fetch the window
+    that is still open.
+
+    Example:
+        fetcher = BrandAnalyticsFetcher(client)
+        trends = fetcher.fetch_many(brand_ids, "2024-01-01", "2024-12-31")
+    """
+
+    def __init__(
+        self,
+        client,
+        max_workers: Optional[int] = None,
+        window_days: Optional[int] = None,
+        cache: Optional[JsonDiskCache] = None
+    ):
+        """
+        Initialize the fetcher.
+
+        Args:
+            client: ForeplayAPIClient instance
+            max_workers: Number of windows fetched concurrently
+            window_days: Window width in days (must fit the 30-day API limit)
+            cache: Cache for closed windows (default: on-disk "analytics" cache)
+        """
+        self.client = client
+        self.max_workers = max_workers or config.ANALYTICS_MAX_WORKERS
+        self.window_days = window_days or config.ANALYTICS_WINDOW_DAYS
+        self.cache = cache if cache is not None else JsonDiskCache("analytics")
+        self.stats: Dict[str, int] = {"fetched": 0, "cached": 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, stat: str) -> None:
+        with self._stats_lock:
+            self.stats[stat] += 1
+
+    def _is_closed(self, window: DateWindow, today: date) -> bool:
+        return window.end < today - timedelta(days=config.ANALYTICS_SETTLE_DAYS)
+
+    def _fetch_window(self, brand_id: str, window: DateWindow, today: date) -> Dict[str, Any]:
+        key = f"{brand_id}:{window.start.isoformat()}:{window.end.isoformat()}"
+        closed = self._is_closed(window, today)
+
+        if closed:
+            cached = self.cache.get(key)
+            if cached is not None:
+                self._count("cached")
+                return cached
+
+        end = min(window.end, today)
+        response = self.client.get_brand_analytics(
+            id=brand_id,
+            start_date=window.start.isoformat(),
+            end_date=end.isoformat(),
+            order="oldest"
+        )
+        self._count("fetched")
+
+        if closed:
+            self.cache.set(key, response)
+        return response
+
+    def fetch_many(
+        self,
+        brand_ids: Iterable[str],
+        start_date: DateLike,
+        end_date: Optional[DateLike] = None,
+        order: str = "oldest"
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Fetch stitched analytics for several brands.
+
+        Args:
+            brand_ids: Brand IDs or Facebook page IDs
+            start_date: First day of the range (YYYY-MM-DD)
+            end_date: Last day of the range (default today)
+            order: Order of the stitched series (newest or oldest)
+
+        Returns:
+            Dictionary mapping each brand id to its stitched analytics
+        """
+        today = datetime.now(timezone.utc).date()
+        start = parse_date(start_date)
+        end = min(parse_date(end_date), today) if end_date else today
+        if end < start:
+            raise ValueError(f"end_date {end} is before start_date {start}")
+
+        windows = aligned_windows(start, end, self.window_days)
+        brand_ids = list(dict.fromkeys(brand_ids))
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {
+                (brand_id, window): executor.submit(contextvars.copy_context().run, self._fetch_window, brand_id, window, today)
+                for brand_id in brand_ids
+                for window in windows
+            }
+            responses = {key: future.result() for key, future in futures.items()}
+
+        return {
+            brand_id: stitch_analytics(
+                brand_id,
+                [(window, responses[(brand_id, window)]) for window in windows],
+                start,
+                end,
+                order
+            )
+            for brand_id in brand_ids
+        }
+
+    def fetch(
+        self,
+        brand_id: str,
+        start_date: DateLike,
+        end_date: Optional[DateLike] = None,
+        order: str = "oldest"
+    ) -> Dict[str, Any]:
+        """Fetch stitched analytics for a single brand (see fetch_many)"""
+        return self.fetch_many([brand_id], start_date, end_date, order)[brand_id]
+
+
+def stitch_analytics(
+    brand_id: str,
+    window_responses: List[tuple],
+    start: date,
+    end: date,
+    order: str = "oldest"
+) -> Dict[str, Any]:
+    """
+    Stitch per-window analytics responses into one continuous series per key.
+
+    Every list of dated points found in the response data (running ads
+    distribution, creative velocity, ...) is concatenated across windows,
+    deduplicated by date (later windows win), trimmed to [start, end] and
+    sorted. Points without a date are kept once each (every window repeats
+    them). Non-series values are kept per window under "windows".
+
+    Args:
+        brand_id: Brand the responses belong to
+        window_responses: List of (DateWindow, response) tuples
+        start: First day to keep
+        end: Last day to keep
+        order: "newest" for descending series, anything else for ascending
+
+    Returns:
+        Dictionary with "id", "start_date", "end_date", "series" and "windows"
+    """
+    series: Dict[str, Dict[str, Any]] = {}
+    undated: Dict[str, Dict[str, Any]] = {}
+    windows = []
+    first, last = start.isoformat(), end.isoformat()
+
+    for window, response in sorted(window_responses, key=lambda item: item[0].start):
+        data = response.get('data', response) if isinstance(response, dict) else {}
+        extras = {}
+
+        for name, value in (data.items() if isinstance(data, dict) else []):
+            if not isinstance(value, list):
+                extras[name] = value
+                continue
+            for point in value:
+                day = _point_date(point)
+                if day is None:
+                    key = json.dumps(point, sort_keys=True, default=str)
+                    undated.setdefault(name, {}).setdefault(key, point)
+                elif first <= day <= last:
+                    series.setdefault(name, {})[day] = point
+
+        windows.append({
+            "start_date": window.start.isoformat(),
+            "end_date": window.end.isoformat(),
+            **extras
+        })
+
+    stitched = {
+        name: [points[day] for day in sorted(points, reverse=(order == "newest"))]
+        for name, points in series.items()
+    }
+    for name, points in undated.items():
+        stitched.setdefault(name, list(points.values()))
+
+    return {
+        "id": brand_id,
+        "start_date": first,
+        "end_date": last,
+        "series": stitched,
+        "windows": windows
+    }
@@ -0,0 +1,543 @@
+"""
+Foreplay API - Export Artifact Cache
+Description: Builds each export of an extraction (CSV, JSON, Excel) once and
+serves the stored file afterwards.
+
+The export buttons of the GUI used to rebuild their DataFrame, CSV text or
+workbook from scratch on every click. Artifacts are now keyed by board ID,
+snapshot version (the content digest of the stored result set, see
+ResultHandle.version) and format, and stored under
+config.CACHE_DIR/exports/<board>/<version>/. The GUI starts every format in
+the background as soon as an extraction is stored (prebuild); a click then
+returns the finished file, or waits for the build already running instead of
+starting a second one. Two sessions extracting the same board with the same
+ads share the same files, each downloading them under the name of its own
+extraction (board and time). Builds run in the export worker pool
+(foreplay_exportpool): in separate processes, reading the ads from the
+ResultStore directory, with downloads someone is waiting for ahead of
+prebuilds. A build whose directory is deleted while it waits (the session
+extracted again) restarts from the copy of another request waiting for the
+same snapshot.
+
+Every artifact has a small sidecar (<format>.info: row counts and a
+preview), written last, so a file is only served once it is complete.
+Artifacts unused for config.EXPORT_MAX_AGE_HOURS are removed, and the
+directory is kept under config.EXPORT_CACHE_MB by evicting the least
+recently downloaded ones.
+"""
+
+import importlib.util
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from dataclasses import dataclass, replace
+from datetime import datetime
+from typing import Optional, Dict, Any, List, Iterable
+
+from config import config
+from foreplay_exportpool import ExportWorkerPool, RANKS
+from foreplay_export import (
+    create_quick_dataframe,
+    create_csv_dataframe,
+    create_timestamped_dataframe,
+    create_normalized_dataframes,
+    dataframe_to_csv,
+    create_json_export,
+    write_excel,
+)
+from foreplay_scheduler import INTERACTIVE, PREFETCH
+
+# Checked without importing (pyarrow is slow to import and only needed by the workers)
+PARQUET_AVAILABLE = bool(importlib.util.find_spec("pyarrow") or importlib.util.find_spec("fastparquet"))
+
+
+INFO_SUFFIX = ".info"
+PREVIEW_ROWS = 20
+
+
+def _dataframe_info(df, preview_rows: int = PREVIEW_ROWS) -> Dict[str, Any]:
+    return {
+        "rows": len(df),
+        "columns": len(df.columns),
+        "preview": json.loads(df.head(preview_rows).to_json(orient="records", force_ascii=False)),
+    }
+
+
+def _build_quick_csv(ads, path: str) -> Dict[str, Any]:
+    df = create_quick_dataframe(ads)
+    dataframe_to_csv(df, path)
+    info = _dataframe_info(df, 3)
+    info["chars"] = int(df["full_transcription"].fillna("").astype(str).str.len().sum()) if len(df) else 0
+    return info
+
+
+def _build_csv(ads, path: str) -> Dict[str, Any]:
+    df = create_csv_dataframe(ads)
+    dataframe_to_csv(df, path)
+    return _dataframe_info(df, 5)
+
+
+def _build_timestamped_csv(ads, path: str) -> Dict[str, Any]:
+    df = create_timestamped_dataframe(ads)
+    dataframe_to_csv(df, path)
+    return _dataframe_info(df)
+
+
+def _build_normalized_ads(ads, path: str) -> Dict[str, Any]:
+    df_ads, df_transcripts = create_normalized_dataframes(ads)
+    dataframe_to_csv(df_ads, path)
+    return {**_dataframe_info(df_ads, 5), "unique_transcripts": len(df_transcripts)}
+
+
+def _build_normalized_transcripts(ads, path: str) -> Dict[str, Any]:
+    df_ads, df_transcripts = create_normalized_dataframes(ads)
+    dataframe_to_csv(df_transcripts, path)
+    return {**_dataframe_info(df_transcripts, 5), "ads": len(df_ads)}
+
+
+def _build_parquet(ads, path: str) -> Dict[str, Any]:
+    df = create_csv_dataframe(ads)
+    df.to_parquet(path, index=False)
+    return {"rows": len(df), "columns": len(df.columns)}
+
+
+def _build_json(ads, path: str) -> Dict[str, Any]:
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(create_json_export(ads))
+    return {"rows": len(ads)}
+
+
+def _build_excel(ads, path: str) -> Dict[str, Any]:
+    write_excel(ads, path)
+    return {"rows": len(ads), "sheets": ["Transcript Completi", "Timestamp Dettagliati"]}
+
+
+# format -> extension, MIME type, download name ({board}, {timestamp}), builder
+# (run in a worker process) and passes of the builder over the ads (progress)
+FORMATS: Dict[str, Dict[str, Any]] = {
+    "quick_csv": {
+        "extension": "csv", "mime": "text/csv",
+        "file_name": "transcripts_{board}_{timestamp}.csv", "build": _build_quick_csv, "passes": 1,
+    },
+    "csv": {
+        "extension": "csv", "mime": "text/csv",
+        "file_name": "board_{board}_transcripts_{timestamp}.csv", "build": _build_csv, "passes": 1,
+    },
+    "timestamped_csv": {
+        "extension": "csv", "mime": "text/csv",
+        "file_name": "board_{board}_timestamped_{timestamp}.csv", "build": _build_timestamped_csv, "passes": 1,
+    },
+    "normalized_ads": {
+        "extension": "csv", "mime": "text/csv",
+        "file_name": "board_{board}_ads_{timestamp}.csv", "build": _build_normalized_ads, "passes": 1,
+    },
+    "normalized_transcripts": {
+        "extension": "csv", "mime": "text/csv",
+        "file_name": "board_{board}_unique_transcripts_{timestamp}.csv", "build": _build_normalized_transcripts, "passes": 1,
+    },
+    "json": {
+        "extension": "json", "mime": "application/json",
+        "file_name": "board_{board}_complete_{timestamp}.json", "build": _build_json, "passes": 1,
+    },
+    "excel": {
+        "extension": "xlsx", "mime": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        "file_name": "board_{board}_transcripts_{timestamp}.xlsx", "build": _build_excel, "passes": 2,
+    },
+    "parquet": {
+        "extension": "parquet", "mime": "application/vnd.apache.parquet",
+        "file_name": "board_{board}_transcripts_{timestamp}.parquet", "build": _build_parquet, "passes": 1,
+    },
+}
+
+
+def available_formats() -> List[str]:
+    """Formats whose dependencies are installed (Parquet needs pyarrow or fastparquet)"""
+    return [fmt for fmt in FORMATS if fmt != "parquet" or PARQUET_AVAILABLE]
+
+
+def _safe(value: str) -> str:
+    return "".join(c for c in str(value) if c.isalnum() or c in "-_") or "unknown"
+
+
+def _file_name(handle, fmt: str) -> str:
+    """Download name of an artifact for the session asking for it (its board and extraction time)"""
+    created_at = handle.meta.get("created_at") or time.time()
+    return FORMATS[fmt]["file_name"].format(
+        board=handle.meta.get("board_id") or "unknown",
+        timestamp=datetime.fromtimestamp(created_at).strftime("%Y%m%d_%H%M%S")
+    )
+
+
+@dataclass(frozen=True)
+class ExportArtifact:
+    """A finished export file and what the GUI shows about it"""
+
+    format: str
+    path: str
+    file_name: str
+    mime: str
+    info: Dict[str, Any]
+
+    @property
+    def size_bytes(self) -> int:
+        return os.path.getsize(self.path)
+
+    def read(self) -> bytes:
+        """Content of the file (for st.download_button)"""
+        with open(self.path, "rb") as f:
+            return f.read()
+
+
+class ExportArtifactCache:
+    """
+    Build-once, LRU-bounded store of export files per board snapshot.
+
+    Example:
+        artifacts = ExportArtifactCache()
+        artifacts.prebuild(handle)                       # right after the extraction
+        artifact = artifacts.build(handle, "excel")      # instant once prebuilt
+        st.download_button("Excel", artifact.read(), file_name=artifact.file_name, mime=artifact.mime)
+    """
+
+    def __init__(
+        self,
+        cache_dir: Optional[str] = None,
+        max_mb: Optional[float] = None,
+        max_age_hours: Optional[float] = None,
+        pool: Optional[ExportWorkerPool] = None
+    ):
+        """
+        Initialize the cache.
+
+        Args:
+            cache_dir: Directory of the artifacts (default config.CACHE_DIR/exports)
+            max_mb: Disk budget; least recently used artifacts are evicted above it
+            max_age_hours: Artifacts unused for longer are removed
+            pool: Worker pool running the builds (default: a new one with
+                config.EXPORT_MAX_WORKERS workers)
+        """
+        self.directory = cache_dir or os.path.join(config.CACHE_DIR, "exports")
+        self.max_bytes = int((max_mb if max_mb is not None else config.EXPORT_CACHE_MB) * 1024 * 1024)
+        self.max_age_seconds = (max_age_hours if max_age_hours is not None else config.EXPORT_MAX_AGE_HOURS) * 3600
+        os.makedirs(self.directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self.pool = pool or ExportWorkerPool()
+        self._in_flight: Dict[str, Future] = {}
+        # artifact path -> [(handle, request_class)] of every request waiting for the build
+        self._waiting: Dict[str, list] = {}
+        # artifact path -> (bytes incl. sidecar, last used)
+        self._index: Dict[str, list] = {}
+        self._total = 0
+        self.stats: Dict[str, int] = {"hits": 0, "builds": 0, "deduplicated": 0, "failures": 0, "evicted": 0, "rebuilt": 0}
+        self._load_index()
+
+    # =============================================================================
+    # STORAGE
+    # =============================================================================
+
+    def _load_index(self) -> None:
+        for directory, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(INFO_SUFFIX):
+                    continue
+                info_path = os.path.join(directory, name)
+                try:
+                    with open(info_path, "r", encoding="utf-8") as f:
+                        path = os.path.join(directory, json.load(f)["name"])
+                    size = os.path.getsize(path) + os.path.getsize(info_path)
+                    last_used = os.path.getmtime(info_path)
+                except (OSError, ValueError, KeyError):
+                    continue
+                self._index[path] = [size, last_used]
+                self._total += size
+        self.cleanup()
+
+    def _path(self, board_id: str, version: str, fmt: str) -> str:
+        name = f"{fmt}.{FORMATS[fmt]['extension']}"
+        return os.path.join(self.directory, _safe(board_id), _safe(version), name)
+
+    def _load(self, path: str, fmt: str, file_name: str) -> Optional[ExportArtifact]:
+        try:
+            with open(path + INFO_SUFFIX, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not os.path.exists(path):
+            return None
+        return ExportArtifact(fmt, path, file_name, FORMATS[fmt]["mime"], meta["info"])
+
+    def _touch(self, path: str) -> None:
+        # Last use is kept in the sidecar's mtime, so LRU order survives restarts
+        now = time.time()
+        with self._lock:
+            entry = self._index.get(path)
+            if entry is None:
+                return
+            stale = now - entry[1] > 60
+            entry[1] = now
+        if stale:
+            try:
+                os.utime(path + INFO_SUFFIX, (now, now))
+            except OSError:
+                pass
+
+    def _remove(self, paths: Iterable[str]) -> None:
+        for path in paths:
+            for name in (path + INFO_SUFFIX, path):
+                try:
+                    os.remove(name)
+                except OSError:
+                    pass
+            # Drop the version and board directories once empty
+            for directory in (os.path.dirname(path), os.path.dirname(os.path.dirname(path))):
+                try:
+                    os.rmdir(directory)
+                except OSError:
+                    break
+
+    def _evict(self) -> None:
+        with self._lock:
+            if self._total <= self.max_bytes:
+                return
+            victims = []
+            for path, (size, _) in sorted(self._index.items(), key=lambda item: item[1][1]):
+                if self._total <= self.max_bytes * 0.9:
+                    break
+                victims.append(path)
+                self._total -= size
+                del self._index[path]
+            self.stats["evicted"] += len(victims)
+        self._remove(victims)
+
+    def cleanup(self) -> int:
+        """
+        Remove artifacts unused for max_age_hours, then evict down to the size budget.
+
+        Returns:
+            Number of artifacts removed for age
+        """
+        cutoff = time.time() - self.max_age_seconds
+        with self._lock:
+            victims = [path for path, (_, last_used) in self._index.items() if last_used < cutoff]
+            for path in victims:
+                self._total -= self._index.pop(path)[0]
+            self.stats["evicted"] += len(victims)
+        self._remove(victims)
+        self._evict()
+        return len(victims)
+
+    # =============================================================================
+    # BUILDING
+    # =============================================================================
+
+    def _store(self, handle, fmt: str, path: str, tmp_path: str, built: Future) -> ExportArtifact:
+        spec = FORMATS[fmt]
+        try:
+            info = built.result()
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+        # The download name is not stored: sessions sharing this snapshot each get their own
+        meta = {"name": os.path.basename(path), "built_at": time.time(), "info": info}
+        directory = os.path.dirname(path)
+        tmp_info = os.path.join(directory, f".{uuid.uuid4().hex}{INFO_SUFFIX}")
+        with open(tmp_info, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, default=str)
+        os.replace(tmp_info, path + INFO_SUFFIX)
+
+        size = os.path.getsize(path) + os.path.getsize(path + INFO_SUFFIX)
+        with self._lock:
+            previous = self._index.get(path)
+            if previous:
+                self._total -= previous[0]
+            self._index[path] = [size, time.time()]
+            self._total += size
+            self.stats["builds"] += 1
+        self._evict()
+        return ExportArtifact(fmt, path, _file_name(handle, fmt), spec["mime"], info)
+
+    def _start(self, handle, fmt: str, path: str, request_class: str) -> None:
+        spec = FORMATS[fmt]
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # Same extension as the final file (openpyxl and pandas look at it)
+        tmp_path = os.path.join(directory, f".{uuid.uuid4().hex}.{spec['extension']}")
+        built = self.pool.submit(path, spec["build"], handle.directory, tmp_path, spec["passes"], request_class)
+        built.add_done_callback(lambda f: self._on_built(handle, fmt, path, tmp_path, f))
+
+    def _restart(self, handle, fmt: str, path: str) -> bool:
+        """
+        Rebuild from another copy of the snapshot when the build's own copy is gone.
+
+        The job reads the ResultStore directory of the request that started
+        it; a new extraction of that session (or its release) deletes the
+        directory while the job may still be queued. Any other request
+        waiting for the same snapshot has a copy with the same content.
+        """
+        if os.path.isdir(handle.directory):
+            return False
+        with self._lock:
+            waiting = self._waiting.get(path, [])
+            live = [(h, c) for h, c in waiting if os.path.isdir(h.directory)]
+        if not live:
+            return False
+        request_class = min((c for _, c in live), key=RANKS.__getitem__)
+        try:
+            self._start(live[-1][0], fmt, path, request_class)
+        except RuntimeError:
+            return False
+        with self._lock:
+            self.stats["rebuilt"] += 1
+        return True
+
+    def _on_built(self, handle, fmt: str, path: str, tmp_path: str, built: Future) -> None:
+        # Stored before leaving _in_flight, so no request in between starts a second build
+        try:
+            artifact, error = self._store(handle, fmt, path, tmp_path, built), None
+        except BaseException as e:
+            artifact, error = None, e
+            if self._restart(handle, fmt, path):
+                return
+        with self._lock:
+            future = self._in_flight.pop(path)
+            self._waiting.pop(path, None)
+            if error is not None:
+                self.stats["failures"] += 1
+        if error is None:
+            future.set_result(artifact)
+        else:
+            future.set_exception(error)
+
+    @staticmethod
+    def _named(handle, fmt: str, shared: Future) -> Future:
+        """Future of a build started by another request, resolving to an artifact named for this handle"""
+        named: Future = Future()
+
+        def done(f: Future) -> None:
+            error = f.exception()
+            if error is not None:
+                named.set_exception(error)
+            else:
+                named.set_result(replace(f.result(), file_name=_file_name(handle, fmt)))
+
+        shared.add_done_callback(done)
+        return named
+
+    def get(self, handle, fmt: str) -> Optional[ExportArtifact]:
+        """Finished artifact of the result set in a format, or None (never builds)"""
+        path = self._path(handle.meta.get("board_id") or "unknown", handle.version, fmt)
+        with self._lock:
+            known = path in self._index
+        artifact = self._load(path, fmt, _file_name(handle, fmt)) if known else None
+        if artifact is not None:
+            self._touch(path)
+        return artifact
+
+    def submit(self, handle, fmt: str, request_class: str = INTERACTIVE) -> Future:
+        """
+        Start building an artifact unless it is stored or already being built.
+
+        Args:
+            handle: ResultHandle of the extraction (its board_id and version
+                form the key)
+            fmt: One of FORMATS
+            request_class: INTERACTIVE when someone waits for the file,
+                PREFETCH for prebuilds (an interactive request promotes a
+                queued prebuild)
+
+        Returns:
+            Future resolving to the ExportArtifact
+        """
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown export format: {fmt} (expected one of {', '.join(FORMATS)})")
+        artifact = self.get(handle, fmt)
+        if artifact is not None:
+            with self._lock:
+                self.stats["hits"] += 1
+            done: Future = Future()
+            done.set_result(artifact)
+            return done
+
+        path = self._path(handle.meta.get("board_id") or "unknown", handle.version, fmt)
+        with self._lock:
+            future = self._in_flight.get(path)
+            queued = future is not None
+            if queued:
+                self.stats["deduplicated"] += 1
+            else:
+                future = self._in_flight[path] = Future()
+            self._waiting.setdefault(path, []).append((handle, request_class))
+        if queued:
+            # Someone now waits for a prebuild still in the queue: move it up
+            self.pool.promote(path, request_class)
+            return self._named(handle, fmt, future)
+
+        try:
+            self._start(handle, fmt, path, request_class)
+        except RuntimeError as e:
+            with self._lock:
+                self._in_flight.pop(path, None)
+                self._waiting.pop(path, None)
+            future.set_exception(e)
+            return future
+        # Named for this handle: a rebuild may come from another request's copy
+        return self._named(handle, fmt, future)
+
+    def build(self, handle, fmt: str) -> ExportArtifact:
+        """Artifact of the result set in a format, built now if needed (waits for it)"""
+        return self.submit(handle, fmt).result()
+
+    def progress(self, handle, fmt: str) -> Optional[Dict[str, Any]]:
+        """
+        Where an artifact stands: {"state": "done"}, the worker pool's
+        "queued" (position) / "running" (fraction) status, or None when it
+        is neither stored nor being built.
+        """
+        path = self._path(handle.meta.get("board_id") or "unknown", handle.version, fmt)
+        with self._lock:
+            if path in self._index:
+                return {"state": "done"}
+            building = path in self._in_flight
+        status = self.pool.progress(path) if building else None
+        if building and status is None:
+            # Built, the file is being moved into place
+            return {"state": "running", "done": len(handle), "total": len(handle), "fraction": 1.0}
+        return status
+
+    def prebuild(self, handle, formats: Optional[Iterable[str]] = None) -> List[Future]:
+        """
+        Queue every format of a new result set in the background.
+
+        Args:
+            handle: ResultHandle of the extraction
+            formats: Formats to build (default: available_formats())
+
+        Returns:
+            Futures of the queued artifacts
+        """
+        self.cleanup()
+        return [self.submit(handle, fmt, PREFETCH) for fmt in (formats or available_formats())]
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Counters, artifacts and disk usage (MB) of the cache"""
+        with self._lock:
+            return {
+                **self.stats,
+                "artifacts": len(self._index),
+                "building": len(self._in_flight),
+                "disk_mb": round(self._total / 1024 / 1024, 2),
+                "max_mb": round(self.max_bytes / 1024 / 1024, 2),
+                "pool": self.pool.snapshot(),
+            }
+
+    def close(self) -> None:
+        self.pool.close()
@@ -0,0 +1,181 @@
+"""
+Foreplay API - Brand ID Batching
+Description: Packs many brand ids into comma-separated get_ads_by_brand_id
+requests, paginates the combined stream and demultiplexes the ads back into
+one result set per brand.
+
+Every batch follows one offset chain, capped at max_pages pages. A batch
+that reaches the cap is split in two, down to single brands, so a busy brand
+cannot silently crowd the brands after it out of the combined stream. The
+pages already read are not requested again: filtering the stream down to half
+of its brands keeps their order, so each half starts with its ads already
+read and resumes at that offset. A single brand that still reaches the cap is
+logged and listed in BrandBatchFetcher.capped.
+"""
+
+import contextvars
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, List, Iterable
+
+from config import config
+from foreplay_extraction import call_with_retries
+from foreplay_sharding import ad_key
+
+
+logger = logging.getLogger(__name__)
+
+def pack_ids(ids: Iterable[str], batch_size: int) -> List[List[str]]:
+    """
+    Split ids into batches of at most batch_size, dropping blanks and duplicates.
+
+    Args:
+        ids: Brand ids, in the order they should be requested
+        batch_size: Maximum number of ids per request
+
+    Returns:
+        List of id batches
+    """
+    if batch_size < 1:
+        raise ValueError("batch_size must be at least 1")
+    unique = list(dict.fromkeys(str(i).strip() for i in ids if i and str(i).strip()))
+    return [unique[i:i + batch_size] for i in range(0, len(unique), batch_size)]
+
+
+class BrandBatchFetcher:
+    """
+    Fetch ads for many brands with as few get_ads_by_brand_id calls as allowed.
+
+    Brand ids are packed BRAND_IDS_PER_REQUEST at a time into one comma-separated
+    brand_id parameter; every batch is paginated with offset and batches run
+    concurrently. Each returned ad is routed back to its brand via brand_id.
+
+    Example:
+        fetcher = BrandBatchFetcher(client)
+        ads_by_brand = fetcher.fetch(brand_ids, live=True, display_format="video")
+    """
+
+    def __init__(
+        self,
+        client,
+        batch_size: Optional[int] = None,
+        max_workers: Optional[int] = None,
+        page_limit: Optional[int] = None,
+        max_pages: Optional[int] = None,
+        retries: int = 0
+    ):
+        """
+        Initialize the fetcher.
+
+        Args:
+            client: ForeplayAPIClient instance
+            batch_size: Maximum brand ids packed into one request
+            max_workers: Number of batches paginated concurrently
+            page_limit: Results per page requested from the API
+            max_pages: Safety cap on the offset chain of one batch (batches
+                reaching it are split)
+            retries: Retries of a failed page (see call_with_retries)
+        """
+        self.client = client
+        self.batch_size = batch_size or config.BRAND_IDS_PER_REQUEST
+        self.max_workers = max_workers or config.BRAND_BATCH_MAX_WORKERS
+        self.page_limit = page_limit or config.SCAN_PAGE_LIMIT
+        self.max_pages = max_pages or config.SCAN_MAX_PAGES_PER_WINDOW
+        self.retries = retries
+        self.stats: Dict[str, int] = {}
+        self.capped: List[str] = []
+        self._stats_lock = threading.Lock()
+
+    def _count(self, stat: str, amount: int = 1) -> None:
+        with self._stats_lock:
+            self.stats[stat] = self.stats.get(stat, 0) + amount
+
+    def _fetch_batch(
+        self,
+        batch: List[str],
+        filters: Dict[str, Any],
+        known: Optional[List[Dict[str, Any]]] = None
+    ) -> List[Dict[str, Any]]:
+        # known: the first ads of this batch's stream, read by the batch it was split from
+        ads: List[Dict[str, Any]] = list(known or [])
+        for _ in range(self.max_pages):
+            offset = len(ads)
+            response = call_with_retries(
+                lambda: self.client.get_ads_by_brand_id(
+                    brand_id=",".join(batch),
+                    offset=offset,
+                    limit=self.page_limit,
+                    **filters
+                ),
+                self.retries
+            )
+            self._count("requests")
+            data = response.get('data') or []
+            ads.extend(data)
+            if len(data) < self.page_limit:
+                return ads
+
+        # The combined stream goes on past the cap: brands late in it would come back incomplete
+        if len(batch) > 1:
+            middle = len(batch) // 2
+            self._count("splits")
+            logger.info(
+                "Batch of %d brands reached %d pages; continuing it in two halves", len(batch), self.max_pages
+            )
+            halves = []
+            for half in (batch[:middle], batch[middle:]):
+                members = set(half)
+                read = [ad for ad in ads if str(ad.get('brand_id') or '') in members]
+                self._count("reused_ads", len(read))
+                halves.extend(self._fetch_batch(half, filters, read))
+            return halves
+
+        self._count("capped")
+        with self._stats_lock:
+            self.capped.append(batch[0])
+        logger.warning(
+            "Brand %s has more than %d ads: results stop at the page cap", batch[0], len(ads)
+        )
+        return ads
+
+    def fetch(self, brand_ids: Iterable[str], **filters: Any) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Fetch ads for every brand id.
+
+        Args:
+            brand_ids: Brand ids to fetch
+            **filters: Any other get_ads_by_brand_id filter (live, order, ...)
+
+        Returns:
+            Dictionary mapping each requested brand id to its ads (brands
+            without ads map to an empty list; brands cut at the page cap are
+            listed in self.capped)
+        """
+        batches = pack_ids(brand_ids, self.batch_size)
+        self.stats = {"batches": len(batches), "requests": 0, "unmatched": 0, "splits": 0, "reused_ads": 0, "capped": 0}
+        self.capped = []
+        results: Dict[str, List[Dict[str, Any]]] = {
+            brand_id: [] for batch in batches for brand_id in batch
+        }
+        seen: Dict[str, set] = {brand_id: set() for brand_id in results}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            # Workers run in copies of this context (priority class, active profiler)
+            futures = [executor.submit(contextvars.copy_context().run, self._fetch_batch, b, filters) for b in batches]
+            batch_ads = [future.result() for future in futures]
+
+        for ads in batch_ads:
+            for ad in ads:
+                brand_id = str(ad.get('brand_id') or '')
+                if brand_id not in results:
+                    self._count("unmatched")
+                    continue
+                key = ad_key(ad)
+                if key is not None:
+                    if key in seen[brand_id]:
+                        continue
+                    seen[brand_id].add(key)
+                results[brand_id].append(ad)
+
+        return results
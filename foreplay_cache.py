@@ -0,0 +1,77 @@
+"""
+Foreplay API - Disk Cache
+Description: Small JSON-on-disk key/value cache shared by the fetchers that
+need to keep API responses between runs.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+from typing import Optional, Any
+
+from config import config
+
+
+class JsonDiskCache:
+    """
+    Key/value cache storing one JSON file per entry.
+
+    Writes are atomic (temp file + rename), so concurrent workers and crashed
+    processes never leave half-written entries behind.
+    """
+
+    def __init__(self, namespace: str, cache_dir: Optional[str] = None, ttl: Optional[float] = None):
+        """
+        Initialize the cache.
+
+        Args:
+            namespace: Sub-directory separating unrelated caches
+            cache_dir: Root cache directory (default config.CACHE_DIR)
+            ttl: Seconds after which entries expire (None = never)
+        """
+        self.directory = os.path.join(cache_dir or config.CACHE_DIR, namespace)
+        self.ttl = ttl
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{digest}.json")
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Return the cached value for key, or default if missing or expired"""
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return default
+
+        if self.ttl is not None and time.time() - entry.get("stored_at", 0) > self.ttl:
+            return default
+        return entry.get("value", default)
+
+    def set(self, key: str, value: Any) -> None:
+        """Store a JSON-serializable value under key"""
+        entry = {"key": key, "stored_at": time.time(), "value": value}
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def delete(self, key: str) -> None:
+        """Remove key from the cache if present"""
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def __contains__(self, key: str) -> bool:
+        marker = object()
+        return self.get(key, marker) is not marker
@@ -0,0 +1,293 @@
+"""
+Foreplay API - Extraction Checkpoints
+Description: Durable journals that let a long extraction survive crashes and
+redeploys. Every listed page and every fetched ad detail is appended to a
+JSON-lines journal as soon as it arrives; a resumed run replays the journal
+and only calls the API for work that is not in it yet, so finished pages and
+ads never cost credits twice. Ads whose detail call still failed are recorded
+too and retried on the next resume.
+
+Layout of a job directory (config.CHECKPOINT_DIR/<job_id>):
+    job.json               parameters of the run (to resume it as it was)
+    done.jsonl             one record per finished target, with its summary
+    targets/<name>.jsonl   pages, listings, ad details and failures of one
+                           target (board, brand or discovery search)
+
+Each target has its own journal, so a resumed multi-board job only holds the
+target in progress in memory.
+
+A job is run by one process at a time: lock_job() takes <job_id>.lock next
+to the job directory, and a second GUI session or CLI resume of the same
+job gets JobBusy instead of appending to the same journals.
+"""
+
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+from typing import Optional, Dict, Any, List
+
+from config import config
+from foreplay_locks import FileLock
+
+
+JOB_FILE = "job.json"
+DONE_FILE = "done.jsonl"
+
+
+class JobBusy(RuntimeError):
+    """Raised when another process or session is running the job"""
+
+
+def _safe_name(name: str) -> str:
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in str(name)) or "default"
+
+
+def read_journal(path: str) -> List[Dict[str, Any]]:
+    """
+    Read the records of a journal file.
+
+    A process killed mid-write can leave a torn last line; it is dropped and
+    cut from the file so the next append starts on a clean line.
+    """
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return []
+
+    records, good_end = [], 0
+    lines = data.split(b"\n")
+    # The last element follows the final newline: empty, or a torn write
+    for line in lines[:-1]:
+        if line.strip():
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                break
+        good_end += len(line) + 1
+
+    if good_end < len(data):
+        with open(path, "r+b") as f:
+            f.truncate(good_end)
+    return records
+
+
+class JournalFile:
+    """Append-only JSON-lines file, flushed on every record and fsynced at most every sync_interval"""
+
+    def __init__(self, path: str, sync_interval: float):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.sync_interval = sync_interval
+        self._file = open(path, "ab")
+        self._synced = time.monotonic()
+        self._lock = threading.Lock()
+
+    def append(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+        with self._lock:
+            self._file.write(line)
+            # flush() alone survives a killed process; fsync() also survives a host crash
+            self._file.flush()
+            if time.monotonic() - self._synced >= self.sync_interval:
+                os.fsync(self._file.fileno())
+                self._synced = time.monotonic()
+
+    def close(self) -> None:
+        with self._lock:
+            if not self._file.closed:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+
+
+class TargetJournal:
+    """
+    Checkpoint of one extraction target (a board, a brand, a search).
+
+    Example:
+        journal = job.target("board_abc")
+        ads = list_board_ads(client, "abc", journal=journal)          # pages replayed
+        ads = fetch_ad_details(client, ads, journal=journal)          # only missing ads fetched
+    """
+
+    def __init__(self, path: str, sync_interval: Optional[float] = None):
+        self.path = path
+        self.pages: Dict[int, List[Dict[str, Any]]] = {}
+        self.listing: Optional[List[Dict[str, Any]]] = None
+        self.details: Dict[str, Dict[str, Any]] = {}
+        self.failed: Dict[str, Dict[str, Any]] = {}
+
+        for record in read_journal(path):
+            kind = record.get("t")
+            if kind == "page":
+                self.pages[record["offset"]] = record["ads"]
+            elif kind == "listing":
+                self.listing = record["ads"]
+            elif kind == "ad":
+                self.details[record["id"]] = record["ad"]
+                self.failed.pop(record["id"], None)
+            elif kind == "failed":
+                self.failed[record["id"]] = {"error": record["error"], "attempts": record["attempts"]}
+
+        if sync_interval is None:
+            sync_interval = config.CHECKPOINT_SYNC_SECONDS
+        self._file = JournalFile(path, sync_interval)
+        self._lock = threading.Lock()
+
+    def page(self, offset: int) -> Optional[List[Dict[str, Any]]]:
+        """Ads of the page listed at offset in an earlier run, or None"""
+        return self.pages.get(offset)
+
+    def record_page(self, offset: int, ads: List[Dict[str, Any]]) -> None:
+        self.pages[offset] = ads
+        self._file.append({"t": "page", "offset": offset, "ads": ads})
+
+    def record_listing(self, ads: List[Dict[str, Any]]) -> None:
+        """Record a complete listing (scans that cannot be split into pages)"""
+        self.listing = ads
+        self._file.append({"t": "listing", "ads": ads})
+
+    def record_ad(self, ad_id: str, details: Dict[str, Any]) -> None:
+        with self._lock:
+            self.details[str(ad_id)] = details
+            self.failed.pop(str(ad_id), None)
+        self._file.append({"t": "ad", "id": str(ad_id), "ad": details})
+
+    def record_failure(self, ad_id: str, error: Exception, attempts: int) -> None:
+        with self._lock:
+            previous = self.failed.get(str(ad_id), {}).get("attempts", 0)
+            self.failed[str(ad_id)] = {"error": str(error), "attempts": previous + attempts}
+        self._file.append({"t": "failed", "id": str(ad_id), "error": str(error), "attempts": previous + attempts})
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self) -> "TargetJournal":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+
+class CheckpointJob:
+    """
+    A resumable extraction job: its parameters, per-target journals and the
+    targets already finished.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.job_id = os.path.basename(os.path.normpath(directory))
+        with open(os.path.join(directory, JOB_FILE), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.done: Dict[str, Dict[str, Any]] = {
+            record["target"]: record["summary"]
+            for record in read_journal(os.path.join(directory, DONE_FILE))
+        }
+
+    @property
+    def params(self) -> Dict[str, Any]:
+        return self.meta.get("params", {})
+
+    @classmethod
+    def create(cls, params: Dict[str, Any], job_id: Optional[str] = None, root: Optional[str] = None) -> "CheckpointJob":
+        """
+        Start a new job directory.
+
+        Args:
+            params: JSON-serializable parameters needed to resume the run
+            job_id: Job name (default: command and timestamp)
+            root: Parent directory (default config.CHECKPOINT_DIR)
+
+        Returns:
+            The new job
+        """
+        job_id = _safe_name(job_id or f"{params.get('command', 'job')}-{datetime.now().strftime('%Y%m%d-%H%M%S')}")
+        directory = job_path(job_id, root)
+        if os.path.exists(os.path.join(directory, JOB_FILE)):
+            raise FileExistsError(f"Checkpoint job already exists: {job_id}")
+        os.makedirs(directory, exist_ok=True)
+
+        tmp_path = os.path.join(directory, f"{JOB_FILE}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"job_id": job_id, "created_at": time.time(), "params": params}, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, os.path.join(directory, JOB_FILE))
+        return cls(directory)
+
+    @classmethod
+    def open(cls, job_id: str, root: Optional[str] = None) -> "CheckpointJob":
+        """Open an existing job (raises FileNotFoundError if missing)"""
+        return cls(job_path(job_id, root))
+
+    def target(self, name: str) -> TargetJournal:
+        """Journal of one target, replaying what earlier runs recorded"""
+        return TargetJournal(os.path.join(self.directory, "targets", f"{_safe_name(name)}.jsonl"))
+
+    def is_done(self, name: str) -> bool:
+        return name in self.done
+
+    def mark_done(self, name: str, summary: Dict[str, Any]) -> None:
+        """Record a finished target; resumed runs skip it and reuse summary"""
+        self.done[name] = summary
+        done_file = JournalFile(os.path.join(self.directory, DONE_FILE), sync_interval=0)
+        try:
+            done_file.append({"target": name, "summary": summary})
+        finally:
+            done_file.close()
+
+    def remove(self) -> None:
+        """Delete the job and all its journals"""
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def job_path(job_id: str, root: Optional[str] = None) -> str:
+    """Directory of a job under root (default config.CHECKPOINT_DIR)"""
+    return os.path.join(root or config.CHECKPOINT_DIR, _safe_name(job_id))
+
+
+def lock_job(job_id: str, root: Optional[str] = None) -> FileLock:
+    """
+    Take the exclusive lock of a job (release() it when the run ends).
+
+    The lock file lives next to the job directory and is never removed, so
+    removing a finished job does not let a second runner in early.
+
+    Raises:
+        JobBusy: If another process or session holds the lock
+    """
+    lock = FileLock(job_path(job_id, root) + ".lock")
+    if not lock.acquire(blocking=False):
+        raise JobBusy(f"Checkpoint job {job_id} is being run by another process")
+    return lock
+
+
+def list_jobs(root: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Describe every job stored under root, oldest first.
+
+    Returns:
+        One dictionary per job: job_id, created_at, command, done targets
+    """
+    root = root or config.CHECKPOINT_DIR
+    if not os.path.isdir(root):
+        return []
+
+    jobs = []
+    for name in os.listdir(root):
+        try:
+            job = CheckpointJob(os.path.join(root, name))
+        except (OSError, ValueError):
+            continue
+        jobs.append({
+            "job_id": job.job_id,
+            "created_at": job.meta.get("created_at"),
+            "command": job.params.get("command"),
+            "done_targets": len(job.done),
+        })
+    return sorted(jobs, key=lambda job: job["created_at"] or 0)
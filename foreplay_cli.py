@@ -0,0 +1,893 @@
+"""
+Foreplay API - Command-Line Interface
+Description: Headless bulk extraction for cron jobs and servers, without the
+Streamlit runtime. Runs the same board, brand and discovery extraction as the
+GUI and writes CSV, NDJSON, JSON, Parquet or Excel files.
+
+Progress and per-stage throughput go to stderr; a JSON summary of the run
+goes to stdout.
+
+`watch` is different: it polls tracked Spyder brands and streams one JSON
+event per line (new, inactive or changed ad) to stdout until interrupted.
+
+`query` answers from the local ad index (every ad fetched on this host) and
+spends no credits.
+
+Every run is checkpointed (see foreplay_checkpoint): if it crashes, is
+killed or leaves failed ads behind, `resume JOB` continues it without
+fetching finished pages and ads again.
+
+Usage:
+    python foreplay_cli.py board BOARD_ID_OR_URL [...] --format csv,ndjson -o exports/
+    python foreplay_cli.py board --boards-file boards.txt --concurrency 8 --rate-limit 10
+    python foreplay_cli.py board --all-boards --format parquet
+    python foreplay_cli.py brand BRAND_ID [...] --start 2025-01-01 --end 2025-03-31
+    python foreplay_cli.py discover --query "protein" --start 2025-01-01 --end 2025-01-31
+    python foreplay_cli.py board BOARD_ID --videos --media-dir archive/ --bandwidth 20
+    python foreplay_cli.py resume board-20250101-020000
+    python foreplay_cli.py watch --interval 3600 >> spyder_events.ndjson
+    python foreplay_cli.py query --niches beauty --live true --facets all
+    python foreplay_cli.py domains --file landing_pages.txt > brands.ndjson
+
+Exit codes:
+    0  every target extracted
+    1  partial success (some targets or ads failed)
+    2  invalid arguments
+    3  missing or rejected API key
+    4  every target failed
+    130 interrupted
+"""
+
+import argparse
+import contextlib
+import importlib.util
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Optional, Dict, Any, List, Callable, Tuple
+
+try:
+    # Before config: its settings are read from the environment when it is imported
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    pass
+
+from config import config
+from foreplay_extraction import call_with_retries, is_auth_error
+from foreplay_profiler import Profiler, activate
+from foreplay_scheduler import CLASSES, BACKGROUND, priority
+
+
+EXIT_OK = 0
+EXIT_PARTIAL = 1
+EXIT_USAGE = 2
+EXIT_AUTH = 3
+EXIT_FAILED = 4
+EXIT_INTERRUPTED = 130
+
+FORMATS = ("csv", "timestamped", "ndjson", "json", "parquet", "excel")
+EXTENSIONS = {
+    "csv": "csv",
+    "timestamped": "timestamped.csv",
+    "ndjson": "ndjson",
+    "json": "json",
+    "parquet": "parquet",
+    "excel": "xlsx",
+}
+
+
+class CliError(Exception):
+    """Error ending the run with a specific exit code"""
+
+    def __init__(self, message: str, exit_code: int):
+        super().__init__(message)
+        self.exit_code = exit_code
+
+
+def log(message: str) -> None:
+    print(message, file=sys.stderr, flush=True)
+
+
+# =============================================================================
+# PROGRESS AND STAGE THROUGHPUT
+# =============================================================================
+
+class StageStats:
+    """Items and wall time per stage (listing, details, export), across targets"""
+
+    def __init__(self):
+        self.stages: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def measure(self, stage: str):
+        """Time a block; call the yielded function with the number of items handled"""
+        counted = [0]
+        start = time.perf_counter()
+        try:
+            yield lambda items: counted.__setitem__(0, items)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                totals = self.stages.setdefault(stage, [0, 0.0])
+                totals[0] += counted[0]
+                totals[1] += elapsed
+
+    def rows(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                "stage": stage,
+                "items": int(items),
+                "seconds": round(seconds, 3),
+                "items_per_second": round(items / seconds, 2) if seconds else None,
+            }
+            for stage, (items, seconds) in self.stages.items()
+        ]
+
+    def report(self) -> None:
+        log(f"{'stage':<10} {'items':>8} {'seconds':>9} {'items/s':>9}")
+        for row in self.rows():
+            rate = row["items_per_second"] if row["items_per_second"] is not None else "-"
+            log(f"{row['stage']:<10} {row['items']:>8} {row['seconds']:>9} {rate:>9}")
+
+
+class ProgressReporter:
+    """Prints detail-call (or video download) progress to stderr at about every 10%"""
+
+    def __init__(self, label: str, quiet: bool = False, unit: str = "ads"):
+        self.label = label
+        self.quiet = quiet
+        self.unit = unit
+        self.start = time.perf_counter()
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._last_step = -1
+
+    def progress(self, done: int, total: int, ad: Dict[str, Any]) -> None:
+        if self.quiet or not total:
+            return
+        step = done * 10 // total
+        with self._lock:
+            if step <= self._last_step and done != total:
+                return
+            self._last_step = step
+            elapsed = time.perf_counter() - self.start
+            rate = done / elapsed if elapsed else 0.0
+            log(f"  {self.label}: {done}/{total} {self.unit} ({rate:.1f} {self.unit}/s)")
+
+    def error(self, ad_id: str, error: Exception) -> None:
+        with self._lock:
+            self.errors += 1
+        if is_auth_error(error):
+            raise CliError(f"API key rejected: {error}", EXIT_AUTH)
+        if not self.quiet:
+            log(f"  {self.label}: ad {ad_id} failed: {error}")
+
+
+# =============================================================================
+# OUTPUT
+# =============================================================================
+
+def check_formats(formats: List[str]) -> None:
+    unknown = [f for f in formats if f not in FORMATS]
+    if unknown:
+        raise CliError(f"Unknown format(s): {', '.join(unknown)} (choose from {', '.join(FORMATS)})", EXIT_USAGE)
+    if "parquet" in formats and not (importlib.util.find_spec("pyarrow") or importlib.util.find_spec("fastparquet")):
+        raise CliError("Parquet output needs pyarrow (pip install pyarrow)", EXIT_USAGE)
+
+
+def write_outputs(ads: List[Dict[str, Any]], formats: List[str], output_dir: str, stem: str) -> List[str]:
+    """
+    Write ads in every requested format.
+
+    Returns:
+        Paths of the written files
+    """
+    from foreplay_export import (
+        create_csv_dataframe,
+        create_timestamped_dataframe,
+        create_json_export,
+        dataframe_to_csv,
+        write_excel
+    )
+
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for fmt in formats:
+        path = os.path.join(output_dir, f"{stem}.{EXTENSIONS[fmt]}")
+        if fmt == "csv":
+            dataframe_to_csv(create_csv_dataframe(ads), path)
+        elif fmt == "timestamped":
+            dataframe_to_csv(create_timestamped_dataframe(ads), path)
+        elif fmt == "ndjson":
+            with open(path, "w", encoding="utf-8") as f:
+                for ad in ads:
+                    f.write(json.dumps(ad, ensure_ascii=False) + "\n")
+        elif fmt == "json":
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(create_json_export(ads))
+        elif fmt == "parquet":
+            create_csv_dataframe(ads).to_parquet(path, index=False)
+        elif fmt == "excel":
+            write_excel(ads, path)
+        paths.append(path)
+    return paths
+
+
+def safe_name(value: str) -> str:
+    return "".join(c if c.isalnum() or c in "-_" else "_" for c in str(value))[:80] or "all"
+
+
+# =============================================================================
+# TARGETS
+# =============================================================================
+
+def board_targets(client, args) -> List[Tuple[str, Callable[..., List[Dict[str, Any]]]]]:
+    from foreplay_extraction import extract_board_id, list_board_ads
+
+    raw = list(args.boards)
+    if args.boards_file:
+        with open(args.boards_file, "r", encoding="utf-8") as f:
+            raw.extend(line.strip() for line in f if line.strip() and not line.startswith("#"))
+    if args.all_boards:
+        raw.extend(str(board.get('id')) for board in client.get_boards().get('data', []) if board.get('id'))
+    if not raw:
+        raise CliError("No boards given (use BOARD_ID, --boards-file or --all-boards)", EXIT_USAGE)
+
+    board_ids = []
+    for value in dict.fromkeys(raw):
+        board_id = extract_board_id(value)
+        if not board_id:
+            raise CliError(f"Not a board ID or URL: {value}", EXIT_USAGE)
+        board_ids.append(board_id)
+
+    # A resumed job works on the same boards, even if the account changed since
+    args.boards, args.boards_file, args.all_boards = board_ids, None, False
+
+    targets = []
+    for board_id in dict.fromkeys(board_ids):
+        def listing(journal=None, board_id=board_id):
+            ads = list_board_ads(client, board_id, limit=args.limit, journal=journal, retries=args.retries)
+            if args.all_formats:
+                return ads
+            return [ad for ad in ads if ad.get('display_format') == 'video']
+
+        targets.append((f"board_{board_id}", listing))
+    return targets
+
+
+def _filters(args) -> Dict[str, Any]:
+    filters = {
+        "display_format": args.display_format,
+        "live": args.live,
+        "languages": args.languages,
+        "niches": args.niches,
+        "publisher_platform": args.publisher_platform,
+    }
+    return {key: value for key, value in filters.items() if value is not None}
+
+
+def _paginate(
+    fetch_page: Callable[..., Dict[str, Any]],
+    limit: Optional[int],
+    journal=None,
+    retries: int = 0,
+    **params: Any
+) -> List[Dict[str, Any]]:
+    page_size = config.SCAN_PAGE_LIMIT
+    ads: List[Dict[str, Any]] = []
+    while limit is None or len(ads) < limit:
+        requested = page_size if limit is None else min(page_size, limit - len(ads))
+        offset = len(ads)
+        page = journal.page(offset) if journal else None
+        if page is None:
+            page = call_with_retries(
+                lambda: fetch_page(offset=offset, limit=requested, **params), retries
+            ).get('data', [])
+            if journal:
+                journal.record_page(offset, page)
+        ads.extend(page)
+        if len(page) < requested:
+            break
+    return ads
+
+
+def _scan(scan: Callable[[], List[Dict[str, Any]]], limit: Optional[int], journal=None) -> List[Dict[str, Any]]:
+    """Run a sharded scan once per job: its result is journaled as a whole"""
+    if journal and journal.listing is not None:
+        ads = journal.listing
+    else:
+        ads = scan()
+        if journal:
+            journal.record_listing(ads)
+    return ads[:limit] if limit else ads
+
+
+def brand_targets(client, args) -> List[Tuple[str, Callable[..., List[Dict[str, Any]]]]]:
+    filters = _filters(args)
+    if bool(args.start) != bool(args.end):
+        raise CliError("--start and --end must be given together", EXIT_USAGE)
+
+    brand_ids = list(dict.fromkeys(args.brands))
+    # Without a date range or --limit, several brands share get_ads_by_brand_ids requests
+    # (a per-brand --limit stops each brand early, which one combined stream cannot)
+    batched = len(brand_ids) > 1 and not args.start and args.limit is None
+    fetched: Dict[str, List[Dict[str, Any]]] = {}
+
+    def batch_listing(journal, brand_id: str) -> List[Dict[str, Any]]:
+        def scan():
+            if brand_id not in fetched:
+                # Targets run in order: fetch this brand and the ones after it together
+                rest = brand_ids[brand_ids.index(brand_id):]
+                fetched.update(client.get_ads_by_brand_ids(
+                    rest, max_workers=args.concurrency, retries=args.retries, order=args.order, **filters
+                ))
+            return fetched.pop(brand_id)
+        return _scan(scan, None, journal)
+
+    targets = []
+    for brand_id in brand_ids:
+        if batched:
+            def listing(journal=None, brand_id=brand_id):
+                return batch_listing(journal, brand_id)
+        elif args.start:
+            def listing(journal=None, brand_id=brand_id):
+                return _scan(
+                    lambda: client.get_ads_by_brand_id_sharded(
+                        brand_id, args.start, args.end, order=args.order, max_workers=args.concurrency, **filters
+                    ),
+                    args.limit,
+                    journal
+                )
+        else:
+            def listing(journal=None, brand_id=brand_id):
+                return _paginate(
+                    client.get_ads_by_brand_id, args.limit, journal, args.retries,
+                    brand_id=brand_id, order=args.order, **filters
+                )
+        targets.append((f"brand_{brand_id}", listing))
+    return targets
+
+
+def discover_targets(client, args) -> List[Tuple[str, Callable[..., List[Dict[str, Any]]]]]:
+    filters = _filters(args)
+    if args.query:
+        filters["query"] = args.query
+    if bool(args.start) != bool(args.end):
+        raise CliError("--start and --end must be given together", EXIT_USAGE)
+
+    if args.start:
+        def listing(journal=None):
+            return _scan(
+                lambda: client.discover_ads_sharded(
+                    args.start, args.end, order=args.order, max_workers=args.concurrency, **filters
+                ),
+                args.limit,
+                journal
+            )
+    else:
+        def listing(journal=None):
+            return _paginate(client.discover_ads, args.limit, journal, args.retries, order=args.order, **filters)
+    return [(f"discover_{safe_name(args.query or 'all')}", listing)]
+
+
+# =============================================================================
+# RUN
+# =============================================================================
+
+def run_target(client, name: str, listing, args, stats: StageStats, journal=None, media=None) -> Dict[str, Any]:
+    """List, enrich and export one target (and archive its videos with media); returns its summary"""
+    from foreplay_concurrency import worker_count
+    from foreplay_extraction import fetch_ad_details
+    from foreplay_media import summarize
+
+    started = time.perf_counter()
+    with stats.measure("listing") as count:
+        ads = listing(journal)
+        count(len(ads))
+    if journal and journal.details:
+        log(f"{name}: {len(ads)} ads listed, resuming with {len(journal.details)} details already fetched")
+    else:
+        log(f"{name}: {len(ads)} ads listed")
+
+    reporter = ProgressReporter(name, quiet=args.quiet)
+    if args.details and ads:
+        with stats.measure("details") as count:
+            ads = fetch_ad_details(
+                client,
+                ads,
+                delay=args.delay,
+                max_workers=worker_count(client, args.concurrency, config.MAX_CONCURRENCY),
+                on_progress=reporter.progress,
+                on_error=reporter.error,
+                retries=args.retries,
+                journal=journal
+            )
+            count(len(ads))
+
+    with stats.measure("export") as count:
+        stem = f"{name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        files = write_outputs(ads, args.formats, args.output_dir, stem) if ads or args.write_empty else []
+        count(len(ads) if files else 0)
+
+    videos: Dict[str, int] = {}
+    if media and ads:
+        # Already archived videos are skipped, so a resumed run only fetches the rest
+        with stats.measure("videos") as count:
+            videos = summarize(media.download_ads(ads, on_progress=ProgressReporter(name, args.quiet, "videos").progress))
+            count(sum(videos.values()))
+
+    seconds = time.perf_counter() - started
+    log(f"{name}: {len(ads)} ads, {reporter.errors} errors, {seconds:.1f}s -> {', '.join(files) or 'no files'}")
+    if videos:
+        log(f"{name}: videos {', '.join(f'{number} {status}' for status, number in sorted(videos.items()))}")
+    return {
+        "target": name,
+        "status": "partial" if reporter.errors or videos.get("failed") else "ok",
+        "ads": len(ads),
+        "errors": reporter.errors,
+        "seconds": round(seconds, 3),
+        "files": files,
+        "videos": videos,
+    }
+
+
+def create_job(args):
+    """Checkpoint job for a new run (None with --no-checkpoint)"""
+    from foreplay_checkpoint import CheckpointJob
+
+    if not args.checkpoint:
+        return None
+    # The API key is never written to disk; resume reads it from the environment again
+    params = {key: value for key, value in vars(args).items() if key not in ("api_key", "job")}
+    try:
+        return CheckpointJob.create(params, job_id=args.job)
+    except FileExistsError:
+        raise CliError(f"Checkpoint job {args.job} already exists (continue it with: resume {args.job})", EXIT_USAGE)
+
+
+def run(args, job=None) -> Tuple[int, Dict[str, Any]]:
+    """
+    Run the extraction described by args; returns (exit code, summary).
+
+    With a checkpoint job every page and ad detail is journaled as it
+    arrives, finished targets are skipped and the job is removed once the
+    whole run succeeds. Otherwise it is kept for `resume`.
+    """
+    from foreplay_client import ForeplayAPIClient
+
+    api_key = args.api_key or config.API_KEY or os.getenv("FOREPLAY_API_KEY")
+    if not api_key:
+        raise CliError("FOREPLAY_API_KEY is not set (environment, .env or --api-key)", EXIT_AUTH)
+    check_formats(args.formats)
+
+    # With adaptive concurrency --concurrency is the ceiling of the AIMD limit
+    client = ForeplayAPIClient(
+        api_key,
+        base_url=args.base_url,
+        pool_size=args.concurrency,
+        rate_limit=args.rate_limit,
+        max_concurrency=args.concurrency,
+        hedge=getattr(args, "hedge", None)
+    )
+    profiler = Profiler(enabled=bool(args.trace))
+    stats = StageStats()
+    results: List[Dict[str, Any]] = []
+    media = None
+    job_lock = None
+    if getattr(args, "videos", False):
+        from foreplay_media import MediaDownloader
+        media = MediaDownloader(args.media_dir, bandwidth_mb_s=args.bandwidth)
+
+    try:
+        # Bulk work yields to interactive (GUI) traffic unless told otherwise
+        with activate(profiler), priority(getattr(args, "priority", BACKGROUND)):
+            builders = {"board": board_targets, "brand": brand_targets, "discover": discover_targets}
+            targets = builders[args.command](client, args)
+            job = job or create_job(args)
+            if job:
+                from foreplay_checkpoint import JobBusy, lock_job
+                try:
+                    job_lock = lock_job(job.job_id)
+                except JobBusy:
+                    job_id, job = job.job_id, None
+                    raise CliError(f"Checkpoint job {job_id} is already running in another process", EXIT_USAGE)
+                log(f"Checkpoint job: {job.job_id}")
+
+            for number, (name, listing) in enumerate(targets, 1):
+                if job and job.is_done(name):
+                    log(f"[{number}/{len(targets)}] {name}: already done")
+                    results.append({**job.done[name], "resumed": True})
+                    continue
+
+                log(f"[{number}/{len(targets)}] {name}")
+                journal = job.target(name) if job else None
+                try:
+                    result = run_target(client, name, listing, args, stats, journal, media)
+                except CliError:
+                    raise
+                except Exception as e:
+                    if is_auth_error(e):
+                        raise CliError(f"API key rejected: {e}", EXIT_AUTH)
+                    log(f"{name}: failed: {e}")
+                    result = {"target": name, "status": "failed", "error": str(e), "ads": 0, "errors": 0, "files": []}
+                finally:
+                    if journal:
+                        journal.close()
+
+                results.append(result)
+                # Partial targets stay open so a resume retries their failed ads
+                if job and result["status"] == "ok":
+                    job.mark_done(name, result)
+    except BaseException as e:
+        if job and isinstance(e, (CliError, KeyboardInterrupt)):
+            log(f"Progress saved, continue with: python foreplay_cli.py resume {job.job_id}")
+        if job_lock:
+            job_lock.release()
+        raise
+    finally:
+        # Read before close(), which empties the connection pools
+        connection = client.connection_stats()
+        client.close()
+        if media:
+            media.close()
+        if args.trace:
+            profiler.export_chrome_trace(args.trace)
+            log(f"Trace written to {args.trace}")
+
+    stats.report()
+    limits = client.concurrency_stats()
+    if limits:
+        log(
+            f"concurrency limit {limits['limit']} (max {limits['max_limit']}), "
+            f"{limits['increases']} increases, {limits['decreases']} decreases, "
+            f"latency {limits['recent_ms']} ms (baseline {limits['baseline_ms']} ms)"
+        )
+    hedging = client.hedging_stats()
+    if hedging:
+        log(
+            f"hedging deadline {hedging['deadline_ms']} ms, {hedging['hedged']} hedges "
+            f"for {hedging['lookups']} lookups ({hedging['hedge_wins']} won, "
+            f"{hedging['budget_denied']} over budget)"
+        )
+    failed = sum(1 for r in results if r["status"] == "failed")
+    partial = sum(1 for r in results if r["status"] == "partial")
+    if results and failed == len(results):
+        exit_code = EXIT_FAILED
+    elif failed or partial:
+        exit_code = EXIT_PARTIAL
+    else:
+        exit_code = EXIT_OK
+
+    if job and exit_code == EXIT_OK:
+        job.remove()
+    elif job:
+        log(f"Failed work is kept in the checkpoint, retry it with: python foreplay_cli.py resume {job.job_id}")
+    # Held until the job is removed or kept, so a concurrent resume cannot start in between
+    if job_lock:
+        job_lock.release()
+
+    summary = {
+        "command": args.command,
+        "job": job.job_id if job else None,
+        "exit_code": exit_code,
+        "targets": results,
+        "stages": stats.rows(),
+        "connection": connection,
+        "concurrency": limits,
+        "scheduler": client.scheduler_stats(),
+        "hedging": hedging,
+        "media": media.snapshot() if media else {},
+    }
+    return exit_code, summary
+
+
+def api_client(args):
+    """Client for the commands that stream their results (watch, domains)"""
+    from foreplay_client import ForeplayAPIClient
+
+    api_key = args.api_key or config.API_KEY or os.getenv("FOREPLAY_API_KEY")
+    if not api_key:
+        raise CliError("FOREPLAY_API_KEY is not set (environment, .env or --api-key)", EXIT_AUTH)
+    return ForeplayAPIClient(
+        api_key,
+        base_url=args.base_url,
+        pool_size=args.concurrency,
+        rate_limit=args.rate_limit,
+        max_concurrency=args.concurrency
+    )
+
+
+def run_watch(args) -> int:
+    """Stream Spyder change events to stdout until interrupted (or once with --once)"""
+    from foreplay_watch import SpyderWatcher
+
+    events_out = sys.stdout
+    client = api_client(args)
+    watcher = SpyderWatcher(client, brand_ids=args.brands, interval=args.interval, baseline_events=args.baseline_events)
+
+    def emit(event: Dict[str, Any]) -> None:
+        events_out.write(json.dumps(event, ensure_ascii=False) + "\n")
+        events_out.flush()
+
+    try:
+        # The client prints credit updates; keep stdout for the events
+        with contextlib.redirect_stdout(sys.stderr):
+            if args.once:
+                watcher.poll(force=True, on_event=emit)
+            else:
+                log(f"Watching {len(watcher.tracked_brands())} brands, each every {watcher.interval:.0f}s")
+                watcher.run(on_event=emit)
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        if is_auth_error(e):
+            raise CliError(f"API key rejected: {e}", EXIT_AUTH)
+        raise
+    finally:
+        client.close()
+        stats = watcher.snapshot()
+        log(
+            f"{stats['checks']} brand checks, {stats['requests']} requests "
+            f"({stats['requests_per_check']} per check): {stats['new']} new, "
+            f"{stats['inactive']} inactive, {stats['changed']} changed, {stats['errors']} errors"
+        )
+    return EXIT_PARTIAL if stats["errors"] else EXIT_OK
+
+
+def run_domains(args) -> int:
+    """Resolve landing-page URLs to brands, one JSON line per URL on stdout"""
+    from foreplay_concurrency import worker_count
+    from foreplay_domains import DomainResolver, canonical_domain
+
+    urls = list(args.urls)
+    if args.file:
+        with (sys.stdin if args.file == "-" else open(args.file, encoding="utf-8")) as f:
+            urls.extend(line.strip() for line in f if line.strip() and not line.startswith("#"))
+    if not urls:
+        raise CliError("No URLs given (use URL arguments or --file)", EXIT_USAGE)
+
+    client = api_client(args)
+    resolver = DomainResolver(client, max_workers=worker_count(client, args.concurrency, config.DOMAIN_MAX_WORKERS))
+    progress = ProgressReporter("domains", quiet=args.quiet, unit="domains")
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            resolved = resolver.resolve_many(
+                urls,
+                refresh=args.refresh,
+                on_progress=lambda done, total: progress.progress(done, total, {})
+            )
+    except Exception as e:
+        if is_auth_error(e):
+            raise CliError(f"API key rejected: {e}", EXIT_AUTH)
+        raise
+    finally:
+        client.close()
+
+    for url, brands in resolved.items():
+        sys.stdout.write(json.dumps({"url": url, "domain": canonical_domain(url), "brands": brands}, ensure_ascii=False) + "\n")
+    stats = resolver.snapshot()
+    log(
+        f"{stats['inputs']} URLs, {stats['domains']} distinct domains: {stats['cached']} cached, "
+        f"{stats['fetched']} looked up, {stats['failed']} failed, {stats['invalid']} unreadable"
+    )
+    if any(is_auth_error(error) for error in resolver.errors.values()):
+        raise CliError("API key rejected", EXIT_AUTH)
+    for domain, error in resolver.errors.items():
+        log(f"  {domain}: {error}")
+    return EXIT_PARTIAL if stats["failed"] else EXIT_OK
+
+
+def run_query(args) -> int:
+    """Print the ads of the local index matching the filters, with facet counts"""
+    from foreplay_adindex import get_ad_index
+
+    facets = [f.strip() for f in args.facets.split(",") if f.strip()] if args.facets else None
+    try:
+        result = get_ad_index().query(
+            brand_id=args.brand_id,
+            live=args.live,
+            display_format=args.display_format,
+            publisher_platform=args.publisher_platform,
+            niche=args.niches,
+            market_target=args.market_target,
+            language=args.languages,
+            start_date=args.start,
+            end_date=args.end,
+            search=args.search,
+            order=args.order,
+            offset=args.offset,
+            limit=args.limit,
+            facets=facets
+        )
+    except ValueError as e:
+        raise CliError(str(e), EXIT_USAGE)
+    log(f"{result['metadata']['total']} matching ads in the local index ({result['metadata']['took_ms']} ms)")
+    if not config.AD_INDEX:
+        log("Indexing is off: set FOREPLAY_AD_INDEX=1 to store the ads fetched by later commands")
+    json.dump(result, sys.stdout, ensure_ascii=False)
+    print()
+    return EXIT_OK
+
+
+def build_parser() -> argparse.ArgumentParser:
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("-o", "--output-dir", default=".", help="Directory for the exported files (default: current)")
+    common.add_argument("-f", "--format", dest="formats", default="csv",
+                        type=lambda value: [f.strip().lower() for f in value.split(",") if f.strip()],
+                        help=f"Comma-separated output formats: {', '.join(FORMATS)} (default csv)")
+    common.add_argument("-c", "--concurrency", type=int,
+                        help="Maximum requests in flight (default: adaptive up to "
+                             f"{config.ADAPTIVE_MAX_CONCURRENCY}, or {config.MAX_CONCURRENCY} "
+                             "with FOREPLAY_ADAPTIVE_CONCURRENCY=0)")
+    common.add_argument("--rate-limit", type=float, default=config.RATE_LIMIT,
+                        help="Maximum requests per second, 0 = unlimited")
+    common.add_argument("--delay", type=float, default=0.0, help="Pause after each detail call per worker, in seconds")
+    common.add_argument("--limit", type=int, help="Maximum ads per target")
+    common.add_argument("--priority", choices=CLASSES, default=BACKGROUND,
+                        help="Scheduler class of the run's requests (default background)")
+    common.add_argument("--hedge", action="store_true", default=None,
+                        help="Hedge slow detail calls with a second request (default FOREPLAY_HEDGE)")
+    common.add_argument("--api-key", help="API key (default FOREPLAY_API_KEY)")
+    common.add_argument("--base-url", default=config.BASE_URL, help="API base URL (default FOREPLAY_BASE_URL, e.g. a mock server)")
+    common.add_argument("--trace", help="Write a Chrome trace of the run to this file")
+    common.add_argument("--write-empty", action="store_true", help="Write files even for targets without ads")
+    common.add_argument("-q", "--quiet", action="store_true", help="Only print per-target results and the summary")
+    common.add_argument("--retries", type=int, default=config.DETAIL_RETRIES,
+                        help=f"Retry rounds for failed detail calls, retries of failed listing pages (default {config.DETAIL_RETRIES})")
+    common.add_argument("--videos", action="store_true",
+                        help="Download the video of every ad into --media-dir (resumable, deduplicated)")
+    common.add_argument("--media-dir", default=config.MEDIA_DIR, help=f"Video archive directory (default {config.MEDIA_DIR})")
+    common.add_argument("--bandwidth", type=float, default=config.MEDIA_BANDWIDTH_MB_S,
+                        help="Total video download bandwidth in MB/s, 0 = unlimited")
+    common.add_argument("--job", help="Name of the checkpoint job (default: command and timestamp)")
+    common.add_argument("--no-checkpoint", dest="checkpoint", action="store_false",
+                        help="Do not journal progress (the run cannot be resumed)")
+
+    filters = argparse.ArgumentParser(add_help=False)
+    filters.add_argument("--start", help="First day (YYYY-MM-DD); with --end runs a sharded date scan")
+    filters.add_argument("--end", help="Last day (YYYY-MM-DD)")
+    filters.add_argument("--order", default="newest", help="Sort order (newest, oldest, longest_running, most_relevant)")
+    filters.add_argument("--display-format", help="Ad format filter (video, image, carousel, ...)")
+    filters.add_argument("--live", type=lambda value: value.lower() in ("1", "true", "yes"), help="Only live (true) or inactive (false) ads")
+    filters.add_argument("--languages", help="Language filter")
+    filters.add_argument("--niches", help="Niche filter")
+    filters.add_argument("--publisher-platform", help="Platform filter")
+    filters.add_argument("--details", action="store_true", help="Fetch full ad details (transcripts) for every ad")
+
+    parser = argparse.ArgumentParser(
+        prog="foreplay_cli.py",
+        description="Bulk extraction of Foreplay ads without the Streamlit GUI",
+        epilog="Exit codes: 0 ok, 1 partial, 2 invalid arguments, 3 API key, 4 all targets failed, 130 interrupted"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    board = commands.add_parser("board", parents=[common], help="Video ads of boards with transcripts")
+    board.add_argument("boards", nargs="*", help="Board IDs or URLs")
+    board.add_argument("--boards-file", help="File with one board ID or URL per line")
+    board.add_argument("--all-boards", action="store_true", help="Every board of the account")
+    board.add_argument("--all-formats", action="store_true", help="Keep non-video ads too")
+    board.add_argument("--no-details", dest="details", action="store_false", help="Skip the detail calls")
+    board.set_defaults(details=True)
+
+    brand = commands.add_parser("brand", parents=[common, filters], help="Ads of one or more brands")
+    brand.add_argument("brands", nargs="+", help="Brand IDs")
+
+    discover = commands.add_parser("discover", parents=[common, filters], help="Ads from discovery search")
+    discover.add_argument("--query", help="Search query")
+
+    watch = commands.add_parser("watch", help="Stream new, inactive and changed ads of Spyder brands (NDJSON)")
+    watch.add_argument("brands", nargs="*", help="Brand IDs (default: every brand tracked in Spyder)")
+    watch.add_argument("--interval", type=float, default=config.WATCH_INTERVAL_SECONDS,
+                       help=f"Seconds between checks of a brand (default {config.WATCH_INTERVAL_SECONDS:.0f})")
+    watch.add_argument("--once", action="store_true", help="Check every brand now and exit")
+    watch.add_argument("--baseline-events", action="store_true",
+                       help="Report the ads of brands seen for the first time as new")
+    watch.add_argument("-c", "--concurrency", type=int, help="Maximum requests in flight")
+    watch.add_argument("--rate-limit", type=float, default=config.RATE_LIMIT,
+                       help="Maximum requests per second, 0 = unlimited")
+    watch.add_argument("--api-key", help="API key (default FOREPLAY_API_KEY)")
+    watch.add_argument("--base-url", default=config.BASE_URL, help="API base URL (default FOREPLAY_BASE_URL, e.g. a mock server)")
+
+    domains = commands.add_parser("domains", help="Resolve landing-page URLs to brands (NDJSON, cached per domain)")
+    domains.add_argument("urls", nargs="*", help="URLs, hosts or domains")
+    domains.add_argument("--file", help="File with one URL per line ('-' for stdin)")
+    domains.add_argument("--refresh", action="store_true", help="Ignore cached brand lists")
+    domains.add_argument("-c", "--concurrency", type=int, help="Domains looked up in parallel")
+    domains.add_argument("--rate-limit", type=float, default=config.RATE_LIMIT,
+                         help="Maximum requests per second, 0 = unlimited")
+    domains.add_argument("--api-key", help="API key (default FOREPLAY_API_KEY)")
+    domains.add_argument("--base-url", default=config.BASE_URL, help="API base URL (default FOREPLAY_BASE_URL, e.g. a mock server)")
+    domains.add_argument("-q", "--quiet", action="store_true", help="Only print the results and the summary")
+
+    query = commands.add_parser("query", help="Filter the ads already fetched on this host (no API calls)")
+    query.add_argument("--brand-id", action="append", help="Brand ID (repeat for any of several)")
+    query.add_argument("--live", type=lambda value: value.lower() in ("1", "true", "yes"), help="Only live (true) or inactive (false) ads")
+    query.add_argument("--display-format", action="append", help="Ad format (repeatable)")
+    query.add_argument("--publisher-platform", action="append", help="Platform (repeatable)")
+    query.add_argument("--niches", action="append", help="Niche (repeatable)")
+    query.add_argument("--market-target", action="append", help="Target audience (repeatable)")
+    query.add_argument("--languages", action="append", help="Language (repeatable)")
+    query.add_argument("--start", help="First publication day (YYYY-MM-DD)")
+    query.add_argument("--end", help="Last publication day (YYYY-MM-DD)")
+    query.add_argument("--search", help="Text in name, brand, headline, description or transcript")
+    query.add_argument("--order", default="newest", help="newest, oldest or recently_seen")
+    query.add_argument("--limit", type=int, default=10, help="Ads returned (0 = only counts)")
+    query.add_argument("--offset", type=int, default=0)
+    query.add_argument("--facets", help="Comma-separated facets to count, or 'all'")
+
+    resume = commands.add_parser("resume", help="Continue an interrupted or partial run from its checkpoint")
+    resume.add_argument("job", nargs="?", help="Checkpoint job to continue (omit to list the stored jobs)")
+    resume.add_argument("--api-key", help="API key (default FOREPLAY_API_KEY)")
+    resume.add_argument("-c", "--concurrency", type=int, help="Override the job's concurrency")
+    resume.add_argument("--rate-limit", type=float, help="Override the job's requests per second")
+    resume.add_argument("-q", "--quiet", action="store_true", help="Only print per-target results and the summary")
+
+    return parser
+
+
+def resume_args(args) -> Tuple[argparse.Namespace, Any]:
+    """Arguments of the checkpointed run to continue, with the resume overrides applied"""
+    from foreplay_checkpoint import CheckpointJob
+
+    try:
+        job = CheckpointJob.open(args.job)
+    except (OSError, ValueError):
+        raise CliError(f"No checkpoint job named {args.job} in {config.CHECKPOINT_DIR}", EXIT_USAGE)
+
+    restored = argparse.Namespace(**job.params)
+    restored.api_key = args.api_key
+    restored.job = job.job_id
+    restored.quiet = args.quiet or restored.quiet
+    if args.concurrency is not None:
+        restored.concurrency = args.concurrency
+    if args.rate_limit is not None:
+        restored.rate_limit = args.rate_limit
+    return restored, job
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if getattr(args, "concurrency", None) is not None and args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+
+    try:
+        # The client prints credit updates; keep stdout for the JSON summary
+        if args.command == "resume" and not args.job:
+            from foreplay_checkpoint import list_jobs
+            json.dump(list_jobs(), sys.stdout)
+            print()
+            return EXIT_OK
+
+        if args.command == "watch":
+            return run_watch(args)
+        if args.command == "query":
+            return run_query(args)
+        if args.command == "domains":
+            return run_domains(args)
+
+        job = None
+        if args.command == "resume":
+            args, job = resume_args(args)
+
+        with contextlib.redirect_stdout(sys.stderr):
+            exit_code, summary = run(args, job)
+    except CliError as e:
+        log(f"Error: {e}")
+        return e.exit_code
+    except KeyboardInterrupt:
+        log("Interrupted")
+        return EXIT_INTERRUPTED
+
+    json.dump(summary, sys.stdout)
+    print()
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
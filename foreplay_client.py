@@ -8,6 +8,20 @@ import requests
 from typing import Optional, Dict, Any, List
 from urllib.parse import urljoin
 import json
+import threading
+import time
+
+import foreplay_profiler
+from config import config
+from foreplay_adindex import get_ad_index, is_ad_endpoint
+from foreplay_analytics import BrandAnalyticsFetcher
+from foreplay_batching import BrandBatchFetcher
+from foreplay_concurrency import AdaptiveConcurrencyLimiter, is_overload_status, worker_count
+from foreplay_domains import DomainResolver
+from foreplay_hedging import HedgedRequester, raise_if_cancelled
+from foreplay_scheduler import RequestScheduler
+from foreplay_sharding import ShardedAdScanner
+from foreplay_transport import RateLimiter, create_transport, default_pool_size
 
 
 class ForeplayAPIClient:
@@ -20,19 +34,116 @@ class ForeplayAPIClient:
     
     BASE_URL = "https://public.api.foreplay.co/"
     
-    def __init__(self, api_key: str):
+    def __init__(
+        self,
+        api_key: str,
+        base_url: Optional[str] = None,
+        transport=None,
+        pool_size: Optional[int] = None,
+        rate_limit: Optional[float] = None,
+        max_concurrency: Optional[int] = None,
+        hedge: Optional[bool] = None,
+        index_ads: Optional[bool] = None
+    ):
         """
         Initialize the Foreplay API client.
         
+        Prefer get_shared_client() in long-running processes: each client
+        owns its own connection pool, so a new client pays new TLS handshakes.
+        
         Args:
             api_key: Your Foreplay API key from the dashboard
+            base_url: Override the API base URL (e.g. a local mock server)
+            transport: Transport sending the requests (default: selected by
+                FOREPLAY_TRANSPORT, see foreplay_transport)
+            pool_size: Connections kept alive per host (default: largest
+                configured concurrency)
+            rate_limit: Maximum requests per second across all threads
+                (default config.RATE_LIMIT, 0 = unlimited)
+            max_concurrency: Most requests in flight: ceiling of the adaptive
+                limit (default config.ADAPTIVE_MAX_CONCURRENCY), or the fixed
+                limit when FOREPLAY_ADAPTIVE_CONCURRENCY is off
+            hedge: Hedge slow ad detail lookups with a second request
+                (default config.HEDGE_REQUESTS, see foreplay_hedging)
+            index_ads: Store every ad received in the local ad index
+                (default config.AD_INDEX, off unless enabled, see foreplay_adindex)
         """
         self.api_key = api_key
+        self.base_url = base_url or self.BASE_URL
         self.session = requests.Session()
         self.session.headers.update({
             "Authorization": f"Bearer {api_key}",
             "Content-Type": "application/json"
         })
+        self.transport = transport or create_transport(self.session, pool_size=pool_size)
+        rate_limit = config.RATE_LIMIT if rate_limit is None else rate_limit
+        self.rate_limiter = RateLimiter(rate_limit) if rate_limit else None
+        self.limiter = (
+            AdaptiveConcurrencyLimiter(max_limit=max_concurrency)
+            if config.ADAPTIVE_CONCURRENCY else None
+        )
+        # Every request waits here for a slot; interactive traffic goes first
+        self.scheduler = RequestScheduler(
+            self.limiter,
+            max_in_flight=max_concurrency or pool_size or default_pool_size()
+        )
+        hedge = config.HEDGE_REQUESTS if hedge is None else hedge
+        self.hedger = (
+            HedgedRequester(max_workers=2 * (max_concurrency or pool_size or default_pool_size()))
+            if hedge else None
+        )
+        index_ads = config.AD_INDEX if index_ads is None else index_ads
+        self.ad_index = get_ad_index() if index_ads else None
+    
+    def close(self):
+        """Close the transport (saves the cassette in record mode)"""
+        if self.hedger:
+            self.hedger.close()
+        self.transport.close()
+    
+    def connection_stats(self) -> Dict[str, Any]:
+        """
+        Get connection pool statistics (requests, connections opened, reuse rate).
+        
+        Returns:
+            Dictionary of transport statistics (empty for offline transports)
+        """
+        stats = getattr(self.transport, "connection_stats", None)
+        return stats() if stats else {}
+    
+    def concurrency_stats(self) -> Dict[str, Any]:
+        """
+        Get the adaptive concurrency limit, its counters and its history.
+        
+        Returns:
+            Dictionary with the limiter snapshot plus "history" (empty when
+            adaptive concurrency is off)
+        """
+        if not self.limiter:
+            return {}
+        return {**self.limiter.snapshot(), "history": self.limiter.limit_history()}
+    
+    def scheduler_stats(self) -> Dict[str, Any]:
+        """
+        Get the request scheduler state per priority class.
+        
+        Returns:
+            Dictionary with the current limit and, per class (interactive,
+            background, prefetch), requests in flight, queued, admitted,
+            preempted and queue wait p50/p95 in milliseconds
+        """
+        return self.scheduler.snapshot()
+    
+    def hedging_stats(self) -> Dict[str, Any]:
+        """
+        Get the hedged detail lookup counters.
+        
+        Returns:
+            Dictionary with the current hedge deadline, lookups, hedges sent,
+            hedges won, hedges denied by the budget and losers cancelled or
+            discarded (empty when hedging is off)
+        """
+        return self.hedger.snapshot() if self.hedger else {}
     
     def _make_request(
         self, 
@@ -56,21 +167,45 @@ class ForeplayAPIClient:
         Raises:
             requests.exceptions.RequestException: If the request fails
         """
-        url = urljoin(self.BASE_URL, endpoint)
-        
-        response = self.session.request(
-            method=method,
-            url=url,
-            params=params,
-            json=data
-        )
+        url = urljoin(self.base_url, endpoint)
+        
+        if self.rate_limiter:
+            start = time.perf_counter_ns()
+            waited = self.rate_limiter.acquire()
+            if waited:
+                foreplay_profiler.current().add(endpoint, "rate_limit", start, time.perf_counter_ns() - start)
+        
+        # A hedged attempt whose lookup was answered meanwhile is not sent
+        raise_if_cancelled()
+        
+        # The scheduler holds the request until its priority class gets a
+        # slot; the adaptive limiter learns from its latency and status
+        with self.scheduler.slot() as slot:
+            if slot.waited:
+                waited_ns = int(slot.waited * 1e9)
+                foreplay_profiler.current().add(endpoint, "queue_wait", time.perf_counter_ns() - waited_ns, waited_ns)
+            with foreplay_profiler.span(f"{method} {endpoint}", "request") as request_span:
+                response = self.transport.request(
+                    method=method,
+                    url=url,
+                    params=params,
+                    json=data
+                )
+                request_span.set(status=response.status_code)
+            if is_overload_status(response.status_code):
+                slot.overloaded, slot.reason = True, str(response.status_code)
         
         # Check for API credits remaining
         if 'X-Credits-Remaining' in response.headers:
             print(f"Credits Remaining: {response.headers['X-Credits-Remaining']}")
         
         response.raise_for_status()
-        return response.json()
+        with foreplay_profiler.span(endpoint, "json_decode", bytes=len(response.content)):
+            payload = response.json()
+        if self.ad_index is not None and is_ad_endpoint(endpoint):
+            # Queued for the index's writer thread, off the request path
+            self.ad_index.add_response(payload)
+        return payload
     
     # =============================================================================
     # SWIPEFILE ENDPOINTS
@@ -349,8 +484,7 @@ class ForeplayAPIClient:
         Returns:
             Dictionary containing ad details
         """
-        params = {"ad_id": ad_id}
-        return self._make_request("GET", "api/ad", params=params)
+        return self._get_ad_details(ad_id, by_path=False)
     
     def get_ad_by_id(self, ad_id: str) -> Dict[str, Any]:
         """
@@ -362,7 +496,16 @@ class ForeplayAPIClient:
         Returns:
             Dictionary containing ad details
         """
-        return self._make_request("GET", f"api/ad/{ad_id}")
+        return self._get_ad_details(ad_id, by_path=True)
+    
+    def _get_ad_details(self, ad_id: str, by_path: bool) -> Dict[str, Any]:
+        """Ad details from one endpoint, hedged on the other when hedging is on"""
+        by_query = lambda: self._make_request("GET", "api/ad", params={"ad_id": ad_id})
+        by_id = lambda: self._make_request("GET", f"api/ad/{ad_id}")
+        primary, alternate = (by_id, by_query) if by_path else (by_query, by_id)
+        if not self.hedger:
+            return primary()
+        return self.hedger.call(primary, alternate)
     
     # =============================================================================
     # BRANDS ENDPOINTS
@@ -429,6 +572,35 @@ class ForeplayAPIClient:
         
         return self._make_request("GET", "api/brand/getAdsByBrandId", params=params)
     
+    def get_ads_by_brand_ids(
+        self,
+        brand_ids: List[str],
+        batch_size: Optional[int] = None,
+        max_workers: Optional[int] = None,
+        retries: int = 0,
+        **filters: Any
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Get ads for many brands, packing several brand IDs into each request.
+        
+        Args:
+            brand_ids: List of brand IDs
+            batch_size: Maximum brand IDs per request (default from config)
+            max_workers: Number of batches paginated concurrently
+            retries: Retries of a failed page
+            **filters: Any other get_ads_by_brand_id filter (live, order, ...)
+            
+        Returns:
+            Dictionary mapping each brand ID to its list of ads
+        """
+        fetcher = BrandBatchFetcher(
+            self,
+            batch_size=batch_size,
+            max_workers=worker_count(self, max_workers, config.BRAND_BATCH_MAX_WORKERS),
+            retries=retries
+        )
+        return fetcher.fetch(brand_ids, **filters)
+    
     def get_ads_by_page_id(
         self,
         page_id: str,
@@ -517,6 +689,42 @@ class ForeplayAPIClient:
         }
         return self._make_request("GET", "api/brand/getBrandsByDomain", params=params)
     
+    def resolve_domains(
+        self,
+        urls: List[str],
+        max_workers: Optional[int] = None,
+        refresh: bool = False
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Resolve landing-page URLs to brands, once per registrable domain.
+        
+        URLs are canonicalized first ("https://www.shop.example.com/p" and
+        "example.com" are the same lookup), brand lists are cached on disk
+        and uncached domains are looked up concurrently.
+        
+        Args:
+            urls: URLs, hosts or domains
+            max_workers: Number of domains looked up concurrently
+            refresh: Ignore cached brand lists
+            
+        Returns:
+            Dictionary mapping each URL to its list of brands
+        """
+        resolver = DomainResolver(self, max_workers=worker_count(self, max_workers, config.DOMAIN_MAX_WORKERS))
+        return resolver.resolve_many(urls, refresh=refresh)
+    
+    def get_domains_by_brand(self, brand_id: str) -> List[str]:
+        """
+        Get the domains a brand has been resolved from (local, no credits).
+        
+        Args:
+            brand_id: The brand ID
+            
+        Returns:
+            Registrable domains recorded by resolve_domains
+        """
+        return DomainResolver(self).domains_for_brand(brand_id)
+    
     def get_brand_analytics(
         self,
         id: str,
@@ -548,6 +756,32 @@ class ForeplayAPIClient:
         
         return self._make_request("GET", "api/brand/analytics", params=params)
     
+    def get_brand_analytics_range(
+        self,
+        id: str,
+        start_date: str,
+        end_date: Optional[str] = None,
+        order: str = "oldest"
+    ) -> Dict[str, Any]:
+        """
+        Get analytics for a brand over any date range, beyond the 30-day limit.
+        
+        The range is split into compliant windows fetched concurrently; closed
+        windows are cached on disk so repeat calls only fetch the open window.
+        
+        Args:
+            id: The brand ID (20-25 chars) or Facebook page ID
+            start_date: Start date for analytics period (YYYY-MM-DD)
+            end_date: End date for analytics period (default today)
+            order: Order of the stitched series (newest or oldest)
+            
+        Returns:
+            Dictionary with one continuous time series per analytics key
+        """
+        return BrandAnalyticsFetcher(
+            self, max_workers=worker_count(self, None, config.ANALYTICS_MAX_WORKERS)
+        ).fetch(id, start_date, end_date, order)
+    
     # =============================================================================
     # DISCOVERY ENDPOINTS
     # =============================================================================
@@ -642,9 +876,96 @@ class ForeplayAPIClient:
         return self._make_request("GET", "api/discovery/brands", params=params)
     
     # =============================================================================
-    # USAGE ENDPOINT
+    # SHARDED SCANS
     # =============================================================================
     
+    def discover_ads_sharded(
+        self,
+        start_date: str,
+        end_date: str,
+        order: str = "newest",
+        max_workers: Optional[int] = None,
+        window_days: Optional[int] = None,
+        **filters: Any
+    ) -> List[Dict[str, Any]]:
+        """
+        Deep-scan discovery results by splitting the date range into windows
+        scanned in parallel (dense windows are subdivided automatically).
+        
+        Args:
+            start_date: First day of the range (YYYY-MM-DD)
+            end_date: Last day of the range (YYYY-MM-DD)
+            order: Sort order (newest, oldest, longest_running, most_relevant)
+            max_workers: Number of windows scanned concurrently
+            window_days: Initial window width in days
+            **filters: Any other discover_ads filter (query, live, niches, ...)
+            
+        Returns:
+            List of unique ads merged in the requested order
+        """
+        scanner = ShardedAdScanner(
+            self.discover_ads,
+            max_workers=worker_count(self, max_workers, config.SCAN_MAX_WORKERS),
+            window_days=window_days
+        )
+        return scanner.scan(start_date, end_date, order=order, **filters)
+    
+    def get_ads_by_brand_id_sharded(
+        self,
+        brand_id: str,
+        start_date: str,
+        end_date: str,
+        order: str = "newest",
+        max_workers: Optional[int] = None,
+        window_days: Optional[int] = None,
+        **filters: Any
+    ) -> List[Dict[str, Any]]:
+        """
+        Deep-scan a brand's ads by splitting the date range into windows
+        scanned in parallel (dense windows are subdivided automatically).
+        
+        Args:
+            brand_id: The ID of the brand (or multiple comma-separated IDs)
+            start_date: First day of the range (YYYY-MM-DD)
+            end_date: Last day of the range (YYYY-MM-DD)
+            order: Sort order (newest, oldest, longest_running, most_relevant)
+            max_workers: Number of windows scanned concurrently
+            window_days: Initial window width in days
+            **filters: Any other get_ads_by_brand_id filter
+            
+        Returns:
+            List of unique ads merged in the requested order
+        """
+        scanner = ShardedAdScanner(
+            self.get_ads_by_brand_id,
+            max_workers=worker_count(self, max_workers, config.SCAN_MAX_WORKERS),
+            window_days=window_days
+        )
+        return scanner.scan(start_date, end_date, order=order, brand_id=brand_id, **filters)
+    
+    # =============================================================================
+    # LOCAL AD INDEX (no API calls, no credits)
+    # =============================================================================
+
+    def query_local_ads(self, **filters) -> Dict[str, Any]:
+        """
+        Filter the ads already fetched on this host, with facet counts.
+
+        Args:
+            **filters: Filters of AdIndex.query (brand_id, live, display_format,
+                publisher_platform, niche, market_target, language, start_date,
+                end_date, search, order, offset, limit, facets)
+
+        Returns:
+            Dictionary with "data" (ads), "metadata" (count, total) and
+            "facets" (value counts per requested facet)
+        """
+        return (self.ad_index if self.ad_index is not None else get_ad_index()).query(**filters)
+
+    # =============================================================================
+    # USAGE ENDPOINT
+    # =============================================================================
+
     def get_usage(self) -> Dict[str, Any]:
         """
         Get your API usage statistics and remaining credits.
@@ -655,3 +976,35 @@ class ForeplayAPIClient:
         """
         return self._make_request("GET", "api/usage")
 
+
+# =============================================================================
+# SHARED CLIENTS
+# =============================================================================
+
+_shared_clients: Dict[tuple, ForeplayAPIClient] = {}
+_shared_clients_lock = threading.Lock()
+
+
+def get_shared_client(api_key: Optional[str] = None, base_url: Optional[str] = None) -> ForeplayAPIClient:
+    """
+    Get the long-lived client of this process for an API key.
+    
+    The client (and its kept-alive connection pool) is created on first use
+    and reused by every later caller, so repeated extractions and credit
+    checks skip the TLS handshake.
+    
+    Args:
+        api_key: Foreplay API key (default: FOREPLAY_API_KEY)
+        base_url: Override the API base URL
+        
+    Returns:
+        Shared ForeplayAPIClient instance
+    """
+    api_key = api_key or config.get_api_key()
+    key = (api_key, base_url)
+    with _shared_clients_lock:
+        client = _shared_clients.get(key)
+        if client is None:
+            client = ForeplayAPIClient(api_key, base_url=base_url)
+            _shared_clients[key] = client
+        return client
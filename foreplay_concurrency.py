@@ -0,0 +1,233 @@
+"""
+Foreplay API - Adaptive Concurrency
+Description: AIMD (additive increase, multiplicative decrease) limit on the
+number of API requests in flight, shared by every thread of a client.
+
+The limit grows while the API answers quickly and without errors (doubling
+per round trip at first, then +1 per round trip) and is cut by a constant
+factor on 429s, 5xx, timeouts and latency spikes. Parallel paths are sized
+to the limiter's ceiling and the limiter decides how many of their requests
+run at once, so throughput follows what the API can take at any moment
+instead of a fixed worker count.
+"""
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, List, Iterator
+
+import requests
+
+from config import config
+
+
+# EWMA weights of the short-term (spike detection) and long-term (baseline) latency
+RECENT_ALPHA = 0.3
+BASELINE_ALPHA = 0.02
+MIN_SAMPLES = 5
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD concurrency limit with metrics.
+
+    Example:
+        limiter = AdaptiveConcurrencyLimiter(max_limit=32)
+        with limiter.slot() as outcome:
+            response = send()
+            outcome.overloaded = response.status_code == 429
+        limiter.snapshot()        # current limit, in flight, latencies, counters
+    """
+
+    def __init__(
+        self,
+        initial: Optional[int] = None,
+        min_limit: Optional[int] = None,
+        max_limit: Optional[int] = None,
+        decrease_factor: Optional[float] = None,
+        latency_spike: Optional[float] = None,
+        history_size: int = 500
+    ):
+        """
+        Initialize the limiter.
+
+        Args:
+            initial: Starting limit (default config.ADAPTIVE_INITIAL_CONCURRENCY)
+            min_limit: Limit never goes below this
+            max_limit: Limit never goes above this (size worker pools to it)
+            decrease_factor: Multiplier applied to the limit on overload
+            latency_spike: Recent latency above baseline times this factor
+                counts as overload
+            history_size: Limit changes kept in history
+        """
+        self.min_limit = max(1, min_limit or config.ADAPTIVE_MIN_CONCURRENCY)
+        self.max_limit = max(self.min_limit, max_limit or config.ADAPTIVE_MAX_CONCURRENCY)
+        initial = initial or config.ADAPTIVE_INITIAL_CONCURRENCY
+        self.decrease_factor = decrease_factor or config.ADAPTIVE_DECREASE_FACTOR
+        self.latency_spike = latency_spike or config.ADAPTIVE_LATENCY_SPIKE
+
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.in_flight = 0
+        self.baseline: Optional[float] = None
+        self.recent: Optional[float] = None
+        self.slow_start = True
+        self.history = deque(maxlen=history_size)
+        self.counters: Dict[str, int] = {"successes": 0, "overloads": 0, "increases": 0, "decreases": 0}
+
+        self._samples = 0
+        self._last_decrease = 0.0
+        self._started = time.monotonic()
+        self._cond = threading.Condition()
+        self._record("start")
+
+    def _record(self, reason: str) -> None:
+        self.history.append({
+            "t": round(time.monotonic() - self._started, 3),
+            "limit": int(self.limit),
+            "reason": reason,
+        })
+
+    def acquire(self) -> float:
+        """
+        Wait for a free slot under the current limit.
+
+        Returns:
+            Seconds spent waiting
+        """
+        start = time.monotonic()
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+        return time.monotonic() - start
+
+    def begin(self) -> None:
+        """Count a request admitted by an external scheduler (see foreplay_scheduler)"""
+        with self._cond:
+            self.in_flight += 1
+
+    def release(self, latency: float, overloaded: bool = False, reason: str = "error") -> None:
+        """
+        Free a slot and adapt the limit to the outcome of its request.
+
+        Args:
+            latency: Seconds the request took
+            overloaded: The API signalled overload (429, 5xx, timeout)
+            reason: Recorded in history when the limit is cut
+        """
+        with self._cond:
+            saturated = self.in_flight >= int(self.limit)
+            self.in_flight -= 1
+
+            if overloaded:
+                self.counters["overloads"] += 1
+                self._decrease(reason)
+            else:
+                self.counters["successes"] += 1
+                self._samples += 1
+                self.recent = latency if self.recent is None else self.recent + RECENT_ALPHA * (latency - self.recent)
+                self.baseline = latency if self.baseline is None else self.baseline + BASELINE_ALPHA * (latency - self.baseline)
+
+                if self._samples >= MIN_SAMPLES and self.recent > self.baseline * self.latency_spike:
+                    self._decrease("latency")
+                elif saturated:
+                    # Only grow when the limit was actually reached, so idle
+                    # periods do not inflate it
+                    self._increase()
+
+            self._cond.notify_all()
+
+    def _increase(self) -> None:
+        previous = int(self.limit)
+        step = 1.0 if self.slow_start else 1.0 / self.limit
+        self.limit = min(self.max_limit, self.limit + step)
+        if int(self.limit) != previous:
+            self.counters["increases"] += 1
+            self._record("increase")
+
+    def _decrease(self, reason: str) -> None:
+        # Requests already in flight were sent under the old limit: ignore
+        # their signals for one round trip instead of cutting again
+        now = time.monotonic()
+        if now - self._last_decrease < max(self.recent or 0.0, 0.05):
+            return
+        self._last_decrease = now
+        self.slow_start = False
+        self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+        self.recent = self.baseline
+        self.counters["decreases"] += 1
+        self._record(reason)
+
+    @contextmanager
+    def slot(self) -> Iterator["SlotOutcome"]:
+        """
+        Hold a slot for one request. Set overloaded/reason on the yielded
+        outcome; exceptions count as overload only for timeouts and
+        connection errors (see is_overload_error).
+        """
+        outcome = SlotOutcome()
+        outcome.waited = self.acquire()
+        start = time.monotonic()
+        try:
+            yield outcome
+        except Exception as e:
+            if is_overload_error(e):
+                outcome.overloaded, outcome.reason = True, type(e).__name__
+            raise
+        finally:
+            self.release(time.monotonic() - start, outcome.overloaded, outcome.reason)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Current limit, requests in flight, latencies (ms) and counters"""
+        with self._cond:
+            return {
+                "limit": int(self.limit),
+                "in_flight": self.in_flight,
+                "min_limit": self.min_limit,
+                "max_limit": self.max_limit,
+                "slow_start": self.slow_start,
+                "baseline_ms": round(self.baseline * 1000, 1) if self.baseline is not None else None,
+                "recent_ms": round(self.recent * 1000, 1) if self.recent is not None else None,
+                **self.counters,
+            }
+
+    def limit_history(self) -> List[Dict[str, Any]]:
+        """Limit changes: seconds since start, new limit and reason"""
+        with self._cond:
+            return list(self.history)
+
+
+class SlotOutcome:
+    """Outcome of the request holding a slot, filled in by the caller"""
+
+    __slots__ = ("overloaded", "reason", "waited")
+
+    def __init__(self):
+        self.overloaded = False
+        self.reason = "error"
+        self.waited = 0.0
+
+
+def is_overload_status(status: int) -> bool:
+    """429 and 5xx mean the API is overloaded"""
+    return status == 429 or status >= 500
+
+
+def is_overload_error(error: Exception) -> bool:
+    """Timeouts and refused/reset connections mean the API is overloaded"""
+    return isinstance(error, (requests.Timeout, requests.ConnectionError))
+
+
+def worker_count(client, max_workers: Optional[int], default: int) -> int:
+    """
+    Threads for a parallel path of client.
+
+    An explicit max_workers always wins. Otherwise, with an adaptive limiter
+    the pool is sized to its ceiling and the limiter decides how many
+    requests are in flight; without one the configured default is used.
+    """
+    if max_workers:
+        return max_workers
+    limiter = getattr(client, "limiter", None)
+    return limiter.max_limit if limiter else default
@@ -0,0 +1,409 @@
+"""
+Foreplay API - Columnar Segment Corpus
+Description: Stores every timestamped transcript segment of a board as columns
+on disk instead of lists of dicts: start/end times as float32 NumPy arrays, ad
+ids as a dictionary-encoded column, and sentences as one UTF-8 string table
+with an offset index. All columns are memory-mapped on open, so slicing by ad,
+time-window queries ("what is said in the first 3 seconds") and scans across
+many boards only page in the data they touch.
+
+A board's corpus directory holds immutable versions. Each rebuild writes a
+new "v<timestamp>" subdirectory and then switches the CURRENT pointer file
+to it with one atomic rename, under the board's lock file. Readers hold the
+lock shared only while they map a version, so two sessions rebuilding the
+same board never remove each other's files and the Analisi tab keeps a
+consistent view of the version it opened.
+
+Layout of a corpus version:
+    start.npy, end.npy     float32 segment times (seconds)
+    ad.npy                 uint32 code into meta.json "ad_ids"
+    ad_offsets.npy         uint64, segments of ad k are [ad_offsets[k], ad_offsets[k+1])
+    ad_duration.npy        float32 video_duration of ad k
+    text.bin, text.npy     UTF-8 sentences and their uint64 offsets
+    meta.json              board id, ad ids/names, counts
+
+NumPy is imported on first use, so importing this module stays cheap.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import time
+from array import array
+from typing import Optional, Dict, Any, List, Iterable, Iterator, Tuple, TYPE_CHECKING
+
+from config import config
+from foreplay_locks import FileLock
+from foreplay_profiler import profiled
+
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
+
+
+CORPUS_VERSION = 2
+META_FILE = "meta.json"
+CURRENT_FILE = "CURRENT"
+LOCK_FILE = ".lock"
+KEEP_VERSIONS = 2  # the current version plus the previous one
+
+# float32 keeps ~7 significant digits; times are reported rounded to milliseconds
+TIME_DECIMALS = 3
+
+
+def corpus_path(board_id: str, root: Optional[str] = None) -> str:
+    """Directory of a board's corpus under root (default config.CORPUS_DIR)"""
+    safe = "".join(c for c in str(board_id) if c.isalnum() or c in "-_") or "default"
+    return os.path.join(root or config.CORPUS_DIR, safe)
+
+
+def current_version(directory: str) -> Optional[str]:
+    """
+    Version directory a board corpus currently points to.
+
+    Returns:
+        Path of the current version, the directory itself for a corpus
+        written before versioning, or None when there is no corpus
+    """
+    try:
+        with open(os.path.join(directory, CURRENT_FILE), "r", encoding="utf-8") as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        name = ""
+    if name and os.path.isfile(os.path.join(directory, name, META_FILE)):
+        return os.path.join(directory, name)
+    if os.path.isfile(os.path.join(directory, META_FILE)):
+        return directory
+    return None
+
+
+class SegmentCorpusWriter:
+    """
+    Streams ads into a new version of a board corpus.
+
+    Files are written to a temporary directory inside the board directory.
+    close() renames it to a new version and switches CURRENT to it, so
+    readers never see a half-written corpus.
+    """
+
+    def __init__(self, directory: str, **meta: Any):
+        self.directory = directory
+        self.meta = meta
+        os.makedirs(directory, exist_ok=True)
+        self._tmp = tempfile.mkdtemp(dir=directory, prefix=".tmp-")
+
+        self.ad_ids: List[str] = []
+        self.names: List[str] = []
+        self.starts = array("f")
+        self.ends = array("f")
+        self.codes = array("I")
+        self.ad_offsets = array("Q", [0])
+        self.ad_durations = array("f")
+        self.text_offsets = array("Q", [0])
+        self._text = open(os.path.join(self._tmp, "text.bin"), "wb")
+
+    def append(self, ad: Dict[str, Any]) -> None:
+        """Add the timestamped segments of one ad (ads without segments are skipped)"""
+        segments = ad.get('timestamped_transcription') or []
+        if not segments:
+            return
+
+        code = len(self.ad_ids)
+        self.ad_ids.append(str(ad.get('ad_id') or ad.get('id') or ''))
+        self.names.append(ad.get('name') or '')
+        self.ad_durations.append(float(ad.get('video_duration') or 0))
+
+        for segment in segments:
+            self.starts.append(float(segment.get('startTime') or 0))
+            self.ends.append(float(segment.get('endTime') or 0))
+            self.codes.append(code)
+            encoded = (segment.get('sentence') or '').strip().encode("utf-8")
+            self._text.write(encoded)
+            self.text_offsets.append(self.text_offsets[-1] + len(encoded))
+        self.ad_offsets.append(len(self.starts))
+
+    def extend(self, ads: Iterable[Dict[str, Any]]) -> None:
+        for ad in ads:
+            self.append(ad)
+
+    def close(self) -> "SegmentCorpus":
+        import numpy as np
+
+        self._text.close()
+        columns = {
+            "start": np.frombuffer(self.starts, dtype=np.float32),
+            "end": np.frombuffer(self.ends, dtype=np.float32),
+            "ad": np.frombuffer(self.codes, dtype=np.uint32),
+            "ad_offsets": np.frombuffer(self.ad_offsets, dtype=np.uint64),
+            "ad_duration": np.frombuffer(self.ad_durations, dtype=np.float32),
+            "text": np.frombuffer(self.text_offsets, dtype=np.uint64),
+        }
+        for name, column in columns.items():
+            np.save(os.path.join(self._tmp, f"{name}.npy"), column)
+
+        meta = {
+            **self.meta,
+            "version": CORPUS_VERSION,
+            "ad_ids": self.ad_ids,
+            "names": self.names,
+            "segments": len(self.starts),
+            "created_at": time.time(),
+        }
+        with open(os.path.join(self._tmp, META_FILE), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+
+        with FileLock(os.path.join(self.directory, LOCK_FILE)):
+            name = f"v{time.time_ns():020d}"
+            os.replace(self._tmp, os.path.join(self.directory, name))
+            fd, pointer = tempfile.mkstemp(dir=self.directory, prefix=".tmp-", suffix=".current")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(name)
+            os.replace(pointer, os.path.join(self.directory, CURRENT_FILE))
+            self._prune(name)
+            return SegmentCorpus(os.path.join(self.directory, name))
+
+    def _prune(self, current: str) -> None:
+        """Remove versions older than the last KEEP_VERSIONS and files of an unversioned corpus"""
+        versions = sorted(
+            name for name in os.listdir(self.directory)
+            if name.startswith("v") and os.path.isdir(os.path.join(self.directory, name))
+        )
+        for name in versions[:-KEEP_VERSIONS]:
+            if name != current:
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+        for name in ("start.npy", "end.npy", "ad.npy", "ad_offsets.npy", "ad_duration.npy", "text.bin", "text.npy", META_FILE):
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+    def abort(self) -> None:
+        self._text.close()
+        shutil.rmtree(self._tmp, ignore_errors=True)
+
+    def __enter__(self) -> "SegmentCorpusWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is not None:
+            self.abort()
+
+
+@profiled("corpus")
+def build_corpus(ads: Iterable[Dict[str, Any]], directory: str, **meta: Any) -> "SegmentCorpus":
+    """
+    Write the segments of ads as a new version of a board corpus.
+
+    Args:
+        ads: Extracted ads (list or ResultHandle)
+        directory: Board corpus directory (see corpus_path())
+        **meta: Extra metadata kept with the corpus (board_id, ...)
+
+    Returns:
+        The memory-mapped corpus
+    """
+    with SegmentCorpusWriter(directory, **meta) as writer:
+        writer.extend(ads)
+        return writer.close()
+
+
+class SegmentCorpus:
+    """
+    Read-only, memory-mapped view of a segment corpus.
+
+    Example:
+        corpus = SegmentCorpus(corpus_path(board_id))
+        hooks = corpus.hooks(seconds=3)          # ad_id -> opening sentences
+        rows = corpus.window(0, 3)               # segment indices overlapping 0-3s
+        corpus.to_dataframe(rows)
+    """
+
+    def __init__(self, directory: str):
+        """
+        Open a corpus.
+
+        Args:
+            directory: Board corpus directory (its current version is
+                opened) or one version directory
+
+        Raises:
+            FileNotFoundError: If there is no corpus
+        """
+        lock_path = os.path.join(directory, LOCK_FILE)
+        if not os.path.exists(lock_path):
+            self._open(directory)
+            return
+        # Writers prune old versions under the exclusive lock; once mapped,
+        # the files stay readable even after they are removed
+        with FileLock(lock_path, shared=True):
+            self._open(directory)
+
+    def _open(self, directory: str) -> None:
+        import numpy as np
+
+        version = current_version(directory)
+        if version is None:
+            raise FileNotFoundError(f"No corpus in {directory}")
+        self.directory = directory = version
+        with open(os.path.join(directory, META_FILE), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta.get("version") != CORPUS_VERSION:
+            raise ValueError(f"Unsupported corpus version in {directory}: {self.meta.get('version')}")
+
+        self.ad_ids: List[str] = self.meta["ad_ids"]
+        self.names: List[str] = self.meta["names"]
+        self._codes = {ad_id: code for code, ad_id in enumerate(self.ad_ids)}
+
+        self.start = self._load("start")
+        self.end = self._load("end")
+        self.ad = self._load("ad")
+        self.ad_offsets = self._load("ad_offsets")
+        self.ad_duration = self._load("ad_duration")
+        self.text_offsets = self._load("text")
+
+        text_path = os.path.join(directory, "text.bin")
+        if os.path.getsize(text_path) > 0:
+            self._text = np.memmap(text_path, dtype=np.uint8, mode="r")
+        else:
+            self._text = np.zeros(0, dtype=np.uint8)
+
+    def _load(self, name: str) -> "np.ndarray":
+        import numpy as np
+
+        return np.load(os.path.join(self.directory, f"{name}.npy"), mmap_mode="r")
+
+    @property
+    def board_id(self) -> Optional[str]:
+        return self.meta.get("board_id")
+
+    def __len__(self) -> int:
+        return self.meta["segments"]
+
+    @property
+    def ad_count(self) -> int:
+        return len(self.ad_ids)
+
+    @property
+    def duration(self) -> "np.ndarray":
+        """Duration of each segment in seconds"""
+        return self.end - self.start
+
+    def sentence(self, index: int) -> str:
+        start, end = int(self.text_offsets[index]), int(self.text_offsets[index + 1])
+        return self._text[start:end].tobytes().decode("utf-8")
+
+    def sentences(self, indices: Optional[Iterable[int]] = None) -> List[str]:
+        """Decode the sentences at indices (all of them when indices is None)"""
+        if indices is None:
+            data = self._text.tobytes()
+            offsets = self.text_offsets.tolist()
+            return [data[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(self))]
+        return [self.sentence(int(i)) for i in indices]
+
+    def ad_slice(self, ad_id: str) -> slice:
+        """Segment index range of one ad (empty slice if the ad has no segments)"""
+        code = self._codes.get(str(ad_id))
+        if code is None:
+            return slice(0, 0)
+        return slice(int(self.ad_offsets[code]), int(self.ad_offsets[code + 1]))
+
+    def segments(self, ad_id: str) -> List[Dict[str, Any]]:
+        """Segments of one ad in the API's startTime/endTime/sentence shape"""
+        span = self.ad_slice(ad_id)
+        return [
+            {
+                "startTime": round(float(self.start[i]), TIME_DECIMALS),
+                "endTime": round(float(self.end[i]), TIME_DECIMALS),
+                "sentence": self.sentence(i)
+            }
+            for i in range(span.start, span.stop)
+        ]
+
+    def window(self, start: float = 0.0, end: float = float("inf"), mode: str = "overlap") -> "np.ndarray":
+        """
+        Indices of the segments falling in a time window (seconds from video start).
+
+        Args:
+            start: Window start
+            end: Window end
+            mode: "overlap" (any overlap), "within" (fully inside) or "start"
+                (segment starts inside the window)
+
+        Returns:
+            Sorted segment indices
+        """
+        if mode == "overlap":
+            mask = (self.start < end) & (self.end > start)
+        elif mode == "within":
+            mask = (self.start >= start) & (self.end <= end)
+        elif mode == "start":
+            mask = (self.start >= start) & (self.start < end)
+        else:
+            raise ValueError(f"Unknown window mode: {mode} (use overlap, within or start)")
+        return mask.nonzero()[0]
+
+    def hooks(self, seconds: float = 3.0) -> Dict[str, str]:
+        """
+        Opening line of every ad: the sentences starting in its first seconds.
+
+        Returns:
+            Dictionary ad_id -> joined sentences (ads with no segment in the window are omitted)
+        """
+        hooks: Dict[str, List[str]] = {}
+        for i in self.window(0.0, seconds, mode="start"):
+            hooks.setdefault(self.ad_ids[int(self.ad[i])], []).append(self.sentence(int(i)))
+        return {ad_id: " ".join(parts) for ad_id, parts in hooks.items()}
+
+    def to_dataframe(self, indices: Optional[Iterable[int]] = None) -> "pd.DataFrame":
+        """Segments as a DataFrame (same columns as create_timestamped_dataframe)"""
+        import numpy as np
+        import pandas as pd
+
+        if indices is None:
+            indices = np.arange(len(self))
+            sentences = self.sentences()
+        else:
+            indices = np.asarray(indices, dtype=np.int64)
+            sentences = self.sentences(indices)
+        codes = np.asarray(self.ad[indices])
+        return pd.DataFrame({
+            'ad_id': np.asarray(self.ad_ids, dtype=object)[codes],
+            'name': np.asarray(self.names, dtype=object)[codes],
+            'start_time': np.round(np.asarray(self.start[indices], dtype=np.float64), TIME_DECIMALS),
+            'end_time': np.round(np.asarray(self.end[indices], dtype=np.float64), TIME_DECIMALS),
+            'sentence': sentences,
+        })
+
+
+def open_corpora(root: Optional[str] = None) -> Iterator[SegmentCorpus]:
+    """Yield every board corpus stored under root (default config.CORPUS_DIR)"""
+    root = root or config.CORPUS_DIR
+    if not os.path.isdir(root):
+        return
+    for name in sorted(os.listdir(root)):
+        directory = os.path.join(root, name)
+        if name.startswith(".") or current_version(directory) is None:
+            continue
+        try:
+            yield SegmentCorpus(directory)
+        except (OSError, ValueError):
+            continue
+
+
+def scan_window(
+    start: float = 0.0,
+    end: float = float("inf"),
+    mode: str = "overlap",
+    root: Optional[str] = None
+) -> Iterator[Tuple[SegmentCorpus, "np.ndarray"]]:
+    """
+    Run a time-window query across every stored board, one corpus at a time.
+
+    Yields:
+        (corpus, matching segment indices) for boards with at least one match
+    """
+    for corpus in open_corpora(root):
+        indices = corpus.window(start, end, mode=mode)
+        if len(indices):
+            yield corpus, indices
@@ -0,0 +1,76 @@
+"""
+Foreplay API - Content-Addressed Transcript Deduplication
+Description: Ad variants that share a video also share their full_transcription
+and timestamped_transcription. These helpers hash the transcript payload so
+that stores and exports keep one shared blob per distinct transcript and ads
+refer to it by id.
+"""
+
+import hashlib
+import json
+from typing import Optional, Dict, Any, List, Iterable, Tuple
+
+
+TRANSCRIPT_FIELDS = ("full_transcription", "timestamped_transcription")
+
+# Key under which a stored ad record points to its transcript blob
+TRANSCRIPT_REF = "_transcript"
+
+
+def transcript_payload(ad: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Return the transcript fields of an ad, or None if it has no transcript"""
+    if not ad.get('full_transcription') and not ad.get('timestamped_transcription'):
+        return None
+    return {field: ad.get(field) for field in TRANSCRIPT_FIELDS}
+
+
+def transcript_id(payload: Dict[str, Any]) -> str:
+    """Content hash of a transcript payload (stable across runs and processes)"""
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+def split_transcript(ad: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional[str], Optional[Dict[str, Any]]]:
+    """
+    Separate an ad from its transcript.
+
+    Returns:
+        Tuple (ad without transcript fields, transcript id, transcript payload);
+        id and payload are None for ads without a transcript
+    """
+    payload = transcript_payload(ad)
+    if payload is None:
+        return ad, None, None
+    stripped = {key: value for key, value in ad.items() if key not in TRANSCRIPT_FIELDS}
+    return stripped, transcript_id(payload), payload
+
+
+def normalize_ads(ads: Iterable[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Dict[str, Dict[str, Any]]]:
+    """
+    Split ads into ad rows and a table of unique transcripts.
+
+    Each returned ad carries a "transcript_id" (None without transcript).
+    Each transcript entry lists the ads and the distinct video URLs that share it.
+
+    Args:
+        ads: Extracted ads (full details)
+
+    Returns:
+        Tuple (ads, transcripts by id)
+    """
+    rows: List[Dict[str, Any]] = []
+    transcripts: Dict[str, Dict[str, Any]] = {}
+
+    for ad in ads:
+        stripped, tid, payload = split_transcript(ad)
+        rows.append({**stripped, "transcript_id": tid})
+        if tid is None:
+            continue
+        entry = transcripts.get(tid)
+        if entry is None:
+            entry = transcripts[tid] = {**payload, "ad_ids": [], "video_urls": []}
+        entry["ad_ids"].append(ad.get('ad_id') or ad.get('id'))
+        if ad.get('video') and ad['video'] not in entry["video_urls"]:
+            entry["video_urls"].append(ad['video'])
+
+    return rows, transcripts
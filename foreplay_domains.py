@@ -0,0 +1,278 @@
+"""
+Foreplay API - Domain Resolution
+Description: Resolves landing-page URLs to Foreplay brands with as few
+getBrandsByDomain calls as possible.
+
+The endpoint accepts "example.com", "https://www.example.com/shop?x=1" and
+"shop.example.com" alike, so the same brand lookup used to be sent under many
+spellings and cached under none. Every input is first reduced to its
+registrable domain (scheme, credentials, port, path, "www." and subdomains
+dropped; internationalized names in punycode), using the Public Suffix List
+when tldextract is installed and a built-in table of common suffixes
+otherwise. Hosting platforms where every subdomain is its own site
+(myshopify.com, github.io, ...) keep the shop's label.
+
+Resolved brand lists are cached on disk for config.DOMAIN_CACHE_TTL_HOURS
+(domains without brands for config.DOMAIN_MISSING_TTL_HOURS), and every
+brand keeps the list of domains it was found under (domains_for_brand). Bulk
+resolution deduplicates the domains first and looks the missing ones up in
+parallel.
+"""
+
+import contextvars
+import ipaddress
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional, Dict, Any, List, Iterable, Callable
+from urllib.parse import urlsplit
+
+from config import config
+from foreplay_cache import JsonDiskCache
+
+try:
+    import tldextract
+    # Bundled suffix list snapshot only: no download at run time
+    _extract = tldextract.TLDExtract(suffix_list_urls=(), include_psl_private_domains=True)
+    TLDEXTRACT_AVAILABLE = True
+except ImportError:  # built-in suffix table below
+    TLDEXTRACT_AVAILABLE = False
+
+
+HOST_PATTERN = re.compile(r"^[a-z0-9-]+(\.[a-z0-9-]+)*$")
+
+# Public suffixes of two labels that are common in ad landing pages
+MULTI_LABEL_SUFFIXES = frozenset((
+    "co.uk", "org.uk", "me.uk", "ltd.uk", "plc.uk", "ac.uk", "gov.uk",
+    "com.au", "net.au", "org.au", "co.nz", "net.nz", "org.nz",
+    "co.jp", "ne.jp", "or.jp", "co.kr", "or.kr", "com.cn", "net.cn", "com.hk", "com.tw", "com.sg", "com.my",
+    "co.in", "net.in", "org.in", "co.id", "co.th", "com.ph", "com.vn", "com.pk", "com.tr", "co.il",
+    "com.br", "net.br", "com.mx", "com.ar", "com.co", "com.pe", "com.uy", "com.ec", "co.za",
+    "com.eg", "com.sa", "com.ng", "co.ke", "com.ua", "com.pl", "co.at", "or.at", "com.es", "com.pt",
+))
+
+# Hosting platforms where each subdomain is a separate site (PSL private section)
+HOSTED_SUFFIXES = frozenset((
+    "myshopify.com", "wixsite.com", "squarespace.com", "webflow.io", "github.io", "gitlab.io",
+    "netlify.app", "vercel.app", "pages.dev", "herokuapp.com", "blogspot.com", "wordpress.com",
+    "myshopline.com", "mybigcommerce.com", "carrd.co", "framer.website", "web.app", "firebaseapp.com",
+))
+
+
+def registrable_domain(host: str) -> str:
+    """Registrable domain of a host name (shop.example.co.uk -> example.co.uk)"""
+    if TLDEXTRACT_AVAILABLE:
+        parts = _extract(host)
+        if parts.domain and parts.suffix:
+            return f"{parts.domain}.{parts.suffix}"
+        return host
+
+    labels = host.split(".")
+    for size in (2, 1):
+        suffix = ".".join(labels[-size:])
+        if len(labels) > size and (suffix in MULTI_LABEL_SUFFIXES or suffix in HOSTED_SUFFIXES):
+            return ".".join(labels[-size - 1:])
+    return ".".join(labels[-2:])
+
+
+def canonical_domain(url: str) -> Optional[str]:
+    """
+    Canonical lookup key of a URL, host or domain.
+
+    Args:
+        url: e.g. "https://www.Example.com/p?id=1", "shop.example.com", "example.com"
+
+    Returns:
+        Registrable domain ("example.com"), the host itself for IP addresses
+        and single-label hosts, or None when no host can be read
+    """
+    value = (url or "").strip()
+    if not value:
+        return None
+    if "://" not in value and not value.startswith("//"):
+        value = "//" + value
+    try:
+        host = urlsplit(value).hostname
+    except ValueError:
+        return None
+    if not host:
+        return None
+    host = host.strip(".")
+    try:
+        host = host.encode("idna").decode("ascii")
+    except UnicodeError:
+        return None
+
+    try:
+        ipaddress.ip_address(host)
+        return host
+    except ValueError:
+        pass
+    if not HOST_PATTERN.match(host):
+        return None
+    if "." not in host:
+        return host
+    if host.startswith("www."):
+        host = host[len("www."):]
+    return registrable_domain(host)
+
+
+def _brand_id(brand: Dict[str, Any]) -> Optional[str]:
+    value = brand.get("id") or brand.get("brand_id")
+    return str(value) if value else None
+
+
+class DomainResolver:
+    """
+    Cached, deduplicated resolution of landing-page URLs to brands.
+
+    Example:
+        resolver = DomainResolver(client)
+        brands = resolver.resolve("https://www.example.com/products/x")
+        by_url = resolver.resolve_many(landing_page_urls)   # parallel, one call per domain
+        resolver.domains_for_brand(brands[0]["id"])         # ["example.com", ...]
+    """
+
+    def __init__(
+        self,
+        client,
+        max_workers: Optional[int] = None,
+        cache_dir: Optional[str] = None,
+        ttl_hours: Optional[float] = None
+    ):
+        """
+        Initialize the resolver.
+
+        Args:
+            client: ForeplayAPIClient instance
+            max_workers: Domains looked up concurrently
+            cache_dir: Root of the caches (default config.CACHE_DIR)
+            ttl_hours: Lifetime of cached brand lists (default
+                config.DOMAIN_CACHE_TTL_HOURS)
+        """
+        self.client = client
+        self.max_workers = max_workers or config.DOMAIN_MAX_WORKERS
+        ttl_hours = config.DOMAIN_CACHE_TTL_HOURS if ttl_hours is None else ttl_hours
+        self.cache = JsonDiskCache("domains", cache_dir=cache_dir, ttl=ttl_hours * 3600)
+        self.missing = JsonDiskCache("domains_missing", cache_dir=cache_dir, ttl=config.DOMAIN_MISSING_TTL_HOURS * 3600)
+        self.reverse = JsonDiskCache("brand_domains", cache_dir=cache_dir)
+
+        self._lock = threading.Lock()
+        self.errors: Dict[str, Exception] = {}
+        self.stats: Dict[str, int] = {"inputs": 0, "invalid": 0, "domains": 0, "cached": 0, "fetched": 0, "failed": 0}
+
+    def _count(self, **values: int) -> None:
+        with self._lock:
+            for name, value in values.items():
+                self.stats[name] += value
+
+    def _cached(self, domain: str) -> Optional[List[Dict[str, Any]]]:
+        brands = self.cache.get(domain)
+        if brands is None and domain in self.missing:
+            brands = []
+        return brands
+
+    def _fetch(self, domain: str) -> List[Dict[str, Any]]:
+        response = self.client.get_brands_by_domain(domain, limit=config.DOMAIN_BRAND_LIMIT)
+        brands = [b for b in response.get("data") or [] if isinstance(b, dict)]
+        previous = set(filter(None, map(_brand_id, self.cache.get(domain) or [])))
+        if brands:
+            self.cache.set(domain, brands)
+            self.missing.delete(domain)
+        else:
+            # A refresh that finds nothing replaces the old brand list
+            self.cache.delete(domain)
+            self.missing.set(domain, True)
+
+        current = set(filter(None, map(_brand_id, brands)))
+        for brand_id in sorted(previous | current):
+            # Read-modify-write of the shared entry, one brand at a time
+            with self._lock:
+                domains = self.reverse.get(brand_id, [])
+                if brand_id in current and domain not in domains:
+                    self.reverse.set(brand_id, sorted(domains + [domain]))
+                elif brand_id not in current and domain in domains:
+                    domains = [d for d in domains if d != domain]
+                    if domains:
+                        self.reverse.set(brand_id, domains)
+                    else:
+                        self.reverse.delete(brand_id)
+        self._count(fetched=1)
+        return brands
+
+    def resolve(self, url: str, refresh: bool = False) -> List[Dict[str, Any]]:
+        """
+        Brands of the domain of url (cached).
+
+        Args:
+            url: URL, host or domain
+            refresh: Ignore the cached brand list
+
+        Returns:
+            List of brand dicts as returned by getBrandsByDomain (empty for
+            unreadable URLs and domains without brands)
+        """
+        return self.resolve_many([url], refresh=refresh)[url]
+
+    def resolve_many(
+        self,
+        urls: Iterable[str],
+        refresh: bool = False,
+        on_progress: Optional[Callable[[int, int], None]] = None
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Resolve many URLs, calling the API once per distinct uncached domain.
+
+        Lookups that fail are reported in self.errors (domain -> exception),
+        not cached, and resolve to an empty list.
+
+        Args:
+            urls: URLs, hosts or domains (duplicates are fine)
+            refresh: Ignore cached brand lists
+            on_progress: Called with (domains done, domains to fetch)
+
+        Returns:
+            Dictionary mapping every input URL to its brands
+        """
+        urls = list(dict.fromkeys(urls))
+        domains = {url: canonical_domain(url) for url in urls}
+        unique = list(dict.fromkeys(d for d in domains.values() if d))
+        self._count(inputs=len(urls), invalid=sum(1 for d in domains.values() if not d), domains=len(unique))
+
+        resolved: Dict[str, List[Dict[str, Any]]] = {}
+        if not refresh:
+            for domain in unique:
+                brands = self._cached(domain)
+                if brands is not None:
+                    resolved[domain] = brands
+            self._count(cached=len(resolved))
+        pending = [d for d in unique if d not in resolved]
+
+        if pending:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(pending))) as executor:
+                futures = {
+                    executor.submit(contextvars.copy_context().run, self._fetch, domain): domain
+                    for domain in pending
+                }
+                for done, future in enumerate(as_completed(futures), 1):
+                    domain = futures[future]
+                    try:
+                        resolved[domain] = future.result()
+                    except Exception as e:
+                        resolved[domain] = []
+                        with self._lock:
+                            self.errors[domain] = e
+                        self._count(failed=1)
+                    if on_progress:
+                        on_progress(done, len(pending))
+
+        return {url: resolved.get(domain, []) if domain else [] for url, domain in domains.items()}
+
+    def domains_for_brand(self, brand_id: str) -> List[str]:
+        """Domains under which a brand has been resolved so far"""
+        return self.reverse.get(str(brand_id), [])
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Counters of the lookups (inputs, distinct domains, cached, fetched, failed)"""
+        with self._lock:
+            return dict(self.stats)
@@ -0,0 +1,246 @@
+"""
+Foreplay API - Export Builders
+Description: Builds the CSV, Excel and JSON exports of extracted video ads.
+Shared by the Streamlit GUI and the benchmarks.
+"""
+
+import json
+import textwrap
+from typing import TYPE_CHECKING, Optional, Dict, Any, Iterable, Sequence, Tuple
+
+from foreplay_dedup import normalize_ads
+from foreplay_profiler import profiled
+
+# pandas (~0.5s to import) and openpyxl are imported on first use, so the GUI
+# paints before paying for them
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+def _clean_description(description: str) -> str:
+    return (description or '').replace('<br />', '\n').replace('<br>', '\n')
+
+
+@profiled("dataframe")
+def create_quick_dataframe(video_ads: Iterable[Dict[str, Any]]) -> "pd.DataFrame":
+    """Crea DataFrame rapido (ad_id, name, full_transcription)"""
+    import pandas as pd
+
+    return pd.DataFrame([
+        {
+            'ad_id': ad.get('ad_id', ''),
+            'name': ad.get('name', ''),
+            'full_transcription': ad.get('full_transcription', '')
+        }
+        for ad in video_ads
+    ])
+
+
+@profiled("dataframe")
+def create_csv_dataframe(video_ads: Iterable[Dict[str, Any]]) -> "pd.DataFrame":
+    """Crea DataFrame per CSV"""
+    import pandas as pd
+
+    rows = []
+
+    for ad in video_ads:
+        # Converti timestamped_transcription in JSON string (gestisci None)
+        timestamped_data = ad.get('timestamped_transcription') or []
+        timestamped_json = json.dumps(timestamped_data, ensure_ascii=False)
+
+        rows.append({
+            'ad_id': ad.get('ad_id', ''),
+            'name': ad.get('name', ''),
+            'brand_id': ad.get('brand_id', ''),
+            'description': _clean_description(ad.get('description', '')),
+            'headline': ad.get('headline', ''),
+            'full_transcription': ad.get('full_transcription', ''),
+            'timestamped_transcription': timestamped_json,  # JSON array completo
+            'video_duration_seconds': ad.get('video_duration', 0),
+            'display_format': ad.get('display_format', ''),
+            'publisher_platform': ', '.join(ad.get('publisher_platform', [])) if isinstance(ad.get('publisher_platform'), list) else ad.get('publisher_platform', ''),
+            'live': ad.get('live', False),
+            'video_url': ad.get('video', ''),
+            'link_url': ad.get('link_url', ''),
+        })
+
+    return pd.DataFrame(rows)
+
+
+@profiled("dataframe")
+def create_timestamped_dataframe(video_ads: Iterable[Dict[str, Any]]) -> "pd.DataFrame":
+    """Crea DataFrame con timestamp dettagliati"""
+    import pandas as pd
+
+    rows = []
+
+    for ad in video_ads:
+        ad_id = ad.get('ad_id', '')
+        name = ad.get('name', '')
+        timestamped = ad.get('timestamped_transcription') or []
+
+        for segment in timestamped:
+            rows.append({
+                'ad_id': ad_id,
+                'name': name,
+                'start_time': segment.get('startTime', 0),
+                'end_time': segment.get('endTime', 0),
+                'sentence': segment.get('sentence', '').strip()
+            })
+
+    return pd.DataFrame(rows)
+
+
+@profiled("dataframe")
+def create_normalized_dataframes(video_ads: Iterable[Dict[str, Any]]) -> Tuple["pd.DataFrame", "pd.DataFrame"]:
+    """
+    Crea due DataFrame normalizzati: ads e transcript unici.
+
+    Le varianti che condividono lo stesso video hanno lo stesso transcript:
+    ogni transcript distinto compare una sola volta, gli ads lo referenziano
+    tramite transcript_id.
+
+    Returns:
+        Tuple (ads con transcript_id, transcript unici con ad_ids e video_urls)
+    """
+    import pandas as pd
+
+    ads, transcripts = normalize_ads(video_ads)
+
+    ads_rows = [
+        {
+            'ad_id': ad.get('ad_id', ''),
+            'name': ad.get('name', ''),
+            'brand_id': ad.get('brand_id', ''),
+            'description': _clean_description(ad.get('description', '')),
+            'headline': ad.get('headline', ''),
+            'transcript_id': ad['transcript_id'] or '',
+            'video_duration_seconds': ad.get('video_duration', 0),
+            'display_format': ad.get('display_format', ''),
+            'publisher_platform': ', '.join(ad.get('publisher_platform', [])) if isinstance(ad.get('publisher_platform'), list) else ad.get('publisher_platform', ''),
+            'live': ad.get('live', False),
+            'video_url': ad.get('video', ''),
+            'link_url': ad.get('link_url', ''),
+        }
+        for ad in ads
+    ]
+
+    transcript_rows = [
+        {
+            'transcript_id': tid,
+            'full_transcription': entry.get('full_transcription') or '',
+            'timestamped_transcription': json.dumps(entry.get('timestamped_transcription') or [], ensure_ascii=False),
+            'ad_count': len(entry['ad_ids']),
+            'ad_ids': ', '.join(str(ad_id) for ad_id in entry['ad_ids']),
+            'video_urls': '\n'.join(entry['video_urls']),
+        }
+        for tid, entry in transcripts.items()
+    ]
+
+    return pd.DataFrame(ads_rows), pd.DataFrame(transcript_rows)
+
+
+@profiled("csv")
+def dataframe_to_csv(df: "pd.DataFrame", path: Optional[str] = None) -> Optional[str]:
+    """Scrive il DataFrame in CSV (utf-8-sig); senza path restituisce il testo"""
+    return df.to_csv(path, index=False, encoding='utf-8-sig')
+
+
+@profiled("json_encode")
+def create_json_export(video_ads: Iterable[Dict[str, Any]]) -> str:
+    """
+    Serializza gli ads completi in JSON.
+
+    Stesso output di json.dumps(list, indent=2), ma un ad alla volta, così gli
+    ads letti dal ResultStore non vengono caricati tutti in memoria.
+    """
+    items = [
+        textwrap.indent(json.dumps(ad, indent=2, ensure_ascii=False), "  ")
+        for ad in video_ads
+    ]
+    if not items:
+        return "[]"
+    return "[\n" + ",\n".join(items) + "\n]"
+
+
+@profiled("excel")
+def write_excel(video_ads: Sequence[Dict[str, Any]], path: str) -> None:
+    """
+    Scrive il file Excel con 2 sheets: transcript completi e timestamp dettagliati.
+
+    Args:
+        video_ads: Ads estratti, letti due volte (una lista o un ResultHandle,
+            non un generatore)
+        path: Percorso del file .xlsx
+    """
+    from openpyxl import Workbook
+    from openpyxl.styles import Font, PatternFill
+
+    wb = Workbook()
+
+    # Sheet 1: Info Generali
+    ws1 = wb.active
+    ws1.title = "Transcript Completi"
+
+    headers = ['ad_id', 'name', 'brand_id', 'description', 'headline',
+               'full_transcription', 'timestamped_transcription', 'video_duration', 'video_url']
+    ws1.append(headers)
+
+    for cell in ws1[1]:
+        cell.font = Font(bold=True, color="FFFFFF")
+        cell.fill = PatternFill(start_color="1F77B4", end_color="1F77B4", fill_type="solid")
+
+    for ad in video_ads:
+        # Converti timestamped_transcription in JSON string (gestisci None)
+        timestamped_data = ad.get('timestamped_transcription') or []
+        timestamped_json = json.dumps(timestamped_data, ensure_ascii=False)
+
+        ws1.append([
+            ad.get('ad_id', ''),
+            ad.get('name', ''),
+            ad.get('brand_id', ''),
+            ad.get('description', '').replace('<br />', '\n'),
+            ad.get('headline', ''),
+            ad.get('full_transcription', ''),
+            timestamped_json,  # JSON array completo
+            ad.get('video_duration', 0),
+            ad.get('video', '')
+        ])
+
+    # Sheet 2: Timestamp Dettagliati
+    ws2 = wb.create_sheet("Timestamp Dettagliati")
+    ws2.append(['ad_id', 'name', 'start_time', 'end_time', 'sentence'])
+
+    for cell in ws2[1]:
+        cell.font = Font(bold=True, color="FFFFFF")
+        cell.fill = PatternFill(start_color="28A745", end_color="28A745", fill_type="solid")
+
+    for ad in video_ads:
+        timestamped = ad.get('timestamped_transcription') or []
+        for seg in timestamped:
+            ws2.append([
+                ad.get('ad_id', ''),
+                ad.get('name', ''),
+                seg.get('startTime', 0),
+                seg.get('endTime', 0),
+                seg.get('sentence', '')
+            ])
+
+    wb.save(path)
+
+
+@profiled("excel")
+def write_insights_excel(report: Dict[str, Any], path: str) -> None:
+    """
+    Scrive il report di analisi transcript in Excel, un foglio per tabella.
+
+    Args:
+        report: Report di foreplay_insights.compute_insights
+        path: Percorso del file .xlsx
+    """
+    import pandas as pd
+    from foreplay_insights import report_tables
+
+    with pd.ExcelWriter(path, engine="openpyxl") as writer:
+        for name, df in report_tables(report).items():
+            df.to_excel(writer, sheet_name=name[:31], index=False)
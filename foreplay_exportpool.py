@@ -0,0 +1,360 @@
+"""
+Foreplay API - Export Worker Pool
+Description: Runs CPU-heavy export builders (DataFrames, CSV, Parquet, Excel
+through openpyxl) in separate processes, so one large export no longer holds
+the interpreter that serves every GUI session.
+
+The fly.toml VM has a single shared CPU. Builders used to run in the
+Streamlit process, where a long openpyxl save stalled the reruns of every
+other user. Jobs now go to a pool of config.EXPORT_MAX_WORKERS worker
+processes started with "spawn" (no copy of the GUI's threads or memory) and
+running at a lower CPU priority (config.EXPORT_WORKER_NICE).
+
+No ads are pickled. A job names a ResultStore directory that is already on
+disk and the file to write. The worker reads the ads back from that
+directory and returns only a small info dict. Workers report progress (ads
+read per pass) through a queue that a listener thread in the parent turns
+into per-job status.
+
+Waiting jobs are kept in a priority queue in the parent, and at most
+max_workers run at once. Interactive jobs (a user waiting on a button) go
+before prefetch jobs (exports built ahead of time), and a prefetch job is
+promoted when someone starts waiting for it. A worker that dies (e.g.
+killed for memory) fails only its own job; the pool is recreated for the
+next one.
+"""
+
+import heapq
+import itertools
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Future
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Dict, Any, Callable
+
+from config import config
+from foreplay_scheduler import INTERACTIVE, BACKGROUND, PREFETCH
+from foreplay_store import ResultHandle
+
+
+RANKS = {INTERACTIVE: 0, BACKGROUND: 1, PREFETCH: 2}
+PROGRESS_INTERVAL = 0.25  # seconds between two progress messages of a job
+
+# Set in every worker by _init_worker
+_progress_queue = None
+
+
+def _init_worker(progress_queue, nice: int) -> None:
+    global _progress_queue
+    _progress_queue = progress_queue
+    if nice and hasattr(os, "nice"):
+        try:
+            os.nice(nice)
+        except OSError:
+            pass
+
+
+def _report(key: str, done: int, total: int) -> None:
+    if _progress_queue is not None:
+        try:
+            _progress_queue.put_nowait((key, done, total))
+        except (queue.Full, ValueError, OSError):
+            pass
+
+
+class _ProgressAds:
+    """Ads of a result set that report how many have been read (over every pass)"""
+
+    def __init__(self, handle: ResultHandle, key: str, passes: int):
+        self.handle = handle
+        self.key = key
+        self.total = len(handle) * max(1, passes)
+        self.done = 0
+        self._reported = 0.0
+
+    @property
+    def meta(self) -> Dict[str, Any]:
+        return self.handle.meta
+
+    def __len__(self) -> int:
+        return len(self.handle)
+
+    def __iter__(self):
+        for ad in self.handle:
+            self.done += 1
+            now = time.monotonic()
+            if now - self._reported >= PROGRESS_INTERVAL:
+                self._reported = now
+                _report(self.key, min(self.done, self.total), self.total)
+            yield ad
+
+
+def _run(key: str, build: Callable, directory: str, path: str, passes: int) -> Dict[str, Any]:
+    """Worker side of a job: read the ads from disk and write the export to path"""
+    ads = _ProgressAds(ResultHandle.open(directory), key, passes)
+    _report(key, 0, ads.total)
+    return build(ads, path)
+
+
+class ExportWorkerPool:
+    """
+    Priority queue of export jobs run in worker processes.
+
+    Example:
+        pool = ExportWorkerPool()
+        future = pool.submit("B1/v1/excel", build_excel, handle.directory, "/tmp/out.xlsx", passes=2)
+        pool.progress("B1/v1/excel")   # {"state": "running", "done": 1200, "total": 4000, ...}
+        info = future.result()
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, processes: Optional[bool] = None):
+        """
+        Initialize the pool (workers start with the first job).
+
+        Args:
+            max_workers: Jobs run at the same time
+            processes: Run jobs in worker processes (default
+                config.EXPORT_PROCESSES); False runs them in threads of this
+                process
+        """
+        self.max_workers = max_workers or config.EXPORT_MAX_WORKERS
+        self.processes = config.EXPORT_PROCESSES if processes is None else processes
+
+        self._lock = threading.Lock()
+        self._executor = None
+        self._heap: list = []
+        self._seq = itertools.count()
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._running = 0
+        self._closed = False
+        self.stats: Dict[str, int] = {"submitted": 0, "completed": 0, "failed": 0, "promoted": 0, "pool_restarts": 0}
+
+        if self.processes:
+            self._context = multiprocessing.get_context("spawn")
+            self._progress = self._context.Queue()
+        else:
+            self._progress = queue.Queue()
+        self._listener = threading.Thread(target=self._listen, name="export-progress", daemon=True)
+        self._listener.start()
+
+    def _new_executor(self):
+        if self.processes:
+            options = {}
+            if config.EXPORT_WORKER_MAX_TASKS:
+                # Workers are replaced now and then, returning the memory of big exports
+                options["max_tasks_per_child"] = config.EXPORT_WORKER_MAX_TASKS
+            return ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=self._context,
+                initializer=_init_worker,
+                initargs=(self._progress, config.EXPORT_WORKER_NICE),
+                **options
+            )
+        # Threads share this process: no nice() here, it would slow the GUI too
+        return ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix="export",
+            initializer=_init_worker,
+            initargs=(self._progress, 0)
+        )
+
+    def _listen(self) -> None:
+        while True:
+            try:
+                message = self._progress.get(timeout=1.0)
+            except queue.Empty:
+                if self._closed:
+                    return
+                continue
+            except (EOFError, OSError, ValueError):
+                return
+            if message is None:
+                return
+            key, done, total = message
+            with self._lock:
+                job = self._jobs.get(key)
+                if job is not None and job["state"] == "running":
+                    job["done"], job["total"] = done, total
+
+    # =============================================================================
+    # QUEUE
+    # =============================================================================
+
+    def submit(
+        self,
+        key: str,
+        build: Callable[[Any, str], Dict[str, Any]],
+        directory: str,
+        path: str,
+        passes: int = 1,
+        request_class: str = INTERACTIVE
+    ) -> Future:
+        """
+        Queue a job, or return the job already queued or running under key.
+
+        Args:
+            key: Identity of the job (one job per key at a time)
+            build: Module-level function (ads, path) -> info dict
+            directory: ResultStore directory of the ads
+            path: File the job writes
+            passes: Times build iterates over the ads (for progress)
+            request_class: INTERACTIVE, BACKGROUND or PREFETCH
+
+        Returns:
+            Future resolving to build's info dict
+        """
+        rank = RANKS[request_class]
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Export pool is closed")
+            job = self._jobs.get(key)
+            if job is not None:
+                existing = job["future"]
+            else:
+                existing = None
+                job = {
+                    "future": Future(), "rank": rank, "state": "queued", "done": 0, "total": 0,
+                    "args": (key, build, directory, path, passes), "queued_at": time.time(),
+                }
+                self._jobs[key] = job
+                heapq.heappush(self._heap, (rank, next(self._seq), key))
+                self.stats["submitted"] += 1
+        if existing is not None:
+            self.promote(key, request_class)
+            return existing
+        self._dispatch()
+        return job["future"]
+
+    def promote(self, key: str, request_class: str) -> bool:
+        """
+        Move a queued job up to request_class.
+
+        Returns:
+            True if the job was queued with a lower priority
+        """
+        rank = RANKS[request_class]
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is None or job["state"] != "queued" or rank >= job["rank"]:
+                return False
+            job["rank"] = rank
+            heapq.heappush(self._heap, (rank, next(self._seq), key))
+            self.stats["promoted"] += 1
+        self._dispatch()
+        return True
+
+    def _dispatch(self) -> None:
+        while True:
+            with self._lock:
+                if self._closed or self._running >= self.max_workers:
+                    return
+                job = None
+                while self._heap:
+                    rank, _, key = heapq.heappop(self._heap)
+                    candidate = self._jobs.get(key)
+                    # Skip entries left behind by promotions
+                    if candidate is not None and candidate["state"] == "queued" and candidate["rank"] == rank:
+                        job = candidate
+                        break
+                if job is None:
+                    return
+                job["state"] = "running"
+                job["started_at"] = time.time()
+                self._running += 1
+                if self._executor is None:
+                    self._executor = self._new_executor()
+                executor = self._executor
+            try:
+                inner = executor.submit(_run, *job["args"])
+            except (BrokenProcessPool, RuntimeError) as e:
+                self._finish(job, executor, error=e)
+                continue
+            inner.add_done_callback(lambda f, job=job, executor=executor: self._done(job, executor, f))
+
+    def _done(self, job: Dict[str, Any], executor, inner: Future) -> None:
+        try:
+            self._finish(job, executor, result=inner.result())
+        except BaseException as e:
+            self._finish(job, executor, error=e)
+
+    def _finish(self, job: Dict[str, Any], executor, result: Any = None, error: Optional[BaseException] = None) -> None:
+        key = job["args"][0]
+        with self._lock:
+            self._running -= 1
+            self._jobs.pop(key, None)
+            if error is None:
+                self.stats["completed"] += 1
+            else:
+                self.stats["failed"] += 1
+                if isinstance(error, BrokenProcessPool) and self._executor is executor:
+                    # A worker died: start a fresh pool for the next jobs
+                    self._executor = None
+                    self.stats["pool_restarts"] += 1
+        if isinstance(error, BrokenProcessPool):
+            executor.shutdown(wait=False, cancel_futures=True)
+        if error is None:
+            job["future"].set_result(result)
+        else:
+            job["future"].set_exception(error)
+        self._dispatch()
+
+    # =============================================================================
+    # STATUS
+    # =============================================================================
+
+    def progress(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Status of a queued or running job, or None when there is none.
+
+        Returns:
+            {"state": "queued", "position": jobs ahead} or
+            {"state": "running", "done": ads read, "total": ads to read, "fraction": 0-1}
+        """
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is None:
+                return None
+            if job["state"] == "queued":
+                ahead = sum(
+                    1 for other in self._jobs.values()
+                    if other["state"] == "running"
+                    or (other["state"] == "queued" and (other["rank"], other["queued_at"]) < (job["rank"], job["queued_at"]))
+                )
+                return {"state": "queued", "position": ahead}
+            total = job["total"]
+            return {
+                "state": "running",
+                "done": job["done"],
+                "total": total,
+                "fraction": job["done"] / total if total else 0.0,
+            }
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Counters plus queued and running jobs"""
+        with self._lock:
+            return {
+                **self.stats,
+                "queued": sum(1 for job in self._jobs.values() if job["state"] == "queued"),
+                "running": self._running,
+                "max_workers": self.max_workers,
+                "processes": self.processes,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            executor, self._executor = self._executor, None
+            queued = [job for job in self._jobs.values() if job["state"] == "queued"]
+            for job in queued:
+                self._jobs.pop(job["args"][0], None)
+        for job in queued:
+            job["future"].cancel()
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+        try:
+            self._progress.put_nowait(None)
+        except (queue.Full, ValueError, OSError):
+            pass
@@ -0,0 +1,292 @@
+"""
+Foreplay API - Board Extraction
+Description: Retrieves the video ads of a board together with their full ad
+details (transcripts included). Shared by the Streamlit GUI, the command-line
+interface and the benchmarks.
+"""
+
+import contextvars
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Optional, Dict, Any, List, Callable, TypeVar
+
+import requests
+
+from config import config
+from foreplay_profiler import span
+
+if TYPE_CHECKING:
+    from foreplay_checkpoint import TargetJournal
+
+T = TypeVar("T")
+
+
+def extract_board_id(url: str) -> Optional[str]:
+    """Extract the board ID from a board URL (https://app.foreplay.co/boards/BOARD_ID) or a bare ID"""
+    match = re.search(r'/boards/([a-zA-Z0-9_-]+)', url)
+    if match:
+        return match.group(1)
+    if re.match(r'^[a-zA-Z0-9_-]+$', url):
+        return url
+    return None
+
+
+def is_retryable(error: Exception) -> bool:
+    """Whether a failed call is worth retrying (network errors, 408, 429 and 5xx)"""
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        status = error.response.status_code
+        return status in (408, 429) or status >= 500
+    return True
+
+
+def is_auth_error(error: Exception) -> bool:
+    """Whether a call failed because the API key is missing or rejected (401, 403)"""
+    response = getattr(error, "response", None)
+    return isinstance(error, requests.HTTPError) and response is not None and response.status_code in (401, 403)
+
+
+def call_with_retries(call: Callable[[], T], retries: int = 0) -> T:
+    """
+    Run call, retrying retryable errors with the same backoff as detail calls
+    (config.RETRY_BACKOFF_SECONDS, doubling each time).
+
+    Args:
+        call: Function making one API call
+        retries: Retries after the first attempt
+
+    Returns:
+        What call returns
+
+    Raises:
+        Exception: The last error, once retries are used up or it is not retryable
+    """
+    attempt = 0
+    while True:
+        try:
+            return call()
+        except Exception as e:
+            if attempt >= retries or not is_retryable(e):
+                raise
+            attempt += 1
+            with span("retry", "backoff", round=attempt):
+                time.sleep(config.RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1))
+
+
+def list_board_ads(
+    client,
+    board_id: str,
+    limit: Optional[int] = 200,
+    page_size: Optional[int] = None,
+    journal: Optional["TargetJournal"] = None,
+    retries: int = 0,
+    **filters: Any
+) -> List[Dict[str, Any]]:
+    """
+    List the ads of a board, following pages until limit or the end of the board.
+
+    Args:
+        client: ForeplayAPIClient instance
+        board_id: The ID of the board
+        limit: Maximum number of ads (None for the whole board)
+        page_size: Ads requested per page (default config.BOARD_PAGE_LIMIT)
+        journal: Checkpoint of the target; pages listed by an earlier run
+            are replayed from it and new pages are recorded
+        retries: Retries of a failed page (see call_with_retries)
+        **filters: Any other get_board_ads filter (display_format, live, ...)
+
+    Returns:
+        Board ads in board order
+    """
+    page_size = page_size or config.BOARD_PAGE_LIMIT
+    ads: List[Dict[str, Any]] = []
+
+    while limit is None or len(ads) < limit:
+        requested = page_size if limit is None else min(page_size, limit - len(ads))
+        offset = len(ads)
+        page = journal.page(offset) if journal else None
+        if page is None:
+            with span(board_id, "board_listing", offset=offset):
+                page = call_with_retries(
+                    lambda: client.get_board_ads(board_id=board_id, offset=offset, limit=requested, **filters),
+                    retries
+                ).get('data', [])
+            if journal:
+                journal.record_page(offset, page)
+        ads.extend(page)
+        if len(page) < requested:
+            break
+
+    return ads
+
+
+def fetch_ad_details(
+    client,
+    ads: List[Dict[str, Any]],
+    delay: float = 0.0,
+    max_workers: int = 1,
+    on_progress: Optional[Callable[[int, int, Dict[str, Any]], None]] = None,
+    on_error: Optional[Callable[[str, Exception], None]] = None,
+    retries: int = 0,
+    journal: Optional["TargetJournal"] = None,
+    cancel: Optional[threading.Event] = None
+) -> List[Dict[str, Any]]:
+    """
+    Merge each ad with its full details (get_ad_by_id), keeping the input order.
+
+    Failed calls go to a retry queue that is run again after the first pass,
+    waiting config.RETRY_BACKOFF_SECONDS before the first retry round and
+    twice as long before each next one.
+
+    Args:
+        client: ForeplayAPIClient instance
+        ads: Ads carrying an 'id' (or 'ad_id')
+        delay: Pause after each detail call, in seconds (per worker)
+        max_workers: Detail calls in flight at once
+        on_progress: Called with (done, total, ad) after each detail call
+        on_error: Called with (ad_id, exception) for each ad still failing
+            after the retries; the ad is skipped
+        retries: Retry rounds for failed ads (errors that cannot succeed,
+            such as 404, are not retried)
+        journal: Checkpoint of the target; ads it already holds are not
+            fetched again, new details and final failures are recorded
+        cancel: Once set, no further detail calls start (the ads not fetched
+            yet are left out, and stay pending in the journal)
+
+    Returns:
+        Ads merged with their details
+    """
+    total = len(ads)
+    results: List[Optional[Dict[str, Any]]] = [None] * total
+    errors: Dict[int, Exception] = {}
+    done = 0
+    lock = threading.Lock()
+
+    pending = []
+    for index, ad in enumerate(ads):
+        cached = journal.details.get(str(ad.get('id') or ad.get('ad_id'))) if journal else None
+        if cached is not None:
+            results[index] = {**ad, **cached}
+            done += 1
+        else:
+            pending.append(index)
+
+    def fetch(index: int) -> None:
+        nonlocal done
+        if cancel is not None and cancel.is_set():
+            return
+        ad = ads[index]
+        ad_id = ad.get('id') or ad.get('ad_id')
+
+        try:
+            with span(str(ad_id), "ad_detail"):
+                ad_details = client.get_ad_by_id(ad_id)
+        except Exception as e:
+            with lock:
+                errors[index] = e
+            return
+
+        results[index] = {**ad, **ad_details}
+        if journal:
+            journal.record_ad(ad_id, ad_details)
+
+        with lock:
+            done += 1
+            completed = done
+        if on_progress:
+            on_progress(completed, total, ad)
+
+        if delay:
+            with span("delay", "throttle"):
+                time.sleep(delay)
+
+    def run(indices: List[int]) -> None:
+        if max_workers <= 1 or len(indices) <= 1:
+            for index in indices:
+                fetch(index)
+            return
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ad-detail") as executor:
+            # Each task runs in a copy of this context, so spans reach the active profiler
+            futures = [executor.submit(contextvars.copy_context().run, fetch, index) for index in indices]
+            for future in futures:
+                future.result()
+
+    run(pending)
+
+    attempts = 1
+    while attempts <= retries:
+        queue = sorted(index for index, error in errors.items() if is_retryable(error))
+        if not queue or (cancel is not None and cancel.is_set()):
+            break
+        with span("retry", "backoff", round=attempts, ads=len(queue)):
+            time.sleep(config.RETRY_BACKOFF_SECONDS * 2 ** (attempts - 1))
+        for index in queue:
+            del errors[index]
+        run(queue)
+        attempts += 1
+
+    for index, error in sorted(errors.items()):
+        ad_id = ads[index].get('id') or ads[index].get('ad_id')
+        if journal:
+            journal.record_failure(ad_id, error, attempts)
+        if on_error:
+            on_error(ad_id, error)
+
+    return [ad for ad in results if ad is not None]
+
+
+def extract_board_video_ads(
+    client,
+    board_id: str,
+    limit: Optional[int] = 200,
+    delay: float = 0.1,
+    on_listed: Optional[Callable[[int], None]] = None,
+    on_progress: Optional[Callable[[int, int, Dict[str, Any]], None]] = None,
+    on_error: Optional[Callable[[str, Exception], None]] = None,
+    max_workers: int = 1,
+    retries: int = 0,
+    journal: Optional["TargetJournal"] = None,
+    cancel: Optional[threading.Event] = None
+) -> List[Dict[str, Any]]:
+    """
+    Retrieve all video ads of a board merged with their ad details.
+
+    Args:
+        client: ForeplayAPIClient instance
+        board_id: The ID of the board
+        limit: Maximum number of board ads listed (None for the whole board)
+        delay: Pause between detail calls, in seconds
+        on_listed: Called with the number of video ads found
+        on_progress: Called with (done, total, ad) after each detail call
+        on_error: Called with (ad_id, exception) for each ad still failing
+            after the retries; the ad is skipped
+        max_workers: Detail calls in flight at once
+        retries: Retry rounds for failed detail calls (and retries of
+            each failed listing page)
+        journal: Checkpoint of the board (see foreplay_checkpoint); a run
+            interrupted earlier resumes from it
+        cancel: Stops the detail calls once set (see fetch_ad_details)
+
+    Returns:
+        List of board ads merged with their details
+    """
+    all_ads = list_board_ads(client, board_id, limit=limit, journal=journal, retries=retries)
+
+    # Keep only video ads
+    video_ads = [ad for ad in all_ads if ad.get('display_format') == 'video']
+
+    if on_listed:
+        on_listed(len(video_ads))
+
+    return fetch_ad_details(
+        client,
+        video_ads,
+        delay=delay,
+        max_workers=max_workers,
+        on_progress=on_progress,
+        on_error=on_error,
+        retries=retries,
+        journal=journal,
+        cancel=cancel
+    )
@@ -4,12 +4,32 @@ Interfaccia web interattiva per scaricare transcript da boards Foreplay
 """
 
 import streamlit as st
-import pandas as pd
+import contextvars
 import json
-import re
+import logging
+import queue
+import threading
+import uuid
 from datetime import datetime
-from foreplay_client import ForeplayAPIClient
-import time
+from contextlib import nullcontext
+
+try:
+    # Prima di config: le sue impostazioni si leggono dall'ambiente all'import
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    pass
+
+from config import config
+from foreplay_checkpoint import CheckpointJob, JobBusy, lock_job
+from foreplay_client import get_shared_client
+from foreplay_concurrency import worker_count
+from foreplay_extraction import extract_board_id, extract_board_video_ads
+from foreplay_export import dataframe_to_csv, write_insights_excel
+from foreplay_profiler import Profiler, activate
+from foreplay_store import ResultStore, StoreQuotaExceeded
+
+logger = logging.getLogger(__name__)
 
 # Configurazione pagina
 st.set_page_config(
@@ -53,123 +73,220 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # API Key - Load from environment variable
-import os
-from dotenv import load_dotenv
+@st.cache_resource
+def load_api_key():
+    """Legge la API key una sola volta per processo (il .env è già caricato all'avvio)"""
+    import os
+    
+    return os.getenv("FOREPLAY_API_KEY")
+
+
+@st.cache_resource
+def get_client(api_key: str):
+    """Client condiviso tra sessioni e rerun (pool di connessioni keep-alive)"""
+    return get_shared_client(api_key)
+
+
+@st.cache_resource
+def get_result_store():
+    """Result store su disco condiviso da tutte le sessioni"""
+    return ResultStore()
+
+
+def get_corpus(board_id: str):
+    """Corpus colonnare dei segmenti della board (None se non ancora creato)"""
+    # numpy viene importato solo quando serve, non all'avvio
+    from foreplay_corpus import SegmentCorpus, corpus_path
+    try:
+        return SegmentCorpus(corpus_path(board_id))
+    except (OSError, ValueError):
+        return None
+
+
+def save_corpus(video_ads, board_id: str):
+    """Salva i segmenti timestampati della board in formato colonnare su disco"""
+    from foreplay_corpus import build_corpus, corpus_path
+    return build_corpus(video_ads, corpus_path(board_id), board_id=board_id)
+
+
+@st.cache_resource
+def get_export_artifacts():
+    """Export (CSV, JSON, Excel) generati una volta per versione della board, condivisi tra sessioni"""
+    from foreplay_artifacts import ExportArtifactCache
+    return ExportArtifactCache()
+
+
+def wait_for_export(video_ads, fmt: str):
+    """Export nel formato richiesto: subito se già pronto, altrimenti con la barra di avanzamento"""
+    from concurrent.futures import wait
+    artifacts = get_export_artifacts()
+    future = artifacts.submit(video_ads, fmt)
+    if not future.done():
+        # Generato in un processo separato: qui si attende soltanto
+        progress_bar = st.progress(0.0)
+        while not wait([future], timeout=0.25).done:
+            status = artifacts.progress(video_ads, fmt) or {}
+            if status.get('state') == 'queued':
+                progress_bar.progress(0.0, text=f"⏳ In coda ({status['position']} export prima di questo)")
+            elif status.get('state') == 'running':
+                progress_bar.progress(
+                    min(status['fraction'], 0.99), text=f"⚙️ {status['done']:,}/{status['total']:,} ads elaborati"
+                )
+        progress_bar.empty()
+    return future.result()
+
+
+@st.cache_resource
+def get_neardup_index():
+    """Indice dei quasi-duplicati di tutte le board estratte (condiviso tra sessioni)"""
+    from foreplay_neardup import NearDuplicateIndex, index_path
+    try:
+        return NearDuplicateIndex.load(index_path())
+    except (OSError, ValueError):
+        return NearDuplicateIndex()
 
-load_dotenv()
-API_KEY = os.getenv("FOREPLAY_API_KEY")
+
+@st.cache_resource
+def get_thumbnail_cache():
+    """Cache locale delle thumbnail ridimensionate (condivisa tra sessioni)"""
+    # Pillow viene importato solo quando si mostrano i risultati
+    from foreplay_thumbnails import ThumbnailCache
+    return ThumbnailCache()
+
+
+@st.cache_resource
+def get_media_downloader():
+    """Downloader dell'archivio video (condiviso tra sessioni: un download per URL, banda totale limitata)"""
+    from foreplay_media import MediaDownloader
+    return MediaDownloader()
+
+
+def update_neardup_index(video_ads, board_id: str) -> None:
+    """Aggiunge all'indice solo gli ads nuovi e li accoda all'indice su disco"""
+    from foreplay_neardup import index_path
+    index = get_neardup_index()
+    if index.add(video_ads, board_id=board_id):
+        index.save(index_path())
+
+
+def get_session_id() -> str:
+    """ID della sessione Streamlit corrente (cartella dei risultati su disco)"""
+    if '_session_id' not in st.session_state:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        ctx = get_script_run_ctx()
+        st.session_state['_session_id'] = ctx.session_id if ctx else uuid.uuid4().hex
+    return st.session_state['_session_id']
+
+
+API_KEY = load_api_key()
 
 if not API_KEY:
     st.error("⚠️ API Key non configurata! Imposta la variabile d'ambiente FOREPLAY_API_KEY")
     st.stop()
 
 
-def extract_board_id(url: str) -> str:
-    """Estrae l'ID della board dall'URL"""
-    # Pattern: https://app.foreplay.co/boards/BOARD_ID
-    match = re.search(r'/boards/([a-zA-Z0-9_-]+)', url)
-    if match:
-        return match.group(1)
-    # Se è già solo l'ID
-    if re.match(r'^[a-zA-Z0-9_-]+$', url):
-        return url
-    return None
+def profiling():
+    """Attiva il profiler della sessione, se abilitato nella sidebar"""
+    profiler = st.session_state.get('profiler')
+    if profiler is not None:
+        return activate(profiler)
+    return nullcontext()
+
+
+def board_job_id(board_id: str) -> str:
+    """Job di checkpoint della board (uno per board, condiviso tra le sessioni)"""
+    return f"gui-{board_id}"
+
+
+def open_board_checkpoint(board_id: str) -> CheckpointJob:
+    """Checkpoint dell'estrazione della board: riprende un'estrazione interrotta di recente"""
+    job_id = board_job_id(board_id)
+    try:
+        job = CheckpointJob.open(job_id)
+        if datetime.now().timestamp() - job.meta.get("created_at", 0) <= config.CHECKPOINT_MAX_AGE_HOURS * 3600:
+            return job
+        job.remove()
+    except (OSError, ValueError):
+        pass
+    return CheckpointJob.create({"command": "gui", "board_id": board_id}, job_id=job_id)
 
 
 def get_video_ads_with_transcripts(board_id: str, progress_bar=None, status_text=None):
     """Recupera tutti i video ads con transcript dalla board"""
-    client = ForeplayAPIClient(API_KEY)
-    
-    # Recupera tutti gli ads
-    if status_text:
-        status_text.text("📋 Recupero ads dalla board...")
+    client = get_client(API_KEY)
     
-    ads_response = client.get_board_ads(board_id=board_id, limit=200)
-    all_ads = ads_response.get('data', [])
+    # Una sola sessione alla volta estrae la board (JobBusy per le altre), così il journal ha un solo scrittore
+    with lock_job(board_job_id(board_id)):
+        # Pagine e dettagli già recuperati da un'estrazione interrotta non vengono richiesti di nuovo
+        job = open_board_checkpoint(board_id)
+        journal = job.target(board_id)
     
-    # Filtra solo video ads
-    video_ads = [ad for ad in all_ads if ad.get('display_format') == 'video']
+        # Recupera tutti gli ads
+        if status_text:
+            status_text.text("📋 Recupero ads dalla board...")
     
-    if status_text:
-        status_text.text(f"🎬 Trovati {len(video_ads)} video ads. Recupero dettagli...")
+        def on_listed(total):
+            if status_text and journal.details:
+                status_text.text(f"♻️ Ripresa estrazione interrotta: {len(journal.details)}/{total} ads già recuperati...")
+            elif status_text:
+                status_text.text(f"🎬 Trovati {total} video ads. Recupero dettagli...")
     
-    # Recupera dettagli completi per ogni video
-    video_ads_complete = []
-    total = len(video_ads)
-    
-    for i, ad in enumerate(video_ads):
-        ad_id = ad.get('id')
-        
-        try:
-            # Recupera dettagli completi
-            ad_details = client.get_ad_by_id(ad_id)
-            
-            # Combina dati
-            ad_complete = {**ad, **ad_details}
-            video_ads_complete.append(ad_complete)
-            
+        def on_progress(done, total, ad):
             # Aggiorna progress
             if progress_bar:
-                progress_bar.progress((i + 1) / total)
+                progress_bar.progress(done / total)
             if status_text:
-                status_text.text(f"⏳ Processando {i+1}/{total}: {ad.get('name', 'N/A')[:40]}...")
-            
-            time.sleep(0.1)
-            
-        except Exception as e:
-            st.warning(f"⚠️ Errore recuperando ad {ad_id}: {e}")
+                status_text.text(f"⏳ Processando {done}/{total}: {ad.get('name', 'N/A')[:40]}...")
     
-    return video_ads_complete
-
-
-def create_csv_dataframe(video_ads):
-    """Crea DataFrame per CSV"""
-    rows = []
+        def on_error(ad_id, e):
+            st.warning(f"⚠️ Errore recuperando ad {ad_id} (verrà ritentato alla prossima estrazione): {e}")
     
-    for ad in video_ads:
-        # Converti timestamped_transcription in JSON string (gestisci None)
-        timestamped_data = ad.get('timestamped_transcription') or []
-        timestamped_json = json.dumps(timestamped_data, ensure_ascii=False)
-        
-        rows.append({
-            'ad_id': ad.get('ad_id', ''),
-            'name': ad.get('name', ''),
-            'brand_id': ad.get('brand_id', ''),
-            'description': ad.get('description', '').replace('<br />', '\n').replace('<br>', '\n'),
-            'headline': ad.get('headline', ''),
-            'full_transcription': ad.get('full_transcription', ''),
-            'timestamped_transcription': timestamped_json,  # JSON array completo
-            'video_duration_seconds': ad.get('video_duration', 0),
-            'display_format': ad.get('display_format', ''),
-            'publisher_platform': ', '.join(ad.get('publisher_platform', [])) if isinstance(ad.get('publisher_platform'), list) else ad.get('publisher_platform', ''),
-            'live': ad.get('live', False),
-            'video_url': ad.get('video', ''),
-            'link_url': ad.get('link_url', ''),
-        })
+        # I dettagli arrivano da più thread in parallelo (limite adattivo del client); Streamlit
+        # si aggiorna solo dal thread dello script, quindi gli eventi passano da una coda
+        events = queue.Queue()
+        outcome = {}
+        cancel = threading.Event()
     
-    return pd.DataFrame(rows)
-
-
-def create_timestamped_dataframe(video_ads):
-    """Crea DataFrame con timestamp dettagliati"""
-    rows = []
+        def extract():
+            try:
+                outcome['ads'] = extract_board_video_ads(
+                    client,
+                    board_id,
+                    delay=0.0,
+                    on_listed=lambda *a: events.put((on_listed, a)),
+                    on_progress=lambda *a: events.put((on_progress, a)),
+                    on_error=lambda *a: events.put((on_error, a)),
+                    max_workers=worker_count(client, None, config.MAX_CONCURRENCY),
+                    retries=config.DETAIL_RETRIES,
+                    journal=journal,
+                    cancel=cancel
+                )
+            except BaseException as e:
+                outcome['error'] = e
+            finally:
+                events.put(None)
     
-    for ad in video_ads:
-        ad_id = ad.get('ad_id', '')
-        name = ad.get('name', '')
-        timestamped = ad.get('timestamped_transcription') or []
-        
-        if timestamped:
-            for segment in timestamped:
-                rows.append({
-                    'ad_id': ad_id,
-                    'name': name,
-                    'start_time': segment.get('startTime', 0),
-                    'end_time': segment.get('endTime', 0),
-                    'sentence': segment.get('sentence', '').strip()
-                })
+        # Il thread eredita il contesto (profiler attivo, classe di priorità)
+        worker = threading.Thread(target=contextvars.copy_context().run, args=(extract,), daemon=True)
+        worker.start()
+        try:
+            for event in iter(events.get, None):
+                callback, args = event
+                callback(*args)
+        finally:
+            # Interrotta (rerun o stop della sessione): nessun nuovo dettaglio, il journal
+            # si chiude solo quando il thread ha finito di scriverci
+            cancel.set()
+            worker.join()
+            journal.close()
+        if 'error' in outcome:
+            raise outcome['error']
+        video_ads = outcome['ads']
     
-    return pd.DataFrame(rows)
+        # Il checkpoint resta solo se alcuni ads sono falliti
+        if not journal.failed:
+            job.remove()
+        return video_ads
 
 
 # ==============================================================================
@@ -220,11 +337,44 @@ with st.sidebar:
     if st.button("💳 Controlla Crediti"):
         with st.spinner("Controllo..."):
             try:
-                client = ForeplayAPIClient(API_KEY)
+                client = get_client(API_KEY)
                 usage = client.get_usage()
                 st.success(f"Crediti: {usage.get('credits_remaining', 'N/A')}")
+                
+                # Riuso connessioni (keep-alive) del client condiviso
+                stats = client.connection_stats()
+                if stats.get('requests'):
+                    st.caption(
+                        f"🔌 Connessioni: {stats['connections']} aperte per {stats['requests']} richieste "
+                        f"(riuso {stats['reuse_rate']:.0%})"
+                    )
+                
+                # Limite adattivo di richieste in parallelo (AIMD)
+                limits = client.concurrency_stats()
+                if limits:
+                    st.caption(
+                        f"🚦 Concorrenza adattiva: {limits['limit']} richieste in parallelo "
+                        f"(max {limits['max_limit']}, {limits['decreases']} riduzioni per 429/errori/latenza)"
+                    )
+                
+                # Attesa in coda delle richieste interattive (precedenza sui job in background)
+                waits = client.scheduler_stats()['classes']
+                if waits['background']['admitted']:
+                    st.caption(
+                        f"⏳ Attesa in coda p95: interattive {waits['interactive']['wait_p95_ms']} ms, "
+                        f"background {waits['background']['wait_p95_ms']} ms"
+                    )
             except Exception as e:
                 st.error(f"Errore: {e}")
+    
+    st.divider()
+    
+    # Profiling
+    if st.checkbox("⏱️ Profiling", help="Registra i tempi di ogni fase (API, decoding, DataFrame, Excel) ed esporta un trace Chrome"):
+        if 'profiler' not in st.session_state:
+            st.session_state['profiler'] = Profiler()
+    else:
+        st.session_state.pop('profiler', None)
 
 # Input principale
 st.markdown("### 🔗 Inserisci il Link della Board")
@@ -264,31 +414,65 @@ if extract_button and board_url:
             
             progress_bar = st.progress(0)
             status_text = st.empty()
+            extracted = False
             
             try:
                 # Recupera video ads
-                video_ads = get_video_ads_with_transcripts(board_id, progress_bar, status_text)
+                if 'profiler' in st.session_state:
+                    st.session_state['profiler'].clear()
+                with profiling():
+                    video_ads = get_video_ads_with_transcripts(board_id, progress_bar, status_text)
                 
                 if not video_ads:
                     st.warning("⚠️ Nessun video ad trovato in questa board!")
                 else:
                     status_text.text(f"✅ Completato! Recuperati {len(video_ads)} video ads")
                     
-                    # Salva in session state
-                    st.session_state['video_ads'] = video_ads
+                    # Salva su disco: la sessione tiene solo l'handle
+                    st.session_state['video_ads'] = get_result_store().write(
+                        get_session_id(), video_ads, board_id=board_id
+                    )
                     st.session_state['board_id'] = board_id
+                    st.session_state.pop('media_records', None)
+                    
+                    # Corpus colonnare dei segmenti (query per finestra temporale, tra board)
+                    with profiling():
+                        save_corpus(st.session_state['video_ads'], board_id)
+                    
+                    # Export generati in background: i download successivi sono immediati
+                    if config.EXPORT_PREBUILD:
+                        get_export_artifacts().prebuild(st.session_state['video_ads'])
                     
                     st.success(f"🎉 Trovati {len(video_ads)} video ads con transcript!")
+                    extracted = True
                     
+            except StoreQuotaExceeded as e:
+                st.error(f"❌ Risultati troppo grandi per questa sessione: {e}")
+            except JobBusy:
+                st.warning("⏳ Questa board è già in estrazione in un'altra sessione. Riprova quando sarà terminata.")
             except Exception as e:
                 st.error(f"❌ Errore durante l'estrazione: {e}")
                 import traceback
                 st.code(traceback.format_exc())
+            
+            # L'indice dei quasi-duplicati non fa fallire l'estrazione
+            if extracted:
+                try:
+                    with profiling():
+                        update_neardup_index(st.session_state['video_ads'], board_id)
+                except Exception:
+                    logger.exception("Near-duplicate index update failed for board %s", board_id)
+
+# Risultati scaduti (rimossi dalla pulizia del result store)
+if st.session_state.get('video_ads') and not st.session_state['video_ads'].exists():
+    del st.session_state['video_ads']
+    st.info("ℹ️ I risultati precedenti sono scaduti. Estrai di nuovo la board.")
 
 # Visualizza risultati
 if 'video_ads' in st.session_state and st.session_state['video_ads']:
     video_ads = st.session_state['video_ads']
     board_id = st.session_state.get('board_id', 'unknown')
+    summary = video_ads.summary
     
     st.markdown("---")
     st.markdown("## 📺 Risultati")
@@ -298,21 +482,24 @@ if 'video_ads' in st.session_state and st.session_state['video_ads']:
     with col1:
         st.metric("Video Ads", len(video_ads))
     with col2:
-        with_transcript = sum(1 for ad in video_ads if ad.get('full_transcription'))
-        st.metric("Con Transcript", with_transcript)
+        st.metric("Con Transcript", summary.get('with_transcript', 0))
     with col3:
-        total_duration = sum(ad.get('video_duration', 0) for ad in video_ads)
-        st.metric("Durata Totale", f"{total_duration:.0f}s")
+        st.metric("Durata Totale", f"{summary.get('total_duration', 0):.0f}s")
     with col4:
-        total_segments = sum(len(ad.get('timestamped_transcription') or []) for ad in video_ads)
-        st.metric("Segmenti Totali", total_segments)
+        st.metric("Segmenti Totali", summary.get('total_segments', 0))
     
     # Tabs per diversi formati
-    tab1, tab2, tab3 = st.tabs(["📋 Visualizza Transcript", "📥 Esporta CSV", "📊 Esporta Excel"])
+    tab1, tab2, tab3, tab4 = st.tabs([
+        "📋 Visualizza Transcript", "📥 Esporta CSV", "📊 Esporta Excel", "📈 Analisi Transcript"
+    ])
     
     with tab1:
         st.markdown("### 🎬 Video Ads con Transcript")
         
+        # Thumbnail servite in locale quando già in cache; le altre si scaricano in background
+        # (nel frattempo si mostra l'URL remoto, al rerun successivo la copia locale)
+        thumbnails = get_thumbnail_cache().cached_many(ad.get('thumbnail') for ad in video_ads)
+        
         for i, ad in enumerate(video_ads, 1):
             with st.expander(f"🎥 {i}. {ad.get('name', 'Senza nome')}", expanded=(i==1)):
                 col1, col2 = st.columns([2, 1])
@@ -330,7 +517,7 @@ if 'video_ads' in st.session_state and st.session_state['video_ads']:
                 
                 with col2:
                     if ad.get('thumbnail'):
-                        st.image(ad.get('thumbnail'), width=200)
+                        st.image(thumbnails.get(ad.get('thumbnail')) or ad.get('thumbnail'), width=200)
                 
                 # Description
                 if ad.get('description'):
@@ -385,6 +572,7 @@ if 'video_ads' in st.session_state and st.session_state['video_ads']:
                             })
                         
                         if segments_data:
+                            import pandas as pd
                             df_segments = pd.DataFrame(segments_data)
                             st.dataframe(df_segments, use_container_width=True, hide_index=True)
                             
@@ -399,50 +587,34 @@ if 'video_ads' in st.session_state and st.session_state['video_ads']:
         st.info("📋 Export essenziale: Solo **ad_id**, **name** e **full_transcription**")
         
         if st.button("⚡ SCARICA CSV RAPIDO (3 campi)", type="primary", use_container_width=True):
-            with st.spinner("Generando CSV rapido..."):
+            with st.spinner("Generando CSV rapido..."), profiling():
                 try:
-                    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                    
-                    # DataFrame semplificato - SOLO 3 CAMPI
-                    quick_data = []
-                    for ad in video_ads:
-                        quick_data.append({
-                            'ad_id': ad.get('ad_id', ''),
-                            'name': ad.get('name', ''),
-                            'full_transcription': ad.get('full_transcription', '')
-                        })
-                    
-                    df_quick = pd.DataFrame(quick_data)
+                    # Già generato in background dopo l'estrazione: nessun ricalcolo
+                    artifact = wait_for_export(video_ads, "quick_csv")
                     
-                    # Salva localmente
-                    quick_filename = f"transcripts_quick_{timestamp}.csv"
-                    df_quick.to_csv(quick_filename, index=False, encoding='utf-8-sig')
-                    
-                    st.success(f"✅ CSV rapido creato: **{quick_filename}**")
+                    st.success(f"✅ CSV rapido pronto: **{artifact.file_name}**")
                     
                     # Download button
-                    csv_data = df_quick.to_csv(index=False, encoding='utf-8-sig')
                     st.download_button(
                         label="⬇️ SCARICA CSV",
-                        data=csv_data,
-                        file_name=f"transcripts_{board_id}_{timestamp}.csv",
-                        mime="text/csv",
+                        data=artifact.read(),
+                        file_name=artifact.file_name,
+                        mime=artifact.mime,
                         use_container_width=True
                     )
                     
                     # Preview con evidenziazione
                     st.markdown("**📊 Preview CSV (prime 3 righe):**")
-                    st.dataframe(df_quick.head(3), use_container_width=True)
+                    st.dataframe(artifact.info['preview'], use_container_width=True)
                     
                     # Info
                     col_info1, col_info2, col_info3 = st.columns(3)
                     with col_info1:
-                        st.metric("Righe", len(df_quick))
+                        st.metric("Righe", artifact.info['rows'])
                     with col_info2:
                         st.metric("Colonne", 3)
                     with col_info3:
-                        total_chars = sum(len(str(row['full_transcription'])) for _, row in df_quick.iterrows())
-                        st.metric("Caratteri Totali", f"{total_chars:,}")
+                        st.metric("Caratteri Totali", f"{artifact.info['chars']:,}")
                     
                 except Exception as e:
                     st.error(f"Errore: {e}")
@@ -453,167 +625,199 @@ if 'video_ads' in st.session_state and st.session_state['video_ads']:
         # Opzioni di esportazione avanzate
         export_option = st.radio(
             "Seleziona formato CSV avanzato:",
-            ["CSV Completo (tutti i campi)", "CSV Timestampato (ogni segmento una riga)", "Entrambi"]
+            [
+                "CSV Completo (tutti i campi)",
+                "CSV Timestampato (ogni segmento una riga)",
+                "Entrambi",
+                "CSV Normalizzato (ads + transcript unici)"
+            ]
         )
         
         col1, col2 = st.columns(2)
         
         with col1:
             if st.button("📄 Genera CSV", type="primary"):
-                with st.spinner("Generando CSV..."):
+                with st.spinner("Generando CSV..."), profiling():
                     try:
-                        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                        
-                        if export_option in ["CSV Base (info generali + transcript)", "Entrambi"]:
-                            # CSV Base
-                            df = create_csv_dataframe(video_ads)
-                            csv_filename = f"board_{board_id}_transcripts_{timestamp}.csv"
-                            df.to_csv(csv_filename, index=False, encoding='utf-8-sig')
+                        if export_option in ["CSV Completo (tutti i campi)", "Entrambi"]:
+                            # CSV Completo
+                            artifact = wait_for_export(video_ads, "csv")
                             
-                            st.success(f"✅ CSV creato: {csv_filename}")
+                            st.success(f"✅ CSV pronto: {artifact.file_name}")
                             
                             # Download button
-                            csv_data = df.to_csv(index=False, encoding='utf-8-sig')
                             st.download_button(
-                                label="⬇️ Scarica CSV Base",
-                                data=csv_data,
-                                file_name=csv_filename,
-                                mime="text/csv"
+                                label="⬇️ Scarica CSV Completo",
+                                data=artifact.read(),
+                                file_name=artifact.file_name,
+                                mime=artifact.mime
                             )
                             
                             # Preview
-                            st.markdown("**Preview CSV Base:**")
-                            st.dataframe(df.head(), use_container_width=True)
+                            st.markdown("**Preview CSV Completo:**")
+                            st.dataframe(artifact.info['preview'], use_container_width=True)
                         
                         if export_option in ["CSV Timestampato (ogni segmento una riga)", "Entrambi"]:
                             # CSV Timestampato
-                            df_ts = create_timestamped_dataframe(video_ads)
-                            csv_ts_filename = f"board_{board_id}_timestamped_{timestamp}.csv"
-                            df_ts.to_csv(csv_ts_filename, index=False, encoding='utf-8-sig')
+                            artifact = wait_for_export(video_ads, "timestamped_csv")
                             
-                            st.success(f"✅ CSV timestampato creato: {csv_ts_filename}")
+                            st.success(f"✅ CSV timestampato pronto: {artifact.file_name}")
                             
                             # Download button
-                            csv_ts_data = df_ts.to_csv(index=False, encoding='utf-8-sig')
                             st.download_button(
                                 label="⬇️ Scarica CSV Timestampato",
-                                data=csv_ts_data,
-                                file_name=csv_ts_filename,
-                                mime="text/csv"
+                                data=artifact.read(),
+                                file_name=artifact.file_name,
+                                mime=artifact.mime
                             )
                             
                             # Preview
                             st.markdown("**Preview CSV Timestampato:**")
-                            st.dataframe(df_ts.head(20), use_container_width=True)
+                            st.dataframe(artifact.info['preview'], use_container_width=True)
+                        
+                        if export_option == "CSV Normalizzato (ads + transcript unici)":
+                            # CSV Normalizzato: ogni transcript condiviso dalle varianti una sola volta
+                            ads_artifact = wait_for_export(video_ads, "normalized_ads")
+                            transcripts_artifact = wait_for_export(video_ads, "normalized_transcripts")
+                            
+                            st.success(
+                                f"✅ CSV normalizzati pronti: {ads_artifact.file_name}, {transcripts_artifact.file_name} "
+                                f"({transcripts_artifact.info['rows']} transcript unici su {ads_artifact.info['rows']} ads)"
+                            )
+                            
+                            st.download_button(
+                                label="⬇️ Scarica CSV Ads",
+                                data=ads_artifact.read(),
+                                file_name=ads_artifact.file_name,
+                                mime=ads_artifact.mime
+                            )
+                            st.download_button(
+                                label="⬇️ Scarica CSV Transcript Unici",
+                                data=transcripts_artifact.read(),
+                                file_name=transcripts_artifact.file_name,
+                                mime=transcripts_artifact.mime
+                            )
+                            
+                            st.markdown("**Preview Transcript Unici:**")
+                            st.dataframe(transcripts_artifact.info['preview'], use_container_width=True)
                         
                     except Exception as e:
                         st.error(f"Errore durante la creazione del CSV: {e}")
         
         with col2:
             if st.button("💾 Salva JSON Completo"):
-                with st.spinner("Salvando JSON..."):
+                with st.spinner("Salvando JSON..."), profiling():
                     try:
-                        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                        json_filename = f"board_{board_id}_complete_{timestamp}.json"
+                        artifact = wait_for_export(video_ads, "json")
                         
-                        with open(json_filename, 'w', encoding='utf-8') as f:
-                            json.dump(video_ads, f, indent=2, ensure_ascii=False)
-                        
-                        st.success(f"✅ JSON salvato: {json_filename}")
+                        st.success(f"✅ JSON pronto: {artifact.file_name}")
                         
                         # Download button
-                        json_data = json.dumps(video_ads, indent=2, ensure_ascii=False)
                         st.download_button(
                             label="⬇️ Scarica JSON",
-                            data=json_data,
-                            file_name=json_filename,
-                            mime="application/json"
+                            data=artifact.read(),
+                            file_name=artifact.file_name,
+                            mime=artifact.mime
                         )
                         
                     except Exception as e:
                         st.error(f"Errore durante il salvataggio JSON: {e}")
+            
+            from foreplay_artifacts import available_formats
+            if "parquet" in available_formats() and st.button("🧱 Salva Parquet"):
+                with st.spinner("Salvando Parquet..."), profiling():
+                    try:
+                        artifact = wait_for_export(video_ads, "parquet")
+                        
+                        st.success(f"✅ Parquet pronto: {artifact.file_name}")
+                        
+                        st.download_button(
+                            label="⬇️ Scarica Parquet",
+                            data=artifact.read(),
+                            file_name=artifact.file_name,
+                            mime=artifact.mime
+                        )
+                        
+                    except Exception as e:
+                        st.error(f"Errore durante il salvataggio Parquet: {e}")
+        
+        st.markdown("---")
+        st.markdown("### 🎞️ Archivio Video")
+        st.caption(
+            f"Scarica i video degli annunci in `{config.MEDIA_DIR}` sul server: download paralleli, "
+            "riprendibili, senza duplicati e verificati"
+        )
+        
+        if st.button("🎞️ Scarica Video", key="download_videos"):
+            from foreplay_media import summarize
+            
+            progress_bar = st.progress(0.0)
+            status_text = st.empty()
+            
+            def show_progress(done, total, record):
+                progress_bar.progress(done / total)
+                status_text.text(f"🎞️ Video {done}/{total}")
+            
+            try:
+                with profiling():
+                    records = get_media_downloader().download_ads(video_ads, on_progress=show_progress)
+                st.session_state['media_records'] = records
+                counts = summarize(records)
+                status_text.empty()
+                st.success(
+                    f"✅ {counts.get('downloaded', 0)} scaricati, {counts.get('cached', 0)} già in archivio, "
+                    f"{counts.get('duplicate', 0)} duplicati"
+                )
+                if counts.get('failed'):
+                    st.warning(f"⚠️ {counts['failed']} video non scaricati (riprova per riprenderli)")
+            except Exception as e:
+                st.error(f"Errore durante il download dei video: {e}")
+        
+        records = [r for r in st.session_state.get('media_records', []) if r.get('path')]
+        if records:
+            total_mb = sum(r['bytes'] for r in {r['path']: r for r in records}.values()) / 1024 / 1024
+            if total_mb <= config.MEDIA_ZIP_MAX_MB:
+                def build_zip():
+                    import os
+                    import tempfile
+                    import zipfile
+                    # Streamlit tiene in memoria il file scaricato (fino a MEDIA_ZIP_MAX_MB): lo ZIP
+                    # si crea solo al click, su un file temporaneo, e se ne legge una sola copia
+                    with tempfile.TemporaryFile() as spool:
+                        # I video sono già compressi: ZIP senza ricompressione
+                        with zipfile.ZipFile(spool, 'w', zipfile.ZIP_STORED) as archive:
+                            for record in records:
+                                archive.write(record['path'], f"{record['ad_id']}{os.path.splitext(record['path'])[1]}")
+                        spool.seek(0)
+                        return spool.read()
+                
+                st.download_button(
+                    label=f"📦 Scarica ZIP ({total_mb:.0f} MB)",
+                    data=build_zip,
+                    file_name=f"board_{board_id}_videos.zip",
+                    mime="application/zip",
+                    key="zip_videos",
+                    on_click="ignore"
+                )
+            else:
+                st.info(f"📁 {total_mb:.0f} MB di video: troppi per uno ZIP, sono in `{config.MEDIA_DIR}/files`")
     
     with tab3:
         st.markdown("### 📊 Esporta in Excel")
         
         if st.button("📗 Genera File Excel", type="primary"):
-            with st.spinner("Creando file Excel..."):
+            with st.spinner("Creando file Excel..."), profiling():
                 try:
-                    from openpyxl import Workbook
-                    from openpyxl.styles import Font, PatternFill, Alignment
-                    
-                    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                    excel_filename = f"board_{board_id}_transcripts_{timestamp}.xlsx"
-                    
-                    wb = Workbook()
-                    
-                    # Sheet 1: Info Generali
-                    ws1 = wb.active
-                    ws1.title = "Transcript Completi"
-                    
-                    # Header
-                    headers = ['ad_id', 'name', 'brand_id', 'description', 'headline', 
-                               'full_transcription', 'timestamped_transcription', 'video_duration', 'video_url']
-                    ws1.append(headers)
-                    
-                    # Stile header
-                    for cell in ws1[1]:
-                        cell.font = Font(bold=True, color="FFFFFF")
-                        cell.fill = PatternFill(start_color="1F77B4", end_color="1F77B4", fill_type="solid")
-                    
-                    # Dati
-                    for ad in video_ads:
-                        # Converti timestamped_transcription in JSON string (gestisci None)
-                        timestamped_data = ad.get('timestamped_transcription') or []
-                        timestamped_json = json.dumps(timestamped_data, ensure_ascii=False)
-                        
-                        ws1.append([
-                            ad.get('ad_id', ''),
-                            ad.get('name', ''),
-                            ad.get('brand_id', ''),
-                            ad.get('description', '').replace('<br />', '\n'),
-                            ad.get('headline', ''),
-                            ad.get('full_transcription', ''),
-                            timestamped_json,  # JSON array completo
-                            ad.get('video_duration', 0),
-                            ad.get('video', '')
-                        ])
-                    
-                    # Sheet 2: Timestamp Dettagliati
-                    ws2 = wb.create_sheet("Timestamp Dettagliati")
-                    ws2.append(['ad_id', 'name', 'start_time', 'end_time', 'sentence'])
-                    
-                    # Stile header
-                    for cell in ws2[1]:
-                        cell.font = Font(bold=True, color="FFFFFF")
-                        cell.fill = PatternFill(start_color="28A745", end_color="28A745", fill_type="solid")
-                    
-                    # Dati timestampati
-                    for ad in video_ads:
-                        timestamped = ad.get('timestamped_transcription') or []
-                        for seg in timestamped:
-                            ws2.append([
-                                ad.get('ad_id', ''),
-                                ad.get('name', ''),
-                                seg.get('startTime', 0),
-                                seg.get('endTime', 0),
-                                seg.get('sentence', '')
-                            ])
+                    # Sheet 1: Transcript completi, Sheet 2: Timestamp dettagliati
+                    artifact = wait_for_export(video_ads, "excel")
                     
-                    # Salva
-                    wb.save(excel_filename)
-                    
-                    st.success(f"✅ Excel creato: {excel_filename}")
-                    
-                    # Leggi file per download
-                    with open(excel_filename, 'rb') as f:
-                        excel_data = f.read()
+                    st.success(f"✅ Excel pronto: {artifact.file_name}")
                     
                     st.download_button(
                         label="⬇️ Scarica Excel",
-                        data=excel_data,
-                        file_name=excel_filename,
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                        data=artifact.read(),
+                        file_name=artifact.file_name,
+                        mime=artifact.mime
                     )
                     
                     st.info(f"📊 File contiene 2 sheets:\n- Sheet 1: Transcript completi\n- Sheet 2: Timestamp dettagliati")
@@ -622,6 +826,196 @@ if 'video_ads' in st.session_state and st.session_state['video_ads']:
                     st.error(f"Errore durante la creazione dell'Excel: {e}")
                     import traceback
                     st.code(traceback.format_exc())
+    
+    with tab4:
+        st.markdown("### 📈 Analisi Transcript")
+        st.caption("Parole e frasi più frequenti, hook di apertura, ritmo (parole/secondo) e durate dei video")
+        
+        col_scope, col_hook, col_top = st.columns(3)
+        with col_scope:
+            scope = st.radio("Ambito:", ["Questa board", "Tutte le board salvate"])
+        with col_hook:
+            hook_seconds = st.slider("Hook: primi secondi", 1.0, 10.0, 3.0, 0.5)
+        with col_top:
+            top_n = st.slider("Righe per classifica", 10, 100, 30, 10)
+        
+        if st.button("📈 Calcola Analisi", type="primary"):
+            with st.spinner("Analizzando i transcript..."), profiling():
+                try:
+                    from foreplay_corpus import open_corpora
+                    from foreplay_insights import cached_insights
+                    
+                    if scope == "Questa board":
+                        corpus = get_corpus(board_id)
+                        corpora = [corpus] if corpus is not None else []
+                    else:
+                        corpora = list(open_corpora())
+                    
+                    if not corpora:
+                        st.warning("⚠️ Nessun corpus disponibile: estrai prima una board.")
+                    else:
+                        report, from_cache = cached_insights(corpora, top_n=top_n, hook_seconds=hook_seconds)
+                        st.session_state['insights'] = report
+                        if from_cache:
+                            st.caption("Risultato dalla cache (stesso snapshot dei dati)")
+                except Exception as e:
+                    st.error(f"Errore durante l'analisi: {e}")
+        
+        report = st.session_state.get('insights')
+        if report:
+            from foreplay_insights import report_tables
+            
+            tables = report_tables(report)
+            summary = report['summary']
+            
+            col1, col2, col3, col4 = st.columns(4)
+            with col1:
+                st.metric("Board / Ads", f"{summary['boards']} / {summary['ads']}")
+            with col2:
+                st.metric("Parole", f"{summary['words']:,}")
+            with col3:
+                st.metric("Parole/sec (mediana)", summary['median_words_per_second'] or "-")
+            with col4:
+                st.metric("Durata mediana", f"{summary['median_video_duration']}s" if summary['median_video_duration'] else "-")
+            
+            st.markdown("#### 🎣 Hook più comuni")
+            st.dataframe(tables['hooks'], use_container_width=True, hide_index=True)
+            
+            col_words, col_ngrams = st.columns(2)
+            with col_words:
+                st.markdown("#### 🔤 Parole più frequenti")
+                st.bar_chart(tables['words'].head(20).set_index('term'))
+            with col_ngrams:
+                st.markdown("#### 💬 Frasi più frequenti")
+                ngram_sizes = sorted(report['ngrams'])
+                ngram_size = st.selectbox("Lunghezza frase (parole)", ngram_sizes, index=len(ngram_sizes) - 1)
+                st.dataframe(tables[f"ngrams_{ngram_size}"], use_container_width=True, hide_index=True)
+            
+            col_pace, col_duration = st.columns(2)
+            with col_pace:
+                st.markdown("#### ⏩ Ritmo (parole/secondo)")
+                st.bar_chart(tables['pace'].set_index('bin'))
+            with col_duration:
+                st.markdown("#### ⏱️ Durata video")
+                st.bar_chart(tables['durations'].set_index('bin'))
+            
+            st.markdown("#### 📥 Esporta Analisi")
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            col_x, col_j, col_c = st.columns(3)
+            with col_x:
+                if st.button("📗 Genera Excel Analisi"):
+                    with st.spinner("Creando file Excel..."), profiling():
+                        insights_filename = f"insights_{board_id}_{timestamp}.xlsx"
+                        write_insights_excel(report, insights_filename)
+                        with open(insights_filename, 'rb') as f:
+                            st.download_button(
+                                label="⬇️ Scarica Excel Analisi",
+                                data=f.read(),
+                                file_name=insights_filename,
+                                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                            )
+            with col_j:
+                st.download_button(
+                    label="⬇️ Scarica JSON Analisi",
+                    data=json.dumps(report, ensure_ascii=False, indent=2),
+                    file_name=f"insights_{board_id}_{timestamp}.json",
+                    mime="application/json"
+                )
+            with col_c:
+                st.download_button(
+                    label="⬇️ Scarica CSV per Ad",
+                    data=dataframe_to_csv(tables['ads']),
+                    file_name=f"insights_ads_{board_id}_{timestamp}.csv",
+                    mime="text/csv"
+                )
+
+        st.markdown("---")
+        st.markdown("### 🧬 Script Quasi Duplicati")
+        st.caption("Ads con transcript quasi identici (varianti leggermente modificate dello stesso script)")
+        
+        col_dup_scope, col_dup_threshold = st.columns(2)
+        with col_dup_scope:
+            dup_scope = st.radio("Cerca in:", ["Questa board", "Tutte le board estratte"], key="dup_scope")
+        with col_dup_threshold:
+            dup_threshold = st.slider(
+                "Somiglianza minima (solo questa board)", 0.3, 0.95, 0.7, 0.05,
+                help="Jaccard stimata tra i transcript; l'indice di tutte le board usa FOREPLAY_NEARDUP_THRESHOLD"
+            )
+        
+        if st.button("🧬 Trova Duplicati", type="primary"):
+            with st.spinner("Cercando script quasi duplicati..."), profiling():
+                try:
+                    if dup_scope == "Questa board":
+                        from foreplay_neardup import find_near_duplicates
+                        st.session_state['duplicates'] = find_near_duplicates(video_ads, threshold=dup_threshold)
+                    else:
+                        st.session_state['duplicates'] = get_neardup_index().clusters()
+                except Exception as e:
+                    st.error(f"Errore durante la ricerca dei duplicati: {e}")
+        
+        clusters = st.session_state.get('duplicates')
+        if clusters is not None:
+            import pandas as pd
+            
+            if not clusters:
+                st.info("Nessun gruppo di script quasi duplicati trovato.")
+            else:
+                st.metric("Gruppi trovati", len(clusters), f"{sum(c['size'] for c in clusters)} ads")
+                duplicates_df = pd.DataFrame([
+                    {
+                        'gruppo': number,
+                        'ad_id': member['key'],
+                        'name': member.get('name', ''),
+                        'board_id': member.get('board_id', ''),
+                        'somiglianza': member['similarity'],
+                    }
+                    for number, cluster in enumerate(clusters, 1)
+                    for member in cluster['members']
+                ])
+                st.dataframe(duplicates_df, use_container_width=True, hide_index=True)
+                st.download_button(
+                    label="⬇️ Scarica CSV Duplicati",
+                    data=dataframe_to_csv(duplicates_df),
+                    file_name=f"duplicates_{board_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+                    mime="text/csv"
+                )
+
+# Pannello profiling
+if st.session_state.get('profiler') and st.session_state['profiler'].spans:
+    import pandas as pd
+    
+    profiler = st.session_state['profiler']
+    
+    st.markdown("---")
+    st.markdown("## ⏱️ Profilo per Fase")
+    
+    st.dataframe(
+        pd.DataFrame(profiler.stage_breakdown()).rename(columns={
+            'stage': 'Fase', 'count': 'Chiamate', 'total_ms': 'Totale (ms)',
+            'mean_ms': 'Media (ms)', 'max_ms': 'Max (ms)'
+        }),
+        use_container_width=True,
+        hide_index=True
+    )
+    st.caption("Le fasi annidate (es. request dentro ad_detail) si sovrappongono nei totali")
+    
+    # Andamento del limite di concorrenza adattiva
+    limits = get_client(API_KEY).concurrency_stats()
+    if len(limits.get('history', [])) > 1:
+        st.markdown("#### 🚦 Limite di Concorrenza")
+        st.line_chart(
+            pd.DataFrame(limits['history']).rename(columns={'t': 'Secondi', 'limit': 'Richieste in parallelo'}),
+            x='Secondi',
+            y='Richieste in parallelo'
+        )
+    
+    st.download_button(
+        label="⬇️ Scarica Trace (Chrome)",
+        data=profiler.chrome_trace_json(),
+        file_name=f"trace_{st.session_state.get('board_id', 'board')}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+        mime="application/json",
+        help="Apri il file in chrome://tracing o https://ui.perfetto.dev"
+    )
 
 # Footer
 st.markdown("---")
@@ -0,0 +1,220 @@
+"""
+Foreplay API - Hedged Requests
+Description: Cuts the tail latency of ad detail lookups. A board extraction
+waits for its slowest few detail calls, and a call stuck behind a slow
+backend usually answers quickly when sent again.
+
+Each lookup starts one request. If it has not answered by an adaptive
+deadline (config.HEDGE_PERCENTILE of recent lookup latencies), a second
+request goes out: to the alternate endpoint (api/ad?ad_id= for
+api/ad/{id} and vice versa) or as a plain retry of the same one. The first
+successful response wins. The loser is cancelled if it has not been sent
+yet, otherwise its response is discarded when it arrives.
+
+Hedges are paid from a token bucket: every lookup earns config.HEDGE_BUDGET
+tokens and every hedge spends one, so hedging never adds more than that
+fraction of extra requests (plus a small burst) however slow the API gets.
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future, FIRST_COMPLETED, wait
+import contextvars
+from typing import Optional, Dict, Any, Callable
+
+from config import config
+import foreplay_profiler
+
+
+class HedgeCancelled(Exception):
+    """A hedged attempt was no longer needed before it was sent"""
+
+
+_cancelled: contextvars.ContextVar[Optional[threading.Event]] = contextvars.ContextVar("foreplay_hedge_cancelled", default=None)
+
+
+def raise_if_cancelled() -> None:
+    """Stop an attempt whose lookup was already answered (called before sending)"""
+    event = _cancelled.get()
+    if event is not None and event.is_set():
+        raise HedgeCancelled()
+
+
+class HedgeBudget:
+    """Token bucket capping hedges to a fraction of lookups"""
+
+    def __init__(self, ratio: float, burst: float):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = burst
+        self._lock = threading.Lock()
+
+    def earn(self) -> None:
+        with self._lock:
+            self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def spend(self) -> bool:
+        with self._lock:
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return True
+            return False
+
+
+class HedgedRequester:
+    """
+    Run lookups with a hedged second request after an adaptive deadline.
+
+    Example:
+        hedger = HedgedRequester()
+        details = hedger.call(
+            lambda: client._make_request("GET", f"api/ad/{ad_id}"),
+            alternate=lambda: client._make_request("GET", "api/ad", params={"ad_id": ad_id})
+        )
+        hedger.snapshot()        # deadline, hedges sent and won, budget
+    """
+
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        percentile: Optional[float] = None,
+        budget: Optional[float] = None,
+        target: Optional[str] = None,
+        history_size: int = 500
+    ):
+        """
+        Initialize the hedger.
+
+        Args:
+            max_workers: Threads running attempts, two per concurrent lookup
+                (default: twice config.MAX_CONCURRENCY)
+            percentile: Latency percentile used as hedge deadline
+            budget: Extra requests allowed per lookup (0.1 = at most 10%)
+            target: "alternate" to hedge on the other endpoint, "same" to
+                send the same request again
+            history_size: Recent lookup latencies the deadline is computed from
+        """
+        self.max_workers = max_workers or 2 * config.MAX_CONCURRENCY
+        self.percentile = percentile or config.HEDGE_PERCENTILE
+        self.target = target or config.HEDGE_TARGET
+        if self.target not in ("alternate", "same"):
+            raise ValueError(f"Unknown hedge target: {self.target} (use alternate or same)")
+        self.budget = HedgeBudget(config.HEDGE_BUDGET if budget is None else budget, config.HEDGE_BUDGET_BURST)
+
+        self._latencies = deque(maxlen=history_size)
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.counters: Dict[str, int] = {
+            "lookups": 0, "hedged": 0, "hedge_wins": 0, "budget_denied": 0, "cancelled": 0, "discarded": 0
+        }
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.counters[name] += 1
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="hedge")
+            return self._executor
+
+    def deadline(self) -> float:
+        """Seconds to wait for the first request before hedging"""
+        with self._lock:
+            if len(self._latencies) < config.HEDGE_MIN_SAMPLES:
+                return config.HEDGE_INITIAL_DELAY_SECONDS
+            latencies = sorted(self._latencies)
+        index = min(len(latencies) - 1, int(len(latencies) * self.percentile / 100))
+        return max(config.HEDGE_MIN_DELAY_SECONDS, latencies[index])
+
+    def _submit(self, func: Callable[[], Any], cancelled: threading.Event) -> Future:
+        # The attempt keeps the caller's priority class and profiler
+        context = contextvars.copy_context()
+        context.run(_cancelled.set, cancelled)
+        return self._pool().submit(context.run, func)
+
+    def _observe(self, started: float) -> Callable[[Future], None]:
+        # Every first request feeds the deadline, including ones that lose
+        # to a hedge, so slow requests keep counting in the percentile
+        def done(future: Future) -> None:
+            if not future.cancelled() and future.exception() is None:
+                with self._lock:
+                    self._latencies.append(time.monotonic() - started)
+        return done
+
+    def call(self, primary: Callable[[], Any], alternate: Optional[Callable[[], Any]] = None) -> Any:
+        """
+        Run primary, hedging with alternate (or primary again) past the deadline.
+
+        Args:
+            primary: The lookup to run
+            alternate: Equivalent lookup on the other endpoint
+
+        Returns:
+            The first successful result
+
+        Raises:
+            The primary's exception when every attempt failed, or right away
+            when the primary fails before the deadline
+        """
+        hedge = alternate if alternate is not None and self.target == "alternate" else primary
+        self._count("lookups")
+        self.budget.earn()
+
+        cancelled = threading.Event()
+        started = time.monotonic()
+        first = self._submit(primary, cancelled)
+        first.add_done_callback(self._observe(started))
+
+        done, _ = wait([first], timeout=self.deadline())
+        if done:
+            return first.result()
+
+        if not self.budget.spend():
+            self._count("budget_denied")
+            return first.result()
+
+        self._count("hedged")
+        hedge_start = time.perf_counter_ns()
+        second = self._submit(hedge, cancelled)
+        pending = {first, second}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        winner = "hedge" if future is second else "primary"
+                        if winner == "hedge":
+                            self._count("hedge_wins")
+                        foreplay_profiler.current().add(
+                            "hedged lookup", "hedge", hedge_start, time.perf_counter_ns() - hedge_start, {"winner": winner}
+                        )
+                        return future.result()
+                    if future is first or error is None:
+                        error = future.exception()
+            raise error
+        finally:
+            cancelled.set()
+            for future in pending:
+                self._count("cancelled" if future.cancel() else "discarded")
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Current deadline (ms), hedge counters and budget tokens left"""
+        deadline = self.deadline()
+        with self._lock:
+            return {
+                "deadline_ms": round(deadline * 1000, 1),
+                "samples": len(self._latencies),
+                "target": self.target,
+                "budget": self.budget.ratio,
+                "tokens": round(self.budget.tokens, 2),
+                **self.counters,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,282 @@
+"""
+Foreplay API - Transcript Insights
+Description: Board-level and cross-board transcript analytics computed over
+the columnar segment corpus: word and n-gram frequencies, the most common
+opening lines (hooks), speaking pace in words per second, and video duration
+distributions.
+
+Tokens are mapped to integer codes once, so n-gram counting, per-ad sums and
+histograms are plain NumPy array operations. Reports are cached per corpus
+snapshot (directory + creation time), so re-opening a tab is free.
+"""
+
+import re
+from itertools import chain
+from typing import TYPE_CHECKING, Optional, Dict, Any, List, Sequence, Tuple
+
+import numpy as np
+
+from foreplay_cache import JsonDiskCache
+from foreplay_corpus import SegmentCorpus
+from foreplay_profiler import profiled
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+REPORT_VERSION = 1
+
+TOKEN_PATTERN = r"[^\W\d_]+(?:'[^\W\d_]+)?"
+SEPARATOR = "\x1f"
+_TOKENS = re.compile(f"{TOKEN_PATTERN}|{SEPARATOR}")
+_HOOK_CLEANUP = re.compile(r"[^\w\s']+")
+
+# Function words left out of the single-word ranking (n-grams keep them,
+# since "you need to" is exactly the kind of phrase worth finding)
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have i if in is it its it's of on or
+so that the this to was we were with you your you're our my me they their them
+he she his her not no do does did just all can will would what when how who
+il lo la i gli le un una di da in con su per tra fra e ed o che non è ma se
+mi ti ci si vi del della dei delle al alla ai alle nel nella sono sei ha hai
+""".split())
+
+DURATION_BINS = (0, 6, 10, 15, 30, 60, 120, np.inf)
+PACE_BINS = (0, 1, 1.5, 2, 2.5, 3, 3.5, 4, np.inf)
+
+
+def _bin_labels(bins: Sequence[float], unit: str) -> List[str]:
+    labels = []
+    for low, high in zip(bins[:-1], bins[1:]):
+        labels.append(f"{low:g}+{unit}" if np.isinf(high) else f"{low:g}-{high:g}{unit}")
+    return labels
+
+
+def _histogram(values: np.ndarray, bins: Sequence[float], unit: str) -> List[Dict[str, Any]]:
+    counts, _ = np.histogram(values, bins=np.asarray(bins, dtype=np.float64))
+    return [{"bin": label, "count": int(count)} for label, count in zip(_bin_labels(bins, unit), counts)]
+
+
+def _percentiles(values: np.ndarray) -> Dict[str, float]:
+    if not len(values):
+        return {}
+    p = np.percentile(values, [10, 25, 50, 75, 90])
+    return {
+        "mean": round(float(values.mean()), 3),
+        "p10": round(float(p[0]), 3),
+        "p25": round(float(p[1]), 3),
+        "p50": round(float(p[2]), 3),
+        "p75": round(float(p[3]), 3),
+        "p90": round(float(p[4]), 3),
+    }
+
+
+def _top_ngrams(codes: np.ndarray, token_ads: np.ndarray, vocabulary: np.ndarray, n: int, top_n: int) -> List[Dict[str, Any]]:
+    """Count n-grams that do not cross ad boundaries, vectorized on int64 ids"""
+    if len(codes) < n:
+        return []
+    size = np.int64(len(vocabulary))
+    length = len(codes) - n + 1
+
+    ids = np.zeros(length, dtype=np.int64)
+    valid = np.ones(length, dtype=bool)
+    for offset in range(n):
+        ids = ids * size + codes[offset:offset + length]
+        if offset:
+            valid &= token_ads[offset:offset + length] == token_ads[:length]
+
+    unique, counts = np.unique(ids[valid], return_counts=True)
+    if not len(unique):
+        return []
+    order = np.argsort(-counts, kind="stable")[:top_n]
+
+    rows = []
+    for index in order:
+        value, words = int(unique[index]), []
+        for _ in range(n):
+            value, code = divmod(value, int(size))
+            words.append(vocabulary[code])
+        rows.append({"term": " ".join(reversed(words)), "count": int(counts[index])})
+    return rows
+
+
+@profiled("insights")
+def compute_insights(
+    corpora: Sequence[SegmentCorpus],
+    top_n: int = 30,
+    hook_seconds: float = 3.0,
+    max_ngram: int = 3
+) -> Dict[str, Any]:
+    """
+    Compute transcript analytics over one or more board corpora.
+
+    Args:
+        corpora: Segment corpora to analyze together
+        top_n: Rows kept in each ranking
+        hook_seconds: Sentences starting within this many seconds form the hook
+        max_ngram: Longest phrase length counted (2 = bigrams, 3 = trigrams)
+
+    Returns:
+        JSON-serializable report: summary, words, ngrams, hooks, pace,
+        durations and one row per ad
+    """
+    import pandas as pd
+
+    board_ids, ad_ids, sentences, starts, ends, seg_ads, video_durations = [], [], [], [], [], [], []
+    ad_base = 0
+    for corpus in corpora:
+        board_ids.extend([corpus.board_id or ""] * corpus.ad_count)
+        ad_ids.extend(corpus.ad_ids)
+        sentences.append(corpus.sentences())
+        starts.append(np.asarray(corpus.start, dtype=np.float64))
+        ends.append(np.asarray(corpus.end, dtype=np.float64))
+        seg_ads.append(np.asarray(corpus.ad, dtype=np.int64) + ad_base)
+        video_durations.append(np.asarray(corpus.ad_duration, dtype=np.float64))
+        ad_base += corpus.ad_count
+
+    n_ads = ad_base
+    sentences = list(chain.from_iterable(sentences))
+    start = np.concatenate(starts) if starts else np.zeros(0)
+    end = np.concatenate(ends) if ends else np.zeros(0)
+    seg_ad = np.concatenate(seg_ads) if seg_ads else np.zeros(0, dtype=np.int64)
+    video_duration = np.concatenate(video_durations) if video_durations else np.zeros(0)
+
+    # Tokenize once, in a single regex pass over all sentences joined by a
+    # separator; every ranking then works on integer codes
+    matches = np.asarray(
+        _TOKENS.findall(SEPARATOR.join(sentences).lower() + SEPARATOR) if sentences else [],
+        dtype=object
+    )
+    is_separator = matches == SEPARATOR
+    token_segment = np.cumsum(is_separator)[~is_separator]
+    seg_words = np.bincount(token_segment, minlength=len(sentences)).astype(np.int64)
+    codes, vocabulary = pd.factorize(pd.Series(matches[~is_separator], dtype=object))
+    codes = codes.astype(np.int64)
+    vocabulary = np.asarray(vocabulary, dtype=object)
+    token_ads = np.repeat(seg_ad, seg_words)
+
+    # Words: frequency without stopwords
+    word_counts = np.bincount(codes, minlength=len(vocabulary))
+    if len(vocabulary):
+        word_counts[np.fromiter((word in STOPWORDS for word in vocabulary), dtype=bool, count=len(vocabulary))] = 0
+    top_words = np.argsort(-word_counts, kind="stable")[:top_n]
+    words = [
+        {"term": vocabulary[i], "count": int(word_counts[i])}
+        for i in top_words if word_counts[i] > 0
+    ]
+    ngrams = {n: _top_ngrams(codes, token_ads, vocabulary, n, top_n) for n in range(2, max_ngram + 1)}
+
+    # Pace: words per second of speech, per ad
+    seg_seconds = np.clip(end - start, 0, None)
+    ad_words = np.bincount(seg_ad, weights=seg_words, minlength=n_ads)
+    ad_speech = np.bincount(seg_ad, weights=seg_seconds, minlength=n_ads)
+    ad_pace = np.divide(ad_words, ad_speech, out=np.zeros(n_ads), where=ad_speech > 0)
+    paced = ad_pace[ad_speech > 0]
+
+    # Hooks: sentences starting in the first hook_seconds, joined per ad
+    ad_hooks = [""] * n_ads
+    hook_segments = np.flatnonzero(start < hook_seconds)
+    for ad, index in zip(seg_ad[hook_segments].tolist(), hook_segments.tolist()):
+        if not sentences[index]:
+            continue
+        ad_hooks[ad] = f"{ad_hooks[ad]} {sentences[index]}" if ad_hooks[ad] else sentences[index]
+    hook_text = pd.Series([hook for hook in ad_hooks if hook], dtype=object)
+    normalized = (
+        hook_text.str.lower()
+        .str.replace(_HOOK_CLEANUP, " ", regex=True)
+        .str.split().str.join(" ")
+    )
+    hook_groups = (
+        pd.DataFrame({"normalized": normalized.to_numpy(), "hook": hook_text.to_numpy()})
+        .loc[lambda df: df["normalized"] != ""]
+        .groupby("normalized", sort=False)
+        .agg(hook=("hook", "first"), ads=("hook", "size"))
+        .sort_values("ads", ascending=False, kind="stable")
+        .head(top_n)
+    )
+    hooks = [{"hook": row.hook, "ads": int(row.ads)} for row in hook_groups.itertuples()]
+
+    with_duration = video_duration[video_duration > 0]
+
+    return {
+        "version": REPORT_VERSION,
+        "params": {"top_n": top_n, "hook_seconds": hook_seconds, "max_ngram": max_ngram},
+        "summary": {
+            "boards": len(corpora),
+            "ads": n_ads,
+            "segments": len(sentences),
+            "words": int(seg_words.sum()),
+            "vocabulary": len(vocabulary),
+            "speech_seconds": round(float(seg_seconds.sum()), 1),
+            "median_words_per_second": round(float(np.median(paced)), 3) if len(paced) else None,
+            "median_video_duration": round(float(np.median(with_duration)), 1) if len(with_duration) else None,
+        },
+        "words": words,
+        "ngrams": {str(n): rows for n, rows in ngrams.items()},
+        "hooks": hooks,
+        "pace": {"stats": _percentiles(paced), "histogram": _histogram(paced, PACE_BINS, " w/s")},
+        "durations": {"stats": _percentiles(with_duration), "histogram": _histogram(with_duration, DURATION_BINS, "s")},
+        "ads": [
+            {
+                "board_id": board_ids[i],
+                "ad_id": ad_ids[i],
+                "words": int(ad_words[i]),
+                "speech_seconds": round(float(ad_speech[i]), 3),
+                "words_per_second": round(float(ad_pace[i]), 3),
+                "video_duration": round(float(video_duration[i]), 3),
+                "hook": ad_hooks[i],
+            }
+            for i in range(n_ads)
+        ],
+    }
+
+
+def snapshot_key(corpora: Sequence[SegmentCorpus], **params: Any) -> str:
+    """Cache key identifying the exact corpus snapshots and parameters"""
+    parts = [f"{corpus.directory}@{corpus.meta.get('created_at')}" for corpus in corpora]
+    options = ",".join(f"{name}={value}" for name, value in sorted(params.items()))
+    return f"v{REPORT_VERSION}|{'|'.join(parts)}|{options}"
+
+
+def cached_insights(
+    corpora: Sequence[SegmentCorpus],
+    cache: Optional[JsonDiskCache] = None,
+    **params: Any
+) -> Tuple[Dict[str, Any], bool]:
+    """
+    Return compute_insights() for corpora, reusing the report cached for the
+    same snapshots. A rebuilt corpus has a new creation time, so its old
+    reports are never served.
+
+    Returns:
+        Tuple (report, whether it came from the cache)
+    """
+    cache = cache or JsonDiskCache("insights")
+    key = snapshot_key(corpora, **params)
+    report = cache.get(key)
+    if report is not None:
+        return report, True
+    report = compute_insights(corpora, **params)
+    cache.set(key, report)
+    return report, False
+
+
+def report_tables(report: Dict[str, Any]) -> Dict[str, "pd.DataFrame"]:
+    """Flatten a report into named DataFrames (GUI tables and exports)"""
+    import pandas as pd
+
+    summary = {**report["summary"], **report["params"]}
+    tables = {
+        "summary": pd.DataFrame([{"metric": key, "value": value} for key, value in summary.items()]),
+        "words": pd.DataFrame(report["words"], columns=["term", "count"]),
+    }
+    for n, rows in report["ngrams"].items():
+        tables[f"ngrams_{n}"] = pd.DataFrame(rows, columns=["term", "count"])
+    tables["hooks"] = pd.DataFrame(report["hooks"], columns=["hook", "ads"])
+    tables["pace"] = pd.DataFrame(report["pace"]["histogram"], columns=["bin", "count"])
+    tables["durations"] = pd.DataFrame(report["durations"]["histogram"], columns=["bin", "count"])
+    tables["ads"] = pd.DataFrame(
+        report["ads"],
+        columns=["board_id", "ad_id", "words", "speech_seconds", "words_per_second", "video_duration", "hook"]
+    )
+    return tables
@@ -0,0 +1,130 @@
+"""
+Foreplay API - File Locks
+Description: Advisory locks on lock files, shared by every process and thread
+on the host (GUI sessions, CLI jobs, export workers).
+
+Several stores live in directories that all sessions write to: cassettes,
+the segment corpus, the near-duplicate index, checkpoint journals and the
+video archive. A FileLock on a sibling ".lock" file serializes their
+writers. flock() locks belong to the open file, so two threads of the same
+process exclude each other too. On Windows msvcrt.locking is used instead
+(exclusive only).
+"""
+
+import os
+import time
+from typing import Optional
+
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:  # Windows
+    import msvcrt
+    FCNTL_AVAILABLE = False
+
+
+class LockTimeout(Exception):
+    """Raised when a lock is still held by someone else after the timeout"""
+
+
+class FileLock:
+    """
+    Exclusive (or shared) advisory lock on a lock file.
+
+    Example:
+        with FileLock(path + ".lock"):
+            ...                                  # one writer at a time, across processes
+
+        lock = FileLock(job_dir + ".lock")
+        if not lock.acquire(blocking=False):     # held by another session
+            ...
+
+    An instance belongs to one holder: threads that need the same lock each
+    create their own FileLock on the path.
+    """
+
+    def __init__(self, path: str, shared: bool = False, timeout: Optional[float] = None):
+        """
+        Initialize the lock (nothing is locked until acquire()).
+
+        Args:
+            path: Lock file, created if missing
+            shared: Take a shared (reader) lock instead of an exclusive one
+            timeout: Seconds acquire() waits before raising LockTimeout
+                (default: wait forever)
+        """
+        self.path = path
+        self.shared = shared and FCNTL_AVAILABLE
+        self.timeout = timeout
+        self._fd: Optional[int] = None
+
+    @property
+    def locked(self) -> bool:
+        return self._fd is not None
+
+    def _try(self, fd: int) -> bool:
+        try:
+            if FCNTL_AVAILABLE:
+                fcntl.flock(fd, (fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX) | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            return False
+
+    def acquire(self, blocking: bool = True) -> bool:
+        """
+        Take the lock.
+
+        Args:
+            blocking: Wait for the lock (up to timeout); False returns at once
+
+        Returns:
+            True once held, False if blocking=False and someone else holds it
+
+        Raises:
+            LockTimeout: If the timeout passes while waiting
+        """
+        if self._fd is not None:
+            return True
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+
+        if FCNTL_AVAILABLE and blocking and self.timeout is None:
+            fcntl.flock(fd, fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX)
+            self._fd = fd
+            return True
+
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        delay = 0.005
+        while not self._try(fd):
+            if not blocking:
+                os.close(fd)
+                return False
+            if deadline is not None and time.monotonic() >= deadline:
+                os.close(fd)
+                raise LockTimeout(f"Lock {self.path} still held after {self.timeout}s")
+            time.sleep(delay)
+            delay = min(delay * 2, 0.1)
+        self._fd = fd
+        return True
+
+    def release(self) -> None:
+        fd, self._fd = self._fd, None
+        if fd is None:
+            return
+        try:
+            if FCNTL_AVAILABLE:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            else:
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(fd)
+
+    def __enter__(self) -> "FileLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.release()
@@ -0,0 +1,456 @@
+"""
+Foreplay API - Media Downloader
+Description: Archives the video creatives of extracted ads. Videos are
+downloaded in parallel, each one in config.MEDIA_CHUNK_MB HTTP range
+requests, so a dropped connection only costs the chunk in flight and an
+interrupted run continues where it stopped.
+
+Layout of the media directory (config.MEDIA_DIR):
+    files/<sha256>.mp4       verified videos, named by content
+    partial/<url hash>.part  bytes received so far (+ .json: URL, ETag, size,
+                             .lock: held by the process downloading the URL)
+    manifest.jsonl           one record per finished URL (+ .lock)
+
+Downloads are deduplicated twice: by URL (ads sharing a video URL, or a URL
+already in the manifest, are not fetched again) and by content hash (the same
+creative under two URLs is stored once). Every file is verified before it is
+moved into files/: its size must match the server's and, when the ETag is a
+plain MD5 (S3, most CDNs), so must its MD5.
+
+One downloader is shared by the GUI sessions, and CLI runs may use the same
+archive: a URL is downloaded by one process at a time (its partial file is
+locked), and the manifest is read and appended under its own lock. Before
+downloading, a process picks up the records the others appended, so a video
+another process just finished is not fetched again.
+
+config.MEDIA_MAX_WORKERS bounds parallel downloads and
+config.MEDIA_BANDWIDTH_MB_S their total bandwidth. config.MEDIA_ORIGIN
+rewrites the scheme and host of every URL, so a local file server can stand
+in for the CDN in tests (see benchmarks/cdn_server.py).
+"""
+
+import contextvars
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, Future, as_completed
+from typing import Optional, Dict, Any, List, Callable, Iterable
+from urllib.parse import urlsplit, urlunsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import config
+import foreplay_profiler
+from foreplay_checkpoint import JournalFile, read_journal
+from foreplay_locks import FileLock
+from foreplay_transport import RateLimiter
+
+
+MANIFEST_FILE = "manifest.jsonl"
+READ_SIZE = 64 * 1024
+
+
+class VerificationError(Exception):
+    """A downloaded file does not match the size or checksum announced by the server"""
+
+
+def _md5_etag(etag: Optional[str]) -> Optional[str]:
+    """MD5 carried by a strong ETag like "9e107d9d372bb6826bd81d3542a419d6", else None"""
+    if not etag or etag.startswith("W/"):
+        return None
+    value = etag.strip('"').lower()
+    return value if re.fullmatch(r"[0-9a-f]{32}", value) else None
+
+
+def _content_range_total(header: str) -> Optional[int]:
+    match = re.match(r"bytes (\d+)-(\d+)/(\d+|\*)", header or "")
+    if not match or match.group(3) == "*":
+        return None
+    return int(match.group(3))
+
+
+class MediaDownloader:
+    """
+    Parallel, resumable, deduplicated video downloads.
+
+    Example:
+        downloader = MediaDownloader("archive", bandwidth_mb_s=20)
+        results = downloader.download_ads(ads, on_progress=lambda done, total, item: ...)
+        downloader.snapshot()        # files, bytes, duplicates, failures
+    """
+
+    def __init__(
+        self,
+        media_dir: Optional[str] = None,
+        max_workers: Optional[int] = None,
+        bandwidth_mb_s: Optional[float] = None,
+        chunk_mb: Optional[float] = None,
+        retries: Optional[int] = None,
+        origin: Optional[str] = None,
+        session: Optional[requests.Session] = None
+    ):
+        """
+        Initialize the downloader.
+
+        Args:
+            media_dir: Directory of the archive (default config.MEDIA_DIR)
+            max_workers: Parallel downloads
+            bandwidth_mb_s: Total download bandwidth in MB/s (0 = unlimited)
+            chunk_mb: Size of each range request
+            retries: Attempts per chunk after a network error, and per file
+                after a failed verification
+            origin: Scheme and host replacing those of every URL
+                (e.g. http://127.0.0.1:8766 for a local file server)
+            session: HTTP session (default: a new one pooling max_workers
+                connections)
+        """
+        self.directory = media_dir or config.MEDIA_DIR
+        self.max_workers = max_workers or config.MEDIA_MAX_WORKERS
+        bandwidth_mb_s = config.MEDIA_BANDWIDTH_MB_S if bandwidth_mb_s is None else bandwidth_mb_s
+        # Bytes are taken one read at a time, so the limit holds over short windows too
+        self.bandwidth = RateLimiter(bandwidth_mb_s * 1024 * 1024, burst=4 * READ_SIZE) if bandwidth_mb_s else None
+        self.chunk_size = int((chunk_mb or config.MEDIA_CHUNK_MB) * 1024 * 1024)
+        self.retries = config.MEDIA_RETRIES if retries is None else retries
+        self.origin = origin if origin is not None else config.MEDIA_ORIGIN
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=config.HTTP_POOL_CONNECTIONS, pool_maxsize=self.max_workers)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+        self.session = session
+
+        self.files_dir = os.path.join(self.directory, "files")
+        self.partial_dir = os.path.join(self.directory, "partial")
+        os.makedirs(self.files_dir, exist_ok=True)
+        os.makedirs(self.partial_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._in_flight: Dict[str, Future] = {}
+        self.by_url: Dict[str, Dict[str, Any]] = {}
+        self.by_hash: Dict[str, Dict[str, Any]] = {}
+        self.manifest_path = os.path.join(self.directory, MANIFEST_FILE)
+        with self._manifest_lock():
+            # read_journal() may cut a torn last line: never while another process appends
+            for record in read_journal(self.manifest_path):
+                self._add_record(record)
+            self._manifest_offset = os.path.getsize(self.manifest_path) if os.path.exists(self.manifest_path) else 0
+            self._manifest = JournalFile(self.manifest_path, config.CHECKPOINT_SYNC_SECONDS)
+        self.stats: Dict[str, int] = {
+            "downloaded": 0, "cached": 0, "duplicates": 0, "failed": 0,
+            "bytes": 0, "resumed_bytes": 0, "chunk_retries": 0, "restarts": 0
+        }
+
+    def _manifest_lock(self) -> FileLock:
+        # A new lock per use: a FileLock instance must not be shared by threads
+        return FileLock(self.manifest_path + ".lock")
+
+    def _add_record(self, record: Dict[str, Any]) -> None:
+        self.by_url[record["url"]] = record
+        self.by_hash.setdefault(record["sha256"], record)
+
+    def _refresh(self) -> None:
+        """Pick up manifest records appended since the last read (by any process)"""
+        with self._manifest_lock():
+            try:
+                with open(self.manifest_path, "rb") as f:
+                    f.seek(self._manifest_offset)
+                    data = f.read()
+            except FileNotFoundError:
+                return
+            end = data.rfind(b"\n") + 1
+            self._manifest_offset += end
+        records = []
+        for line in data[:end].split(b"\n"):
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+        with self._lock:
+            for record in records:
+                self._add_record(record)
+
+    def _count(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self.stats[name] += value
+
+    def _source_url(self, url: str) -> str:
+        if not self.origin:
+            return url
+        origin = urlsplit(self.origin)
+        parts = urlsplit(url)
+        return urlunsplit((origin.scheme, origin.netloc, parts.path, parts.query, ""))
+
+    def _extension(self, url: str) -> str:
+        extension = os.path.splitext(urlsplit(url).path)[1].lower()
+        return extension if re.fullmatch(r"\.[a-z0-9]{1,5}", extension) else ".mp4"
+
+    # =============================================================================
+    # SINGLE DOWNLOAD
+    # =============================================================================
+
+    def _load_state(self, part_path: str, url: str) -> Dict[str, Any]:
+        """Validators of a partial download of url, or {} to start over"""
+        try:
+            with open(f"{part_path}.json", "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = {}
+        if state.get("url") != url or not os.path.exists(part_path):
+            state = {"url": url}
+            open(part_path, "wb").close()
+        return state
+
+    def _save_state(self, part_path: str, state: Dict[str, Any]) -> None:
+        tmp_path = f"{part_path}.json.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, f"{part_path}.json")
+
+    def _fetch_chunk(self, url: str, part_path: str, state: Dict[str, Any]) -> bool:
+        """
+        Request the next chunk and append it to the partial file.
+
+        Returns:
+            True when the file is complete
+        """
+        offset = os.path.getsize(part_path)
+        total = state.get("total")
+        if total is not None and offset >= total:
+            return True
+
+        end = offset + self.chunk_size - 1
+        if total is not None:
+            end = min(end, total - 1)
+        headers = {"Range": f"bytes={offset}-{end}"}
+        validator = state.get("etag") or state.get("last_modified")
+        if offset and validator:
+            # The server sends the whole (new) file if it changed since
+            headers["If-Range"] = validator
+
+        with self.session.get(self._source_url(url), headers=headers, stream=True, timeout=config.MEDIA_TIMEOUT) as response:
+            if response.status_code == 416 and offset:
+                # Nothing past offset: the file was already complete
+                state["total"] = offset
+                return True
+            response.raise_for_status()
+
+            if response.status_code == 206:
+                if not response.headers.get("Content-Range", "").startswith(f"bytes {offset}-"):
+                    raise requests.ConnectionError(f"Unexpected Content-Range: {response.headers.get('Content-Range')}")
+                state["total"] = _content_range_total(response.headers["Content-Range"])
+                mode = "ab"
+            else:
+                # No range support, or the file changed: start over with the full body
+                if offset:
+                    self._count("restarts")
+                length = response.headers.get("Content-Length")
+                state["total"] = int(length) if length and "Content-Encoding" not in response.headers else None
+                mode = "wb"
+            state["etag"] = response.headers.get("ETag")
+            state["last_modified"] = response.headers.get("Last-Modified")
+            self._save_state(part_path, state)
+
+            with open(part_path, mode) as f:
+                for block in response.iter_content(READ_SIZE):
+                    if self.bandwidth:
+                        self.bandwidth.acquire(len(block))
+                    f.write(block)
+                    self._count("bytes", len(block))
+
+        if response.status_code != 206:
+            # A full body was streamed to its end
+            state["total"] = os.path.getsize(part_path)
+            return True
+        return state["total"] is not None and os.path.getsize(part_path) >= state["total"]
+
+    def _verify(self, part_path: str, state: Dict[str, Any]) -> str:
+        """Check size and (when the ETag carries it) MD5; returns the SHA-256"""
+        size = os.path.getsize(part_path)
+        if state.get("total") is not None and size != state["total"]:
+            raise VerificationError(f"Size {size} differs from {state['total']}")
+        sha256, md5 = hashlib.sha256(), hashlib.md5()
+        with open(part_path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                sha256.update(block)
+                md5.update(block)
+        expected = _md5_etag(state.get("etag"))
+        if expected and md5.hexdigest() != expected:
+            raise VerificationError(f"MD5 {md5.hexdigest()} differs from ETag {expected}")
+        return sha256.hexdigest()
+
+    def _download(self, url: str) -> Dict[str, Any]:
+        part_path = os.path.join(self.partial_dir, hashlib.sha1(url.encode("utf-8")).hexdigest() + ".part")
+        # Lock files are kept: removing one could let a second process lock a new file
+        with FileLock(f"{part_path}.lock"):
+            self._refresh()
+            with self._lock:
+                record = self.by_url.get(url)
+                if record and os.path.exists(record["path"]):
+                    # Finished by another process while this one waited
+                    self.stats["cached"] += 1
+                    return {**record, "status": "cached"}
+            return self._fetch(url, part_path)
+
+    def _fetch(self, url: str, part_path: str) -> Dict[str, Any]:
+        with foreplay_profiler.span(url, "media") as span:
+            state = self._load_state(part_path, url)
+            resumed = os.path.getsize(part_path)
+            if resumed:
+                self._count("resumed_bytes", resumed)
+
+            verify_attempts = 0
+            while True:
+                failures = 0
+                while True:
+                    try:
+                        if self._fetch_chunk(url, part_path, state):
+                            break
+                        failures = 0
+                    except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError):
+                        # Bytes received before the error stay in the partial file
+                        failures += 1
+                        self._count("chunk_retries")
+                        if failures > self.retries:
+                            raise
+                        time.sleep(config.MEDIA_RETRY_BACKOFF_SECONDS * 2 ** (failures - 1))
+                try:
+                    sha256 = self._verify(part_path, state)
+                    break
+                except VerificationError:
+                    verify_attempts += 1
+                    if verify_attempts > self.retries:
+                        raise
+                    state = {"url": url}
+                    open(part_path, "wb").close()
+                    self._count("restarts")
+
+            size = os.path.getsize(part_path)
+            span.set(bytes=size)
+            with self._lock:
+                existing = self.by_hash.get(sha256)
+            if existing and os.path.exists(existing["path"]):
+                os.remove(part_path)
+                status = "duplicate"
+                path = existing["path"]
+            else:
+                path = os.path.join(self.files_dir, sha256 + self._extension(url))
+                os.replace(part_path, path)
+                status = "downloaded"
+            try:
+                os.remove(f"{part_path}.json")
+            except OSError:
+                pass
+
+        record = {"url": url, "sha256": sha256, "path": path, "bytes": size, "etag": state.get("etag")}
+        with self._lock:
+            self._add_record(record)
+            self.stats["duplicates" if status == "duplicate" else "downloaded"] += 1
+        with self._manifest_lock():
+            self._manifest.append(record)
+        return {**record, "status": status}
+
+    def _finish(self, url: str) -> None:
+        with self._lock:
+            self._in_flight.pop(url, None)
+
+    def submit(self, url: str, executor: ThreadPoolExecutor) -> Future:
+        """
+        Start downloading url unless it is archived or already downloading.
+
+        Returns:
+            Future resolving to the url's record (url, sha256, path, bytes,
+            status: downloaded, duplicate or cached)
+        """
+        with self._lock:
+            record = self.by_url.get(url)
+            if record and os.path.exists(record["path"]):
+                self.stats["cached"] += 1
+                done: Future = Future()
+                done.set_result({**record, "status": "cached"})
+                return done
+            if url in self._in_flight:
+                return self._in_flight[url]
+            future = executor.submit(contextvars.copy_context().run, self._download, url)
+            self._in_flight[url] = future
+        future.add_done_callback(lambda _: self._finish(url))
+        return future
+
+    # =============================================================================
+    # BATCHES
+    # =============================================================================
+
+    def download(
+        self,
+        urls: Iterable[str],
+        on_progress: Optional[Callable[[int, int, Dict[str, Any]], None]] = None
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Download several URLs in parallel.
+
+        Args:
+            urls: Video URLs (duplicates are fetched once)
+            on_progress: Called with (done, total, record) after each URL,
+                in the calling thread
+
+        Returns:
+            Dictionary url -> record; failed URLs have status "failed" and
+            an "error"
+        """
+        urls = list(dict.fromkeys(u for u in urls if u))
+        results: Dict[str, Dict[str, Any]] = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="media") as executor:
+            futures = {self.submit(url, executor): url for url in urls}
+            for done, future in enumerate(as_completed(futures), 1):
+                url = futures[future]
+                try:
+                    results[url] = future.result()
+                except Exception as e:
+                    self._count("failed")
+                    results[url] = {"url": url, "status": "failed", "error": str(e)}
+                if on_progress:
+                    on_progress(done, len(urls), results[url])
+        return results
+
+    def download_ads(
+        self,
+        ads: Iterable[Dict[str, Any]],
+        on_progress: Optional[Callable[[int, int, Dict[str, Any]], None]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Download the videos of extracted ads.
+
+        Args:
+            ads: Ads with a "video" URL (others are skipped)
+            on_progress: Called with (done, total, record) after each video
+
+        Returns:
+            One record per ad with a video: ad_id plus the video's record
+        """
+        ads = [ad for ad in ads if ad.get("video")]
+        results = self.download((ad["video"] for ad in ads), on_progress=on_progress)
+        return [{"ad_id": ad.get("ad_id") or ad.get("id"), **results[ad["video"]]} for ad in ads]
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Counters plus files and MB in the archive"""
+        with self._lock:
+            return {
+                **self.stats,
+                "files": len(self.by_hash),
+                "archive_mb": round(sum(r["bytes"] for r in self.by_hash.values()) / 1024 / 1024, 2),
+            }
+
+    def close(self) -> None:
+        self._manifest.close()
+        self.session.close()
+
+
+def summarize(records: List[Dict[str, Any]]) -> Dict[str, int]:
+    """Count ad video records by status"""
+    summary: Dict[str, int] = {}
+    for record in records:
+        summary[record["status"]] = summary.get(record["status"], 0) + 1
+    return summary
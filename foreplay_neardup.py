@@ -0,0 +1,534 @@
+"""
+Foreplay API - Near-Duplicate Ad Detection
+Description: Finds lightly edited copies of the same script across boards and
+discovery results. Each ad's text (full_transcription, optionally description
+and headline) becomes a set of word shingles, summarized by a MinHash
+signature; locality-sensitive hashing over signature bands proposes candidate
+pairs, so clustering never compares all pairs.
+
+The index is incremental: add() hashes only the new ads into the existing
+buckets, and save() appends only them to the index on disk.
+
+On disk an index is a set of immutable segments (signatures + keys/info)
+listed by a MANIFEST file. save() writes the new ads as one more segment and
+then replaces the manifest with one atomic rename under the index's lock
+file, after re-reading it, so sessions and processes saving at the same time
+add their segments instead of overwriting each other. Ads saved by two
+writers are kept once on load. When the segments pile up, save() merges
+them into one.
+"""
+
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import zlib
+from itertools import chain
+from typing import Optional, Dict, Any, List, Iterable, Sequence, Tuple
+
+import numpy as np
+
+from config import config
+from foreplay_locks import FileLock
+from foreplay_profiler import profiled
+from foreplay_sharding import ad_key
+
+
+INDEX_VERSION = 1
+MANIFEST_VERSION = 2
+MANIFEST_FILE = "MANIFEST"
+LOCK_FILE = ".lock"
+MAX_SEGMENTS = 16  # merged into one segment beyond this
+
+# Single-file layout written before segments (read as the first segment)
+SIGNATURES_FILE = "signatures.npy"
+META_FILE = "meta.json"
+
+PARAMS = ("num_perm", "shingle_size", "fields", "seed")
+
+_CHUNK_SHINGLES = 32768
+
+_WORDS = re.compile(r"\w+")
+
+
+def ad_text(ad: Dict[str, Any], fields: Sequence[str] = ("full_transcription",)) -> str:
+    """Text of an ad used for similarity (selected fields joined)"""
+    return " ".join(str(ad.get(field) or "") for field in fields).strip()
+
+
+def optimal_bands(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """
+    Choose (bands, rows) with bands * rows <= num_perm whose LSH threshold
+    (1 / bands) ** (1 / rows) is closest to the requested Jaccard threshold.
+    """
+    best = (num_perm, 1)
+    best_error = float("inf")
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        error = abs((1.0 / bands) ** (1.0 / rows) - threshold)
+        if error < best_error:
+            best, best_error = (bands, rows), error
+    return best
+
+
+def shingle_hashes(texts: Sequence[str], k: int = 3) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Hash the word k-shingles of every text.
+
+    Words are hashed once per distinct word (crc32); shingle hashes are then
+    combined with array arithmetic. Texts shorter than k words yield a single
+    shingle; empty texts yield none.
+
+    Returns:
+        Tuple (uint32 shingle hashes of all texts concatenated, int64 offsets
+        where text i owns hashes[offsets[i]:offsets[i + 1]])
+    """
+    import pandas as pd
+
+    token_lists = [_WORDS.findall(text.lower()) for text in texts]
+    lengths = np.fromiter((len(tokens) for tokens in token_lists), dtype=np.int64, count=len(token_lists))
+    codes, vocabulary = pd.factorize(pd.Series(list(chain.from_iterable(token_lists)), dtype=object))
+    word_hash = np.fromiter(
+        (zlib.crc32(word.encode("utf-8")) for word in vocabulary),
+        dtype=np.uint64,
+        count=len(vocabulary)
+    )
+    token_hash = word_hash[codes]
+
+    token_offsets = np.concatenate(([0], np.cumsum(lengths)))
+    shingle_counts = np.where(lengths == 0, 0, np.maximum(lengths - k + 1, 1))
+    offsets = np.concatenate(([0], np.cumsum(shingle_counts))).astype(np.int64)
+
+    # Shingle j of text i starts at token token_offsets[i] + j and spans
+    # min(k, length) tokens
+    owner = np.repeat(np.arange(len(texts)), shingle_counts)
+    first = token_offsets[owner] + (np.arange(int(shingle_counts.sum())) - offsets[owner])
+    span = np.minimum(lengths[owner], k)
+    hashes = np.zeros(len(first), dtype=np.uint64)
+    for position in range(k):
+        present = position < span
+        index = np.where(present, first + position, 0)
+        mixed = (hashes * np.uint64(1000003) + token_hash[index] + np.uint64(position)) & np.uint64(0xFFFFFFFF)
+        hashes = np.where(present, mixed, hashes)
+    return hashes.astype(np.uint32), offsets
+
+
+def minhash_signatures(hashes: np.ndarray, offsets: np.ndarray, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    MinHash signature of each text from its shingle hashes.
+
+    Each permutation is a multiply-shift hash ((a * x + b) mod 2**64) >> 32,
+    which needs no modulo. Texts are processed in chunks of whole texts, each
+    chunk as one (permutations x shingles) array reduced per text with
+    minimum.reduceat. Every text must own at least one shingle.
+
+    Returns:
+        uint32 array of shape (texts, permutations)
+    """
+    count = len(offsets) - 1
+    signatures = np.empty((count, len(a)), dtype=np.uint32)
+    a, b = a[:, None], b[:, None]
+    start = 0
+    while start < count:
+        end = start + 1
+        while end < count and offsets[end + 1] - offsets[start] <= _CHUNK_SHINGLES:
+            end += 1
+        x = hashes[offsets[start]:offsets[end]].astype(np.uint64)
+        block = ((x * a + b) >> np.uint64(32)).astype(np.uint32)
+        signatures[start:end] = np.minimum.reduceat(block, offsets[start:end] - offsets[start], axis=1).T
+        start = end
+    return signatures
+
+
+class NearDuplicateIndex:
+    """
+    Incremental MinHash/LSH index of ads.
+
+    Example:
+        index = NearDuplicateIndex(threshold=0.7)
+        index.add(video_ads, board_id=board_id)
+        for cluster in index.clusters():
+            print(cluster["size"], cluster["members"])
+    """
+
+    def __init__(
+        self,
+        threshold: Optional[float] = None,
+        num_perm: int = 128,
+        shingle_size: int = 3,
+        fields: Sequence[str] = ("full_transcription",),
+        seed: int = 1
+    ):
+        """
+        Initialize an empty index.
+
+        Args:
+            threshold: Estimated Jaccard similarity above which ads are
+                near-duplicates (default config.NEARDUP_THRESHOLD)
+            num_perm: MinHash permutations (signature length)
+            shingle_size: Words per shingle
+            fields: Ad fields whose text is compared
+            seed: Seed of the hash permutations (indexes must share it to be merged)
+        """
+        self.threshold = threshold or config.NEARDUP_THRESHOLD
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.fields = tuple(fields)
+        self.seed = seed
+        self.bands, self.rows = optimal_bands(self.threshold, num_perm)
+
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, 2 ** 64, size=num_perm, dtype=np.uint64, endpoint=False) | np.uint64(1)
+        self._b = rng.integers(0, 2 ** 64, size=num_perm, dtype=np.uint64, endpoint=False)
+        self._band_mix = rng.integers(1, 2 ** 61, size=self.rows, dtype=np.uint64)
+
+        self.keys: List[str] = []
+        self.info: List[Dict[str, Any]] = []
+        self.signatures = np.zeros((0, num_perm), dtype=np.uint32)
+        self._positions: Dict[str, int] = {}
+        self._buckets: Dict[Tuple[int, int], int] = {}
+        self._parent: List[int] = []
+        self._saved: Tuple[Optional[str], int] = (None, 0)  # (directory, ads already in it)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._positions
+
+    def _find(self, i: int) -> int:
+        parent = self._parent
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def _union(self, i: int, j: int) -> None:
+        root_i, root_j = self._find(i), self._find(j)
+        if root_i != root_j:
+            self._parent[max(root_i, root_j)] = min(root_i, root_j)
+
+    def similarity(self, i: int, j: int) -> float:
+        """Estimated Jaccard similarity of two indexed ads (by position)"""
+        return float(np.count_nonzero(self.signatures[i] == self.signatures[j])) / self.num_perm
+
+    def _band_keys(self, signatures: np.ndarray) -> np.ndarray:
+        """One 64-bit hash per (ad, band)"""
+        banded = signatures[:, :self.bands * self.rows].astype(np.uint64).reshape(len(signatures), self.bands, self.rows)
+        return (banded * self._band_mix).sum(axis=2)
+
+    def _insert(self, first: int, signatures: np.ndarray) -> None:
+        """Bucket new signatures and union them with similar existing ads"""
+        band_keys = self._band_keys(signatures).tolist()
+        buckets = self._buckets
+        for offset, keys in enumerate(band_keys):
+            position = first + offset
+            for band, value in enumerate(keys):
+                head = buckets.setdefault((band, value), position)
+                # Compare with the bucket's first ad only: near-duplicates of
+                # near-duplicates join through the union-find
+                if head != position and self._find(head) != self._find(position):
+                    if self.similarity(head, position) >= self.threshold:
+                        self._union(head, position)
+
+    @profiled("neardup")
+    def add(self, ads: Iterable[Dict[str, Any]], **info: Any) -> int:
+        """
+        Index new ads; ads already indexed (same id) or without text are skipped.
+
+        Args:
+            ads: Ads from a board, discover_ads or a ResultHandle
+            **info: Metadata kept with each ad (board_id, source, ...)
+
+        Returns:
+            Number of ads added
+        """
+        keys, texts, details = [], [], []
+        seen = set()
+        for ad in ads:
+            key = ad_key(ad)
+            if not key or key in self._positions or key in seen:
+                continue
+            text = ad_text(ad, self.fields)
+            if not _WORDS.search(text):
+                continue
+            seen.add(key)
+            keys.append(key)
+            texts.append(text)
+            details.append({**info, "name": ad.get('name') or '', "brand_id": ad.get('brand_id') or ''})
+
+        if not keys:
+            return 0
+
+        hashes, offsets = shingle_hashes(texts, self.shingle_size)
+        signatures = minhash_signatures(hashes, offsets, self._a, self._b)
+
+        with self._lock:
+            # Another session may have added the same ads while these were hashed
+            fresh = [i for i, key in enumerate(keys) if key not in self._positions]
+            if not fresh:
+                return 0
+            if len(fresh) < len(keys):
+                keys = [keys[i] for i in fresh]
+                details = [details[i] for i in fresh]
+                signatures = signatures[fresh]
+            first = len(self.keys)
+            self.keys.extend(keys)
+            self.info.extend(details)
+            self._positions.update((key, first + i) for i, key in enumerate(keys))
+            self._parent.extend(range(first, first + len(keys)))
+            self.signatures = np.concatenate([self.signatures, signatures])
+            self._insert(first, signatures)
+        return len(keys)
+
+    def clusters(self, min_size: int = 2) -> List[Dict[str, Any]]:
+        """
+        Groups of near-duplicate ads, largest first.
+
+        Returns:
+            One dict per cluster with size, the representative (first indexed)
+            ad, its members (key, info, similarity to the representative) and
+            the distinct boards involved
+        """
+        with self._lock:
+            groups: Dict[int, List[int]] = {}
+            for position in range(len(self.keys)):
+                groups.setdefault(self._find(position), []).append(position)
+
+            clusters = []
+            for root, members in groups.items():
+                if len(members) < min_size:
+                    continue
+                clusters.append({
+                    "size": len(members),
+                    "representative": self.keys[root],
+                    "members": [
+                        {
+                            "key": self.keys[m],
+                            **self.info[m],
+                            "similarity": round(self.similarity(root, m), 3),
+                        }
+                        for m in members
+                    ],
+                    "boards": sorted({str(self.info[m].get("board_id")) for m in members if self.info[m].get("board_id")}),
+                })
+        return sorted(clusters, key=lambda cluster: cluster["size"], reverse=True)
+
+    def duplicates_of(self, key: str) -> List[str]:
+        """Keys in the same cluster as key (excluding key itself)"""
+        position = self._positions.get(key)
+        if position is None:
+            return []
+        root = self._find(position)
+        return [k for i, k in enumerate(self.keys) if i != position and self._find(i) == root]
+
+    def _params(self) -> Dict[str, Any]:
+        return {
+            "num_perm": self.num_perm,
+            "shingle_size": self.shingle_size,
+            "fields": list(self.fields),
+            "seed": self.seed,
+        }
+
+    def save(self, directory: str) -> int:
+        """
+        Append the ads added since the last save (or load) to the index in directory.
+
+        Returns:
+            Number of ads written
+
+        Raises:
+            ValueError: If the index on disk was built with other MinHash parameters
+        """
+        directory = os.path.abspath(directory)
+        with self._lock:
+            saved_dir, saved = self._saved
+            first = saved if saved_dir == directory else 0
+            keys, info = self.keys[first:], self.info[first:]
+            signatures = self.signatures[first:]
+            total = len(self.keys)
+        if not keys:
+            return 0
+
+        os.makedirs(directory, exist_ok=True)
+        segment = _write_segment(directory, signatures, keys, info)
+        committed = False
+        try:
+            with FileLock(os.path.join(directory, LOCK_FILE)):
+                manifest = _read_manifest(directory)
+                if manifest is None:
+                    manifest = {"version": MANIFEST_VERSION, "threshold": self.threshold, **self._params(), "segments": []}
+                elif any(manifest[name] != value for name, value in self._params().items()):
+                    raise ValueError(f"Near-duplicate index in {directory} uses other MinHash parameters")
+                merged = []
+                manifest["segments"].append(segment)
+                if len(manifest["segments"]) > MAX_SEGMENTS:
+                    merged = manifest["segments"]
+                    manifest["segments"] = [_compact(directory, merged)]
+                _write_manifest(directory, manifest)
+                committed = True
+                for old in merged:
+                    _remove_segment(directory, old)
+        finally:
+            if not committed:
+                _remove_segment(directory, segment)
+
+        with self._lock:
+            if self._saved[0] != directory or self._saved[1] < total:
+                self._saved = (directory, total)
+        return len(keys)
+
+    @classmethod
+    def load(cls, directory: str) -> "NearDuplicateIndex":
+        """Load an index saved with save(); buckets and clusters are rebuilt"""
+        directory = os.path.abspath(directory)
+        if not os.path.exists(os.path.join(directory, LOCK_FILE)):
+            manifest, parts = _read_index(directory)
+        else:
+            # Writers delete merged segments under the exclusive lock
+            with FileLock(os.path.join(directory, LOCK_FILE), shared=True):
+                manifest, parts = _read_index(directory)
+
+        index = cls(
+            threshold=manifest["threshold"],
+            num_perm=manifest["num_perm"],
+            shingle_size=manifest["shingle_size"],
+            fields=manifest["fields"],
+            seed=manifest["seed"]
+        )
+        signatures, keys, info = _merge_segments(parts, manifest["num_perm"])
+        index.keys = keys
+        index.info = info
+        index.signatures = signatures
+        index._positions = {key: i for i, key in enumerate(index.keys)}
+        index._parent = list(range(len(index.keys)))
+        index._saved = (directory, len(index.keys))
+        index._insert(0, signatures)
+        return index
+
+
+# =============================================================================
+# ON-DISK SEGMENTS
+# =============================================================================
+
+def _read_manifest(directory: str) -> Optional[Dict[str, Any]]:
+    """
+    Manifest of an index directory (None when there is no index).
+
+    An index saved before segments (one meta.json that also holds the
+    parameters) is described as a manifest with a single segment.
+    """
+    try:
+        with open(os.path.join(directory, MANIFEST_FILE), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        try:
+            with open(os.path.join(directory, META_FILE), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return None
+        if meta.get("version") != INDEX_VERSION:
+            raise ValueError(f"Unsupported near-duplicate index version in {directory}: {meta.get('version')}")
+        return {
+            "version": MANIFEST_VERSION,
+            **{name: meta[name] for name in ("threshold", *PARAMS)},
+            "segments": [{"signatures": SIGNATURES_FILE, "meta": META_FILE}],
+        }
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise ValueError(f"Unsupported near-duplicate index version in {directory}: {manifest.get('version')}")
+    return manifest
+
+
+def _write_manifest(directory: str, manifest: Dict[str, Any]) -> None:
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".manifest")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(directory, MANIFEST_FILE))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _write_segment(directory: str, signatures: np.ndarray, keys: List[str], info: List[Dict[str, Any]]) -> Dict[str, str]:
+    """Write one immutable segment; it is not visible until the manifest lists it"""
+    name = f"seg-{time.time_ns():020d}-{os.getpid()}-{threading.get_ident()}"
+    segment = {"signatures": f"{name}.npy", "meta": f"{name}.json"}
+    np.save(os.path.join(directory, segment["signatures"]), signatures)
+    with open(os.path.join(directory, segment["meta"]), "w", encoding="utf-8") as f:
+        json.dump({"keys": keys, "info": info}, f, ensure_ascii=False)
+    return segment
+
+
+def _remove_segment(directory: str, segment: Dict[str, str]) -> None:
+    for name in segment.values():
+        try:
+            os.remove(os.path.join(directory, name))
+        except OSError:
+            pass
+
+
+def _read_segments(directory: str, segments: List[Dict[str, str]]) -> List[Tuple[np.ndarray, Dict[str, Any]]]:
+    """Signatures and keys/info of each segment"""
+    parts = []
+    for segment in segments:
+        with open(os.path.join(directory, segment["meta"]), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        parts.append((np.load(os.path.join(directory, segment["signatures"])), meta))
+    return parts
+
+
+def _read_index(directory: str) -> Tuple[Dict[str, Any], List[Tuple[np.ndarray, Dict[str, Any]]]]:
+    manifest = _read_manifest(directory)
+    if manifest is None:
+        raise FileNotFoundError(f"No near-duplicate index in {directory}")
+    return manifest, _read_segments(directory, manifest["segments"])
+
+
+def _merge_segments(parts: List[Tuple[np.ndarray, Dict[str, Any]]], num_perm: int) -> Tuple[np.ndarray, List[str], List[Dict[str, Any]]]:
+    """Concatenate segments, keeping the first copy of an ad saved by several writers"""
+    keys: List[str] = []
+    info: List[Dict[str, Any]] = []
+    blocks = []
+    seen = set()
+    for signatures, meta in parts:
+        keep = [i for i, key in enumerate(meta["keys"]) if key not in seen]
+        seen.update(meta["keys"])
+        keys.extend(meta["keys"][i] for i in keep)
+        info.extend(meta["info"][i] for i in keep)
+        blocks.append(signatures[keep] if len(keep) < len(signatures) else signatures)
+    signatures = np.concatenate(blocks) if blocks else np.zeros((0, num_perm), dtype=np.uint32)
+    return signatures, keys, info
+
+
+def _compact(directory: str, segments: List[Dict[str, str]]) -> Dict[str, str]:
+    """Merge segments into one new segment (called under the lock)"""
+    parts = _read_segments(directory, segments)
+    signatures, keys, info = _merge_segments(parts, parts[0][0].shape[1])
+    return _write_segment(directory, signatures, keys, info)
+
+
+def find_near_duplicates(
+    ads: Iterable[Dict[str, Any]],
+    threshold: Optional[float] = None,
+    fields: Sequence[str] = ("full_transcription",),
+    min_size: int = 2
+) -> List[Dict[str, Any]]:
+    """
+    One-shot clustering of a list of ads (board extraction or discover_ads results).
+
+    Returns:
+        Clusters as returned by NearDuplicateIndex.clusters()
+    """
+    index = NearDuplicateIndex(threshold=threshold, fields=fields)
+    index.add(ads)
+    return index.clusters(min_size=min_size)
+
+
+def index_path(name: str = "default") -> str:
+    """Directory of a persistent index under config.CACHE_DIR"""
+    return os.path.join(config.CACHE_DIR, "neardup", name)
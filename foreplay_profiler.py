@@ -0,0 +1,220 @@
+"""
+Foreplay API - Stage Profiler
+Description: Records timed spans for each extraction stage and each request
+(board listing, detail calls, JSON decoding, DataFrame building, Excel writing,
+queue wait, retries) and exports them as a Chrome trace-event JSON file that
+opens in chrome://tracing or https://ui.perfetto.dev.
+
+When no profiler is active, span() returns a shared no-op object, so the
+instrumentation costs one ContextVar lookup per span.
+"""
+
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, List, Callable, Deque
+
+from config import config
+
+
+class _NullSpan:
+    """No-op span returned while profiling is off"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("profiler", "name", "category", "args", "start")
+
+    def __init__(self, profiler: "Profiler", name: str, category: str, args: Dict[str, Any]):
+        self.profiler = profiler
+        self.name = name
+        self.category = category
+        self.args = args
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.profiler.add(self.name, self.category, self.start, time.perf_counter_ns() - self.start, self.args)
+        return False
+
+    def set(self, **args):
+        """Attach extra arguments (status code, sizes, ...) to the span"""
+        self.args.update(args)
+
+
+class Profiler:
+    """
+    Collector of timed spans.
+
+    Example:
+        profiler = Profiler()
+        with activate(profiler):
+            extract_board_video_ads(client, board_id)
+        profiler.export_chrome_trace("extraction.trace.json")
+    """
+
+    def __init__(self, enabled: bool = True, max_spans: Optional[int] = None):
+        """
+        Initialize the profiler.
+
+        Args:
+            enabled: Record spans (False makes span() a no-op)
+            max_spans: Keep only the newest spans (default: all of them)
+        """
+        self.enabled = enabled
+        self.origin = time.perf_counter_ns()
+        self.spans: Deque[Dict[str, Any]] = deque(maxlen=max_spans)
+        self._lock = threading.Lock()
+
+    def span(self, name: str, category: str, **args: Any):
+        """Context manager timing a block of code"""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, category, args)
+
+    def add(self, name: str, category: str, start_ns: int, duration_ns: int, args: Optional[Dict[str, Any]] = None) -> None:
+        """Record a span measured elsewhere (e.g. time spent waiting in a queue)"""
+        if not self.enabled:
+            return
+        span = {
+            "name": name,
+            "cat": category,
+            "start_ns": start_ns,
+            "dur_ns": duration_ns,
+            "tid": threading.get_ident(),
+            "thread": threading.current_thread().name,
+            "args": args or {},
+        }
+        with self._lock:
+            self.spans.append(span)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.spans.clear()
+            self.origin = time.perf_counter_ns()
+
+    def stage_breakdown(self) -> List[Dict[str, Any]]:
+        """
+        Aggregate spans by category.
+
+        Nested categories (e.g. "request" inside "ad_detail") are reported
+        separately, so totals can overlap.
+
+        Returns:
+            One row per category sorted by total time, in milliseconds
+        """
+        totals: Dict[str, List[int]] = {}
+        with self._lock:
+            for span in self.spans:
+                totals.setdefault(span["cat"], []).append(span["dur_ns"])
+
+        rows = []
+        for category, durations in totals.items():
+            total = sum(durations)
+            rows.append({
+                "stage": category,
+                "count": len(durations),
+                "total_ms": round(total / 1e6, 2),
+                "mean_ms": round(total / len(durations) / 1e6, 2),
+                "max_ms": round(max(durations) / 1e6, 2),
+            })
+        return sorted(rows, key=lambda row: row["total_ms"], reverse=True)
+
+    def to_chrome_trace(self) -> Dict[str, Any]:
+        """Return the spans in Chrome trace-event format (complete "X" events)"""
+        pid = os.getpid()
+        with self._lock:
+            spans = list(self.spans)
+
+        events = []
+        threads = {}
+        for span in spans:
+            threads[span["tid"]] = span["thread"]
+            events.append({
+                "name": span["name"],
+                "cat": span["cat"],
+                "ph": "X",
+                "ts": (span["start_ns"] - self.origin) / 1000.0,
+                "dur": span["dur_ns"] / 1000.0,
+                "pid": pid,
+                "tid": span["tid"],
+                "args": span["args"],
+            })
+        for tid, name in threads.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}})
+
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def chrome_trace_json(self) -> str:
+        return json.dumps(self.to_chrome_trace(), default=str)
+
+    def export_chrome_trace(self, path: str) -> None:
+        """Write the spans to a Chrome trace-event JSON file"""
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.chrome_trace_json())
+
+
+# Process-wide profiler, enabled with FOREPLAY_PROFILE=1; bounded, since it lives
+# as long as the process (the GUI server runs for days)
+default_profiler = Profiler(enabled=config.PROFILING, max_spans=config.PROFILE_MAX_SPANS)
+
+_active: contextvars.ContextVar = contextvars.ContextVar("foreplay_profiler", default=default_profiler)
+
+
+def current() -> Profiler:
+    """Return the profiler active in this context"""
+    return _active.get()
+
+
+def span(name: str, category: str, **args: Any):
+    """Time a block of code with the active profiler (no-op when disabled)"""
+    return _active.get().span(name, category, **args)
+
+
+@contextmanager
+def activate(profiler: Profiler):
+    """Make profiler the active one for the current context (thread)"""
+    token = _active.set(profiler)
+    try:
+        yield profiler
+    finally:
+        _active.reset(token)
+
+
+def profiled(category: str, name: Optional[str] = None) -> Callable:
+    """Decorator timing every call of a function under category"""
+    def decorator(func: Callable) -> Callable:
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            profiler = _active.get()
+            if not profiler.enabled:
+                return func(*args, **kwargs)
+            with profiler.span(span_name, category):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,287 @@
+"""
+Foreplay API - Priority Request Scheduler
+Description: Decides which waiting request gets the next free slot when the
+client is at its concurrency limit, so a user clicking "Estrai Transcript"
+does not queue behind thousands of bulk detail calls.
+
+Requests belong to one of three classes, set per thread/task with priority():
+    interactive   GUI actions a person is waiting for (default)
+    background    bulk jobs (CLI, nightly extraction)
+    prefetch      speculative work nobody is waiting for yet
+
+Free slots go to the waiting classes by weighted fair queuing
+(config.SCHEDULER_WEIGHTS), so background work keeps moving but interactive
+requests get most of the capacity. Interactive requests also preempt lower
+classes: when every slot is held by background or prefetch work they are
+admitted over the limit (up to config.SCHEDULER_PREEMPT_SLOTS), and while
+interactive traffic is active, lower classes are held to
+config.SCHEDULER_BACKGROUND_SHARE of the limit.
+
+Interactive activity is also published to a small beacon file under
+config.CACHE_DIR, so bulk jobs running in another process on the same host
+(the CLI) yield to the GUI too.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional, Dict, Any, Iterator
+
+from config import config
+from foreplay_concurrency import SlotOutcome, is_overload_error
+
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+PREFETCH = "prefetch"
+CLASSES = (INTERACTIVE, BACKGROUND, PREFETCH)
+
+_priority: ContextVar[Optional[str]] = ContextVar("foreplay_priority", default=None)
+
+
+def current_priority() -> str:
+    """Priority class of the current thread/task (default config.DEFAULT_PRIORITY)"""
+    return _priority.get() or config.DEFAULT_PRIORITY
+
+
+@contextmanager
+def priority(request_class: str):
+    """
+    Run the block's API requests in a priority class.
+
+    Worker threads started with contextvars.copy_context() inherit it.
+    """
+    if request_class not in CLASSES:
+        raise ValueError(f"Unknown priority class: {request_class} (use {', '.join(CLASSES)})")
+    token = _priority.set(request_class)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class ActivityBeacon:
+    """File whose modification time marks recent interactive traffic, shared across processes"""
+
+    def __init__(self, path: Optional[str] = None, touch_interval: float = 0.5):
+        self.path = path or os.path.join(config.CACHE_DIR, "scheduler", "interactive.beacon")
+        self.touch_interval = touch_interval
+        self._touched = 0.0
+        self._checked = 0.0
+        self._seen = 0.0
+
+    def touch(self) -> None:
+        now = time.time()
+        if now - self._touched < self.touch_interval:
+            return
+        self._touched = now
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "a"):
+                os.utime(self.path, None)
+        except OSError:
+            pass
+
+    def last_seen(self) -> float:
+        """Time of the latest interactive request in any process (stat cached for 0.25 s)"""
+        now = time.time()
+        if now - self._checked >= 0.25:
+            self._checked = now
+            try:
+                self._seen = os.path.getmtime(self.path)
+            except OSError:
+                self._seen = 0.0
+        return self._seen
+
+
+class _Waiter:
+    __slots__ = ("request_class", "event", "enqueued")
+
+    def __init__(self, request_class: str):
+        self.request_class = request_class
+        self.event = threading.Event()
+        self.enqueued = time.monotonic()
+
+
+class RequestScheduler:
+    """
+    Priority-aware admission of API requests under a concurrency limit.
+
+    Example:
+        scheduler = RequestScheduler(limiter)
+        with scheduler.slot() as slot:          # class from priority()
+            response = send()
+            slot.overloaded = response.status_code == 429
+    """
+
+    def __init__(
+        self,
+        limiter=None,
+        max_in_flight: Optional[int] = None,
+        weights: Optional[Dict[str, float]] = None,
+        preempt_slots: Optional[int] = None,
+        background_share: Optional[float] = None,
+        beacon: Optional[ActivityBeacon] = None
+    ):
+        """
+        Initialize the scheduler.
+
+        Args:
+            limiter: AdaptiveConcurrencyLimiter supplying the current limit
+                and fed with every request's outcome
+            max_in_flight: Fixed limit when there is no limiter
+            weights: Share of free slots per class when several are waiting
+            preempt_slots: Slots interactive requests may take over the
+                limit when lower classes hold all of them
+            background_share: Fraction of the limit lower classes may use
+                while interactive traffic is active
+            beacon: Cross-process interactive activity marker (None to
+                create the default one)
+        """
+        self.limiter = limiter
+        self.max_in_flight = max_in_flight or config.MAX_CONCURRENCY
+        self.weights = {**config.SCHEDULER_WEIGHTS, **(weights or {})}
+        self.preempt_slots = config.SCHEDULER_PREEMPT_SLOTS if preempt_slots is None else preempt_slots
+        self.background_share = background_share or config.SCHEDULER_BACKGROUND_SHARE
+        self.grace = config.SCHEDULER_INTERACTIVE_GRACE_SECONDS
+        self.beacon = beacon if beacon is not None else ActivityBeacon()
+
+        self._lock = threading.Lock()
+        self._queues: Dict[str, deque] = {c: deque() for c in CLASSES}
+        self._finish: Dict[str, float] = {c: 0.0 for c in CLASSES}
+        self._virtual_time = 0.0
+        self._last_interactive = 0.0
+        self.in_flight: Dict[str, int] = {c: 0 for c in CLASSES}
+        self.stats: Dict[str, Dict[str, int]] = {c: {"admitted": 0, "preempted": 0} for c in CLASSES}
+        self._waits: Dict[str, deque] = {c: deque(maxlen=1000) for c in CLASSES}
+
+    def _limit(self) -> int:
+        return int(self.limiter.limit) if self.limiter else self.max_in_flight
+
+    def _interactive_active(self) -> bool:
+        if self.in_flight[INTERACTIVE] or self._queues[INTERACTIVE]:
+            return True
+        if time.monotonic() - self._last_interactive < self.grace:
+            return True
+        return time.time() - self.beacon.last_seen() < self.grace
+
+    def _admissible(self, request_class: str) -> Optional[str]:
+        """How request_class can be admitted now: "slot", "preempt" or None"""
+        total = sum(self.in_flight.values())
+        limit = self._limit()
+
+        if request_class == INTERACTIVE:
+            if total < limit:
+                return "slot"
+            lower = total - self.in_flight[INTERACTIVE]
+            if lower and total < limit + self.preempt_slots:
+                return "preempt"
+            return None
+
+        if total >= limit:
+            return None
+        if self._interactive_active():
+            lower = total - self.in_flight[INTERACTIVE]
+            if lower >= max(1, int(limit * self.background_share)):
+                return None
+        return "slot"
+
+    def _dispatch(self) -> None:
+        """Admit waiting requests while slots are free, by weighted fair queuing (lock held)"""
+        while True:
+            ready = {}
+            for request_class in CLASSES:
+                if self._queues[request_class]:
+                    how = self._admissible(request_class)
+                    if how:
+                        ready[request_class] = how
+            if not ready:
+                return
+
+            # Start-time fair queuing: the class with the earliest virtual
+            # finish tag goes next; a tag advances by 1/weight per request
+            request_class = min(
+                ready,
+                key=lambda c: max(self._virtual_time, self._finish[c]) + 1.0 / self.weights[c]
+            )
+            start = max(self._virtual_time, self._finish[request_class])
+            self._finish[request_class] = start + 1.0 / self.weights[request_class]
+            self._virtual_time = start
+
+            waiter = self._queues[request_class].popleft()
+            self._admit(request_class, preempted=ready[request_class] == "preempt")
+            self._waits[request_class].append(time.monotonic() - waiter.enqueued)
+            waiter.event.set()
+
+    def _admit(self, request_class: str, preempted: bool = False) -> None:
+        self.in_flight[request_class] += 1
+        self.stats[request_class]["admitted"] += 1
+        if preempted:
+            self.stats[request_class]["preempted"] += 1
+        if request_class == INTERACTIVE:
+            self._last_interactive = time.monotonic()
+        if self.limiter:
+            self.limiter.begin()
+
+    def acquire(self, request_class: Optional[str] = None) -> float:
+        """
+        Wait until a request of request_class is admitted.
+
+        Returns:
+            Seconds spent waiting
+        """
+        request_class = request_class or current_priority()
+        if request_class == INTERACTIVE:
+            self.beacon.touch()
+
+        waiter = _Waiter(request_class)
+        with self._lock:
+            self._queues[request_class].append(waiter)
+            self._dispatch()
+        waiter.event.wait()
+        return time.monotonic() - waiter.enqueued
+
+    def release(self, request_class: str, latency: float, overloaded: bool = False, reason: str = "error") -> None:
+        """Free the slot of a finished request and admit the next waiters"""
+        if self.limiter:
+            self.limiter.release(latency, overloaded, reason)
+        with self._lock:
+            self.in_flight[request_class] -= 1
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, request_class: Optional[str] = None) -> Iterator[SlotOutcome]:
+        """
+        Hold a slot for one request (class from priority() by default).
+        Set overloaded/reason on the yielded outcome for the limiter.
+        """
+        request_class = request_class or current_priority()
+        outcome = SlotOutcome()
+        outcome.waited = self.acquire(request_class)
+        start = time.monotonic()
+        try:
+            yield outcome
+        except Exception as e:
+            if is_overload_error(e):
+                outcome.overloaded, outcome.reason = True, type(e).__name__
+            raise
+        finally:
+            self.release(request_class, time.monotonic() - start, outcome.overloaded, outcome.reason)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Per class: in flight, queued, admitted, preempted and queue wait p50/p95 (ms)"""
+        with self._lock:
+            classes = {}
+            for request_class in CLASSES:
+                waits = sorted(self._waits[request_class])
+                classes[request_class] = {
+                    "in_flight": self.in_flight[request_class],
+                    "queued": len(self._queues[request_class]),
+                    **self.stats[request_class],
+                    "wait_p50_ms": round(waits[len(waits) // 2] * 1000, 1) if waits else None,
+                    "wait_p95_ms": round(waits[int(len(waits) * 0.95)] * 1000, 1) if waits else None,
+                }
+            return {"limit": self._limit(), "classes": classes}
@@ -0,0 +1,261 @@
+"""
+Foreplay API - Sharded Date-Range Scans
+Description: Splits a start_date/end_date range into windows and scans them in
+parallel, subdividing dense windows adaptively instead of following one long
+offset chain. A window that can no longer be split and still reaches the page
+cap is logged and listed in ShardedAdScanner.capped.
+"""
+
+import contextvars
+import logging
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Optional, Dict, Any, List, Callable, Union
+
+from config import config
+
+
+logger = logging.getLogger(__name__)
+
+DateLike = Union[str, date, datetime]
+
+
+def parse_date(value: DateLike) -> date:
+    """Convert a YYYY-MM-DD string, date or datetime into a date"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(value[:10], "%Y-%m-%d").date()
+
+
+def ad_key(ad: Dict[str, Any]) -> Optional[str]:
+    """Return the identifier used to deduplicate an ad across pages and windows"""
+    key = ad.get('id') or ad.get('ad_id')
+    return str(key) if key is not None else None
+
+
+@dataclass(frozen=True)
+class DateWindow:
+    """
+    A closed [start, end] date range scanned as one shard.
+
+    Neighbouring windows share their boundary day so that ads are never lost
+    whether the API treats end_date as inclusive or exclusive; the overlap is
+    removed by the id-based deduplication when results are merged.
+    """
+
+    start: date
+    end: date
+
+    @property
+    def days(self) -> int:
+        return (self.end - self.start).days
+
+    def params(self) -> Dict[str, str]:
+        return {
+            "start_date": self.start.isoformat(),
+            "end_date": self.end.isoformat()
+        }
+
+    def can_split(self, min_days: int) -> bool:
+        return self.days >= 2 * min_days
+
+    def split(self) -> List["DateWindow"]:
+        """Split the window into two halves sharing the middle day"""
+        middle = self.start + timedelta(days=self.days // 2)
+        return [DateWindow(self.start, middle), DateWindow(middle, self.end)]
+
+
+def split_date_range(start_date: DateLike, end_date: DateLike, window_days: int) -> List[DateWindow]:
+    """
+    Split a date range into consecutive windows of at most window_days.
+
+    Args:
+        start_date: First day of the range
+        end_date: Last day of the range
+        window_days: Width of each window in days
+
+    Returns:
+        List of windows ordered from oldest to newest
+    """
+    start, end = parse_date(start_date), parse_date(end_date)
+    if end < start:
+        raise ValueError(f"end_date {end} is before start_date {start}")
+    if window_days < 1:
+        raise ValueError("window_days must be at least 1")
+
+    windows = []
+    cursor = start
+    while True:
+        window_end = min(cursor + timedelta(days=window_days), end)
+        windows.append(DateWindow(cursor, window_end))
+        if window_end >= end:
+            return windows
+        cursor = window_end
+
+
+@dataclass
+class _ShardResult:
+    window: DateWindow
+    ads: List[Dict[str, Any]]
+    requests: int
+    children: List[DateWindow]
+    capped: bool = False
+
+
+class ShardedAdScanner:
+    """
+    Parallel deep scanner for offset-paginated ad endpoints.
+
+    Each date window is paged serially with offset, but windows run
+    concurrently. When the first page of a window comes back full and the
+    window is still wide enough, it is split in two and both halves are queued,
+    so dense periods fan out to more workers instead of deeper offset chains.
+
+    Example:
+        scanner = ShardedAdScanner(client.discover_ads, max_workers=8)
+        ads = scanner.scan("2024-01-01", "2024-06-30", query="protein")
+    """
+
+    def __init__(
+        self,
+        fetch_page: Callable[..., Dict[str, Any]],
+        max_workers: Optional[int] = None,
+        window_days: Optional[int] = None,
+        min_window_days: Optional[int] = None,
+        page_limit: Optional[int] = None,
+        max_pages_per_window: Optional[int] = None
+    ):
+        """
+        Initialize the scanner.
+
+        Args:
+            fetch_page: Client method accepting start_date, end_date, offset,
+                limit and order keyword arguments (e.g. client.discover_ads)
+            max_workers: Number of windows scanned concurrently
+            window_days: Initial window width in days
+            min_window_days: Windows are never split below this width
+            page_limit: Results per page requested from the API
+            max_pages_per_window: Safety cap on the offset chain of one window
+        """
+        self.fetch_page = fetch_page
+        self.max_workers = max_workers or config.SCAN_MAX_WORKERS
+        self.window_days = window_days or config.SCAN_WINDOW_DAYS
+        self.min_window_days = min_window_days or config.SCAN_MIN_WINDOW_DAYS
+        self.page_limit = page_limit or config.SCAN_PAGE_LIMIT
+        self.max_pages_per_window = max_pages_per_window or config.SCAN_MAX_PAGES_PER_WINDOW
+        self.stats: Dict[str, int] = {}
+        self.capped: List[DateWindow] = []
+
+    def _scan_window(self, window: DateWindow, order: str, filters: Dict[str, Any]) -> _ShardResult:
+        ads: List[Dict[str, Any]] = []
+        requests_made = 0
+
+        for page in range(self.max_pages_per_window):
+            response = self.fetch_page(
+                **filters,
+                **window.params(),
+                offset=page * self.page_limit,
+                limit=self.page_limit,
+                order=order
+            )
+            requests_made += 1
+            data = response.get('data') or []
+            ads.extend(data)
+
+            if len(data) < self.page_limit:
+                break
+
+            # Dense window: fan out instead of walking a long offset chain.
+            # The ads already fetched stay in the result; duplicates from the
+            # children are dropped at merge time.
+            if page == 0 and window.can_split(self.min_window_days):
+                return _ShardResult(window, ads, requests_made, window.split())
+        else:
+            # Every page came back full: the window goes on past the cap
+            return _ShardResult(window, ads, requests_made, [], capped=True)
+
+        return _ShardResult(window, ads, requests_made, [])
+
+    def scan(
+        self,
+        start_date: DateLike,
+        end_date: DateLike,
+        order: str = "newest",
+        **filters: Any
+    ) -> List[Dict[str, Any]]:
+        """
+        Scan a date range and return the merged, deduplicated ads.
+
+        Windows are merged newest-first, except for order="oldest" which is
+        merged oldest-first. Within a window the API order is preserved, so
+        "newest" and "oldest" come back globally ordered; other orders are
+        ordered per window.
+
+        Args:
+            start_date: First day of the range (YYYY-MM-DD)
+            end_date: Last day of the range (YYYY-MM-DD)
+            order: Sort order passed to the API and used for merging
+            **filters: Extra endpoint filters (query, live, niches, ...)
+
+        Returns:
+            List of unique ads (windows cut at the page cap are listed in
+            self.capped)
+        """
+        windows = split_date_range(start_date, end_date, self.window_days)
+        results: List[_ShardResult] = []
+        self.stats = {"windows": 0, "splits": 0, "requests": 0, "duplicates": 0, "capped": 0}
+        self.capped = []
+
+        # Workers run in copies of this context (priority class, active profiler)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = {
+                executor.submit(contextvars.copy_context().run, self._scan_window, w, order, filters)
+                for w in windows
+            }
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    result = future.result()
+                    results.append(result)
+                    self.stats["windows"] += 1
+                    self.stats["requests"] += result.requests
+                    if result.capped:
+                        self.stats["capped"] += 1
+                        self.capped.append(result.window)
+                        logger.warning(
+                            "Window %s..%s has more than %d ads and cannot be split further: results stop at the page cap",
+                            result.window.start, result.window.end, self.max_pages_per_window * self.page_limit
+                        )
+                    if result.children:
+                        self.stats["splits"] += 1
+                        for child in result.children:
+                            pending.add(executor.submit(
+                                contextvars.copy_context().run, self._scan_window, child, order, filters
+                            ))
+
+        return self._merge(results, order)
+
+    def _merge(self, results: List[_ShardResult], order: str) -> List[Dict[str, Any]]:
+        # Narrower windows first at equal boundaries, so a split parent's
+        # partial first page never shadows the ordering of its children
+        reverse = order != "oldest"
+        if reverse:
+            results.sort(key=lambda r: (r.window.end, -r.window.days), reverse=True)
+        else:
+            results.sort(key=lambda r: (r.window.start, r.window.days))
+
+        merged: List[Dict[str, Any]] = []
+        seen = set()
+        for result in results:
+            for ad in result.ads:
+                key = ad_key(ad)
+                if key is not None:
+                    if key in seen:
+                        self.stats["duplicates"] += 1
+                        continue
+                    seen.add(key)
+                merged.append(ad)
+        return merged
@@ -0,0 +1,384 @@
+"""
+Foreplay API - Spill-to-Disk Result Store
+Description: Keeps extracted ads on disk instead of in session memory. A session
+holds only a small ResultHandle; ads are stored as individually compressed JSON
+records with an offset index, and read back lazily through a memory map for
+display and export. Transcripts shared by ad variants are stored once, as
+content-addressed blobs. Per-session quotas and age-based cleanup bound disk
+usage. Every result set carries a content version (a digest of its records),
+so identical extractions can share derived files such as exports.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import threading
+import time
+import uuid
+import zlib
+from array import array
+from typing import Optional, Dict, Any, List, Iterable, Iterator, Union
+
+from config import config
+from foreplay_dedup import TRANSCRIPT_FIELDS, TRANSCRIPT_REF, transcript_payload, transcript_id
+
+
+DATA_FILE = "ads.bin"
+INDEX_FILE = "ads.idx"
+TRANSCRIPTS_FILE = "transcripts.bin"
+TRANSCRIPTS_INDEX_FILE = "transcripts.idx"
+META_FILE = "meta.json"
+
+
+class StoreQuotaExceeded(Exception):
+    """Raised when a session's results exceed the configured quota"""
+
+
+def summarize(ad: Dict[str, Any], summary: Dict[str, Any]) -> None:
+    """Accumulate the figures the GUI shows without re-reading every ad"""
+    summary["with_transcript"] += 1 if ad.get('full_transcription') else 0
+    summary["total_duration"] += ad.get('video_duration', 0) or 0
+    summary["total_segments"] += len(ad.get('timestamped_transcription') or [])
+
+
+class ResultHandle:
+    """
+    Lightweight, read-only view of one stored result set.
+
+    Behaves like a sequence of ad dicts (len, iteration, indexing, slicing),
+    decoding each record from the memory-mapped file only when it is accessed.
+    """
+
+    def __init__(self, directory: str, count: int, meta: Dict[str, Any]):
+        self.directory = directory
+        self.count = count
+        self.meta = meta
+
+    @classmethod
+    def open(cls, directory: str) -> "ResultHandle":
+        """Handle of a result set already on disk (e.g. in another process)"""
+        with open(os.path.join(directory, META_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        return cls(directory, meta["count"], meta)
+
+    @property
+    def summary(self) -> Dict[str, Any]:
+        return self.meta.get("summary", {})
+
+    @property
+    def size_bytes(self) -> int:
+        return self.meta.get("bytes", 0)
+
+    @property
+    def version(self) -> str:
+        """Content digest of the stored ads (same ads, same order: same version)"""
+        return self.meta.get("version") or os.path.basename(self.directory)
+
+    def exists(self) -> bool:
+        return os.path.exists(os.path.join(self.directory, DATA_FILE))
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __bool__(self) -> bool:
+        return self.count > 0
+
+    def _offsets(self) -> array:
+        offsets = array("Q")
+        with open(os.path.join(self.directory, INDEX_FILE), "rb") as f:
+            offsets.frombytes(f.read())
+        return offsets
+
+    def _transcript_index(self) -> Dict[str, List[int]]:
+        try:
+            with open(os.path.join(self.directory, TRANSCRIPTS_INDEX_FILE), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _read(self, indices: Iterable[int]) -> Iterator[Dict[str, Any]]:
+        if self.count == 0:
+            return
+        offsets = self._offsets()
+        transcript_index = self._transcript_index()
+        # Ads sharing a transcript get the same decoded payload objects
+        transcripts: Dict[str, Dict[str, Any]] = {}
+
+        with open(os.path.join(self.directory, DATA_FILE), "rb") as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data, \
+                _open_blobs(os.path.join(self.directory, TRANSCRIPTS_FILE)) as blobs:
+            for i in indices:
+                ad = json.loads(zlib.decompress(data[offsets[i]:offsets[i + 1]]))
+                tid = ad.pop(TRANSCRIPT_REF, None)
+                if tid is not None:
+                    payload = transcripts.get(tid)
+                    if payload is None:
+                        start, end = transcript_index[tid]
+                        payload = transcripts[tid] = json.loads(zlib.decompress(blobs[start:end]))
+                    for field in TRANSCRIPT_FIELDS:
+                        if field in ad:
+                            ad[field] = payload[field]
+                yield ad
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return self._read(range(self.count))
+
+    def __getitem__(self, item: Union[int, slice]) -> Union[Dict[str, Any], List[Dict[str, Any]]]:
+        if isinstance(item, slice):
+            return list(self._read(range(*item.indices(self.count))))
+        if item < 0:
+            item += self.count
+        if not 0 <= item < self.count:
+            raise IndexError("result index out of range")
+        return next(self._read([item]))
+
+    def __repr__(self) -> str:
+        return f"ResultHandle({self.directory!r}, count={self.count})"
+
+
+class _open_blobs:
+    """Memory-map a blob file, tolerating a missing or empty one"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+        self._map = None
+
+    def __enter__(self):
+        if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+            self._file = open(self.path, "rb")
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            return self._map
+        return b""
+
+    def __exit__(self, *exc):
+        if self._map is not None:
+            self._map.close()
+            self._file.close()
+        return False
+
+
+class ResultWriter:
+    """Appends ads to a new result directory; use via ResultStore.writer()"""
+
+    def __init__(self, store: "ResultStore", session_id: str, directory: str, meta: Dict[str, Any]):
+        self.store = store
+        self.session_id = session_id
+        self.directory = directory
+        self.meta = meta
+        self.summary = {"with_transcript": 0, "total_duration": 0.0, "total_segments": 0}
+        self.offsets = array("Q", [0])
+        self.transcripts: Dict[str, List[int]] = {}
+        self.transcript_refs = 0
+        self._data = open(os.path.join(directory, DATA_FILE), "wb")
+        self._blobs = open(os.path.join(directory, TRANSCRIPTS_FILE), "wb")
+        self._blob_bytes = 0
+        self._digest = hashlib.sha1()
+
+    def _check_quota(self, extra: int) -> None:
+        if self.offsets[-1] + self._blob_bytes + extra > self.store.session_quota_bytes:
+            raise StoreQuotaExceeded(
+                f"Results for this session exceed {self.store.session_quota_bytes / 1024 / 1024:.0f} MB"
+            )
+
+    def _store_transcript(self, payload: Dict[str, Any]) -> str:
+        tid = transcript_id(payload)
+        self.transcript_refs += 1
+        if tid not in self.transcripts:
+            blob = zlib.compress(json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), 6)
+            self._check_quota(len(blob))
+            self._blobs.write(blob)
+            self.transcripts[tid] = [self._blob_bytes, self._blob_bytes + len(blob)]
+            self._blob_bytes += len(blob)
+        return tid
+
+    def append(self, ad: Dict[str, Any]) -> None:
+        summarize(ad, self.summary)
+
+        payload = transcript_payload(ad)
+        if payload is not None:
+            # Keep the keys (and their order) but point to the shared blob
+            record_ad = {key: (None if key in TRANSCRIPT_FIELDS else value) for key, value in ad.items()}
+            record_ad[TRANSCRIPT_REF] = self._store_transcript(payload)
+        else:
+            record_ad = ad
+
+        encoded = json.dumps(record_ad, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        # Transcripts are referenced by content hash, so the records cover them too
+        self._digest.update(encoded)
+        record = zlib.compress(encoded, 6)
+        self._check_quota(len(record))
+        self._data.write(record)
+        self.offsets.append(self.offsets[-1] + len(record))
+
+    def extend(self, ads: Iterable[Dict[str, Any]]) -> None:
+        for ad in ads:
+            self.append(ad)
+
+    def close(self) -> ResultHandle:
+        self._data.close()
+        self._blobs.close()
+        with open(os.path.join(self.directory, INDEX_FILE), "wb") as f:
+            f.write(self.offsets.tobytes())
+        with open(os.path.join(self.directory, TRANSCRIPTS_INDEX_FILE), "w", encoding="utf-8") as f:
+            json.dump(self.transcripts, f)
+
+        self.summary["total_duration"] = round(self.summary["total_duration"], 3)
+        meta = {
+            **self.meta,
+            "count": len(self.offsets) - 1,
+            "bytes": self.offsets[-1] + self._blob_bytes,
+            "created_at": time.time(),
+            "version": self._digest.hexdigest()[:16],
+            "summary": self.summary,
+            "transcripts": {"unique": len(self.transcripts), "references": self.transcript_refs},
+        }
+        with open(os.path.join(self.directory, META_FILE), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        return ResultHandle(self.directory, meta["count"], meta)
+
+    def abort(self) -> None:
+        self._data.close()
+        self._blobs.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def __enter__(self) -> "ResultWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is not None:
+            self.abort()
+
+
+class ResultStore:
+    """
+    Disk-backed store of extraction results, one directory per session.
+
+    Example:
+        store = ResultStore()
+        handle = store.write(session_id, video_ads, board_id=board_id)
+        for ad in handle:  # decoded lazily from disk
+            ...
+    """
+
+    def __init__(
+        self,
+        root: Optional[str] = None,
+        session_quota_mb: Optional[float] = None,
+        max_age_hours: Optional[float] = None
+    ):
+        """
+        Initialize the store.
+
+        Args:
+            root: Directory holding the stored results
+            session_quota_mb: Maximum compressed size of a session's results
+            max_age_hours: Results older than this are removed by cleanup()
+        """
+        self.root = root or config.RESULT_STORE_DIR
+        self.session_quota_bytes = int((session_quota_mb or config.RESULT_SESSION_QUOTA_MB) * 1024 * 1024)
+        self.max_age_seconds = (max_age_hours or config.RESULT_MAX_AGE_HOURS) * 3600
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def _session_dir(self, session_id: str) -> str:
+        safe = "".join(c for c in session_id if c.isalnum() or c in "-_") or "default"
+        return os.path.join(self.root, safe)
+
+    def writer(self, session_id: str, **meta: Any) -> ResultWriter:
+        """
+        Open a writer for a new result set of session_id.
+
+        Previous results of the session are replaced when the writer closes
+        (they stay readable until then).
+        """
+        session_dir = self._session_dir(session_id)
+        directory = os.path.join(session_dir, uuid.uuid4().hex)
+        # Under the lock: cleanup() must not remove the session directory in between
+        with self._lock:
+            os.makedirs(directory)
+        return ResultWriter(self, session_id, directory, meta)
+
+    def write(self, session_id: str, ads: Iterable[Dict[str, Any]], **meta: Any) -> ResultHandle:
+        """
+        Store ads for a session, replacing the session's previous results.
+
+        Args:
+            session_id: Owner of the results (e.g. the Streamlit session id)
+            ads: Ads to store
+            **meta: Extra metadata kept with the results (board_id, ...)
+
+        Returns:
+            Handle reading the stored ads lazily
+
+        Raises:
+            StoreQuotaExceeded: If the compressed ads exceed the session quota
+        """
+        self.cleanup()
+        with self.writer(session_id, **meta) as writer:
+            writer.extend(ads)
+            handle = writer.close()
+        self.release(session_id, keep=handle.directory)
+        return handle
+
+    def release(self, session_id: str, keep: Optional[str] = None) -> None:
+        """Delete a session's results (except the directory in keep)"""
+        session_dir = self._session_dir(session_id)
+        with self._lock:
+            try:
+                names = os.listdir(session_dir)
+            except FileNotFoundError:
+                return
+            for name in names:
+                path = os.path.join(session_dir, name)
+                if keep is None or os.path.abspath(path) != os.path.abspath(keep):
+                    shutil.rmtree(path, ignore_errors=True)
+            if keep is None:
+                shutil.rmtree(session_dir, ignore_errors=True)
+
+    def cleanup(self) -> int:
+        """
+        Remove result sets older than max_age_hours (abandoned sessions).
+
+        Returns:
+            Number of result sets removed
+        """
+        removed = 0
+        cutoff = time.time() - self.max_age_seconds
+        with self._lock:
+            for session in os.listdir(self.root):
+                session_dir = os.path.join(self.root, session)
+                if not os.path.isdir(session_dir):
+                    continue
+                # Other processes share the root: a session may vanish at any point
+                try:
+                    names = os.listdir(session_dir)
+                except FileNotFoundError:
+                    continue
+                for name in names:
+                    path = os.path.join(session_dir, name)
+                    try:
+                        if os.path.getmtime(path) < cutoff:
+                            shutil.rmtree(path, ignore_errors=True)
+                            removed += 1
+                    except FileNotFoundError:
+                        continue
+                try:
+                    if not os.listdir(session_dir):
+                        shutil.rmtree(session_dir, ignore_errors=True)
+                except FileNotFoundError:
+                    continue
+        return removed
+
+    def disk_usage(self) -> int:
+        """Total bytes stored across all sessions"""
+        total = 0
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(directory, name))
+                except FileNotFoundError:
+                    continue
+        return total
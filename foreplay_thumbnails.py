@@ -0,0 +1,347 @@
+"""
+Foreplay API - Thumbnail Cache
+Description: Local proxy cache for ad thumbnails. The results tab used to
+hand every remote thumbnail URL to the browser, so each rerun downloaded
+full-size images from the CDN once per ad and per user.
+
+Each thumbnail is fetched once, resized to config.THUMBNAIL_WIDTH, recompressed
+as JPEG and stored under config.CACHE_DIR/thumbnails; the GUI shows the local
+file, which Streamlit serves from the app itself. Without Pillow the image is
+stored as downloaded, with the extension of its real format. The directory is
+kept under config.THUMBNAIL_CACHE_MB by evicting the least recently shown
+thumbnails.
+
+Fetches run in parallel and are deduplicated: concurrent requests for the
+same URL share one download. cached_many() never waits: it returns the
+thumbnails already on disk and fetches the others in the background, so a
+rerun shows the remote URL until the local copy exists. A failed URL leaves
+a ".failed" marker and is not fetched again for config.THUMBNAIL_RETRY_SECONDS,
+across restarts. config.THUMBNAIL_ORIGIN rewrites the scheme and
+host of every URL, so a local file server can stand in for the CDN in tests
+(see benchmarks/cdn_server.py).
+"""
+
+import hashlib
+import io
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Optional, Dict, Any, Iterable, List
+from urllib.parse import urlsplit, urlunsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import config
+
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:  # thumbnails are cached as downloaded
+    PIL_AVAILABLE = False
+
+
+FAILED_SUFFIX = ".failed"
+
+# Leading bytes of the image formats served by the CDN
+SIGNATURES = (
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"GIF87a", ".gif"),
+    (b"GIF89a", ".gif"),
+)
+EXTENSIONS = {".jpg", ".png", ".gif", ".webp"}
+
+
+def image_extension(data: bytes) -> str:
+    """File extension of image bytes (".jpg" when the format is not recognized)"""
+    for signature, extension in SIGNATURES:
+        if data.startswith(signature):
+            return extension
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return ".webp"
+    return ".jpg"
+
+
+def resize_image(data: bytes, width: int, quality: int) -> bytes:
+    """
+    Resize image bytes to width (never upscaling) and recompress as JPEG.
+
+    Returns the original bytes when Pillow is missing or cannot decode them.
+    """
+    if not PIL_AVAILABLE:
+        return data
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            # JPEGs are decoded directly at a reduced scale (much cheaper than
+            # decoding full size and shrinking afterwards)
+            image.draft("RGB", (width, max(1, image.height * width // max(1, image.width))))
+            image.load()
+            if image.width > width:
+                height = max(1, round(image.height * width / image.width))
+                image = image.resize((width, height), Image.BICUBIC)
+            if image.mode != "RGB":
+                image = image.convert("RGB")
+            buffer = io.BytesIO()
+            image.save(buffer, format="JPEG", quality=quality)
+            return buffer.getvalue()
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return data
+
+
+class ThumbnailCache:
+    """
+    Fetch-once, resized, LRU-bounded thumbnail cache on local disk.
+
+    Example:
+        thumbnails = ThumbnailCache()
+        paths = thumbnails.cached_many(ad["thumbnail"] for ad in ads)  # never waits
+        st.image(paths.get(url) or url, width=200)                       # remote URL until cached
+    """
+
+    def __init__(
+        self,
+        cache_dir: Optional[str] = None,
+        max_mb: Optional[float] = None,
+        width: Optional[int] = None,
+        quality: Optional[int] = None,
+        max_workers: Optional[int] = None,
+        origin: Optional[str] = None,
+        session: Optional[requests.Session] = None
+    ):
+        """
+        Initialize the cache.
+
+        Args:
+            cache_dir: Directory of the resized thumbnails
+                (default config.CACHE_DIR/thumbnails)
+            max_mb: Disk budget; least recently used files are evicted above it
+            width: Width in pixels of the stored thumbnails
+            quality: JPEG quality of the stored thumbnails
+            max_workers: Parallel downloads
+            origin: Scheme and host replacing those of every URL
+                (e.g. http://127.0.0.1:8000 for a local file server)
+            session: HTTP session for the downloads (default: a new one with
+                a pool of max_workers connections)
+        """
+        self.directory = cache_dir or os.path.join(config.CACHE_DIR, "thumbnails")
+        self.max_bytes = int((max_mb if max_mb is not None else config.THUMBNAIL_CACHE_MB) * 1024 * 1024)
+        self.width = width or config.THUMBNAIL_WIDTH
+        self.quality = quality or config.THUMBNAIL_QUALITY
+        self.max_workers = max_workers or config.THUMBNAIL_MAX_WORKERS
+        self.origin = origin if origin is not None else config.THUMBNAIL_ORIGIN
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=config.HTTP_POOL_CONNECTIONS, pool_maxsize=self.max_workers)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+        self.session = session
+        os.makedirs(self.directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="thumbnail")
+        self._in_flight: Dict[str, Future] = {}
+        # digest -> time of the last failed download (also a marker file)
+        self._failed: Dict[str, float] = {}
+        # digest -> [path, size, last used], oldest first after sorting
+        self._index: Dict[str, List[Any]] = {}
+        self._total = 0
+        self.stats: Dict[str, int] = {
+            "hits": 0, "downloads": 0, "deduplicated": 0, "failures": 0,
+            "evicted": 0, "downloaded_bytes": 0, "stored_bytes": 0
+        }
+        self._load_index()
+
+    def _load_index(self) -> None:
+        now = time.time()
+        for name in os.listdir(self.directory):
+            digest, extension = os.path.splitext(name)
+            path = os.path.join(self.directory, name)
+            try:
+                info = os.stat(path)
+            except OSError:
+                continue
+            if extension == FAILED_SUFFIX:
+                if now - info.st_mtime < config.THUMBNAIL_RETRY_SECONDS:
+                    self._failed[digest] = info.st_mtime
+                else:
+                    self._remove(path)
+            elif extension in EXTENSIONS:
+                self._index[digest] = [path, info.st_size, info.st_mtime]
+                self._total += info.st_size
+        self._evict()
+
+    def _digest(self, url: str) -> str:
+        return hashlib.sha1(f"{url}|{self.width}|{self.quality}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _source_url(self, url: str) -> str:
+        if not self.origin:
+            return url
+        origin = urlsplit(self.origin)
+        parts = urlsplit(url)
+        return urlunsplit((origin.scheme, origin.netloc, parts.path, parts.query, ""))
+
+    def _touch(self, digest: str) -> None:
+        # Last use is kept in the file's mtime, so LRU order survives restarts
+        now = time.time()
+        with self._lock:
+            entry = self._index.get(digest)
+            if entry is None:
+                return
+            path = entry[0]
+            stale = now - entry[2] > 60
+            entry[2] = now
+        if stale:
+            try:
+                os.utime(path, (now, now))
+            except OSError:
+                pass
+
+    def _evict(self) -> None:
+        with self._lock:
+            if self._total <= self.max_bytes:
+                return
+            victims = []
+            for digest, (path, size, _) in sorted(self._index.items(), key=lambda item: item[1][2]):
+                if self._total <= self.max_bytes * 0.9:
+                    break
+                victims.append(path)
+                self._total -= size
+                del self._index[digest]
+            self.stats["evicted"] += len(victims)
+        for path in victims:
+            self._remove(path)
+
+    def _download(self, url: str, digest: str) -> Optional[str]:
+        try:
+            limit = int(config.THUMBNAIL_MAX_DOWNLOAD_MB * 1024 * 1024)
+            with self.session.get(self._source_url(url), timeout=config.THUMBNAIL_TIMEOUT, stream=True) as response:
+                response.raise_for_status()
+                chunks, size = [], 0
+                for chunk in response.iter_content(64 * 1024):
+                    size += len(chunk)
+                    if size > limit:
+                        raise ValueError(f"Thumbnail larger than {config.THUMBNAIL_MAX_DOWNLOAD_MB} MB")
+                    chunks.append(chunk)
+            data = resize_image(b"".join(chunks), self.width, self.quality)
+            path = os.path.join(self.directory, digest + image_extension(data))
+
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except (requests.RequestException, OSError, ValueError):
+            now = time.time()
+            with self._lock:
+                self.stats["failures"] += 1
+                self._failed[digest] = now
+            try:
+                with open(os.path.join(self.directory, digest + FAILED_SUFFIX), "w", encoding="utf-8") as f:
+                    f.write(url)
+            except OSError:
+                pass
+            return None
+
+        with self._lock:
+            previous = self._index.get(digest)
+            if previous:
+                self._total -= previous[1]
+            self._index[digest] = [path, len(data), time.time()]
+            had_failed = self._failed.pop(digest, None) is not None
+            self._total += len(data)
+            self.stats["downloads"] += 1
+            self.stats["downloaded_bytes"] += size
+            self.stats["stored_bytes"] += len(data)
+        if had_failed:
+            self._remove(os.path.join(self.directory, digest + FAILED_SUFFIX))
+        self._evict()
+        return path
+
+    def _finish(self, url: str) -> None:
+        with self._lock:
+            self._in_flight.pop(url, None)
+
+    def submit(self, url: str) -> Future:
+        """
+        Start fetching url unless it is cached or already being fetched.
+
+        Returns:
+            Future resolving to the local path, or None if the download failed
+        """
+        digest = self._digest(url)
+        with self._lock:
+            entry = self._index.get(digest)
+            if entry is not None:
+                self.stats["hits"] += 1
+                done: Future = Future()
+                done.set_result(entry[0])
+                hit = True
+            elif url in self._in_flight:
+                self.stats["deduplicated"] += 1
+                return self._in_flight[url]
+            elif time.time() - self._failed.get(digest, float("-inf")) < config.THUMBNAIL_RETRY_SECONDS:
+                # Broken URLs are not retried on every rerun
+                done = Future()
+                done.set_result(None)
+                return done
+            else:
+                hit = False
+                future = self._executor.submit(self._download, url, digest)
+                self._in_flight[url] = future
+        if hit:
+            self._touch(digest)
+            return done
+        future.add_done_callback(lambda _: self._finish(url))
+        return future
+
+    def get(self, url: str) -> Optional[str]:
+        """Local path of the resized thumbnail of url (fetched if needed), or None"""
+        if not url:
+            return None
+        return self.submit(url).result()
+
+    def fetch_many(self, urls: Iterable[str]) -> Dict[str, Optional[str]]:
+        """
+        Fetch several thumbnails in parallel.
+
+        Returns:
+            Dictionary url -> local path (None for failed downloads)
+        """
+        futures = {url: self.submit(url) for url in dict.fromkeys(u for u in urls if u)}
+        return {url: future.result() for url, future in futures.items()}
+
+    def cached_many(self, urls: Iterable[str]) -> Dict[str, Optional[str]]:
+        """
+        Thumbnails already on disk, without waiting; the others are fetched in the background.
+
+        Returns:
+            Dictionary url -> local path (None while downloading or after a failure)
+        """
+        paths = {}
+        for url in dict.fromkeys(u for u in urls if u):
+            future = self.submit(url)
+            paths[url] = future.result() if future.done() else None
+        return paths
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Counters, files and disk usage (MB) of the cache"""
+        with self._lock:
+            return {
+                **self.stats,
+                "files": len(self._index),
+                "disk_mb": round(self._total / 1024 / 1024, 2),
+                "max_mb": round(self.max_bytes / 1024 / 1024, 2),
+            }
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
@@ -0,0 +1,378 @@
+"""
+Foreplay API - Pluggable Transports
+Description: Transports used by ForeplayAPIClient._make_request to send HTTP
+requests. Besides the live HTTP transport, a record mode captures responses
+into a compressed cassette and a replay mode serves them back offline, which
+makes profiling runs repeatable and free of credits.
+"""
+
+import atexit
+import gzip
+import json
+import os
+import tempfile
+import threading
+import time
+from http import HTTPStatus
+from typing import Optional, Dict, Any, List, Union
+from urllib.parse import urlencode, urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.util import make_headers
+
+from config import config
+from foreplay_locks import FileLock
+
+
+CASSETTE_VERSION = 1
+
+# Recorded bodies are stored decoded, so transfer-level headers are dropped
+SKIPPED_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection", "keep-alive"}
+
+
+class CassetteMiss(LookupError):
+    """Raised in replay mode when a request was never recorded"""
+
+
+def request_key(method: str, url: str, params: Optional[Dict[str, Any]] = None, json_body: Any = None) -> str:
+    """
+    Build the fingerprint identifying a request inside a cassette.
+
+    Only the path is used (not scheme/host), so a cassette recorded against
+    the real API can be replayed behind any base_url.
+    """
+    path = urlsplit(url).path.lstrip("/")
+    query = urlencode(sorted((k, str(v)) for k, v in (params or {}).items() if v is not None))
+    key = f"{method.upper()} {path}"
+    if query:
+        key += f"?{query}"
+    if json_body is not None:
+        key += " " + json.dumps(json_body, sort_keys=True, separators=(",", ":"))
+    return key
+
+
+def build_response(url: str, status: int, headers: Dict[str, str], body: bytes) -> requests.Response:
+    """Build a requests.Response from recorded parts"""
+    response = requests.Response()
+    response.status_code = status
+    response.headers = CaseInsensitiveDict(headers)
+    response._content = body
+    response.encoding = "utf-8"
+    response.url = url
+    try:
+        response.reason = HTTPStatus(status).phrase
+    except ValueError:
+        response.reason = ""
+    return response
+
+
+def accepted_encodings() -> str:
+    """Accept-Encoding value covering every codec urllib3 can decode here (br needs brotli)"""
+    return make_headers(accept_encoding=True)["accept-encoding"]
+
+
+def default_pool_size() -> int:
+    """Connection pool size matching the largest configured fan-out (plus interactive preemption)"""
+    return max(
+        config.MAX_CONCURRENCY,
+        config.SCAN_MAX_WORKERS,
+        config.ANALYTICS_MAX_WORKERS,
+        config.BRAND_BATCH_MAX_WORKERS,
+        config.ADAPTIVE_MAX_CONCURRENCY if config.ADAPTIVE_CONCURRENCY else 0
+    ) + config.SCHEDULER_PREEMPT_SLOTS
+
+
+class RateLimiter:
+    """
+    Token bucket shared by all threads of a client.
+
+    Allows bursts of up to burst requests, then spaces requests evenly at
+    rate per second.
+    """
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        self.rate = float(rate)
+        self.burst = burst or max(1, int(rate))
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1) -> float:
+        """
+        Take tokens (one request, or bytes for a bandwidth limit), sleeping
+        until they are available.
+
+        Returns:
+            Seconds spent waiting
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= tokens
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class HTTPTransport:
+    """
+    Live transport sending requests through a requests.Session.
+
+    The session gets an HTTPAdapter whose per-host pool is sized to the
+    configured concurrency, so parallel fetchers reuse kept-alive TLS
+    connections instead of opening and discarding extra ones, and it
+    advertises every response compression codec available (gzip, deflate,
+    and br when brotli is installed).
+    """
+
+    def __init__(self, session: requests.Session, pool_size: Optional[int] = None, timeout: Optional[float] = None):
+        self.session = session
+        self.pool_size = pool_size or default_pool_size()
+        self.timeout = timeout or config.REQUEST_TIMEOUT
+        self.adapter = HTTPAdapter(
+            pool_connections=config.HTTP_POOL_CONNECTIONS,
+            pool_maxsize=self.pool_size
+        )
+        session.mount("https://", self.adapter)
+        session.mount("http://", self.adapter)
+        session.headers["Accept-Encoding"] = accepted_encodings()
+        self._stats = {"responses": 0, "compressed_responses": 0, "decoded_bytes": 0}
+        self._stats_lock = threading.Lock()
+
+    def request(self, method: str, url: str, params: Optional[Dict[str, Any]] = None, json: Any = None) -> requests.Response:
+        response = self.session.request(method=method, url=url, params=params, json=json, timeout=self.timeout)
+        with self._stats_lock:
+            self._stats["responses"] += 1
+            if response.headers.get("Content-Encoding"):
+                self._stats["compressed_responses"] += 1
+            self._stats["decoded_bytes"] += len(response.content)
+        return response
+
+    def connection_stats(self) -> Dict[str, Any]:
+        """
+        Report connection reuse across the adapter's pools.
+
+        Returns:
+            Dictionary with requests sent, connections opened, the reuse
+            rate (share of requests served on an already-open connection)
+            and response compression counters
+        """
+        pools = self.adapter.poolmanager.pools
+        requests_sent = connections = 0
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is not None:
+                requests_sent += pool.num_requests
+                connections += pool.num_connections
+
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats.update({
+            "pool_size": self.pool_size,
+            "requests": requests_sent,
+            "connections": connections,
+            "reuse_rate": round(1 - connections / requests_sent, 4) if requests_sent else 0.0,
+            "accept_encoding": self.session.headers.get("Accept-Encoding"),
+        })
+        return stats
+
+    def close(self) -> None:
+        self.session.close()
+
+
+class Cassette:
+    """
+    Compressed store of recorded responses.
+
+    The file is a gzip-compressed JSON-lines stream: a header line followed by
+    one entry per response. Compressing the stream as a whole lets repeated
+    field names and similar transcripts share the dictionary, which keeps
+    cassettes of whole boards small. Identical requests recorded several times
+    are replayed in order, the last one repeating.
+
+    Several recorders (threads, CLI runs, GUI sessions) may write the same
+    cassette. save() merges the entries recorded since the last save into the
+    file currently on disk under a lock file, so no recorder overwrites
+    another's responses.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: Dict[str, List[Dict[str, Any]]] = {}
+        self._cursors: Dict[str, int] = {}
+        self._recorded: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            self.load()
+
+    def _read(self) -> Dict[str, List[Dict[str, Any]]]:
+        entries: Dict[str, List[Dict[str, Any]]] = {}
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            header = json.loads(f.readline() or "{}")
+            if header.get("version") != CASSETTE_VERSION:
+                raise ValueError(f"Unsupported cassette version in {self.path}: {header.get('version')}")
+            for line in f:
+                entry = json.loads(line)
+                entry["body"] = entry["body"].encode("utf-8")
+                entries.setdefault(entry["key"], []).append(entry)
+        return entries
+
+    def load(self) -> None:
+        entries = self._read()
+        with self._lock:
+            self.entries = entries
+            self._cursors = {}
+
+    def save(self) -> None:
+        """Merge the responses recorded since the last save into the file on disk, atomically"""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        with FileLock(self.path + ".lock"):
+            entries = self._read() if os.path.exists(self.path) else {}
+            with self._lock:
+                recorded, self._recorded = self._recorded, []
+            for entry in recorded:
+                entries.setdefault(entry["key"], []).append(entry)
+
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            os.close(fd)
+            try:
+                with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=6) as f:
+                    f.write(json.dumps({"version": CASSETTE_VERSION}) + "\n")
+                    for key_entries in entries.values():
+                        for entry in key_entries:
+                            f.write(json.dumps({**entry, "body": entry["body"].decode("utf-8")}, ensure_ascii=False) + "\n")
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                with self._lock:
+                    self._recorded[:0] = recorded
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+        with self._lock:
+            self.entries = entries
+
+    def add(self, key: str, status: int, headers: Dict[str, str], body: bytes, elapsed: float) -> None:
+        entry = {"key": key, "status": status, "headers": headers, "body": body, "elapsed": round(elapsed, 4)}
+        with self._lock:
+            self.entries.setdefault(key, []).append(entry)
+            self._recorded.append(entry)
+
+    def next(self, key: str) -> Dict[str, Any]:
+        with self._lock:
+            entries = self.entries.get(key)
+            if not entries:
+                raise CassetteMiss(f"No recorded response for {key}")
+            index = self._cursors.get(key, 0)
+            self._cursors[key] = index + 1
+            return entries[min(index, len(entries) - 1)]
+
+    def __len__(self) -> int:
+        return sum(len(entries) for entries in self.entries.values())
+
+
+class RecordingTransport:
+    """
+    Transport that forwards requests to an inner transport and records every
+    response into a cassette. The cassette is saved on close(), or at exit for
+    a transport never closed (close() drops the exit hook again).
+    """
+
+    def __init__(self, inner, cassette: Union[Cassette, str]):
+        self.inner = inner
+        self.cassette = cassette if isinstance(cassette, Cassette) else Cassette(cassette)
+        atexit.register(self.close)
+        self._closed = False
+
+    def request(self, method: str, url: str, params: Optional[Dict[str, Any]] = None, json: Any = None) -> requests.Response:
+        start = time.perf_counter()
+        response = self.inner.request(method, url, params=params, json=json)
+        self.cassette.add(
+            request_key(method, url, params, json),
+            response.status_code,
+            {k: v for k, v in response.headers.items() if k.lower() not in SKIPPED_HEADERS},
+            response.content,
+            time.perf_counter() - start
+        )
+        return response
+
+    def connection_stats(self) -> Dict[str, Any]:
+        return self.inner.connection_stats()
+
+    def close(self) -> None:
+        if not self._closed:
+            self._closed = True
+            atexit.unregister(self.close)
+            self.cassette.save()
+            self.inner.close()
+
+
+class ReplayTransport:
+    """
+    Transport serving responses from a cassette, without network access.
+
+    Args:
+        cassette: Cassette or path to a recorded cassette
+        latency: None for no delay, a number of seconds added to every
+            response, or "recorded" to sleep for the recorded elapsed time
+        latency_scale: Multiplier applied to the simulated latency
+    """
+
+    def __init__(self, cassette: Union[Cassette, str], latency: Union[None, float, str] = None, latency_scale: float = 1.0):
+        if isinstance(cassette, str) and not os.path.exists(cassette):
+            raise FileNotFoundError(f"Cassette not found: {cassette}")
+        self.cassette = cassette if isinstance(cassette, Cassette) else Cassette(cassette)
+        self.latency = latency
+        self.latency_scale = latency_scale
+
+    def request(self, method: str, url: str, params: Optional[Dict[str, Any]] = None, json: Any = None) -> requests.Response:
+        entry = self.cassette.next(request_key(method, url, params, json))
+
+        if self.latency == "recorded":
+            delay = entry.get("elapsed", 0.0)
+        else:
+            delay = self.latency or 0.0
+        if delay:
+            time.sleep(delay * self.latency_scale)
+
+        return build_response(url, entry["status"], entry["headers"], entry["body"])
+
+    def close(self) -> None:
+        pass
+
+
+def create_transport(
+    session: requests.Session,
+    mode: Optional[str] = None,
+    cassette_path: Optional[str] = None,
+    pool_size: Optional[int] = None
+):
+    """
+    Build the transport selected by mode (default config.TRANSPORT_MODE).
+
+    Args:
+        session: Session used by the live HTTP transport
+        mode: "live", "record" or "replay"
+        cassette_path: Cassette file for record/replay (default config.CASSETTE_PATH)
+        pool_size: Connections kept per host (default: largest configured fan-out)
+
+    Returns:
+        Transport instance
+    """
+    mode = (mode or config.TRANSPORT_MODE or "live").lower()
+    cassette_path = cassette_path or config.CASSETTE_PATH
+
+    if mode == "live":
+        return HTTPTransport(session, pool_size=pool_size)
+    if mode == "record":
+        return RecordingTransport(HTTPTransport(session, pool_size=pool_size), cassette_path)
+    if mode == "replay":
+        latency = config.REPLAY_LATENCY
+        if latency not in (None, "", "recorded"):
+            latency = float(latency)
+        return ReplayTransport(cassette_path, latency=latency or None)
+    raise ValueError(f"Unknown transport mode: {mode} (use live, record or replay)")
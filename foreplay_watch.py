@@ -0,0 +1,330 @@
+"""
+Foreplay API - Spyder Change Feed
+Description: Watches tracked Spyder brands and turns their ad lists into a
+stream of events: new ads, ads that went inactive and changed ads.
+
+Re-downloading every ad of every brand on each check does not scale to
+hundreds of brands. Instead each check reads the brand's ads newest first
+and compares every page with the fingerprints stored for that brand (one
+short hash per ad and per watched field). Paging stops at the first page in
+which nothing is new or changed, so an unchanged brand costs one small
+request, and a brand with a few new ads costs one or two. Page sizes start
+at config.WATCH_HEAD_LIMIT and double while changes continue.
+
+Changes deep in a brand's history (an old ad switched off) do not surface
+at the head, so every config.WATCH_FULL_SCAN_EVERY checks a brand is read
+in full and reconciled; ads missing from a full listing are reported
+inactive too.
+
+Brands are checked every config.WATCH_INTERVAL_SECONDS, each at its own
+fixed phase within the interval (a hash of the brand ID), so checks are
+spread evenly instead of all hitting the API at the top of the hour.
+Requests run at background priority, behind interactive GUI traffic.
+A failing brand is retried at its next slot, but a rejected API key (401,
+403) ends the poll, since every later check would fail the same way.
+"""
+
+import hashlib
+import json
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any, List, Callable, Iterable
+
+from config import config
+from foreplay_cache import JsonDiskCache
+from foreplay_extraction import is_auth_error
+from foreplay_scheduler import BACKGROUND, priority
+
+
+# Fields whose change is reported as a "changed" event
+WATCHED_FIELDS = (
+    "live", "name", "headline", "description", "display_format", "publisher_platform",
+    "niches", "languages", "market_target", "video", "thumbnail", "image", "link_url", "cta_title"
+)
+
+
+def _hash(value: Any, length: int = 12) -> str:
+    return hashlib.sha1(json.dumps(value, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:length]
+
+
+def ad_fingerprint(ad: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Compact fingerprint of an ad: live flag, one hash over the watched fields
+    and one short hash per field (to name what changed without storing it).
+    """
+    fields = {field: _hash(ad.get(field), 6) for field in WATCHED_FIELDS if field in ad}
+    return {"d": _hash(fields), "live": bool(ad.get("live")), "f": fields}
+
+
+def _ad_id(ad: Dict[str, Any]) -> str:
+    return str(ad.get("ad_id") or ad.get("id"))
+
+
+def _event(kind: str, brand_id: str, ad_id: str, ad: Optional[Dict[str, Any]] = None, **extra: Any) -> Dict[str, Any]:
+    return {
+        "type": kind,
+        "brand_id": brand_id,
+        "ad_id": ad_id,
+        "detected_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        **extra,
+        "ad": ad,
+    }
+
+
+class SpyderWatcher:
+    """
+    Poll tracked Spyder brands and emit new / inactive / changed ad events.
+
+    Example:
+        watcher = SpyderWatcher(client)
+        for event in watcher.poll():          # brands due now
+            print(event["type"], event["brand_id"], event["ad_id"])
+        watcher.run(on_event=handle, stop=threading.Event())   # forever
+    """
+
+    def __init__(
+        self,
+        client,
+        brand_ids: Optional[Iterable[str]] = None,
+        interval: Optional[float] = None,
+        state_dir: Optional[str] = None,
+        max_workers: Optional[int] = None,
+        baseline_events: bool = False
+    ):
+        """
+        Initialize the watcher.
+
+        Args:
+            client: ForeplayAPIClient instance
+            brand_ids: Brands to watch (default: every brand tracked in
+                Spyder, refreshed every config.WATCH_BRANDS_REFRESH_SECONDS)
+            interval: Seconds between two checks of the same brand
+            state_dir: Root of the stored fingerprints (default config.CACHE_DIR)
+            max_workers: Brands checked in parallel
+            baseline_events: Report every ad of a brand seen for the first
+                time as new (default: the first check only records them)
+        """
+        self.client = client
+        self.brand_ids = list(dict.fromkeys(str(b) for b in brand_ids)) if brand_ids else None
+        self.interval = interval or config.WATCH_INTERVAL_SECONDS
+        self.state = JsonDiskCache("spyder_watch", cache_dir=state_dir)
+        self.max_workers = max_workers or config.WATCH_MAX_WORKERS
+        self.baseline_events = baseline_events
+
+        self._tracked: List[str] = []
+        self._tracked_at = 0.0
+        self._started = time.time()
+        # brand_id -> time of its last failed check (kept out of the state, which
+        # would otherwise lose its "never checked" baseline)
+        self._failed_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {
+            "checks": 0, "full_scans": 0, "requests": 0, "ads_read": 0,
+            "new": 0, "inactive": 0, "changed": 0, "errors": 0
+        }
+
+    # =============================================================================
+    # BRANDS AND SCHEDULE
+    # =============================================================================
+
+    def tracked_brands(self) -> List[str]:
+        """Brands to watch: the explicit list, or Spyder's tracked brands"""
+        if self.brand_ids is not None:
+            return self.brand_ids
+        if self._tracked and time.time() - self._tracked_at < config.WATCH_BRANDS_REFRESH_SECONDS:
+            return self._tracked
+
+        brands, offset = [], 0
+        with priority(BACKGROUND):
+            while True:
+                page = self.client.get_spyder_brands(offset=offset, limit=config.WATCH_PAGE_LIMIT).get("data", [])
+                brands.extend(str(b.get("id")) for b in page if b.get("id"))
+                if len(page) < config.WATCH_PAGE_LIMIT:
+                    break
+                offset += len(page)
+        self._tracked, self._tracked_at = list(dict.fromkeys(brands)), time.time()
+        return self._tracked
+
+    def phase(self, brand_id: str) -> float:
+        """Fixed offset of the brand's checks within the interval"""
+        return (zlib.crc32(brand_id.encode("utf-8")) % 10000) / 10000 * self.interval
+
+    def _slot(self, brand_id: str, when: float) -> int:
+        return int((when - self.phase(brand_id)) // self.interval)
+
+    def is_due(self, brand_id: str, now: Optional[float] = None) -> bool:
+        """
+        True once the brand's slot has passed since its last check, failed
+        or not. Brands never checked count from the watcher's start, so their
+        first (full) scans are spread over the first interval too.
+        """
+        meta = self.state.get(brand_id) or {}
+        last = max(meta.get("checked_at", self._started), self._failed_at.get(brand_id, 0.0))
+        return self._slot(brand_id, now or time.time()) > self._slot(brand_id, last)
+
+    def next_check(self, brand_id: str, now: Optional[float] = None) -> float:
+        """Time of the brand's next scheduled check"""
+        now = now or time.time()
+        return (self._slot(brand_id, now) + 1) * self.interval + self.phase(brand_id)
+
+    # =============================================================================
+    # DIFFING
+    # =============================================================================
+
+    def _count(self, **values: int) -> None:
+        with self._lock:
+            for name, value in values.items():
+                self.stats[name] += value
+
+    def _page(self, brand_id: str, offset: int, limit: int) -> List[Dict[str, Any]]:
+        ads = self.client.get_spyder_brand_ads(brand_id, offset=offset, limit=limit, order="newest").get("data", [])
+        self._count(requests=1, ads_read=len(ads))
+        return ads
+
+    def check_brand(self, brand_id: str, full: Optional[bool] = None) -> List[Dict[str, Any]]:
+        """
+        Check one brand now.
+
+        Args:
+            brand_id: Spyder brand ID
+            full: Read every ad (default: on the first check and every
+                config.WATCH_FULL_SCAN_EVERY checks)
+
+        Returns:
+            Events found, newest ads first
+        """
+        # Small per-brand record read on every check; the per-ad fingerprints
+        # are only loaded (and rewritten) when something has to be diffed
+        meta = self.state.get(brand_id) or {}
+        baseline = not meta
+        checks = meta.get("checks", 0)
+        if full is None:
+            full = baseline or checks % config.WATCH_FULL_SCAN_EVERY == 0
+
+        events: List[Dict[str, Any]] = []
+        known: Optional[Dict[str, Dict[str, Any]]] = None
+        seen = set()
+        offset, limit = 0, config.WATCH_HEAD_LIMIT
+        head = meta.get("head")
+        with priority(BACKGROUND):
+            while True:
+                ads = self._page(brand_id, offset, limit)
+                if offset == 0:
+                    head = _hash([[_ad_id(ad), ad_fingerprint(ad)["d"]] for ad in ads])
+                    if head == meta.get("head") and not full:
+                        # Same newest ads, same content: nothing to diff
+                        break
+                    known = self.state.get(f"{brand_id}/ads", {})
+
+                page_changed = False
+                for ad in ads:
+                    ad_id = _ad_id(ad)
+                    seen.add(ad_id)
+                    fingerprint = ad_fingerprint(ad)
+                    previous = known.get(ad_id)
+                    if previous is None:
+                        page_changed = True
+                        if not baseline or self.baseline_events:
+                            events.append(_event("new", brand_id, ad_id, ad))
+                    elif previous["d"] != fingerprint["d"]:
+                        page_changed = True
+                        fields = sorted(f for f in set(previous["f"]) | set(fingerprint["f"])
+                                        if previous["f"].get(f) != fingerprint["f"].get(f))
+                        if previous["live"] and not fingerprint["live"]:
+                            events.append(_event("inactive", brand_id, ad_id, ad, fields=fields))
+                        else:
+                            events.append(_event("changed", brand_id, ad_id, ad, fields=fields))
+                    known[ad_id] = fingerprint
+
+                if len(ads) < limit or (not page_changed and not full):
+                    break
+                offset += len(ads)
+                limit = min(limit * 2, config.WATCH_PAGE_LIMIT)
+
+        if full and known is not None:
+            for ad_id in [a for a in known if a not in seen]:
+                if known[ad_id]["live"] and not baseline:
+                    events.append(_event("inactive", brand_id, ad_id, None, fields=["missing"]))
+                del known[ad_id]
+
+        if known is not None:
+            self.state.set(f"{brand_id}/ads", known)
+        self.state.set(brand_id, {"head": head, "checked_at": time.time(), "checks": checks + 1})
+        counts = {kind: sum(1 for e in events if e["type"] == kind) for kind in ("new", "inactive", "changed")}
+        self._count(checks=1, full_scans=int(full), **counts)
+        return events
+
+    # =============================================================================
+    # POLLING
+    # =============================================================================
+
+    def poll(self, force: bool = False, on_event: Optional[Callable[[Dict[str, Any]], None]] = None) -> List[Dict[str, Any]]:
+        """
+        Check every brand that is due (every brand with force=True) in parallel.
+
+        Args:
+            force: Ignore the schedule
+            on_event: Called with each event as soon as its brand is checked
+
+        Returns:
+            All events found
+
+        Raises:
+            requests.HTTPError: If the API key is rejected
+        """
+        now = time.time()
+        due = [b for b in self.tracked_brands() if force or self.is_due(b, now)]
+        events: List[Dict[str, Any]] = []
+
+        def check(brand_id: str) -> List[Dict[str, Any]]:
+            try:
+                events = self.check_brand(brand_id)
+            except Exception as e:
+                self._count(errors=1)
+                if is_auth_error(e):
+                    raise
+                # One failing brand must not stop the feed; it waits for its next slot
+                with self._lock:
+                    self._failed_at[brand_id] = time.time()
+                return []
+            with self._lock:
+                self._failed_at.pop(brand_id, None)
+            return events
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(contextvars.copy_context().run, check, b) for b in due]
+            for future in futures:
+                for event in future.result():
+                    events.append(event)
+                    if on_event:
+                        on_event(event)
+        return events
+
+    def run(
+        self,
+        on_event: Callable[[Dict[str, Any]], None],
+        stop: Optional[threading.Event] = None,
+        tick: float = 5.0
+    ) -> None:
+        """
+        Poll until stop is set, waking when the next brand is due (at most every tick seconds).
+        """
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            self.poll(on_event=on_event)
+            brands = self.tracked_brands()
+            wake = min((self.next_check(b) for b in brands), default=time.time() + tick)
+            stop.wait(max(0.0, min(tick, wake - time.time())))
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Counters plus requests per check"""
+        with self._lock:
+            checks = self.stats["checks"]
+            return {
+                **self.stats,
+                "requests_per_check": round(self.stats["requests"] / checks, 2) if checks else None,
+            }